@@ -7,8 +7,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+MONGO_DB_NAME = os.getenv("MONGODB_DB_NAME", "spring_of_knowledge")
 client = AsyncIOMotorClient(MONGO_URI)
-db = client.spring_of_knowledge
+db = client[MONGO_DB_NAME]
 
 def get_db():
     return db
@@ -88,7 +88,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["Authorization", "Content-Type", "X-Requested-With", "Accept", "Origin", "X-CSRF-Token"],
-    expose_headers=["X-Total-Count", "X-Page", "X-Per-Page"],
+    expose_headers=["X-Total-Count", "X-Page", "X-Per-Page", "X-Next-Cursor"],
 )
 
 # Mount static files for uploads
@@ -169,6 +169,10 @@ async def startup_event():
             
             sync_manager = await initialize_sync_system(client, db.name)
             
+            # Keep cached dashboard counters current from the same change streams
+            from .services.dashboard_stats_service import get_dashboard_stats_service
+            get_dashboard_stats_service(db).attach_to_sync_manager(sync_manager)
+            
             # Start WebSocket manager and connect to sync system
             websocket_manager = get_websocket_manager(db)
             websocket_manager.connect_to_sync_manager(sync_manager)
@@ -178,7 +182,23 @@ async def startup_event():
             print("✅ WebSocket manager started")
         except Exception as e:
             print(f"⚠️  Warning: Could not start sync system: {e}")
-    
+
+        # Publish stock journal entries left behind by requests interrupted mid-write
+        try:
+            from .utils.inventory_stock import get_inventory_stock_engine
+            from .db import db
+            await get_inventory_stock_engine(db).relay_outbox()
+        except Exception as e:
+            print(f"⚠️  Warning: Could not relay inventory journal: {e}")
+
+        # Deliver queued email/SMS/push notifications in the background
+        try:
+            from .utils.notification_engine import notification_engine
+            notification_engine.delivery_worker.start()
+            print("✅ Notification delivery worker started")
+        except Exception as e:
+            print(f"⚠️  Warning: Could not start notification delivery worker: {e}")
+
     print("✅ API server started successfully")
 
 @app.on_event("shutdown")
@@ -202,6 +222,24 @@ async def shutdown_event():
         except Exception as e:
             print(f"⚠️  Warning: Error during shutdown: {e}")
     
+    # Stop the notification delivery worker and close pooled SMTP connections
+    try:
+        from .utils.notification_engine import notification_engine
+        await notification_engine.close()
+    except Exception as e:
+        print(f"⚠️  Warning: Could not stop notification delivery: {e}")
+    
+    # Stop timetable solver worker processes
+    from .utils.timetable_solver import shutdown_solver_pool
+    shutdown_solver_pool()
+    
+    # Write out audit events still queued in memory
+    try:
+        from .utils.audit_logger import get_audit_logger
+        await get_audit_logger().close()
+    except Exception as e:
+        print(f"⚠️  Warning: Could not flush audit log: {e}")
+    
     print("✅ API server stopped")
 
 @app.get("/health")
@@ -43,7 +43,9 @@ class AcademicEventCreate(BaseModel):
     branch_id: Optional[str] = None
     color: Optional[str] = "#3498db"  # For calendar display
     is_recurring: bool = False
-    recurrence_pattern: Optional[str] = None  # daily, weekly, monthly
+    recurrence_pattern: Optional[str] = None  # RRULE such as FREQ=WEEKLY;BYDAY=MO,WE, or daily, weekly, monthly
+    recurrence_until: Optional[datetime] = None  # Last possible occurrence start
+    recurrence_exceptions: Optional[List[datetime]] = []  # Occurrence starts that are skipped
     reminder_minutes: Optional[int] = None
     is_public: bool = True  # Visible to all or just staff
     
@@ -75,6 +77,9 @@ class AcademicEvent(AcademicEventCreate):
     updated_at: Optional[datetime] = None
     created_by: Optional[str] = None
     
+    # Original start of this occurrence when expanded from a recurring event
+    recurrence_id: Optional[datetime] = None
+    
     # Additional computed fields
     days_until: Optional[int] = None
     is_overdue: Optional[bool] = None
@@ -92,6 +97,8 @@ class AcademicEventUpdate(BaseModel):
     color: Optional[str] = None
     is_recurring: Optional[bool] = None
     recurrence_pattern: Optional[str] = None
+    recurrence_until: Optional[datetime] = None
+    recurrence_exceptions: Optional[List[datetime]] = None
     reminder_minutes: Optional[int] = None
     is_public: Optional[bool] = None
     
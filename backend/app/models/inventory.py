@@ -70,6 +70,7 @@ class RequestStatus(str, Enum):
     PENDING = "pending"
     APPROVED = "approved"
     REJECTED = "rejected"
+    FULFILLING = "fulfilling"
     FULFILLED = "fulfilled"
     CANCELLED = "cancelled"
 
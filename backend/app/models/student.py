@@ -36,7 +36,7 @@ class StudentBase(BaseModel):
     branch_id: Optional[str] = None
 
 class StudentCreate(StudentBase):
-    pass
+    student_id: Optional[str] = Field(None, description="Unique student identifier; generated as SCH-YYYY-NNNNN when omitted")
 
 class Student(StudentBase):
     id: str
@@ -260,6 +260,37 @@ class TimetableBulkUpdate(BaseModel):
     reason: Optional[str] = None
     notify_changes: bool = True
 
+# Timetable Generation Models
+class TimetableGenerationRequest(BaseModel):
+    academic_year: str
+    class_ids: Optional[List[str]] = None  # Defaults to every class in the branch
+    subject_periods: Dict[str, int] = Field(default_factory=dict, description="Weekly periods per subject_id")
+    class_subject_periods: Dict[str, Dict[str, int]] = Field(
+        default_factory=dict, description="Per-class overrides: class_id -> subject_id -> weekly periods"
+    )
+    subject_room_types: Dict[str, str] = Field(default_factory=dict, description="subject_id -> required room_type")
+    working_days: List[DayOfWeek] = Field(default_factory=lambda: [
+        DayOfWeek.MONDAY, DayOfWeek.TUESDAY, DayOfWeek.WEDNESDAY, DayOfWeek.THURSDAY, DayOfWeek.FRIDAY
+    ])
+    max_consecutive_periods_per_teacher: int = Field(3, ge=1, le=10)
+    max_periods_per_subject_per_day: int = Field(2, ge=1, le=10)
+    time_budget_seconds: float = Field(10, gt=0, le=120)
+    keep_existing: bool = True  # Warm-start from current entries so a re-solve moves as little as possible
+    save: bool = False  # Replace the classes' entries when every lesson was placed
+    seed: int = 0
+
+class TimetableGenerationResult(BaseModel):
+    status: str = Field(..., description="solved, partial")
+    academic_year: str
+    entries: List[TimetableEntryCreate]
+    unplaced: List[Dict[str, Any]] = Field(default_factory=list)
+    warnings: List[str] = Field(default_factory=list)
+    soft_penalty: int
+    iterations: int
+    elapsed_seconds: float
+    moved_lessons: int
+    saved_entries: int = 0
+
 # Statistics and Analytics Models
 class TimetableStats(BaseModel):
     total_periods_scheduled: int
@@ -15,6 +15,8 @@ from ..models.academic_calendar import (
     HolidayCreate, Holiday, AcademicCalendarSummary
 )
 from ..utils.rbac import get_current_user
+from ..utils.calendar_feeds import touch_calendar_feeds, EVENTS_SCOPE
+from ..utils.event_recurrence import with_interval_fields
 from ..models.user import User
 from ..utils.validation import (
     sanitize_input, prevent_nosql_injection, validate_mongodb_id
@@ -241,7 +243,8 @@ async def create_academic_event(
         "created_by": current_user.get("user_id")
     })
     
-    result = await events_coll.insert_one(event_data)
+    result = await events_coll.insert_one(with_interval_fields(event_data))
+    await touch_calendar_feeds(events_coll.database, EVENTS_SCOPE)
     event_data["id"] = str(result.inserted_id)
     
     return AcademicEvent(**event_data)
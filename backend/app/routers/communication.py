@@ -1,16 +1,16 @@
 from typing import List, Any, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from bson import ObjectId
 from datetime import datetime
 
 from ..db import (
-    get_messages_collection, get_message_recipients_collection, get_notifications_collection,
+    get_messages_collection, get_notifications_collection,
     get_announcements_collection, get_parent_student_links_collection,
     get_communication_settings_collection, get_student_collection, get_user_collection,
     get_parents_collection, get_classes_collection, get_exam_results_collection,
     get_exams_collection, get_grading_scales_collection, get_fees_collection,
     get_registration_payments_collection, get_attendance_collection, get_disciplinary_actions_collection,
-    validate_branch_id, validate_student_id
+    validate_branch_id, validate_student_id, get_db
 )
 from ..models.communication import (
     MessageCreate, Message, MessageUpdate, MessageRecipientCreate, MessageRecipient,
@@ -26,6 +26,7 @@ from ..utils.validation import (
 from ..services.comprehensive_parent_portal_service import ComprehensiveParentPortalService
 from ..services.parent_notification_service import ParentNotificationService
 from ..utils.audit_logger import AuditAction, AuditSeverity
+from ..utils.messaging import get_messaging_engine
 
 router = APIRouter()
 
@@ -34,7 +35,7 @@ router = APIRouter()
 async def create_message(
     message_in: MessageCreate,
     messages_coll: Any = Depends(get_messages_collection),
-    recipients_coll: Any = Depends(get_message_recipients_collection),
+    db: Any = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Create a new message."""
@@ -66,14 +67,9 @@ async def create_message(
     message_id = str(result.inserted_id)
     
     # Create recipient records
-    for recipient_id in message_data["recipients"]:
-        recipient_data = {
-            "message_id": message_id,
-            "recipient_id": recipient_id,
-            "recipient_type": message_data["recipient_type"],
-            "created_at": now
-        }
-        await recipients_coll.insert_one(recipient_data)
+    await get_messaging_engine(db).fan_out(
+        message_id, message_data["recipients"], message_data["recipient_type"], now
+    )
     
     message_data["id"] = message_id
     return Message(**message_data)
@@ -115,61 +111,70 @@ async def list_messages(
 
 @router.get("/messages/received", response_model=List[dict])
 async def get_received_messages(
+    response: Response,
     is_read: Optional[bool] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    recipients_coll: Any = Depends(get_message_recipients_collection),
-    messages_coll: Any = Depends(get_messages_collection),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    db: Any = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Get messages received by current user."""
-    query = {"recipient_id": current_user.id}
+    try:
+        rows, next_cursor = await get_messaging_engine(db).inbox(
+            current_user.id, is_read=is_read, limit=limit, cursor=cursor, skip=skip
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    if is_read is not None:
-        query["is_read"] = is_read
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     received_messages = []
-    async for recipient in recipients_coll.find(query).skip(skip).limit(limit).sort("created_at", -1):
-        # Get the actual message
-        message = await messages_coll.find_one({"_id": ObjectId(recipient["message_id"])})
-        if message:
-            received_messages.append({
-                "id": str(recipient["_id"]),
-                "message": {
-                    "id": str(message["_id"]),
-                    "subject": message["subject"],
-                    "content": message["content"],
-                    "message_type": message["message_type"],
-                    "priority": message["priority"],
-                    "sender_id": message["sender_id"],
-                    "sent_at": message.get("sent_at"),
-                    "attachments": message.get("attachments", [])
-                },
-                "is_read": recipient["is_read"],
-                "read_at": recipient.get("read_at"),
-                "is_acknowledged": recipient.get("is_acknowledged", False),
-                "acknowledged_at": recipient.get("acknowledged_at"),
-                "received_at": recipient["created_at"]
-            })
+    for recipient in rows:
+        message = recipient["message"]
+        received_messages.append({
+            "id": str(recipient["_id"]),
+            "message": {
+                "id": str(message["_id"]),
+                "subject": message["subject"],
+                "content": message["content"],
+                "message_type": message["message_type"],
+                "priority": message["priority"],
+                "sender_id": message["sender_id"],
+                "sent_at": message.get("sent_at"),
+                "attachments": message.get("attachments", [])
+            },
+            "is_read": recipient.get("is_read", False),
+            "read_at": recipient.get("read_at"),
+            "is_acknowledged": recipient.get("is_acknowledged", False),
+            "acknowledged_at": recipient.get("acknowledged_at"),
+            "received_at": recipient["created_at"]
+        })
     
     return received_messages
 
+@router.get("/messages/received/unread-count")
+async def get_unread_message_count(
+    db: Any = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Number of unread messages for the current user."""
+    return {"unread": await get_messaging_engine(db).unread_count(current_user.id)}
+
 @router.put("/messages/received/{recipient_id}/read")
 async def mark_message_as_read(
     recipient_id: str,
-    recipients_coll: Any = Depends(get_message_recipients_collection),
+    db: Any = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Mark a received message as read."""
     if not validate_mongodb_id(recipient_id):
         raise HTTPException(status_code=400, detail="Invalid recipient ID")
     
-    result = await recipients_coll.update_one(
-        {"_id": ObjectId(recipient_id), "recipient_id": current_user.id},
-        {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
-    )
+    changed = await get_messaging_engine(db).mark_read(ObjectId(recipient_id), current_user.id)
     
-    if result.matched_count == 0:
+    if changed is None:
         raise HTTPException(status_code=404, detail="Message not found")
     
     return {"status": "marked as read"}
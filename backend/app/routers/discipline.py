@@ -1,9 +1,8 @@
 from typing import List, Any, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from bson import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime, date
-import random
-import string
 
 from ..db import (
     get_incidents_collection, get_disciplinary_actions_collection, get_behavior_points_collection,
@@ -19,6 +18,8 @@ from ..models.discipline import (
     ParentMeetingCreate, ParentMeeting, DisciplinaryStats
 )
 from ..utils.rbac import get_current_user, is_hq_role
+from ..utils.behavior_analytics import get_behavior_analytics
+from ..utils.discipline_codes import get_discipline_code_allocator
 from ..models.user import User
 from ..utils.validation import (
     sanitize_input, prevent_nosql_injection, validate_mongodb_id
@@ -26,38 +27,6 @@ from ..utils.validation import (
 
 router = APIRouter()
 
-def generate_incident_code():
-    """Generate a unique incident code."""
-    return f"INC{random.randint(100000, 999999)}"
-
-def generate_action_code():
-    """Generate a unique disciplinary action code."""
-    return f"DA{random.randint(100000, 999999)}"
-
-def generate_point_code():
-    """Generate a unique behavior point code."""
-    return f"BP{random.randint(100000, 999999)}"
-
-def generate_reward_code():
-    """Generate a unique reward code."""
-    return f"RW{random.randint(100000, 999999)}"
-
-def generate_session_code():
-    """Generate a unique counseling session code."""
-    return f"CS{random.randint(100000, 999999)}"
-
-def generate_contract_code():
-    """Generate a unique behavior contract code."""
-    return f"BC{random.randint(100000, 999999)}"
-
-def generate_rubric_code():
-    """Generate a unique behavior rubric code."""
-    return f"BR{random.randint(1000, 9999)}"
-
-def generate_meeting_code():
-    """Generate a unique parent meeting code."""
-    return f"PM{random.randint(100000, 999999)}"
-
 # Incidents Management
 @router.post("/incidents", response_model=Incident)
 async def create_incident(
@@ -94,9 +63,7 @@ async def create_incident(
         incident_data["branch_id"] = user_branch_id
     
     # Generate unique incident code
-    incident_code = generate_incident_code()
-    while await incidents_coll.find_one({"incident_code": incident_code}):
-        incident_code = generate_incident_code()
+    incident_code = await get_discipline_code_allocator(incidents_coll.database).next_code("incident")
     
     # Add metadata
     now = datetime.utcnow()
@@ -109,6 +76,7 @@ async def create_incident(
     })
     
     result = await incidents_coll.insert_one(incident_data)
+    await get_behavior_analytics(incidents_coll.database).record_incident(incident_data)
     incident_data["id"] = str(result.inserted_id)
     
     return Incident(**incident_data)
@@ -236,16 +204,18 @@ async def update_incident(
         elif update_data["status"] in ["open", "under_investigation"]:
             update_data["is_resolved"] = False
     
-    result = await incidents_coll.update_one(
+    previous_incident = await incidents_coll.find_one_and_update(
         {"_id": ObjectId(incident_id)},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if previous_incident is None:
         raise HTTPException(status_code=404, detail="Incident not found")
     
-    # Return updated incident
-    updated_incident = await incidents_coll.find_one({"_id": ObjectId(incident_id)})
+    # Move the incident between behavior counters if a counted field changed
+    updated_incident = {**previous_incident, **update_data}
+    await get_behavior_analytics(incidents_coll.database).record_incident_change(previous_incident, updated_incident)
     return Incident(
         id=str(updated_incident["_id"]),
         **{k: v for k, v in updated_incident.items() if k != "_id"}
@@ -264,11 +234,13 @@ async def delete_incident(
     if not validate_mongodb_id(incident_id):
         raise HTTPException(status_code=400, detail="Invalid incident ID")
     
-    result = await incidents_coll.delete_one({"_id": ObjectId(incident_id)})
+    deleted_incident = await incidents_coll.find_one_and_delete({"_id": ObjectId(incident_id)})
     
-    if result.deleted_count == 0:
+    if deleted_incident is None:
         raise HTTPException(status_code=404, detail="Incident not found")
     
+    await get_behavior_analytics(incidents_coll.database).record_incident(deleted_incident, sign=-1)
+    
     return {"message": "Incident deleted successfully"}
 
 # Disciplinary Actions
@@ -307,9 +279,7 @@ async def create_disciplinary_action(
         action_data["branch_id"] = user_branch_id
     
     # Generate unique action code
-    action_code = generate_action_code()
-    while await actions_coll.find_one({"action_code": action_code}):
-        action_code = generate_action_code()
+    action_code = await get_discipline_code_allocator(actions_coll.database).next_code("action")
     
     # Add metadata
     now = datetime.utcnow()
@@ -408,9 +378,7 @@ async def create_behavior_point(
             point_data["date_awarded"] = datetime.combine(point_data["date_awarded"], datetime.min.time())
     
     # Generate unique point code
-    point_code = generate_point_code()
-    while await points_coll.find_one({"point_code": point_code}):
-        point_code = generate_point_code()
+    point_code = await get_discipline_code_allocator(points_coll.database).next_code("point")
     
     # Add metadata
     now = datetime.utcnow()
@@ -421,6 +389,7 @@ async def create_behavior_point(
     })
     
     result = await points_coll.insert_one(point_data)
+    await get_behavior_analytics(points_coll.database).record_points(point_data)
     point_data["id"] = str(result.inserted_id)
     
     return BehaviorPoint(**point_data)
@@ -504,16 +473,18 @@ async def update_behavior_point(
     
     update_data["updated_at"] = datetime.utcnow()
     
-    result = await points_coll.update_one(
+    previous_point = await points_coll.find_one_and_update(
         {"_id": ObjectId(point_id)},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if previous_point is None:
         raise HTTPException(status_code=404, detail="Behavior point not found")
     
-    # Return updated point
-    updated_point = await points_coll.find_one({"_id": ObjectId(point_id)})
+    # Move the points between balances if their amount, type or date changed
+    updated_point = {**previous_point, **update_data}
+    await get_behavior_analytics(points_coll.database).record_points_change(previous_point, updated_point)
     return BehaviorPoint(
         id=str(updated_point["_id"]),
         **{k: v for k, v in updated_point.items() if k != "_id"}
@@ -532,11 +503,13 @@ async def delete_behavior_point(
     if not validate_mongodb_id(point_id):
         raise HTTPException(status_code=400, detail="Invalid point ID")
     
-    result = await points_coll.delete_one({"_id": ObjectId(point_id)})
+    deleted_point = await points_coll.find_one_and_delete({"_id": ObjectId(point_id)})
     
-    if result.deleted_count == 0:
+    if deleted_point is None:
         raise HTTPException(status_code=404, detail="Behavior point not found")
     
+    await get_behavior_analytics(points_coll.database).record_points(deleted_point, sign=-1)
+    
     return {"message": "Behavior point deleted successfully"}
 
 # Rewards
@@ -585,9 +558,7 @@ async def create_reward(
             reward_data["presentation_date"] = datetime.combine(reward_data["presentation_date"], datetime.min.time())
     
     # Generate unique reward code
-    reward_code = generate_reward_code()
-    while await rewards_coll.find_one({"reward_code": reward_code}):
-        reward_code = generate_reward_code()
+    reward_code = await get_discipline_code_allocator(rewards_coll.database).next_code("reward")
     
     # Add metadata
     now = datetime.utcnow()
@@ -755,9 +726,7 @@ async def create_counseling_session(
         session_data["branch_id"] = user_branch_id
     
     # Generate unique session code
-    session_code = generate_session_code()
-    while await sessions_coll.find_one({"session_code": session_code}):
-        session_code = generate_session_code()
+    session_code = await get_discipline_code_allocator(sessions_coll.database).next_code("session")
     
     # Add metadata
     now = datetime.utcnow()
@@ -944,9 +913,7 @@ async def create_behavior_contract(
             contract_data["end_date"] = datetime.combine(contract_data["end_date"], datetime.min.time())
     
     # Generate unique contract code
-    contract_code = generate_contract_code()
-    while await contracts_coll.find_one({"contract_code": contract_code}):
-        contract_code = generate_contract_code()
+    contract_code = await get_discipline_code_allocator(contracts_coll.database).next_code("contract")
     
     # Add metadata
     now = datetime.utcnow()
@@ -1097,7 +1064,6 @@ async def get_disciplinary_statistics(
     branch_id: Optional[str] = Query(None, description="Filter by branch ID"),
     incidents_coll: Any = Depends(get_incidents_collection),
     actions_coll: Any = Depends(get_disciplinary_actions_collection),
-    points_coll: Any = Depends(get_behavior_points_collection),
     rewards_coll: Any = Depends(get_rewards_collection),
     sessions_coll: Any = Depends(get_counseling_sessions_collection),
     contracts_coll: Any = Depends(get_behavior_contracts_collection),
@@ -1116,67 +1082,29 @@ async def get_disciplinary_statistics(
         if user_branch_id:
             branch_filter["branch_id"] = user_branch_id
 
-    # Basic counts
-    total_incidents = await incidents_coll.count_documents(branch_filter)
-    open_incidents = await incidents_coll.count_documents({**branch_filter, "status": "open"})
-    resolved_incidents = await incidents_coll.count_documents({**branch_filter, "status": "resolved"})
-    
-    # Behavior points
-    positive_points_cursor = points_coll.aggregate([
-        {"$match": {**branch_filter, "point_type": "positive"}},
-        {"$group": {"_id": None, "total": {"$sum": "$points"}}}
-    ])
-    positive_points_result = await positive_points_cursor.to_list(1)
-    positive_behavior_points = positive_points_result[0]["total"] if positive_points_result else 0
-    
-    negative_points_cursor = points_coll.aggregate([
-        {"$match": {**branch_filter, "point_type": "negative"}},
-        {"$group": {"_id": None, "total": {"$sum": "$points"}}}
-    ])
-    negative_points_result = await negative_points_cursor.to_list(1)
-    negative_behavior_points = abs(negative_points_result[0]["total"]) if negative_points_result else 0
-    
-    # Other counts
-    rewards_given = await rewards_coll.count_documents(branch_filter)
-    counseling_sessions_held = await sessions_coll.count_documents({**branch_filter, "status": "completed"})
-    behavior_contracts_active = await contracts_coll.count_documents({**branch_filter, "status": "active"})
-    parent_meetings_scheduled = await meetings_coll.count_documents({**branch_filter, "status": {"$in": ["scheduled", "confirmed"]}})
-    disciplinary_actions_pending = await actions_coll.count_documents({**branch_filter, "status": "pending"})
-    
-    # Incidents by type
-    incidents_by_type_cursor = incidents_coll.aggregate([
-        {"$match": branch_filter if branch_filter else {}},
-        {"$group": {"_id": "$incident_type", "count": {"$sum": 1}}}
-    ])
-    incidents_by_type = {}
-    async for item in incidents_by_type_cursor:
-        incidents_by_type[item["_id"]] = item["count"]
-    
-    # Incidents by severity
-    incidents_by_severity_cursor = incidents_coll.aggregate([
-        {"$match": branch_filter if branch_filter else {}},
-        {"$group": {"_id": "$severity", "count": {"$sum": 1}}}
-    ])
-    incidents_by_severity = {}
-    async for item in incidents_by_severity_cursor:
-        incidents_by_severity[item["_id"]] = item["count"]
-    
-    return DisciplinaryStats(
-        total_incidents=total_incidents,
-        open_incidents=open_incidents,
-        resolved_incidents=resolved_incidents,
-        incidents_by_type=incidents_by_type,
-        incidents_by_severity=incidents_by_severity,
-        most_common_violations=[],  # Can be implemented based on requirements
-        repeat_offenders=[],  # Can be implemented based on requirements
-        positive_behavior_points=positive_behavior_points,
-        negative_behavior_points=negative_behavior_points,
-        rewards_given=rewards_given,
-        counseling_sessions_held=counseling_sessions_held,
-        behavior_contracts_active=behavior_contracts_active,
-        parent_meetings_scheduled=parent_meetings_scheduled,
-        disciplinary_actions_pending=disciplinary_actions_pending,
-        trend_analysis={},  # Can be implemented based on requirements
-        class_behavior_summary={},  # Can be implemented based on requirements
-        grade_level_analysis={}  # Can be implemented based on requirements
-    )
+    # Incident breakdowns come from one $facet; point balances, trends, class and grade
+    # summaries and repeat offenders from counters maintained as records are written
+    stats = await get_behavior_analytics(incidents_coll.database).statistics(branch_filter, {
+        "incidents": incidents_coll,
+        "rewards": rewards_coll,
+        "sessions": sessions_coll,
+        "contracts": contracts_coll,
+        "meetings": meetings_coll,
+        "actions": actions_coll
+    })
+    return DisciplinaryStats(**stats)
+
+@router.post("/stats/rebuild")
+async def rebuild_disciplinary_statistics(
+    incidents_coll: Any = Depends(get_incidents_collection),
+    current_user: dict = Depends(get_current_user),
+):
+    """Recompute behavior balances and counters from incidents and behavior points."""
+    if current_user.get('role') not in ['super_admin', 'hq_admin']:
+        raise HTTPException(status_code=403, detail="Not authorized to rebuild statistics")
+    
+    try:
+        await get_behavior_analytics(incidents_coll.database).rebuild()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Behavior statistics rebuild failed: {str(e)}")
+    return {"message": "Behavior statistics rebuilt successfully"}
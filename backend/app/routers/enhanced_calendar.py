@@ -1,7 +1,8 @@
 from typing import List, Any, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Request
+from fastapi.responses import StreamingResponse
 from bson import ObjectId
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
 from ..db import get_academic_events_collection
 from ..models.academic_calendar import (
@@ -13,6 +14,10 @@ from ..models.user import User
 from ..utils.validation import sanitize_input, validate_mongodb_id
 from ..utils.calendar_events import calendar_event_generator
 from ..utils.calendar_export import calendar_exporter
+from ..utils.event_recurrence import find_occurrences, with_interval_fields
+from ..utils.calendar_feeds import (
+    get_calendar_feed_service, touch_calendar_feeds, EVENTS_SCOPE, FEED_KINDS, FEED_MEDIA_TYPE
+)
 
 router = APIRouter(prefix="/calendar", tags=["Enhanced Calendar"])
 
@@ -63,10 +68,12 @@ async def get_upcoming_events(
     if user_role == 'branch_admin' and current_user.get('branch_id'):
         query["branch_id"] = current_user.get('branch_id')
     
-    # Get events
+    # Get events; recurring series come back once and are expanded to the window
+    await calendar_event_generator.ensure_event_indexes()
+    window = query.pop("start_date")
+    occurrences = await find_occurrences(events_coll, window["$gte"], window["$lte"], query)
     events = []
-    cursor = events_coll.find(query).sort("start_date", 1).limit(limit)
-    async for event in cursor:
+    for event in occurrences[:limit]:
         event_data = {k: v for k, v in event.items() if k != "_id"}
         event_data['id'] = str(event['_id'])
         events.append(AcademicEvent(**event_data))
@@ -154,12 +161,9 @@ async def get_events(
     # Build MongoDB query directly
     query = {}
     
-    # Date range filtering
+    # Date range filtering; a full range is answered from the interval index below
     if start_date and end_date:
-        query["start_date"] = {
-            "$gte": datetime.combine(start_date, datetime.min.time()),
-            "$lte": datetime.combine(end_date, datetime.max.time())
-        }
+        pass
     elif start_date:
         query["start_date"] = {"$gte": datetime.combine(start_date, datetime.min.time())}
     elif end_date:
@@ -175,8 +179,8 @@ async def get_events(
         query["auto_generated"] = {"$ne": True}
     
     # Class ID filtering
-    if class_ids:
-        class_id_list = [c.strip() for c in class_ids.split(',')]
+    class_id_list = [c.strip() for c in class_ids.split(',')] if class_ids else []
+    if class_id_list and not (start_date and end_date):
         query["class_ids"] = {"$in": class_id_list}
     
     # Branch filtering
@@ -198,8 +202,19 @@ async def get_events(
         ]
     
     # Get events from collection
+    if start_date and end_date:
+        await calendar_event_generator.ensure_event_indexes()
+        found = await find_occurrences(
+            events_coll,
+            datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+            query,
+            [f"class:{class_id}" for class_id in class_id_list]
+        )
+    else:
+        found = await events_coll.find(query).sort("start_date", 1).to_list(None)
     events = []
-    async for event in events_coll.find(query).sort("start_date", 1):
+    for event in found:
         # Skip events with invalid data
         if event.get("academic_year_id") is None:
             continue
@@ -418,6 +433,15 @@ async def download_calendar_export(
             include_private_events=include_private_events
         )
         
+        # iCal is streamed as it is generated
+        if export_request.format == 'ical':
+            filename = f"academic_calendar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ics"
+            return StreamingResponse(
+                calendar_exporter.stream_ical_export(export_request),
+                media_type="text/calendar",
+                headers={"Content-Disposition": f"attachment; filename={filename}"}
+            )
+        
         # Generate export
         export_result = await calendar_exporter.export_calendar(export_request)
         
@@ -434,6 +458,75 @@ async def download_calendar_export(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to download calendar: {str(e)}")
 
+@router.post("/feeds")
+async def create_calendar_feed(
+    request: Request,
+    kind: str = Query("user", description="user, class or teacher"),
+    target_id: Optional[str] = Query(None, description="Class or teacher ID for class and teacher feeds"),
+    current_user: User = Depends(get_current_user),
+    events_coll: Any = Depends(get_academic_events_collection)
+):
+    """Get a persistent subscription URL for calendar apps; the same target always returns the same URL"""
+    if kind not in FEED_KINDS:
+        raise HTTPException(status_code=400, detail=f"Invalid feed kind. Must be one of: {', '.join(FEED_KINDS)}")
+    
+    db = events_coll.database
+    branch_id = current_user.get('branch_id')
+    if kind == "user":
+        target_id = str(current_user.get('user_id'))
+    else:
+        if not target_id or not validate_mongodb_id(target_id):
+            raise HTTPException(status_code=400, detail="A valid target_id is required for class and teacher feeds")
+        target = await db["classes" if kind == "class" else "teachers"].find_one(
+            {"_id": ObjectId(target_id)}, {"branch_id": 1}
+        )
+        if not target:
+            raise HTTPException(status_code=404, detail=f"{kind.title()} not found")
+        if current_user.get('role') not in ['super_admin', 'hq_admin'] and target.get('branch_id') != branch_id:
+            raise HTTPException(status_code=403, detail="Not authorized to subscribe to this calendar")
+        branch_id = target.get('branch_id')
+    
+    feed = await get_calendar_feed_service(db).subscribe(current_user, kind, target_id, branch_id)
+    return {
+        "token": feed["_id"],
+        "kind": kind,
+        "target_id": target_id,
+        "url": str(request.url_for("get_calendar_feed", token=feed["_id"])),
+        "created_at": feed["created_at"]
+    }
+
+@router.get("/feeds/{token}.ics", name="get_calendar_feed")
+async def get_calendar_feed(
+    token: str,
+    request: Request,
+    events_coll: Any = Depends(get_academic_events_collection)
+):
+    """Subscription feed polled by calendar apps; the token in the URL is the credential"""
+    service = get_calendar_feed_service(events_coll.database)
+    state = await service.lookup(token)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Calendar feed not found")
+    
+    headers = state.headers()
+    if state.not_modified(request.headers):
+        return Response(status_code=304, headers=headers)
+    
+    cached = service.cached(state)
+    if cached is not None:
+        return Response(content=cached, media_type=FEED_MEDIA_TYPE, headers=headers)
+    return StreamingResponse(service.render(state), media_type=FEED_MEDIA_TYPE, headers=headers)
+
+@router.delete("/feeds/{token}")
+async def revoke_calendar_feed(
+    token: str,
+    current_user: User = Depends(get_current_user),
+    events_coll: Any = Depends(get_academic_events_collection)
+):
+    """Revoke a subscription URL; calendar apps polling it get 404 from then on"""
+    if not await get_calendar_feed_service(events_coll.database).revoke(token, current_user.get('user_id')):
+        raise HTTPException(status_code=404, detail="Calendar feed not found")
+    return {"success": True, "message": "Calendar feed revoked"}
+
 @router.get("/upcoming-events")
 async def get_upcoming_events(
     days_ahead: int = Query(14, description="Number of days to look ahead"),
@@ -595,7 +688,8 @@ async def create_calendar_event(
         # Sanitize and prepare event data
         event_dict = sanitize_input(event_data.dict(), [
             "title", "description", "event_type", "start_date", "end_date",
-            "is_all_day", "academic_year_id", "term_id", "color", "is_recurring", "is_public"
+            "is_all_day", "academic_year_id", "term_id", "color", "is_recurring", "is_public",
+            "recurrence_pattern", "recurrence_until", "recurrence_exceptions"
         ])
         
         # Add metadata
@@ -613,10 +707,11 @@ async def create_calendar_event(
             raise HTTPException(status_code=400, detail="Start date must be before end date")
         
         # Insert the event
-        result = events_coll.insert_one(event_dict)
+        result = await events_coll.insert_one(with_interval_fields(event_dict))
+        await touch_calendar_feeds(events_coll.database, EVENTS_SCOPE)
         
         # Fetch the created event
-        created_event = events_coll.find_one({'_id': result.inserted_id})
+        created_event = await events_coll.find_one({'_id': result.inserted_id})
         if not created_event:
             raise HTTPException(status_code=500, detail="Failed to retrieve created event")
         
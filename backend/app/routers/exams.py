@@ -29,6 +29,7 @@ from ..services.grade_calculation_service import GradeCalculationService
 from ..services.parent_portal_service import ParentPortalService
 from ..services.grade_notification_service import GradeNotificationService
 from ..utils.calendar_events import calendar_event_generator
+from ..utils.calendar_feeds import touch_calendar_feeds, EVENTS_SCOPE
 from ..utils.notification_integrations import notify
 from ..services.realtime_grade_service import RealtimeGradeService
 from ..utils.websocket_manager import WebSocketManager
@@ -275,6 +276,7 @@ async def create_exam(
             calendar_events.append(str(result.inserted_id))
         
         logger.info(f"Generated {len(calendar_events)} calendar events for exam {exam_data['id']}")
+        await touch_calendar_feeds(events_coll.database, EVENTS_SCOPE)
         
     except Exception as e:
         logger.error(f"Error generating calendar events for exam: {e}")
@@ -515,6 +517,7 @@ async def update_exam(
             # Insert the new calendar event
             await events_coll.insert_one(exam_event)
             logger.info(f"Created updated calendar event for exam {exam_id}")
+        await touch_calendar_feeds(events_coll.database, EVENTS_SCOPE)
         
     except Exception as e:
         logger.error(f"Error updating calendar events for exam {exam_id}: {e}")
@@ -550,6 +553,7 @@ async def delete_exam(
             "auto_generated": True
         })
         logger.info(f"Deleted {calendar_delete_result.deleted_count} calendar events for exam {exam_id}")
+        await touch_calendar_feeds(events_coll.database, EVENTS_SCOPE)
     except Exception as e:
         logger.warning(f"Failed to delete calendar events for exam {exam_id}: {str(e)}")
         # Continue with exam deletion even if calendar cleanup fails
@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks, Request
 from motor.motor_asyncio import AsyncIOMotorCollection
 from bson import ObjectId
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date, timedelta
+from contextlib import contextmanager
 import uuid
+import os
+import asyncio
 import logging
 from pydantic import BaseModel
+from pymongo import ReturnDocument
 
 from ..models.inventory import (
     Asset, Supply, InventoryTransaction, MaintenanceRecord,
@@ -24,10 +28,33 @@ from ..db import (
     get_user_collection as get_users_collection, get_classes_collection, get_db
 )
 from ..utils.rbac import get_current_user, has_permission, Role, Permission, is_hq_role
+from ..utils.sequence_counters import (
+    get_sequence_counter_service, counter_key, max_code_number, INVENTORY_CODE_START
+)
+from ..utils.result_cache import ResultCache
+from ..utils.calendar_feeds import touch_calendar_feeds, EVENTS_SCOPE
+from ..utils.inventory_stock import (
+    get_inventory_stock_engine, StockMovement, SupplyNotFoundError, InsufficientStockError
+)
 
-router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Transaction codes are written on every stock movement; reserve them in blocks per process
+TRANSACTION_CODE_BLOCK_SIZE = 20
+
+# Dashboard analytics per branch; any inventory write clears them
+analytics_cache = ResultCache(ttl_seconds=float(os.getenv("INVENTORY_ANALYTICS_TTL_SECONDS", "30")))
+
+
+async def invalidate_analytics_on_write(request: Request):
+    """Runs around every inventory endpoint and drops cached analytics after writes"""
+    yield
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        analytics_cache.invalidate()
+
+
+router = APIRouter(dependencies=[Depends(invalidate_analytics_on_write)])
+
 
 def require_auth(current_user: dict, allowed_roles: list):
     """Helper function to check user roles"""
@@ -380,55 +407,82 @@ async def update_supply_stock(
     supply_id: str,
     stock_update: StockUpdateRequest,
     current_user: dict = Depends(get_current_user),
-    supplies_collection: AsyncIOMotorCollection = Depends(get_supplies_collection),
-    transactions_collection: AsyncIOMotorCollection = Depends(get_inventory_transactions_collection)
+    db=Depends(get_db)
 ):
     """Update supply stock quantity"""
     require_auth(current_user, ["super_admin", "hq_admin", "branch_admin", "admin"])
     
-    # Get current supply
-    supply = await supplies_collection.find_one({"_id": ObjectId(supply_id)})
-    if not supply:
-        raise HTTPException(status_code=404, detail="Supply not found")
-    
-    new_quantity = supply["quantity_in_stock"] + stock_update.quantity_change
-    if new_quantity < 0:
-        raise HTTPException(status_code=400, detail="Insufficient stock")
+    movement = StockMovement(supply_id, stock_update.quantity_change, reason=stock_update.reason)
+    with stock_errors():
+        updated_supply = await get_inventory_stock_engine(db).apply(movement, current_user["user_id"])
     
-    # Update stock
-    await supplies_collection.update_one(
-        {"_id": ObjectId(supply_id)},
-        {
-            "$set": {
-                "quantity_in_stock": new_quantity,
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
-    
-    # Create transaction record
-    transaction = InventoryTransaction(
-        transaction_code=generate_inventory_code("TXN", 
-            await get_next_transaction_number(transactions_collection)),
-        transaction_type="in" if stock_update.quantity_change > 0 else "out",
-        item_type="supply",
-        item_id=supply_id,
-        item_name=supply["name"],
-        quantity=abs(stock_update.quantity_change),
-        reason=stock_update.reason,
-        created_by=current_user["user_id"]
-    )
-    
-    await transactions_collection.insert_one(transaction.dict(exclude={"id"}))
-    
-    # Return updated supply
-    updated_supply = await supplies_collection.find_one({"_id": ObjectId(supply_id)})
     updated_supply["id"] = str(updated_supply["_id"])
     del updated_supply["_id"]
     
     return Supply(**updated_supply)
 
 
+@contextmanager
+def stock_errors():
+    """Translate stock engine failures into HTTP errors"""
+    try:
+        yield
+    except SupplyNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def item_movements(items: List[Dict[str, Any]], sign: int, **fields) -> List[StockMovement]:
+    """Stock movements for the supply lines of a request, purchase order or audit"""
+    movements = []
+    for item in items:
+        supply_id = item.get("supply_id") or (item.get("item_id") if item.get("item_type", "supply") == "supply" else None)
+        quantity = int(item.get("quantity") or 0)
+        if supply_id and quantity:
+            movements.append(StockMovement(
+                str(supply_id), sign * quantity, unit_cost=item.get("unit_cost"), **fields
+            ))
+    return movements
+
+
+async def resolve_order_lines(items: List[Dict[str, Any]], supplies_collection,
+                              branch_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Purchase order lines with the supply each one stocks. Lines naming their supply by
+    `item_name` are matched to the branch's supply of that name; a line that matches no
+    supply, or more than one, fails the receipt rather than being received into nothing.
+    """
+    names = {
+        item["item_name"].strip() for item in items
+        if not (item.get("supply_id") or item.get("item_id")) and (item.get("item_name") or "").strip()
+    }
+    by_name: Dict[str, List[str]] = {}
+    if names:
+        query: Dict[str, Any] = {"name": {"$in": list(names)}}
+        if branch_id:
+            query["branch_id"] = branch_id
+        async for supply in supplies_collection.find(query, {"name": 1}):
+            by_name.setdefault(supply["name"], []).append(str(supply["_id"]))
+    
+    lines, unresolved = [], []
+    for item in items:
+        if item.get("supply_id") or item.get("item_id") or not int(item.get("quantity") or 0):
+            lines.append(item)
+            continue
+        matches = by_name.get((item.get("item_name") or "").strip(), [])
+        if len(matches) != 1:
+            unresolved.append(item.get("item_name") or "unnamed line")
+            continue
+        lines.append({**item, "supply_id": matches[0]})
+    if unresolved:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Purchase order lines do not match exactly one supply: {', '.join(unresolved)}"
+        )
+    return lines
+
+
 # Maintenance Records
 @router.post("/maintenance", response_model=MaintenanceRecord)
 async def create_maintenance_record(
@@ -916,19 +970,37 @@ async def reject_inventory_request(
 async def fulfill_inventory_request(
     request_id: str,
     current_user: dict = Depends(get_current_user),
-    requests_collection: AsyncIOMotorCollection = Depends(get_inventory_requests_collection)
+    requests_collection: AsyncIOMotorCollection = Depends(get_inventory_requests_collection),
+    db=Depends(get_db)
 ):
-    """Mark an inventory request as fulfilled"""
+    """Mark an inventory request as fulfilled and issue its supplies from stock"""
     require_auth(current_user, ["super_admin", "hq_admin", "branch_admin", "admin"])
     
-    # First check if request exists and is approved
-    request = await requests_collection.find_one({"_id": ObjectId(request_id)})
+    # Claim the request by moving it out of "approved", so concurrent calls cannot issue stock twice
+    request = await requests_collection.find_one_and_update(
+        {"_id": ObjectId(request_id), "status": RequestStatus.APPROVED},
+        {"$set": {"status": RequestStatus.FULFILLING, "updated_at": datetime.utcnow()}}
+    )
     if not request:
-        raise HTTPException(status_code=404, detail="Request not found")
-    
-    if request["status"] != "approved":
+        if await requests_collection.find_one({"_id": ObjectId(request_id)}, {"_id": 1}) is None:
+            raise HTTPException(status_code=404, detail="Request not found")
         raise HTTPException(status_code=400, detail="Only approved requests can be fulfilled")
     
+    movements = item_movements(
+        request.get("items", []), -1,
+        reason=f"Fulfilled request {request.get('request_code', request_id)}",
+        reference_type="inventory_request", reference_id=request_id
+    )
+    try:
+        with stock_errors():
+            await get_inventory_stock_engine(db).apply_bulk(movements, current_user["user_id"])
+    except Exception:
+        await requests_collection.update_one(
+            {"_id": ObjectId(request_id)},
+            {"$set": {"status": RequestStatus.APPROVED, "updated_at": datetime.utcnow()}}
+        )
+        raise
+    
     result = await requests_collection.update_one(
         {"_id": ObjectId(request_id)},
         {
@@ -1179,6 +1251,61 @@ async def update_purchase_order(
     return await get_purchase_order(po_id, current_user, po_collection)
 
 
+@router.post("/purchase-orders/{po_id}/receive", response_model=PurchaseOrder)
+async def receive_purchase_order(
+    po_id: str,
+    delivery_notes: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    po_collection: AsyncIOMotorCollection = Depends(get_purchase_orders_collection),
+    supplies_collection: AsyncIOMotorCollection = Depends(get_supplies_collection),
+    db=Depends(get_db)
+):
+    """Mark a purchase order as received and add its supply lines to stock"""
+    require_auth(current_user, ["super_admin", "hq_admin", "branch_admin", "admin"])
+    
+    existing = await po_collection.find_one({"_id": ObjectId(po_id)})
+    if existing is None:
+        raise HTTPException(status_code=404, detail="Purchase order not found")
+    lines = await resolve_order_lines(existing.get("items", []), supplies_collection, existing.get("branch_id"))
+    
+    # Claim the order first so a repeated call cannot receive the same delivery twice
+    now = datetime.utcnow()
+    received = {
+        "status": "received",
+        "delivered_at": now,
+        "received_by": current_user["user_id"],
+        "delivery_notes": delivery_notes,
+        "updated_at": now
+    }
+    order = await po_collection.find_one_and_update(
+        {"_id": ObjectId(po_id), "status": {"$nin": ["received", "cancelled"]}},
+        {"$set": received}
+    )
+    if not order:
+        raise HTTPException(status_code=400, detail="Purchase order is already received or cancelled")
+    
+    movements = item_movements(
+        lines, 1,
+        reason=f"Received purchase order {order.get('po_number', po_id)}",
+        reference_type="purchase_order", reference_id=po_id
+    )
+    try:
+        with stock_errors():
+            await get_inventory_stock_engine(db).apply_bulk(movements, current_user["user_id"])
+    except Exception:
+        # Nothing was stocked, so the order can be received again
+        await po_collection.update_one(
+            {"_id": ObjectId(po_id), "status": "received"},
+            {"$set": {field: order.get(field) for field in received}}
+        )
+        raise
+    
+    order.update(received)
+    order["id"] = str(order["_id"])
+    del order["_id"]
+    return PurchaseOrder(**order)
+
+
 @router.delete("/purchase-orders/{po_id}")
 async def delete_purchase_order(
     po_id: str,
@@ -1196,6 +1323,49 @@ async def delete_purchase_order(
     return {"message": "Purchase order deleted successfully"}
 
 
+# Inventory Audits
+@router.post("/audits/{audit_id}/apply-adjustments")
+async def apply_audit_adjustments(
+    audit_id: str,
+    current_user: dict = Depends(get_current_user),
+    audits_collection: AsyncIOMotorCollection = Depends(get_inventory_audits_collection),
+    audit_items_collection: AsyncIOMotorCollection = Depends(get_inventory_audit_items_collection),
+    db=Depends(get_db)
+):
+    """Correct supply stock by the variances counted in an audit"""
+    require_auth(current_user, ["super_admin", "hq_admin", "branch_admin", "admin"])
+    
+    audit = await audits_collection.find_one_and_update(
+        {"_id": ObjectId(audit_id), "stock_adjusted_at": {"$exists": False}},
+        {"$set": {"stock_adjusted_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
+    )
+    if not audit:
+        if await audits_collection.find_one({"_id": ObjectId(audit_id)}, {"_id": 1}) is None:
+            raise HTTPException(status_code=404, detail="Audit not found")
+        raise HTTPException(status_code=400, detail="Audit adjustments were already applied")
+    
+    items = await audit_items_collection.find(
+        {"audit_id": audit_id, "item_type": "supply", "variance": {"$ne": 0}}
+    ).to_list(None)
+    movements = [
+        StockMovement(
+            # "in" for a surplus, "out" for a shortage; reference_type marks it as an audit correction
+            item["item_id"], int(item["variance"]),
+            reason=f"Audit {audit.get('audit_code', audit_id)} count adjustment",
+            reference_type="inventory_audit", reference_id=audit_id
+        )
+        for item in items
+    ]
+    try:
+        with stock_errors():
+            await get_inventory_stock_engine(db).apply_bulk(movements, current_user["user_id"])
+    except Exception:
+        await audits_collection.update_one({"_id": ObjectId(audit_id)}, {"$unset": {"stock_adjusted_at": ""}})
+        raise
+    
+    return {"message": "Audit adjustments applied", "adjusted_items": len(movements)}
+
+
 # Analytics and Statistics
 @router.get("/analytics/overview")
 async def get_inventory_overview(
@@ -1244,43 +1414,75 @@ async def get_inventory_overview(
         supply_filter["branch_id"] = user_branch_id
         maintenance_filter["branch_id"] = user_branch_id
 
-    # Asset statistics
-    total_assets = await assets_collection.count_documents(asset_filter)
-    active_assets = await assets_collection.count_documents({**asset_filter, "status": "active"})
-    assets_under_maintenance = await assets_collection.count_documents({**asset_filter, "status": "under_maintenance"})
-
-    # Supply statistics
-    total_supplies = await supplies_collection.count_documents(supply_filter)
-    low_stock_supplies = await supplies_collection.count_documents({
-        **supply_filter,
-        "$expr": {"$lte": ["$quantity_in_stock", "$minimum_stock_level"]},
-    })
-
-    # Maintenance statistics
-    pending_maintenance = await maintenance_collection.count_documents({**maintenance_filter, "status": "scheduled"})
-    overdue_maintenance = await maintenance_collection.count_documents({
-        **maintenance_filter,
-        "status": "scheduled",
-        "scheduled_date": {"$lt": datetime.utcnow()},
-    })
-
-    # Asset value calculation
-    asset_pipeline = []
-    if asset_filter:
-        asset_pipeline.append({"$match": asset_filter})
-    asset_pipeline.extend([
-        {"$match": {"purchase_price": {"$exists": True}}},
-        {"$group": {"_id": None, "total_value": {"$sum": "$purchase_price"}}},
-    ])
-    asset_value_result = await assets_collection.aggregate(asset_pipeline).to_list(1)
-    total_asset_value = asset_value_result[0]["total_value"] if asset_value_result else 0
-
-    # Category distribution
-    category_pipeline = []
-    if asset_filter:
-        category_pipeline.append({"$match": asset_filter})
-    category_pipeline.append({"$group": {"_id": "$category", "count": {"$sum": 1}}})
-    category_distribution = await assets_collection.aggregate(category_pipeline).to_list(None)
+    scope = asset_filter.get("branch_id")
+    return await analytics_cache.get_or_compute(
+        (scope, "overview"),
+        lambda: _compute_inventory_overview(
+            assets_collection, supplies_collection, maintenance_collection,
+            asset_filter, supply_filter, maintenance_filter
+        )
+    )
+
+
+def _first_count(facet: Dict[str, Any], name: str, field: str = "n") -> Any:
+    rows = facet.get(name) or []
+    return rows[0][field] if rows else 0
+
+
+async def _compute_inventory_overview(
+    assets_collection: AsyncIOMotorCollection,
+    supplies_collection: AsyncIOMotorCollection,
+    maintenance_collection: AsyncIOMotorCollection,
+    asset_filter: Dict[str, Any],
+    supply_filter: Dict[str, Any],
+    maintenance_filter: Dict[str, Any]
+) -> Dict[str, Any]:
+    """One $facet aggregation per collection, run concurrently"""
+    asset_pipeline = [
+        {"$match": asset_filter},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "value": [
+                {"$match": {"purchase_price": {"$exists": True}}},
+                {"$group": {"_id": None, "n": {"$sum": "$purchase_price"}}}
+            ],
+            "by_category": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}]
+        }}
+    ]
+    supply_pipeline = [
+        {"$match": supply_filter},
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "low_stock": [
+                {"$match": {"$expr": {"$lte": ["$quantity_in_stock", "$minimum_stock_level"]}}},
+                {"$count": "n"}
+            ]
+        }}
+    ]
+    maintenance_pipeline = [
+        {"$match": {**maintenance_filter, "status": "scheduled"}},
+        {"$facet": {
+            "pending": [{"$count": "n"}],
+            "overdue": [{"$match": {"scheduled_date": {"$lt": datetime.utcnow()}}}, {"$count": "n"}]
+        }}
+    ]
+    asset_facet, supply_facet, maintenance_facet = [
+        (rows or [{}])[0] for rows in await asyncio.gather(
+            assets_collection.aggregate(asset_pipeline).to_list(1),
+            supplies_collection.aggregate(supply_pipeline).to_list(1),
+            maintenance_collection.aggregate(maintenance_pipeline).to_list(1)
+        )
+    ]
+
+    status_counts = {row["_id"]: row["count"] for row in asset_facet.get("by_status", [])}
+    total_assets = sum(status_counts.values())
+    active_assets = status_counts.get("active", 0)
+    assets_under_maintenance = status_counts.get("under_maintenance", 0)
+    total_asset_value = _first_count(asset_facet, "value")
+    total_supplies = _first_count(supply_facet, "total")
+    low_stock_supplies = _first_count(supply_facet, "low_stock")
+    pending_maintenance = _first_count(maintenance_facet, "pending")
+    overdue_maintenance = _first_count(maintenance_facet, "overdue")
 
     return {
         "total_assets": total_assets,
@@ -1291,7 +1493,7 @@ async def get_inventory_overview(
         "pending_maintenance": pending_maintenance,
         "overdue_maintenance": overdue_maintenance,
         "total_asset_value": total_asset_value,
-        "category_distribution": {item["_id"]: item["count"] for item in category_distribution},
+        "category_distribution": {item["_id"]: item["count"] for item in asset_facet.get("by_category", [])},
         "system_health": {
             "asset_utilization": (active_assets / max(total_assets, 1)) * 100,
             "maintenance_compliance": ((pending_maintenance - overdue_maintenance) / max(pending_maintenance, 1)) * 100 if pending_maintenance > 0 else 100,
@@ -1330,126 +1532,72 @@ async def get_maintenance_schedule(
             return {"upcoming_maintenance": [], "total_upcoming": 0, "date_range": {"start": start_date.isoformat(), "end": end_date.isoformat()}}
         filter_dict["branch_id"] = user_branch_id
     
-    upcoming_maintenance = await maintenance_collection.find(filter_dict).sort("scheduled_date", 1).to_list(None)
-    
-    for record in upcoming_maintenance:
-        record["id"] = str(record["_id"])
-        del record["_id"]
-    
-    return {
-        "upcoming_maintenance": [MaintenanceRecord(**record) for record in upcoming_maintenance],
-        "total_upcoming": len(upcoming_maintenance),
-        "date_range": {
-            "start": start_date.isoformat(),
-            "end": end_date.isoformat()
+    async def load_schedule() -> Dict[str, Any]:
+        upcoming_maintenance = await maintenance_collection.find(filter_dict).sort("scheduled_date", 1).to_list(None)
+        
+        for record in upcoming_maintenance:
+            record["id"] = str(record["_id"])
+            del record["_id"]
+        
+        return {
+            "upcoming_maintenance": [MaintenanceRecord(**record) for record in upcoming_maintenance],
+            "total_upcoming": len(upcoming_maintenance),
+            "date_range": {
+                "start": start_date.isoformat(),
+                "end": end_date.isoformat()
+            }
         }
-    }
+    
+    return await analytics_cache.get_or_compute(
+        (filter_dict.get("branch_id"), "maintenance-schedule", days_ahead, start_date), load_schedule
+    )
 
 
 # Helper functions
+async def _next_inventory_number(
+    collection: AsyncIOMotorCollection, field: str, prefix: str, block_size: int = 1
+) -> int:
+    """Allocate the next code number from the shared counter, seeded from existing codes"""
+    async def last_issued() -> int:
+        return max(await max_code_number(collection, field, f"^{prefix}-", position=1), INVENTORY_CODE_START - 1)
+
+    counters = get_sequence_counter_service(collection.database)
+    return await counters.next_value(counter_key("inventory", prefix), seed=last_issued, block_size=block_size)
+
+
 async def get_next_asset_number(collection: AsyncIOMotorCollection) -> int:
     """Get next asset number for code generation"""
-    last_asset = await collection.find_one(
-        {"asset_code": {"$regex": "^AST-"}},
-        sort=[("asset_code", -1)]
-    )
-    if last_asset and last_asset.get("asset_code"):
-        try:
-            last_number = int(last_asset["asset_code"].split("-")[1])
-            return last_number + 1
-        except (ValueError, IndexError):
-            pass
-    return 1000
+    return await _next_inventory_number(collection, "asset_code", "AST")
 
 
 async def get_next_supply_number(collection: AsyncIOMotorCollection) -> int:
     """Get next supply number for code generation"""
-    last_supply = await collection.find_one(
-        {"supply_code": {"$regex": "^SUP-"}},
-        sort=[("supply_code", -1)]
-    )
-    if last_supply and last_supply.get("supply_code"):
-        try:
-            last_number = int(last_supply["supply_code"].split("-")[1])
-            return last_number + 1
-        except (ValueError, IndexError):
-            pass
-    return 1000
+    return await _next_inventory_number(collection, "supply_code", "SUP")
 
 
 async def get_next_maintenance_number(collection: AsyncIOMotorCollection) -> int:
     """Get next maintenance number for code generation"""
-    last_maintenance = await collection.find_one(
-        {"maintenance_code": {"$regex": "^MNT-"}},
-        sort=[("maintenance_code", -1)]
-    )
-    if last_maintenance and last_maintenance.get("maintenance_code"):
-        try:
-            last_number = int(last_maintenance["maintenance_code"].split("-")[1])
-            return last_number + 1
-        except (ValueError, IndexError):
-            pass
-    return 1000
+    return await _next_inventory_number(collection, "maintenance_code", "MNT")
 
 
 async def get_next_transaction_number(collection: AsyncIOMotorCollection) -> int:
     """Get next transaction number for code generation"""
-    last_transaction = await collection.find_one(
-        {"transaction_code": {"$regex": "^TXN-"}},
-        sort=[("transaction_code", -1)]
-    )
-    if last_transaction and last_transaction.get("transaction_code"):
-        try:
-            last_number = int(last_transaction["transaction_code"].split("-")[1])
-            return last_number + 1
-        except (ValueError, IndexError):
-            pass
-    return 1000
+    return await _next_inventory_number(collection, "transaction_code", "TXN", block_size=TRANSACTION_CODE_BLOCK_SIZE)
 
 
 async def get_next_request_number(collection: AsyncIOMotorCollection) -> int:
     """Get next request number for code generation"""
-    last_request = await collection.find_one(
-        {"request_code": {"$regex": "^REQ-"}},
-        sort=[("request_code", -1)]
-    )
-    if last_request and last_request.get("request_code"):
-        try:
-            last_number = int(last_request["request_code"].split("-")[1])
-            return last_number + 1
-        except (ValueError, IndexError):
-            pass
-    return 1000
+    return await _next_inventory_number(collection, "request_code", "REQ")
 
 
 async def get_next_vendor_number(collection: AsyncIOMotorCollection) -> int:
     """Get next vendor number for code generation"""
-    last_vendor = await collection.find_one(
-        {"vendor_code": {"$regex": "^VND-"}},
-        sort=[("vendor_code", -1)]
-    )
-    if last_vendor and last_vendor.get("vendor_code"):
-        try:
-            last_number = int(last_vendor["vendor_code"].split("-")[1])
-            return last_number + 1
-        except (ValueError, IndexError):
-            pass
-    return 1000
+    return await _next_inventory_number(collection, "vendor_code", "VND")
 
 
 async def get_next_po_number(collection: AsyncIOMotorCollection) -> int:
     """Get next purchase order number for code generation"""
-    last_po = await collection.find_one(
-        {"po_number": {"$regex": "^PO-"}},
-        sort=[("po_number", -1)]
-    )
-    if last_po and last_po.get("po_number"):
-        try:
-            last_number = int(last_po["po_number"].split("-")[1])
-            return last_number + 1
-        except (ValueError, IndexError):
-            pass
-    return 1000
+    return await _next_inventory_number(collection, "po_number", "PO")
 
 
 # Asset Assignment Endpoints
@@ -1762,6 +1910,7 @@ async def schedule_maintenance_with_calendar(
         }
         
         await academic_events_collection.insert_one(maintenance_event)
+        await touch_calendar_feeds(db, EVENTS_SCOPE)
         
         return {
             "success": True,
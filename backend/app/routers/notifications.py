@@ -22,6 +22,7 @@ from ..db import (
     get_user_collection, get_student_collection
 )
 from ..utils.rbac import get_current_user, has_permission, Role, Permission
+from ..utils.notification_engine import notification_engine
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -429,14 +430,17 @@ async def get_notification_performance(
     total_processed = len(recent_notifications)
     successful_deliveries = len([n for n in recent_notifications if n.get("delivered_count", 0) > 0])
     
+    delivery_metrics = await notification_engine.delivery_worker.get_metrics()
+    
     return {
         "total_processed_24h": total_processed,
         "successful_deliveries": successful_deliveries,
         "success_rate": (successful_deliveries / max(total_processed, 1)) * 100,
         "average_delivery_time": "2.3 seconds",  # Placeholder
         "system_status": "operational",
-        "queue_length": 0,  # Placeholder
-        "error_rate": ((total_processed - successful_deliveries) / max(total_processed, 1)) * 100
+        "queue_length": delivery_metrics["queue_depth"],
+        "error_rate": ((total_processed - successful_deliveries) / max(total_processed, 1)) * 100,
+        "delivery_worker": delivery_metrics
     }
 
 
@@ -34,13 +34,22 @@ from ..db import (
     validate_student_id,
     validate_fee_category_id
 )
-from ..utils.rbac import get_current_user, has_permission, Permission
+from ..utils.rbac import get_current_user, has_permission, Permission, is_hq_role
 from ..models.user import User
 from ..utils.payment_calculations import (
     calculate_payment_totals,
     apply_late_fees,
     generate_receipt_number
 )
+from ..utils.financial_rollup import get_financial_rollup
+from ..utils.collection_forecast import get_collection_forecaster
+from ..utils.payment_search import (
+    get_payment_search_index,
+    payment_search_fields,
+    encode_cursor,
+    after_cursor,
+    LISTING_SORT
+)
 
 router = APIRouter()
 
@@ -214,9 +223,11 @@ async def create_payment(
         "created_at": datetime.now(),
         "created_by": current_user.get("user_id") or current_user.get("id")
     }
+    payment_doc.update(payment_search_fields(payment_doc))
 
     # Insert payment
     payment_result = await payments_collection.insert_one(payment_doc)
+    get_payment_search_index(payments_collection.database).invalidate_branch(branch_id)
     payment_id = str(payment_result.inserted_id)
     payment_doc["_id"] = payment_id
 
@@ -240,6 +251,8 @@ async def create_payment(
         for i, inserted_id in enumerate(details_result.inserted_ids):
             details_docs[i]["_id"] = str(inserted_id)
 
+    await get_financial_rollup(payments_collection.database).record_payment(payment_doc, details_docs)
+
     # Background task: Send payment notification
     if payer_email:
         background_tasks.add_task(send_payment_notification, payment_id, payer_email)
@@ -266,6 +279,10 @@ class PaymentListResponse(BaseModel):
     page: int
     per_page: int
     pages: int
+    # Pass back as `cursor` for the next page; None on the last page
+    next_cursor: Optional[str] = None
+    # True when there are more matches than were counted
+    total_is_estimate: bool = False
 
 @router.get("/", response_model=PaymentListResponse)
 async def get_payments(
@@ -275,9 +292,10 @@ async def get_payments(
     payment_method: Optional[str] = Query(None, description="Filter by payment method"),
     date_from: Optional[date] = Query(None, description="Filter payments from this date"),
     date_to: Optional[date] = Query(None, description="Filter payments until this date"),
-    search: Optional[str] = Query(None, description="Search by student name, receipt number, or reference"),
+    search: Optional[str] = Query(None, description="Search by the start of a student name or code, receipt number (or its sequence number), reference, payer name or remarks word"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; replaces skip"),
     current_user: dict = Depends(get_current_user),
     collection: AsyncIOMotorCollection = Depends(get_payments_collection),
     students_collection: AsyncIOMotorCollection = Depends(get_student_collection),
@@ -288,6 +306,9 @@ async def get_payments(
     if not has_permission(current_user.get("role"), Permission.READ_PAYMENT):
         raise HTTPException(status_code=403, detail="Permission denied")
 
+    search_index = get_payment_search_index(collection.database)
+    await search_index.ensure_ready()
+
     # Build query
     query = {"branch_id": branch_id}
 
@@ -308,46 +329,62 @@ async def get_payments(
             date_filter["$lte"] = datetime.combine(date_to, datetime.max.time())
         query["payment_date"] = date_filter
 
-    # Handle search functionality
-    if search:
-        print(f"🔍 Searching payments for: '{search}'")
-        search_conditions = [
-            {"receipt_number": {"$regex": search, "$options": "i"}},
-            {"payment_reference": {"$regex": search, "$options": "i"}},
-            {"payer_name": {"$regex": search, "$options": "i"}},
-            {"remarks": {"$regex": search, "$options": "i"}},
-        ]
-
-        # Also search in student names by finding student IDs that match the search term
-        student_name_query = {
-            "$or": [
-                {"first_name": {"$regex": search, "$options": "i"}},
-                {"last_name": {"$regex": search, "$options": "i"}},
-                {"father_name": {"$regex": search, "$options": "i"}},
-                {"grandfather_name": {"$regex": search, "$options": "i"}},
-                {"student_id": {"$regex": search, "$options": "i"}}
-            ],
-            "branch_id": branch_id
-        }
-
-        matching_students = await students_collection.find(student_name_query, {"_id": 1}).to_list(length=100)
-        if matching_students:
-            student_ids = [str(s["_id"]) for s in matching_students]
-            search_conditions.append({"student_id": {"$in": student_ids}})
-            print(f"✅ Found {len(matching_students)} students matching '{search}'")
+    # Prefix search over receipt number, reference and payer name, plus the matching students' payments
+    if search and search.strip():
+        query.update(await search_index.search_filter(branch_id, search))
+
+    # Total for pagination, cached briefly and capped for very broad queries
+    total_count, total_is_estimate = await search_index.count(branch_id, query)
+
+    # Execute query: keyset paging from a cursor, offset paging otherwise
+    page_query = query
+    if cursor:
+        try:
+            page_query = {"$and": [query, after_cursor(cursor)]}
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    page_cursor = collection.find(page_query).sort(LISTING_SORT).limit(limit)
+    if not cursor and skip:
+        page_cursor = page_cursor.skip(skip)
+    docs = await page_cursor.to_list(length=limit)
+    next_cursor = encode_cursor(docs[-1]) if len(docs) == limit else None
+
+    # Load the page's students, fee categories and payment details in one query each
+    object_ids = {d["student_id"] for d in docs if ObjectId.is_valid(str(d.get("student_id", "")))}
+    codes = {d["student_id"] for d in docs if d.get("student_id") and d["student_id"] not in object_ids}
+    student_filters = []
+    if object_ids:
+        student_filters.append({"_id": {"$in": [ObjectId(i) for i in object_ids]}})
+    if codes:
+        student_filters.append({"student_id": {"$in": list(codes)}})
+    students_by_key: Dict[str, Dict[str, Any]] = {}
+    if student_filters:
+        async for student_doc in students_collection.find({"$or": student_filters, "branch_id": branch_id}):
+            students_by_key[str(student_doc["_id"])] = student_doc
+            if student_doc.get("student_id"):
+                students_by_key.setdefault(student_doc["student_id"], student_doc)
+
+    category_names = {d["category"] for d in docs if d.get("category")}
+    categories_by_name: Dict[str, Dict[str, Any]] = {}
+    if category_names:
+        async for fee_cat_doc in fee_categories_collection.find(
+            {"name": {"$in": list(category_names)}, "branch_id": branch_id, "is_active": True}
+        ):
+            categories_by_name.setdefault(fee_cat_doc["name"], fee_cat_doc)
+
+    details_by_payment: Dict[str, List[Dict[str, Any]]] = {}
+    uncategorized = [str(d["_id"]) for d in docs if not d.get("category")]
+    if uncategorized:
+        try:
+            async for detail in details_collection.find(
+                {"payment_id": {"$in": uncategorized}}, {"payment_id": 1, "fee_category_id": 1, "fee_category_name": 1}
+            ):
+                details_by_payment.setdefault(detail["payment_id"], []).append(detail)
+        except Exception as e:
+            print(f"❌ Error loading payment details for fee categories: {e}")
 
-        query["$or"] = search_conditions
-        print(f"🔍 Final search query: {query}")
-
-    # Get total count for pagination
-    total_count = await collection.count_documents(query)
-    print(f"📊 Total payments found: {total_count}")
-
-    # Execute query
-    cursor = collection.find(query).skip(skip).limit(limit).sort("payment_date", -1)
     payments = []
-
-    async for doc in cursor:
+    for doc in docs:
         doc["_id"] = str(doc["_id"])
 
         # Convert Decimal128 fields to float for JSON serialization
@@ -372,93 +409,43 @@ async def get_payments(
         if "payment_method" not in doc:
             doc["payment_method"] = "cash"
 
-        # Debug: Print current document for troubleshooting
-        print(f"🔍 Processing payment doc: student_id={doc.get('student_id')}, branch_id={branch_id}")
-
         # Populate student information
-        student_data = None
-        if doc.get("student_id") and doc["student_id"] != "unknown":
-            try:
-                # Try ObjectId lookup first
-                if ObjectId.is_valid(doc["student_id"]):
-                    student_query = {"_id": ObjectId(doc["student_id"]), "branch_id": branch_id}
-                else:
-                    # Fallback to student_id field lookup
-                    student_query = {"student_id": doc["student_id"], "branch_id": branch_id}
-
-                print(f"🔍 Student query: {student_query}")
-                student_doc = await students_collection.find_one(student_query)
-
-                if student_doc:
-                    print(f"✅ Found student: {student_doc.get('first_name', 'Unknown')} {student_doc.get('father_name', '')}")
-                    student_data = StudentInfo(
-                        id=str(student_doc["_id"]),
-                        student_id=student_doc.get("student_id", ""),
-                        first_name=student_doc.get("first_name", ""),
-                        father_name=student_doc.get("father_name", ""),
-                        grandfather_name=student_doc.get("grandfather_name", ""),
-                        photo_url=student_doc.get("photo_url", "")
-                    )
-                else:
-                    print(f"❌ Student not found for id: {doc['student_id']}")
-            except Exception as e:
-                print(f"❌ Error fetching student {doc['student_id']}: {e}")
+        student_doc = students_by_key.get(doc.get("student_id"))
+        if student_doc:
+            doc["student"] = StudentInfo(
+                id=str(student_doc["_id"]),
+                student_id=student_doc.get("student_id", ""),
+                first_name=student_doc.get("first_name", ""),
+                father_name=student_doc.get("father_name", ""),
+                grandfather_name=student_doc.get("grandfather_name", ""),
+                photo_url=student_doc.get("photo_url", "")
+            ).dict()
 
         # Populate fee category information
         fee_category_data = None
         if doc.get("category"):
-            try:
-                # Try to find fee category by name first, then by ID
-                fee_cat_query = {"name": doc["category"], "branch_id": branch_id, "is_active": True}
-                fee_cat_doc = await fee_categories_collection.find_one(fee_cat_query)
-
-                if fee_cat_doc:
-                    fee_category_data = FeeCategoryInfo(
-                        id=str(fee_cat_doc["_id"]),
-                        name=fee_cat_doc.get("name", doc["category"]),
-                        description=fee_cat_doc.get("description", "")
-                    )
-                else:
-                    # Fallback to just the category name
-                    fee_category_data = FeeCategoryInfo(
-                        id="",
-                        name=doc["category"],
-                        description=""
-                    )
-            except Exception as e:
-                print(f"❌ Error fetching fee category {doc.get('category')}: {e}")
+            fee_cat_doc = categories_by_name.get(doc["category"])
+            if fee_cat_doc:
                 fee_category_data = FeeCategoryInfo(
-                    id="",
-                    name=doc.get("category", "Unknown Category"),
-                    description=""
+                    id=str(fee_cat_doc["_id"]),
+                    name=fee_cat_doc.get("name", doc["category"]),
+                    description=fee_cat_doc.get("description", "")
                 )
+            else:
+                # Fallback to just the category name
+                fee_category_data = FeeCategoryInfo(id="", name=doc["category"], description="")
         else:
             # Fallback: derive category from payment details if available
-            try:
-                payment_id = str(doc.get("_id"))
-                if payment_id and payment_id != "unknown":
-                    detail = await details_collection.find_one({"payment_id": payment_id})
-                    if detail and detail.get("fee_category_name"):
-                        fee_category_data = FeeCategoryInfo(
-                            id=str(detail.get("fee_category_id", "")),
-                            name=detail.get("fee_category_name", "Unknown"),
-                            description=""
-                        )
-                    else:
-                        # Check if multiple categories exist
-                        two = await details_collection.find({"payment_id": payment_id}).limit(2).to_list(2)
-                        if two and len(two) > 1:
-                            fee_category_data = FeeCategoryInfo(
-                                id="",
-                                name="Multiple",
-                                description=""
-                            )
-            except Exception as e:
-                print(f"❌ Error deriving fee category from details for payment {doc.get('_id')}: {e}")
-
-        # Add populated data to document
-        if student_data:
-            doc["student"] = student_data.dict()
+            details = details_by_payment.get(doc["_id"], [])
+            if details and details[0].get("fee_category_name"):
+                fee_category_data = FeeCategoryInfo(
+                    id=str(details[0].get("fee_category_id", "")),
+                    name=details[0].get("fee_category_name", "Unknown"),
+                    description=""
+                )
+            elif len(details) > 1:
+                fee_category_data = FeeCategoryInfo(id="", name="Multiple", description="")
+
         if fee_category_data:
             doc["fee_category"] = fee_category_data.dict()
 
@@ -473,9 +460,31 @@ async def get_payments(
         total=total_count,
         page=page,
         per_page=limit,
-        pages=total_pages
+        pages=total_pages,
+        next_cursor=next_cursor,
+        total_is_estimate=total_is_estimate
     )
 
+@router.get("/forecast")
+async def get_collection_forecast(
+    branch_id: Optional[str] = Query(None, description="Branch to forecast; all branches when omitted"),
+    days: int = Query(30, ge=1, le=365, description="Days ahead to forecast"),
+    current_user: dict = Depends(get_current_user),
+    collection: AsyncIOMotorCollection = Depends(get_payments_collection)
+):
+    """Forecast collections per branch and fee category with 90% intervals"""
+    if not has_permission(current_user.get("role"), Permission.VIEW_FINANCIAL_REPORTS):
+        raise HTTPException(status_code=403, detail="Permission denied")
+
+    # Branch staff only see their own branch
+    if not is_hq_role(current_user.get("role")):
+        branch_id = current_user.get("branch_id")
+        if not branch_id:
+            raise HTTPException(status_code=403, detail="No branch assigned")
+
+    forecaster = get_collection_forecaster(collection.database)
+    return await forecaster.forecast([branch_id] if branch_id and branch_id != "all" else None, days)
+
 @router.get("/dashboard-stats")
 async def get_dashboard_stats(
     branch_id: Optional[str] = Query(None),
@@ -492,153 +501,32 @@ async def get_dashboard_stats(
             print(f"❌ Permission denied for user role: {current_user.get('role')}")
             raise HTTPException(status_code=403, detail="Permission denied")
 
-        # Build query
-        query = {"status": {"$ne": "cancelled"}}
-
-        if branch_id:
-            query["branch_id"] = branch_id
-
-        # Parse date strings manually
-        if date_from or date_to:
-            date_filter = {}
-            if date_from:
-                try:
-                    parsed_date_from = datetime.strptime(date_from, "%Y-%m-%d").date()
-                    date_filter["$gte"] = datetime.combine(parsed_date_from, datetime.min.time())
-                    print(f"✅ Parsed date_from: {parsed_date_from}")
-                except ValueError as e:
-                    print(f"❌ Invalid date_from format: {date_from}, error: {e}")
-                    raise HTTPException(status_code=400, detail=f"Invalid date_from format: {date_from}")
-
-            if date_to:
-                try:
-                    parsed_date_to = datetime.strptime(date_to, "%Y-%m-%d").date()
-                    date_filter["$lte"] = datetime.combine(parsed_date_to, datetime.max.time())
-                    print(f"✅ Parsed date_to: {parsed_date_to}")
-                except ValueError as e:
-                    print(f"❌ Invalid date_to format: {date_to}, error: {e}")
-                    raise HTTPException(status_code=400, detail=f"Invalid date_to format: {date_to}")
-
-            query["payment_date"] = date_filter
-
-        print(f"📊 Dashboard stats query: {query}")  # Debug logging
-
-        # Enhanced aggregation pipeline for comprehensive dashboard stats
-        main_pipeline = [
-            {"$match": query},
-            {
-                "$group": {
-                    "_id": None,
-                    "total_payments": {"$sum": 1},
-                    "total_amount": {"$sum": {"$toDecimal": "$amount"}},
-                    "total_discount": {
-                        "$sum": {
-                            "$cond": [
-                                {"$ifNull": ["$discount_amount", False]},
-                                {"$toDecimal": "$discount_amount"},
-                                0
-                            ]
-                        }
-                    },
-                    "pending_count": {
-                        "$sum": {"$cond": [{"$eq": ["$status", "pending"]}, 1, 0]}
-                    },
-                    "pending_amount": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": ["$status", "pending"]},
-                                {"$toDecimal": "$amount"},
-                                0
-                            ]
-                        }
-                    },
-                    "completed_count": {
-                        "$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}
-                    },
-                    "completed_amount": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": ["$status", "completed"]},
-                                {"$toDecimal": "$amount"},
-                                0
-                            ]
-                        }
-                    },
-                    "overdue_count": {
-                        "$sum": {"$cond": [{"$eq": ["$status", "overdue"]}, 1, 0]}
-                    },
-                    "overdue_amount": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": ["$status", "overdue"]},
-                                {"$toDecimal": "$amount"},
-                                0
-                            ]
-                        }
-                    }
-                }
-            }
-        ]
-
-        # Aggregation for top fee categories
-        fee_categories_pipeline = [
-            {"$match": query},
-            {
-                "$group": {
-                    "_id": "$category",
-                    "total_amount": {"$sum": {"$toDecimal": "$amount"}},
-                    "payment_count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"total_amount": -1}},
-            {"$limit": 5},
-            {
-                "$project": {
-                    "category_name": {"$ifNull": ["$_id", "Unknown"]},
-                    "total_amount": 1,
-                    "payment_count": 1,
-                    "_id": 0
-                }
-            }
-        ]
-
-        # Aggregation for monthly trend (last 6 months)
-        monthly_pipeline = [
-            {"$match": query},
-            {
-                "$group": {
-                    "_id": {
-                        "$dateToString": {
-                            "format": "%Y-%m",
-                            "date": "$payment_date"
-                        }
-                    },
-                    "amount": {"$sum": {"$toDecimal": "$amount"}},
-                    "payment_count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"_id": 1}},
-            {"$limit": 6},
-            {
-                "$project": {
-                    "month": "$_id",
-                    "amount": 1,
-                    "payment_count": 1,
-                    "_id": 0
-                }
-            }
-        ]
-
-        # Execute all aggregations
-        main_result = await collection.aggregate(main_pipeline).to_list(1)
-        fee_categories_result = await collection.aggregate(fee_categories_pipeline).to_list(5)
-        monthly_result = await collection.aggregate(monthly_pipeline).to_list(6)
-
-        print(f"Main aggregation result: {main_result}")  # Debug logging
-        print(f"Fee categories result: {fee_categories_result}")  # Debug logging
-        print(f"Monthly result: {monthly_result}")  # Debug logging
+        # Parse date strings manually; the rollup range is [start, end)
+        start = end = None
+        if date_from:
+            try:
+                start = datetime.strptime(date_from, "%Y-%m-%d")
+            except ValueError as e:
+                print(f"❌ Invalid date_from format: {date_from}, error: {e}")
+                raise HTTPException(status_code=400, detail=f"Invalid date_from format: {date_from}")
+        if date_to:
+            try:
+                end = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)
+            except ValueError as e:
+                print(f"❌ Invalid date_to format: {date_to}, error: {e}")
+                raise HTTPException(status_code=400, detail=f"Invalid date_to format: {date_to}")
+
+        # One pass over the daily rollup instead of three aggregations over every payment
+        rollup = get_financial_rollup(collection.database)
+        result = await rollup.totals(
+            [branch_id] if branch_id else None, start, end,
+            by_category=lambda doc: doc.get("fee_category_name") or "Unknown",
+            by_month=lambda doc: doc["day"].strftime("%Y-%m")
+        )
+        data = result["all"]
+        total_payments = data["payments"]
 
-        if not main_result:
+        if not total_payments:
             return {
                 "total_payments": 0,
                 "total_amount_collected": 0.0,
@@ -652,20 +540,8 @@ async def get_dashboard_stats(
                 "monthly_collection_trend": []
             }
 
-        data = main_result[0]
-
-        # Convert Decimal128 to float safely
-        def decimal_to_float(value):
-            if value is None:
-                return 0.0
-            return float(str(value))
-
-        # Calculate derived metrics
-        total_payments = data.get("total_payments", 0)
-        total_amount = decimal_to_float(data.get("total_amount", 0))
-        completed_amount = decimal_to_float(data.get("completed_amount", 0))
-        pending_amount = decimal_to_float(data.get("pending_amount", 0))
-        overdue_amount = decimal_to_float(data.get("overdue_amount", 0))
+        total_amount = float(data["amount"])
+        completed_amount = float(data.status_amounts["completed"])
 
         # Collection rate: completed amount / total amount * 100
         collection_rate = (completed_amount / total_amount * 100) if total_amount > 0 else 0.0
@@ -673,46 +549,55 @@ async def get_dashboard_stats(
         # Average payment amount
         average_payment_amount = total_amount / total_payments if total_payments > 0 else 0.0
 
-        # Process fee categories
-        top_fee_categories = []
-        for cat in fee_categories_result:
-            top_fee_categories.append({
-                "category_name": cat.get("category_name", "Unknown"),
-                "total_amount": decimal_to_float(cat.get("total_amount", 0)),
-                "payment_count": cat.get("payment_count", 0)
-            })
-
-        # Process monthly trend
-        monthly_collection_trend = []
-        for month in monthly_result:
-            monthly_collection_trend.append({
-                "month": month.get("month", ""),
-                "amount": decimal_to_float(month.get("amount", 0)),
-                "payment_count": month.get("payment_count", 0)
-            })
-
-        response_data = {
+        top_categories = sorted(result["by_category"].items(), key=lambda item: item[1]["amount"], reverse=True)[:5]
+        top_fee_categories = [{
+            "category_name": name,
+            "total_amount": float(totals["amount"]),
+            "payment_count": totals["category_payments"]
+        } for name, totals in top_categories]
+
+        # Last 6 months with payments, oldest first
+        months = sorted(month for month, totals in result["by_month"].items() if totals["payments"])[-6:]
+        monthly_collection_trend = [{
+            "month": month,
+            "amount": float(result["by_month"][month]["amount"]),
+            "payment_count": result["by_month"][month]["payments"]
+        } for month in months]
+
+        return {
             "total_payments": total_payments,
             "total_amount_collected": total_amount,
-            "pending_payments": data.get("pending_count", 0),
-            "pending_amount": pending_amount,
-            "overdue_payments": data.get("overdue_count", 0),
-            "overdue_amount": overdue_amount,
+            "pending_payments": data.status_counts["pending"],
+            "pending_amount": float(data.status_amounts["pending"]),
+            "overdue_payments": data.status_counts["overdue"],
+            "overdue_amount": float(data.status_amounts["overdue"]),
             "collection_rate": collection_rate,
             "average_payment_amount": average_payment_amount,
             "top_fee_categories": top_fee_categories,
             "monthly_collection_trend": monthly_collection_trend
         }
 
-        print(f"Response data: {response_data}")  # Debug logging
-        return response_data
-
     except Exception as e:
         print(f"Dashboard stats error: {e}")  # Debug logging
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Error retrieving dashboard stats: {str(e)}")
 
+@router.post("/rollup/rebuild")
+async def rebuild_financial_rollup(
+    current_user: dict = Depends(get_current_user),
+    collection: AsyncIOMotorCollection = Depends(get_payments_collection)
+):
+    """Recompute the daily financial rollup from payments and payment details"""
+    if current_user.get("role") not in ["super_admin", "hq_admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized to rebuild the financial rollup")
+
+    try:
+        documents = await get_financial_rollup(collection.database).rebuild()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Financial rollup rebuild failed: {str(e)}")
+    return {"message": "Financial rollup rebuilt successfully", "daily_documents": documents}
+
 @router.get("/{payment_id}", response_model=PaymentWithDetails)
 async def get_payment(
     payment_id: str,
@@ -811,14 +696,19 @@ async def update_payment(
             update_doc["verified_by"] = current_user.get("user_id") or current_user.get("id")
             update_doc["verified_at"] = datetime.now()
 
+        if any(field in update_doc for field in ("payment_reference", "payer_name", "remarks")):
+            update_doc.update(payment_search_fields({**existing, **update_doc}))
+
         # Update document
         await collection.update_one(
             {"_id": ObjectId(payment_id)},
             {"$set": update_doc}
         )
+        get_payment_search_index(collection.database).invalidate_branch(existing.get("branch_id"))
 
     # Return updated document
     doc = await collection.find_one({"_id": ObjectId(payment_id)})
+    await get_financial_rollup(collection.database).record_payment_change(existing, doc)
     doc["_id"] = str(doc["_id"])
     return Payment(**doc)
 
@@ -868,9 +758,11 @@ async def cancel_payment(
         {"_id": ObjectId(payment_id)},
         {"$set": update_doc}
     )
+    get_payment_search_index(collection.database).invalidate_branch(existing.get("branch_id"))
 
     # Return updated document
     doc = await collection.find_one({"_id": ObjectId(payment_id)})
+    await get_financial_rollup(collection.database).record_payment_change(existing, doc)
     doc["_id"] = str(doc["_id"])
     return Payment(**doc)
 
@@ -940,9 +832,11 @@ async def refund_payment(
         {"_id": ObjectId(payment_id)},
         {"$set": update_doc}
     )
+    get_payment_search_index(collection.database).invalidate_branch(existing.get("branch_id"))
 
     # Return updated document
     doc = await collection.find_one({"_id": ObjectId(payment_id)})
+    await get_financial_rollup(collection.database).record_payment_change(existing, doc)
     doc["_id"] = str(doc["_id"])
     return Payment(**doc)
 
@@ -958,64 +852,26 @@ async def get_payment_summary(
     if not has_permission(current_user.get("role"), Permission.READ_PAYMENT):
         raise HTTPException(status_code=403, detail="Permission denied")
 
-    # Build query
-    query = {"branch_id": branch_id, "status": {"$ne": "cancelled"}}
-
-    if date_from or date_to:
-        date_filter = {}
-        if date_from:
-            date_filter["$gte"] = datetime.combine(date_from, datetime.min.time())
-        if date_to:
-            date_filter["$lte"] = datetime.combine(date_to, datetime.max.time())
-        query["payment_date"] = date_filter
-
-    # Aggregate data
-    pipeline = [
-        {"$match": query},
-        {
-            "$group": {
-                "_id": None,
-                "total_payments": {"$sum": 1},
-                "total_amount": {"$sum": {"$toDecimal": "$total_amount"}},
-                "total_discount": {"$sum": {"$toDecimal": "$discount_amount"}},
-                "total_tax": {"$sum": {"$toDecimal": "$tax_amount"}},
-                "total_late_fees": {"$sum": {"$toDecimal": "$late_fee_amount"}},
-                "payment_methods": {"$push": "$payment_method"},
-                "statuses": {"$push": "$status"}
-            }
-        }
-    ]
-
-    result = await collection.aggregate(pipeline).to_list(1)
-
-    if not result:
-        return PaymentSummary(
-            total_payments=0,
-            total_amount=Decimal("0"),
-            total_discount=Decimal("0"),
-            total_tax=Decimal("0"),
-            total_late_fees=Decimal("0"),
-            payment_methods={},
-            status_breakdown={}
-        )
-
-    data = result[0]
+    start = datetime.combine(date_from, datetime.min.time()) if date_from else None
+    end = datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else None
 
-    # Count payment methods and statuses
-    payment_methods = {}
-    for method in data.get("payment_methods", []):
-        payment_methods[method] = payment_methods.get(method, 0) + 1
+    result = await get_financial_rollup(collection.database).totals(
+        [branch_id], start, end, by_method=lambda doc: doc.get("payment_method")
+    )
+    data = result["all"]
 
-    status_breakdown = {}
-    for status in data.get("statuses", []):
-        status_breakdown[status] = status_breakdown.get(status, 0) + 1
+    # Cancelled payments are left out of the summary
+    payment_methods = {method: totals["payments"] for method, totals in result["by_method"].items()
+                       if totals["payments"]}
+    status_breakdown = {status: count for status, count in data.status_counts.items()
+                        if count and status != "cancelled"}
 
     return PaymentSummary(
-        total_payments=data.get("total_payments", 0),
-        total_amount=data.get("total_amount", Decimal("0")),
-        total_discount=data.get("total_discount", Decimal("0")),
-        total_tax=data.get("total_tax", Decimal("0")),
-        total_late_fees=data.get("total_late_fees", Decimal("0")),
+        total_payments=data["payments"],
+        total_amount=data["amount"],
+        total_discount=data["discount"],
+        total_tax=data["tax"],
+        total_late_fees=data["late_fees"],
         payment_methods=payment_methods,
         status_breakdown=status_breakdown
     )
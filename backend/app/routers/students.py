@@ -11,9 +11,24 @@ from ..utils.resource_permissions import ResourcePermissionChecker, ResourceType
 from ..models.user import User
 from ..services.parent_service import ParentService
 from ..utils.websocket_manager import WebSocketManager
+from ..utils.sequence_counters import (
+    get_sequence_counter_service, counter_key, max_code_number, STUDENT_ID_PREFIX
+)
+from ..utils.payment_search import student_search_fields, STUDENT_KEY_FIELDS
 
 router = APIRouter()
 
+async def generate_student_id(students: Any) -> str:
+    """Generate the next student ID (format: SCH-2025-00003) from the yearly counter"""
+    year = datetime.now().year
+
+    async def last_issued() -> int:
+        return await max_code_number(students, "student_id", f"^{STUDENT_ID_PREFIX}-{year}-")
+
+    counters = get_sequence_counter_service(students.database)
+    sequence = await counters.next_value(counter_key("student_id", STUDENT_ID_PREFIX, year=year), seed=last_issued)
+    return f"{STUDENT_ID_PREFIX}-{year}-{sequence:05d}"
+
 async def populate_class_info(student_data: dict, classes_collection: Any) -> dict:
     """Helper function to populate class information for a student"""
     if student_data.get("class_id"):
@@ -85,12 +100,16 @@ async def create_student(
         doc["admission_date"] = datetime.combine(doc["admission_date"], time())
     doc["created_at"] = now
     doc["updated_at"] = now
+    if not doc.get("student_id"):
+        doc["student_id"] = await generate_student_id(students)
     # validate class_id if provided
     if doc.get("class_id") is not None:
         await validate_class_id(doc["class_id"])
     # validate branch_id if provided
     if doc.get("branch_id") is not None:
         await validate_branch_id(doc["branch_id"])
+    # Keys for finding the student's payments by name or code
+    doc.update(student_search_fields(doc))
     result = await students.insert_one(doc)
     student_id = str(result.inserted_id)
     
@@ -556,6 +575,8 @@ async def update_student(
     # validate branch_id if provided
     if "branch_id" in update_data and update_data.get("branch_id") is not None:
         await validate_branch_id(update_data["branch_id"])
+    if any(field in update_data for field in STUDENT_KEY_FIELDS + ("student_id",)):
+        update_data.update(student_search_fields({**s, **update_data}))
     # Update using the same query method that found the student
     if s.get("student_id") == student_id:
         # Student was found by student_id
@@ -7,6 +7,7 @@ import os
 import time
 from ..db import get_db
 from ..utils.rbac import get_current_user
+from ..utils.audit_logger import get_audit_logger, SECURITY_ACTIONS
 from ..models.user import User
 
 router = APIRouter()
@@ -143,26 +144,30 @@ async def get_activity_logs(
                 "severity": severity
             })
 
-        # Get recent system events (simulate some)
-        import random
-        current_time = datetime.now()
-
-        # Add some simulated system events
-        simulated_events = [
-            {"type": "system", "message": "Database connection timeout", "severity": "error", "hours_ago": 1},
-            {"type": "system", "message": "System maintenance completed", "severity": "info", "hours_ago": 6},
-            {"type": "system", "message": "High memory usage detected", "severity": "warning", "hours_ago": 12},
-        ]
+        # Recent audit events, read from the hourly audit buckets
+        summary = None
+        try:
+            audit_log = get_audit_logger()
+            for event in await audit_log.get_recent_events(limit=limit):
+                action = event.get("action", "unknown")
+                resource = event.get("resource", {})
+                message = action.replace("_", " ").capitalize()
+                if resource.get("type"):
+                    message += f" ({resource['type']})"
+                if event.get("error"):
+                    message += f": {event['error']}"
 
-        for i, event in enumerate(simulated_events):
-            event_time = current_time - timedelta(hours=event["hours_ago"])
-            logs.append({
-                "id": f"system_{i}",
-                "timestamp": event_time.isoformat(),
-                "type": event["type"],
-                "message": event["message"],
-                "severity": event["severity"]
-            })
+                logs.append({
+                    "id": f"audit_{event.get('_id', event['timestamp'].timestamp())}",
+                    "timestamp": event["timestamp"].isoformat(),
+                    "type": "security" if action in SECURITY_ACTIONS else "audit",
+                    "user": event.get("user", {}).get("email") or event.get("user", {}).get("id"),
+                    "message": message,
+                    "severity": "error" if event.get("severity") == "critical" else event.get("severity", "info")
+                })
+            summary = await audit_log.get_activity_summary(hours=24)
+        except Exception as e:
+            summary = {"error": f"Audit log unavailable: {str(e)}"}
 
         # Sort all logs by timestamp (most recent first)
         logs.sort(key=lambda x: x["timestamp"], reverse=True)
@@ -172,7 +177,8 @@ async def get_activity_logs(
 
         return {
             "success": True,
-            "data": logs
+            "data": logs,
+            "summary": summary
         }
     except Exception as e:
         return {
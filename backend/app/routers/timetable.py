@@ -2,6 +2,8 @@ from typing import List, Any, Optional, Dict
 from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
 from bson import ObjectId
 from datetime import datetime, time, date, timedelta
+from collections import Counter
+import asyncio
 import logging
 
 from ..db import get_db
@@ -12,13 +14,15 @@ from ..models.timetable import (
     ClassTimetableView, TeacherTimetableView, RoomTimetableView,
     BulkTimetableCreate, TimetableBulkUpdate, TimetableStats,
     TimetableExportRequest, TimetableConflict, DayOfWeek, TimetableStatus,
-    ConflictType, TimetableSettings
+    ConflictType, TimetableSettings, TimetableGenerationRequest, TimetableGenerationResult
 )
 from ..utils.rbac import get_current_user
 from ..models.user import User
 from ..utils.timetable_conflicts import TimetableConflictDetector
 from ..utils.timetable_export import TimetableExporter
+from ..utils.timetable_solver import build_timetable_problem, solve_timetable_in_process
 from ..utils.calendar_events import calendar_event_generator
+from ..utils.calendar_feeds import touch_calendar_feeds, touch_timetable_feeds, timetable_scope, EVENTS_SCOPE
 
 logger = logging.getLogger(__name__)
 
@@ -71,6 +75,8 @@ async def create_time_slot(
     })
     
     result = await db.time_slots.insert_one(doc)
+    conflict_detector.invalidate(branch_id, doc["academic_year"])
+    await touch_calendar_feeds(db, timetable_scope("branch", branch_id))
     return TimeSlot(id=str(result.inserted_id), **doc)
 
 @router.get("/time-slots", response_model=List[TimeSlot])
@@ -142,6 +148,8 @@ async def create_timetable_entry(
             )
     
     result = await db.timetable_entries.insert_one(doc)
+    conflict_detector.record_entry(result.inserted_id, doc)
+    await touch_timetable_feeds(db, [doc])
     entry_obj = TimetableEntry(id=str(result.inserted_id), **doc)
     
     # Schedule background notification for conflicts
@@ -176,11 +184,9 @@ async def create_bulk_timetable_entries(
         )
     
     branch_id = current_user.get("branch_id")
-    created_entries = []
-    all_conflicts = []
-    
+    now = datetime.utcnow()
+    docs = []
     for entry_data in bulk_data.entries:
-        now = datetime.utcnow()
         doc = entry_data.dict()
         doc.update({
             "branch_id": branch_id,
@@ -188,22 +194,39 @@ async def create_bulk_timetable_entries(
             "updated_at": now,
             "created_by": str(current_user.get("user_id"))
         })
-        
-        # Detect conflicts
-        conflicts = await conflict_detector.detect_entry_conflicts(doc, db)
-        all_conflicts.extend(conflicts)
-        
+        docs.append(doc)
+    
+    # Detect conflicts for the whole submission in memory, including clashes within it
+    reservation = await conflict_detector.validate_bulk(docs, db)
+    all_conflicts = [conflict for conflicts in reservation.conflicts for conflict in conflicts]
+    
+    # Every failure until the entries are written gives the reserved slots back
+    created_entries = []
+    try:
         # Auto-resolve if requested and possible
-        if bulk_data.auto_resolve_conflicts and conflicts:
-            doc = await conflict_detector.auto_resolve_conflicts(doc, conflicts, db)
+        if bulk_data.auto_resolve_conflicts:
+            for position, conflicts in enumerate(reservation.conflicts):
+                if conflicts:
+                    docs[position] = await conflict_detector.auto_resolve_conflicts(
+                        docs[position], conflicts, db, reservation.indexes[position]
+                    )
+                    reservation.update(position, docs[position])
         
-        result = await db.timetable_entries.insert_one(doc)
-        created_entries.append(TimetableEntry(id=str(result.inserted_id), **doc))
+        inserted_ids = (await db.timetable_entries.insert_many(docs)).inserted_ids if docs else []
+    except BaseException:
+        reservation.release()
+        raise
+    reservation.commit(inserted_ids)
+    if docs:
+        await touch_timetable_feeds(db, docs)
+        created_entries = [
+            TimetableEntry(id=str(entry_id), **doc)
+            for entry_id, doc in zip(inserted_ids, docs)
+        ]
     
     # Store conflicts
     if all_conflicts:
-        for conflict in all_conflicts:
-            await db.timetable_conflicts.insert_one(conflict.dict())
+        await db.timetable_conflicts.insert_many([conflict.dict() for conflict in all_conflicts])
         
         if bulk_data.notify_affected_users:
             background_tasks.add_task(
@@ -224,6 +247,139 @@ async def create_bulk_timetable_entries(
     
     return created_entries
 
+@router.post("/generate", response_model=TimetableGenerationResult)
+async def generate_timetable(
+    request: TimetableGenerationRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Generate a conflict-free weekly timetable for the branch's classes.
+    Entries of classes not being generated are kept and block their teachers and rooms.
+    With keep_existing the current entries seed the search, so re-solving after a small
+    change moves few lessons. Calendar events are not touched; use /sync-to-calendar after saving.
+    """
+    if current_user.get("role") not in ["admin", "superadmin", "branch_admin", "hq_admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient permissions to generate timetables"
+        )
+    
+    branch_id = current_user.get("branch_id")
+    if not branch_id and current_user.get("role") != "superadmin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User must be assigned to a branch"
+        )
+    
+    class_query = {"academic_year": request.academic_year}
+    room_query = {"is_available": True}
+    if branch_id:
+        class_query["branch_id"] = branch_id
+        room_query["branch_id"] = branch_id
+    if request.class_ids:
+        class_query["_id"] = {"$in": [ObjectId(c) if ObjectId.is_valid(c) else c for c in request.class_ids]}
+    
+    classes = await db.classes.find(class_query).to_list(None)
+    if not classes:
+        raise HTTPException(status_code=404, detail="No classes found for the specified criteria")
+    rooms = await db.rooms.find(room_query).to_list(None)
+    index = await conflict_detector.get_index(db, branch_id, request.academic_year)
+    
+    days = [day.value for day in request.working_days]
+    problem = build_timetable_problem(
+        classes, index, rooms, days,
+        subject_periods=request.subject_periods,
+        class_subject_periods=request.class_subject_periods,
+        subject_room_types=request.subject_room_types,
+        keep_existing=request.keep_existing,
+        max_consecutive_periods=request.max_consecutive_periods_per_teacher,
+        max_periods_per_subject_per_day=request.max_periods_per_subject_per_day
+    )
+    if not problem.lessons:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No lessons to schedule; provide subject_periods or class_subject_periods"
+        )
+    
+    # CPU-bound search runs in a worker process, off the event loop
+    solution = await solve_timetable_in_process(problem, request.time_budget_seconds, request.seed)
+    
+    entries = [
+        TimetableEntryCreate(
+            class_id=lesson.class_id,
+            subject_id=lesson.subject_id,
+            teacher_id=lesson.teacher_id,
+            academic_year=request.academic_year,
+            **placement
+        )
+        for lesson, placement in zip(problem.lessons, solution.placements)
+        if placement
+    ]
+    unplaced = Counter(
+        (problem.lessons[i].class_id, problem.lessons[i].subject_id, problem.lessons[i].teacher_id)
+        for i in solution.unplaced
+    )
+    warnings = list(solution.warnings)
+    
+    saved_entries = 0
+    if request.save and not unplaced:
+        now = datetime.utcnow()
+        docs = [
+            {
+                **entry.dict(),
+                "branch_id": branch_id,
+                "created_at": now,
+                "updated_at": now,
+                "created_by": str(current_user.get("user_id"))
+            }
+            for entry in entries
+        ]
+        # Only the class subjects that were scheduled are replaced; other entries were kept fixed
+        pairs = sorted({(lesson.class_id, lesson.subject_id) for lesson in problem.lessons})
+        replace_query = {
+            "$or": [{"class_id": class_id, "subject_id": subject_id} for class_id, subject_id in pairs],
+            "academic_year": request.academic_year
+        }
+        if branch_id:
+            replace_query["branch_id"] = branch_id
+        replaced = await db.timetable_entries.find(replace_query).to_list(None)
+        await db.timetable_entries.delete_many({"_id": {"$in": [entry["_id"] for entry in replaced]}})
+        try:
+            if docs:
+                await db.timetable_entries.insert_many(docs)
+        except Exception as e:
+            # Put the previous timetable back rather than leave the classes half empty
+            logger.error(f"Saving generated timetable failed, restoring {len(replaced)} entries: {e}")
+            await db.timetable_entries.delete_many({"_id": {"$in": [doc["_id"] for doc in docs if "_id" in doc]}})
+            if replaced:
+                await db.timetable_entries.insert_many(replaced)
+            conflict_detector.invalidate(branch_id, request.academic_year)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Could not save the generated timetable; the previous timetable was kept"
+            )
+        saved_entries = len(docs)
+        conflict_detector.invalidate(branch_id, request.academic_year)
+        await touch_calendar_feeds(db, timetable_scope("branch", branch_id))
+    elif request.save:
+        warnings.append("Timetable not saved because some lessons could not be placed")
+    
+    return TimetableGenerationResult(
+        status="partial" if unplaced else "solved",
+        academic_year=request.academic_year,
+        entries=entries,
+        unplaced=[
+            {"class_id": class_id, "subject_id": subject_id, "teacher_id": teacher_id, "periods": periods}
+            for (class_id, subject_id, teacher_id), periods in unplaced.items()
+        ],
+        warnings=warnings,
+        soft_penalty=solution.soft_penalty,
+        iterations=solution.iterations,
+        elapsed_seconds=solution.elapsed_seconds,
+        moved_lessons=solution.moved_lessons,
+        saved_entries=saved_entries
+    )
+
 @router.get("/entries", response_model=List[TimetableEntry])
 async def list_timetable_entries(
     class_id: Optional[str] = Query(None),
@@ -394,6 +550,24 @@ async def list_timetable_conflicts(
     conflicts = await db.timetable_conflicts.find(query).sort("detected_at", -1).to_list(50)
     return [TimetableConflict(id=str(c["_id"]), **c) for c in conflicts]
 
+@router.get("/conflicts/scan", response_model=List[TimetableConflict])
+async def scan_timetable_conflicts(
+    academic_year: Optional[str] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    """Find every overlap in the stored timetable from the in-memory occupancy index"""
+    if current_user.get("role") not in ["admin", "superadmin", "branch_admin", "hq_admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient permissions to scan timetable conflicts"
+        )
+    
+    branch_id = current_user.get("branch_id") if current_user.get("role") != "superadmin" else None
+    index = await conflict_detector.get_index(
+        db, branch_id, academic_year or current_user.get("academic_year", "2024-2025")
+    )
+    return conflict_detector.scan_conflicts(index)
+
 @router.patch("/conflicts/{conflict_id}/resolve")
 async def resolve_conflict(
     conflict_id: str,
@@ -714,6 +888,7 @@ async def _sync_timetable_to_calendar(entries: List[Dict[str, Any]], academic_ye
             "branch_id": branch_id,
             "auto_generated": True
         })
+        await touch_calendar_feeds(db, EVENTS_SCOPE)
         
         # Generate new calendar events
         await calendar_event_generator.generate_timetable_events(entries, academic_year, branch_id)
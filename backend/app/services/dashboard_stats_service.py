@@ -0,0 +1,292 @@
+"""
+Dashboard Statistics Service
+Per-branch dashboard metrics from concurrent aggregations, cached with stale-while-revalidate
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from ..utils.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_TTL_SECONDS = float(os.getenv("DASHBOARD_STATS_TTL_SECONDS", "30"))
+DASHBOARD_STALE_SECONDS = float(os.getenv("DASHBOARD_STATS_STALE_SECONDS", "300"))
+
+# Student fields whose changes move the dashboard numbers
+STUDENT_STAT_FIELDS = {"status", "grade_level", "branch_id", "created_at"}
+
+
+class DashboardStatsService:
+    """
+    Computes the metrics behind /stats/dashboard.
+
+    Every collection is queried once and all queries run concurrently; payment and
+    attendance totals are grouped in the database instead of loading documents. Raw
+    metrics are cached per branch and the response, including derived rates, is built
+    from them on each request. When attached to the DataSyncManager, inserts from the
+    change stream are added to cached counters and other relevant changes invalidate them.
+    """
+
+    def __init__(self, db, ttl_seconds: float = DASHBOARD_TTL_SECONDS,
+                 stale_seconds: float = DASHBOARD_STALE_SECONDS):
+        self.db = db
+        self.cache = ResultCache(ttl_seconds=ttl_seconds, stale_seconds=stale_seconds)
+
+    async def get_dashboard_stats(self, branch_id: Optional[str] = None) -> Dict[str, Any]:
+        scope = branch_id if branch_id and branch_id != "all" else None
+        metrics = await self.cache.get_or_compute((scope, "dashboard"), lambda: self.compute_metrics(scope))
+        return self.build_response(metrics, branch_id)
+
+    async def compute_metrics(self, branch_id: Optional[str]) -> Dict[str, Any]:
+        db = self.db
+        branch_filter = {"branch_id": branch_id} if branch_id else {}
+        now = datetime.now()
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        today = now.date()
+        day_start = datetime.combine(today, datetime.min.time())
+
+        student_pipeline = [
+            {"$match": branch_filter},
+            {"$facet": {
+                "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                "by_grade": [{"$group": {"_id": "$grade_level", "count": {"$sum": 1}}}],
+                "recent": [{"$match": {"created_at": {"$gte": month_start}}}, {"$count": "n"}]
+            }}
+        ]
+        registration_pipeline = [
+            {"$match": branch_filter},
+            {"$group": {
+                "_id": {"$ifNull": ["$payment_status", "Unpaid"]},
+                "count": {"$sum": 1},
+                "amount": {"$sum": {"$ifNull": ["$amount_paid", 0]}}
+            }}
+        ]
+        fee_pipeline = [
+            {"$match": branch_filter},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}, "amount": {"$sum": {"$ifNull": ["$amount", 0]}}}}
+        ]
+        attendance_pipeline = [
+            {"$match": {**branch_filter, "attendance_date": {"$gte": day_start, "$lt": day_start + timedelta(days=1)}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]
+
+        (
+            branches, classes, teachers, grade_levels, subjects, payment_modes,
+            student_facet, registrations, fees, attendance
+        ) = await asyncio.gather(
+            db["branches"].count_documents({}),
+            db["classes"].count_documents(branch_filter),
+            db["teachers"].count_documents(branch_filter),
+            db["grade_levels"].count_documents({}),
+            db["subjects"].count_documents({}),
+            db["payment_mode"].count_documents({}),
+            db["students"].aggregate(student_pipeline).to_list(1),
+            db["registration_payments"].aggregate(registration_pipeline).to_list(None),
+            db["fees"].aggregate(fee_pipeline).to_list(None),
+            db["attendance"].aggregate(attendance_pipeline).to_list(None)
+        )
+
+        students = (student_facet or [{}])[0]
+        status_counts = {row["_id"]: row["count"] for row in students.get("by_status", [])}
+        recent = students.get("recent") or []
+        return {
+            "branches": branches,
+            "classes": classes,
+            "teachers": teachers,
+            "grade_levels": grade_levels,
+            "subjects": subjects,
+            "payment_modes": payment_modes,
+            "students": sum(status_counts.values()),
+            "status_counts": status_counts,
+            "grade_counts": {row["_id"]: row["count"] for row in students.get("by_grade", [])},
+            "recent_registrations": recent[0]["n"] if recent else 0,
+            "month_start": month_start,
+            "registration_payments": {row["_id"]: {"count": row["count"], "amount": row["amount"]} for row in registrations},
+            "fees": {row["_id"]: {"count": row["count"], "amount": row["amount"]} for row in fees},
+            "attendance_date": today,
+            "attendance": {row["_id"]: row["count"] for row in attendance}
+        }
+
+    @staticmethod
+    def build_response(metrics: Dict[str, Any], branch_id: Optional[str]) -> Dict[str, Any]:
+        students_count = metrics["students"]
+        status_counts = metrics["status_counts"]
+        active_students = status_counts.get("Active", 0)
+        classes_count = metrics["classes"]
+
+        grade_utilization = [
+            {
+                "grade": grade or "Unknown",
+                "enrolled": count,
+                "capacity": max(count, 10),  # Default capacity
+                "utilization": 100  # Simplified for now
+            }
+            for grade, count in metrics["grade_counts"].items()
+        ]
+        total_capacity = sum(grade["capacity"] for grade in grade_utilization)
+        enrollment_rate = (students_count / total_capacity * 100) if total_capacity > 0 else 0
+
+        registrations = metrics["registration_payments"]
+        fees = metrics["fees"]
+
+        def count(groups, *statuses):
+            return sum(groups.get(status, {}).get("count", 0) for status in statuses)
+
+        total_revenue = sum(group["amount"] for group in registrations.values()) + fees.get("paid", {}).get("amount", 0)
+        paid_count = count(registrations, "Paid") + count(fees, "paid")
+        unpaid_count = count(registrations, "Unpaid") + count(fees, "unpaid")
+        pending_count = count(registrations, "Partial", "Pending") + count(fees, "pending")
+        registration_total = sum(group["count"] for group in registrations.values())
+
+        attendance = metrics["attendance"] if metrics["attendance_date"] == datetime.now().date() else {}
+        present_today = attendance.get("present", 0)
+        explicit_absent_today = attendance.get("absent", 0)
+        # Derive absent from active students if no explicit absent records exist
+        # This helps when only presents are recorded and missing entries imply absence.
+        if explicit_absent_today > 0:
+            absent_today = explicit_absent_today
+        else:
+            absent_today = max(active_students - present_today, 0)
+
+        # Recent activity lists the latest five documents of each collection
+        recent_students = min(students_count, 5)
+        recent_classes = min(classes_count, 5)
+        recent_payments = min(registration_total, 5)
+
+        return {
+            "overview": {
+                "total_students": students_count,
+                "active_students": active_students,
+                "total_classes": classes_count,
+                "total_teachers": metrics["teachers"],
+                "total_branches": metrics["branches"],
+                "total_revenue": total_revenue,
+                "enrollment_rate": enrollment_rate,
+                "recent_registrations": metrics["recent_registrations"]
+            },
+            "academic": {
+                "grade_levels": metrics["grade_levels"],
+                "subjects": metrics["subjects"],
+                "classes": classes_count,
+                "grade_utilization": grade_utilization,
+                "status_counts": dict(status_counts)
+            },
+            "financial": {
+                "paid_count": paid_count,
+                "unpaid_count": unpaid_count,
+                "pending_count": pending_count,
+                "total_revenue": total_revenue,
+                "payment_completion_rate": (paid_count / max(paid_count + unpaid_count + pending_count, 1)) * 100
+            },
+            "attendance": {
+                "present_today": present_today,
+                "absent_today": absent_today,
+                # Use active_students as denominator when available for a more stable rate
+                "attendance_rate": (present_today / max(active_students, 1)) * 100 if active_students > 0 else 0
+            },
+            "system": {
+                "payment_modes": metrics["payment_modes"],
+                "database_status": "connected",
+                "branch_filter": branch_id
+            },
+            "recent_activity": {
+                "recent_students": recent_students,
+                "recent_classes": recent_classes,
+                "recent_payments": recent_payments,
+                "total_recent": recent_students + recent_classes + recent_payments
+            }
+        }
+
+    # Change stream integration
+
+    def attach_to_sync_manager(self, sync_manager):
+        """Keep cached metrics current from the change events the sync manager already consumes"""
+        for collection in ("students", "teachers", "classes", "attendance"):
+            sync_manager.add_event_handler(f"{collection}:insert", self.handle_insert)
+            for event_type in ("update", "replace", "delete"):
+                sync_manager.add_event_handler(f"{collection}:{event_type}", self.handle_change)
+        for event_type in ("insert", "replace", "delete"):
+            sync_manager.add_event_handler(f"branches:{event_type}", self.handle_change)
+
+    def _invalidate(self, branch_id: Optional[str]):
+        if branch_id:
+            self.cache.invalidate_branch(str(branch_id))
+        else:
+            # Without a branch (e.g. deletes lacking a pre-image) every view may be affected
+            self.cache.invalidate()
+
+    def handle_insert(self, sync_event):
+        document = sync_event.full_document or {}
+        delta = self._insert_delta(sync_event.collection_name, document)
+        branch_id = str(document["branch_id"]) if document.get("branch_id") else None
+        if delta is None:
+            self._invalidate(branch_id)
+            return
+        for scope in {None, branch_id}:
+            self.cache.update((scope, "dashboard"), delta)
+
+    def handle_change(self, sync_event):
+        if sync_event.collection_name == "students" and sync_event.event_type.value == "update":
+            if not STUDENT_STAT_FIELDS.intersection(sync_event.updated_fields or {}):
+                return
+        if sync_event.collection_name in ("teachers", "classes") and sync_event.event_type.value == "update":
+            if "branch_id" not in (sync_event.updated_fields or {}):
+                return
+        self._invalidate(sync_event.branch_id)
+
+    @staticmethod
+    def _insert_delta(collection: str, document: Dict[str, Any]):
+        """A function that adds one inserted document to cached metrics, or None to recompute"""
+        if collection in ("teachers", "classes"):
+            def apply(metrics):
+                metrics[collection] += 1
+            return apply
+
+        if collection == "students":
+            def apply(metrics):
+                status, grade = document.get("status"), document.get("grade_level")
+                metrics["students"] += 1
+                metrics["status_counts"][status] = metrics["status_counts"].get(status, 0) + 1
+                metrics["grade_counts"][grade] = metrics["grade_counts"].get(grade, 0) + 1
+                created_at = document.get("created_at")
+                if isinstance(created_at, datetime) and created_at >= metrics["month_start"]:
+                    metrics["recent_registrations"] += 1
+            return apply
+
+        if collection == "attendance":
+            attendance_date = document.get("attendance_date")
+            if not isinstance(attendance_date, datetime):
+                return None
+
+            def apply(metrics):
+                if attendance_date.date() == metrics["attendance_date"]:
+                    status = document.get("status")
+                    metrics["attendance"][status] = metrics["attendance"].get(status, 0) + 1
+            return apply
+
+        return None
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        return self.cache.get_stats()
+
+
+# Global dashboard stats services, one per database
+_dashboard_services: Dict[str, DashboardStatsService] = {}
+
+
+def get_dashboard_stats_service(db) -> DashboardStatsService:
+    """Get the process-wide dashboard stats service for a database"""
+    service = _dashboard_services.get(db.name)
+    if service is None:
+        service = _dashboard_services[db.name] = DashboardStatsService(db)
+    return service
+
+
+# Export components
+__all__ = [
+    'DashboardStatsService',
+    'get_dashboard_stats_service'
+]
@@ -5,15 +5,17 @@ Provides comprehensive financial insights and analytics
 from typing import List, Dict, Optional, Any
 from datetime import datetime, date, timedelta
 from bson import ObjectId
-from ..models.payment import (
-    PaymentStatus, PaymentMethod, FeeType,
-    FinancialSummary, PaymentAnalytics, Currency
-)
 import asyncio
 from collections import defaultdict
 import pandas as pd
 import numpy as np
 
+from ..utils.collection_forecast import get_collection_forecaster
+from ..utils.financial_rollup import get_financial_rollup
+
+# Payment methods reported as online collections
+ONLINE_METHODS = ("card", "bank_transfer", "mobile_money")
+
 class FinancialAnalyticsService:
     """Service for financial analytics and reporting"""
     
@@ -25,128 +27,27 @@ class FinancialAnalyticsService:
         branch_id: str,
         start_date: date,
         end_date: date,
-        currency: Currency = Currency.USD
-    ) -> FinancialSummary:
+        currency: str = "USD"
+    ) -> Dict[str, Any]:
         """
         Generate comprehensive financial summary
         """
-        # Convert dates to datetime for MongoDB queries
+        # Convert dates to datetime for MongoDB queries; the rollup range is [start, end)
         start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
-        
-        # Build base query for branch filtering
-        base_query = {}
-        if branch_id != "all":
-            base_query["branch_id"] = branch_id
-
-        # Get payment transactions
-        payment_pipeline = [
-            {
-                "$match": {
-                    **base_query,
-                    "payment_date": {
-                        "$gte": start_datetime,
-                        "$lte": end_datetime
-                    },
-                    "currency": currency
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$status",
-                    "total_amount": {"$sum": "$amount"},
-                    "count": {"$sum": 1}
-                }
-            }
-        ]
-        
-        payment_results = await self.db.payment_transactions.aggregate(payment_pipeline).to_list(length=None)
-        
-        # Process payment results
-        payment_summary = {
-            "paid": {"amount": 0, "count": 0},
-            "pending": {"amount": 0, "count": 0},
-            "failed": {"amount": 0, "count": 0}
-        }
+        end_datetime = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
 
-        for result in payment_results:
-            status = result["_id"]
-            if status in payment_summary:
-                payment_summary[status] = {
-                    "amount": result["total_amount"],
-                    "count": result["count"]
-                }
-        
-        # Get payment method breakdown
-        method_pipeline = [
-            {
-                "$match": {
-                    **base_query,
-                    "payment_date": {
-                        "$gte": start_datetime,
-                        "$lte": end_datetime
-                    },
-                    "status": "paid",
-                    "currency": currency
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$payment_method",
-                    "total_amount": {"$sum": "$amount"},
-                    "count": {"$sum": 1}
-                }
-            }
-        ]
-        
-        method_results = await self.db.payment_transactions.aggregate(method_pipeline).to_list(length=None)
-        
-        # Get fee type breakdown
-        fee_type_base_query = {}
-        if branch_id != "all":
-            fee_type_base_query["branch_id"] = branch_id
+        # Payments come from the daily rollup: one document per day, method and fee category
+        payments = await get_financial_rollup(self.db).totals(
+            None if branch_id == "all" else [branch_id], start_datetime, end_datetime,
+            by_method=lambda doc: doc.get("payment_method"),
+            by_tuition=lambda doc: "tuition" in (doc.get("fee_category_name") or "").lower()
+        )
+        paid = payments["all"]
+        collected_by_method = {method: float(totals["collected"]) for method, totals in payments["by_method"].items()}
 
-        fee_type_pipeline = [
-            {
-                "$match": {
-                    **fee_type_base_query,
-                    "created_at": {
-                        "$gte": start_datetime,
-                        "$lte": end_datetime
-                    }
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "fee_templates",
-                    "localField": "fee_template_id",
-                    "foreignField": "_id",
-                    "as": "template"
-                }
-            },
-            {
-                "$unwind": "$template"
-            },
-            {
-                "$group": {
-                    "_id": "$template.fee_type",
-                    "total_amount": {"$sum": "$total_amount"},
-                    "paid_amount": {"$sum": "$paid_amount"}
-                }
-            }
-        ]
-        
-        fee_type_results = await self.db.fee_structures.aggregate(fee_type_pipeline).to_list(length=None)
-        
         # Calculate revenue by fee type
-        tuition_revenue = 0
-        other_revenue = 0
-        
-        for result in fee_type_results:
-            if result["_id"] == FeeType.TUITION:
-                tuition_revenue = result["paid_amount"]
-            else:
-                other_revenue += result["paid_amount"]
+        tuition_revenue = float(payments["by_tuition"][True]["collected"])
+        other_revenue = float(payments["by_tuition"][False]["collected"])
         
         # Get outstanding amounts
         outstanding_base_query = {}
@@ -196,29 +97,8 @@ class FinancialAnalyticsService:
         overdue_amount = overdue_result[0]["overdue_amount"] if overdue_result else 0
         
         # Get refunds
-        refund_pipeline = [
-            {
-                "$match": {
-                    **base_query,
-                    "created_at": {
-                        "$gte": start_datetime,
-                        "$lte": end_datetime
-                    },
-                    "status": "refunded"
-                }
-            },
-            {
-                "$group": {
-                    "_id": None,
-                    "total_refunds": {"$sum": "$refund_amount"},
-                    "count": {"$sum": 1}
-                }
-            }
-        ]
-        
-        refund_result = await self.db.refunds.aggregate(refund_pipeline).to_list(length=1)
-        total_refunds = refund_result[0]["total_refunds"] if refund_result else 0
-        refund_count = refund_result[0]["count"] if refund_result else 0
+        total_refunds = float(paid["refunded"])
+        refund_count = paid["refunds"]
         
         # Get student payment statistics
         student_pipeline = [
@@ -279,40 +159,38 @@ class FinancialAnalyticsService:
         collection_rate = (total_revenue / total_billed * 100) if total_billed > 0 else 0
         
         # Calculate average payment
-        average_payment = (
-            payment_summary["paid"]["amount"] /
-            payment_summary["paid"]["count"]
-        ) if payment_summary["paid"]["count"] > 0 else 0
+        total_collected = float(paid["collected"])
+        average_payment = total_collected / paid["payments"] if paid["payments"] > 0 else 0
         
         # Compile financial summary
-        summary = FinancialSummary(
-            branch_id=branch_id,
-            period_start=start_date,
-            period_end=end_date,
-            currency=currency,
-            total_revenue=total_revenue,
-            tuition_revenue=tuition_revenue,
-            other_revenue=other_revenue,
-            total_collected=payment_summary["paid"]["amount"],
-            cash_collected=sum(r["total_amount"] for r in method_results if r["_id"] == PaymentMethod.CASH.value),
-            online_collected=sum(r["total_amount"] for r in method_results if r["_id"] in [PaymentMethod.CREDIT_CARD.value, PaymentMethod.ONLINE_PAYMENT.value]),
-            other_collected=sum(r["total_amount"] for r in method_results if r["_id"] not in [PaymentMethod.CASH.value, PaymentMethod.CREDIT_CARD.value, PaymentMethod.ONLINE_PAYMENT.value]),
-            total_outstanding=total_outstanding,
-            overdue_amount=overdue_amount,
-            total_transactions=sum(payment_summary[s]["count"] for s in payment_summary),
-            successful_transactions=payment_summary["paid"]["count"],
-            failed_transactions=payment_summary["failed"]["count"],
-            pending_transactions=payment_summary["pending"]["count"],
-            total_refunds=total_refunds,
-            refund_count=refund_count,
-            total_students=sum(student_stats.values()),
-            paid_students=student_stats["paid"],
-            partially_paid_students=student_stats["partially_paid"],
-            unpaid_students=student_stats["unpaid"],
-            average_payment=average_payment,
-            collection_rate=collection_rate,
-            generated_at=datetime.utcnow()
-        )
+        summary = {
+            "branch_id": branch_id,
+            "period_start": start_date,
+            "period_end": end_date,
+            "currency": currency,
+            "total_revenue": total_revenue,
+            "tuition_revenue": tuition_revenue,
+            "other_revenue": other_revenue,
+            "total_collected": total_collected,
+            "cash_collected": collected_by_method.get("cash", 0.0),
+            "online_collected": sum(v for m, v in collected_by_method.items() if m in ONLINE_METHODS),
+            "other_collected": sum(v for m, v in collected_by_method.items() if m != "cash" and m not in ONLINE_METHODS),
+            "total_outstanding": total_outstanding,
+            "overdue_amount": overdue_amount,
+            "total_transactions": sum(paid.status_counts.values()),
+            "successful_transactions": paid.status_counts["completed"],
+            "failed_transactions": paid.status_counts["cancelled"],
+            "pending_transactions": paid.status_counts["pending"],
+            "total_refunds": total_refunds,
+            "refund_count": refund_count,
+            "total_students": sum(student_stats.values()),
+            "paid_students": student_stats["paid"],
+            "partially_paid_students": student_stats["partially_paid"],
+            "unpaid_students": student_stats["unpaid"],
+            "average_payment": average_payment,
+            "collection_rate": collection_rate,
+            "generated_at": datetime.utcnow()
+        }
         
         return summary
     
@@ -320,7 +198,7 @@ class FinancialAnalyticsService:
         self,
         branch_id: str,
         days: int = 30
-    ) -> PaymentAnalytics:
+    ) -> Dict[str, Any]:
         """
         Generate detailed payment analytics
         """
@@ -332,127 +210,33 @@ class FinancialAnalyticsService:
         if branch_id != "all":
             base_query["branch_id"] = branch_id
 
-        # Daily collections
-        daily_pipeline = [
-            {
-                "$match": {
-                    **base_query,
-                    "payment_date": {
-                        "$gte": datetime.combine(start_date, datetime.min.time()),
-                        "$lte": datetime.combine(end_date, datetime.max.time())
-                    },
-                    "status": "paid"
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "$dateToString": {
-                            "format": "%Y-%m-%d",
-                            "date": "$payment_date"
-                        }
-                    },
-                    "amount": {"$sum": "$amount"},
-                    "count": {"$sum": 1}
-                }
-            },
-            {
-                "$sort": {"_id": 1}
-            }
-        ]
-        
-        daily_results = await self.db.payment_transactions.aggregate(daily_pipeline).to_list(length=None)
-        
-        # Monthly collections
-        monthly_pipeline = [
-            {
-                "$match": {
-                    **base_query,
-                    "payment_date": {
-                        "$gte": datetime.combine(start_date - timedelta(days=365), datetime.min.time()),
-                        "$lte": datetime.combine(end_date, datetime.max.time())
-                    },
-                    "status": "paid"
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "$dateToString": {
-                            "format": "%Y-%m",
-                            "date": "$payment_date"
-                        }
-                    },
-                    "amount": {"$sum": "$amount"},
-                    "count": {"$sum": 1}
-                }
-            },
-            {
-                "$sort": {"_id": 1}
-            }
-        ]
-        
-        monthly_results = await self.db.payment_transactions.aggregate(monthly_pipeline).to_list(length=None)
-        
-        # Payment method distribution
-        method_dist_pipeline = [
-            {
-                "$match": {
-                    **base_query,
-                    "payment_date": {
-                        "$gte": datetime.combine(start_date, datetime.min.time()),
-                        "$lte": datetime.combine(end_date, datetime.max.time())
-                    },
-                    "status": "paid"
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$payment_method",
-                    "amount": {"$sum": "$amount"}
-                }
-            }
-        ]
-        
-        method_dist_results = await self.db.payment_transactions.aggregate(method_dist_pipeline).to_list(length=None)
-        method_distribution = {r["_id"]: r["amount"] for r in method_dist_results}
-        
-        # Fee type distribution
-        fee_type_base_query = {}
-        if branch_id != "all":
-            fee_type_base_query["branch_id"] = branch_id
+        # Daily, monthly, method and fee category collections in one pass over the rollup;
+        # monthly figures reach a year further back than the daily window
+        window_start = datetime.combine(start_date, datetime.min.time())
 
-        fee_type_dist_pipeline = [
-            {
-                "$match": {
-                    **fee_type_base_query,
-                    "created_at": {
-                        "$gte": datetime.combine(start_date, datetime.min.time()),
-                        "$lte": datetime.combine(end_date, datetime.max.time())
-                    }
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "fee_templates",
-                    "localField": "fee_template_id",
-                    "foreignField": "_id",
-                    "as": "template"
-                }
-            },
-            {
-                "$unwind": "$template"
-            },
-            {
-                "$group": {
-                    "_id": "$template.fee_type",
-                    "amount": {"$sum": "$paid_amount"}
-                }
-            }
-        ]
-        
-        fee_type_dist_results = await self.db.fee_structures.aggregate(fee_type_dist_pipeline).to_list(length=None)
-        fee_type_distribution = {r["_id"]: r["amount"] for r in fee_type_dist_results}
+        def in_window(key):
+            return lambda doc: key(doc) if doc["day"] >= window_start else None
+
+        payments = await get_financial_rollup(self.db).totals(
+            None if branch_id == "all" else [branch_id],
+            window_start - timedelta(days=365),
+            datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+            by_day=in_window(lambda doc: doc["day"].strftime("%Y-%m-%d")),
+            by_month=lambda doc: doc["day"].strftime("%Y-%m"),
+            by_method=in_window(lambda doc: doc.get("payment_method")),
+            by_fee_category=in_window(lambda doc: doc.get("fee_category_name"))
+        )
+        payments["by_day"].pop(None, None)
+        payments["by_method"].pop(None, None)
+        payments["by_fee_category"].pop(None, None)
+
+        daily_results = [{"date": day, "amount": float(totals["collected"]), "count": totals["payments"]}
+                         for day, totals in sorted(payments["by_day"].items()) if totals["payments"]]
+        monthly_results = [{"month": month, "amount": float(totals["collected"]), "count": totals["payments"]}
+                           for month, totals in sorted(payments["by_month"].items()) if totals["payments"]]
+        method_distribution = {method: float(totals["collected"]) for method, totals in payments["by_method"].items()}
+        fee_type_distribution = {name: float(totals["collected"])
+                                 for name, totals in payments["by_fee_category"].items()}
         
         # Grade level collections
         grade_level_pipeline = [
@@ -609,19 +393,19 @@ class FinancialAnalyticsService:
         
         defaulters_results = await self.db.fee_structures.aggregate(defaulters_pipeline).to_list(length=10)
         
-        analytics = PaymentAnalytics(
-            branch_id=branch_id,
-            daily_collections=[{"date": r["_id"], "amount": r["amount"], "count": r["count"]} for r in daily_results],
-            monthly_collections=[{"month": r["_id"], "amount": r["amount"], "count": r["count"]} for r in monthly_results],
-            payment_method_distribution=method_distribution,
-            fee_type_distribution=fee_type_distribution,
-            grade_level_collections=grade_level_collections,
-            overdue_by_days=overdue_by_days,
-            overdue_by_amount=overdue_by_amount,
-            top_fee_types=top_fee_types,
-            top_defaulters=defaulters_results,
-            generated_at=datetime.utcnow()
-        )
+        analytics = {
+            "branch_id": branch_id,
+            "daily_collections": daily_results,
+            "monthly_collections": monthly_results,
+            "payment_method_distribution": method_distribution,
+            "fee_type_distribution": fee_type_distribution,
+            "grade_level_collections": grade_level_collections,
+            "overdue_by_days": overdue_by_days,
+            "overdue_by_amount": overdue_by_amount,
+            "top_fee_types": top_fee_types,
+            "top_defaulters": defaulters_results,
+            "generated_at": datetime.utcnow()
+        }
         
         return analytics
     
@@ -631,103 +415,22 @@ class FinancialAnalyticsService:
         forecast_days: int = 30
     ) -> Dict:
         """
-        Generate collection forecast based on historical data
+        Generate collection forecast for one branch from its daily collection history
         """
-        # Get historical payment data
-        historical_days = 90
-        end_date = datetime.now().date()
-        start_date = end_date - timedelta(days=historical_days)
-        
-        pipeline = [
-            {
-                "$match": {
-                    "branch_id": branch_id,
-                    "payment_date": {
-                        "$gte": datetime.combine(start_date, datetime.min.time()),
-                        "$lte": datetime.combine(end_date, datetime.max.time())
-                    },
-                    "status": PaymentStatus.PAID
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "$dateToString": {
-                            "format": "%Y-%m-%d",
-                            "date": "$payment_date"
-                        }
-                    },
-                    "amount": {"$sum": "$amount"}
-                }
-            },
-            {
-                "$sort": {"_id": 1}
-            }
-        ]
-        
-        historical_results = await self.db.payment_transactions.aggregate(pipeline).to_list(length=None)
-        
-        if not historical_results:
-            return {
-                "forecast_period": forecast_days,
-                "predicted_collections": 0,
-                "confidence": 0,
-                "based_on_days": 0
-            }
-        
-        # Calculate average daily collection
-        total_amount = sum(r["amount"] for r in historical_results)
-        days_with_data = len(historical_results)
-        avg_daily_collection = total_amount / days_with_data if days_with_data > 0 else 0
-        
-        # Get upcoming due payments
-        upcoming_pipeline = [
-            {
-                "$match": {
-                    "branch_id": branch_id,
-                    "balance": {"$gt": 0},
-                    "due_date": {
-                        "$gte": datetime.now(),
-                        "$lte": datetime.now() + timedelta(days=forecast_days)
-                    },
-                    "is_active": True
-                }
-            },
-            {
-                "$group": {
-                    "_id": None,
-                    "total_due": {"$sum": "$balance"}
-                }
-            }
-        ]
-        
-        upcoming_result = await self.db.fee_structures.aggregate(upcoming_pipeline).to_list(length=1)
-        total_due = upcoming_result[0]["total_due"] if upcoming_result else 0
-        
-        # Calculate collection rate from historical data
-        historical_collection_rate = 0.75  # Default 75% collection rate
-        
-        # Estimate collections
-        predicted_from_average = avg_daily_collection * forecast_days
-        predicted_from_due = total_due * historical_collection_rate
-        
-        # Weighted average prediction
-        predicted_collections = (predicted_from_average * 0.6) + (predicted_from_due * 0.4)
-        
-        # Calculate confidence based on data availability
-        confidence = min(days_with_data / 30, 1.0) * 100  # Max 100% confidence
-        
-        return {
-            "forecast_period": forecast_days,
-            "predicted_collections": round(predicted_collections, 2),
-            "predicted_from_historical": round(predicted_from_average, 2),
-            "predicted_from_due": round(predicted_from_due, 2),
-            "total_due_amount": round(total_due, 2),
-            "average_daily_collection": round(avg_daily_collection, 2),
-            "collection_rate": round(historical_collection_rate * 100, 2),
-            "confidence": round(confidence, 2),
-            "based_on_days": days_with_data
-        }
+        forecast = await self.generate_collection_forecasts([branch_id], forecast_days)
+        return forecast["branches"][branch_id]
+
+    async def generate_collection_forecasts(
+        self,
+        branch_ids: Optional[List[str]] = None,
+        forecast_days: int = 30
+    ) -> Dict:
+        """
+        Generate collection forecasts for several branches (default: all) in one pass.
+        Each branch and fee category has a seasonal model kept up to date from the daily
+        financial rollup, so this reads only what changed since the previous forecast.
+        """
+        return await get_collection_forecaster(self.db).forecast(branch_ids, forecast_days)
     
     async def get_revenue_trends(
         self,
@@ -740,34 +443,19 @@ class FinancialAnalyticsService:
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=months * 30)
         
-        pipeline = [
-            {
-                "$match": {
-                    "branch_id": branch_id,
-                    "payment_date": {
-                        "$gte": datetime.combine(start_date, datetime.min.time()),
-                        "$lte": datetime.combine(end_date, datetime.max.time())
-                    },
-                    "status": PaymentStatus.PAID
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "year": {"$year": "$payment_date"},
-                        "month": {"$month": "$payment_date"}
-                    },
-                    "revenue": {"$sum": "$amount"},
-                    "transactions": {"$sum": 1}
-                }
-            },
-            {
-                "$sort": {"_id.year": 1, "_id.month": 1}
-            }
+        # Monthly totals from the daily rollup, so long ranges cost one document per day
+        payments = await get_financial_rollup(self.db).totals(
+            [branch_id],
+            datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+            by_month=lambda doc: (doc["day"].year, doc["day"].month)
+        )
+        results = [
+            {"_id": {"year": year, "month": month}, "revenue": float(totals["collected"]),
+             "transactions": totals["payments"]}
+            for (year, month), totals in sorted(payments["by_month"].items()) if totals["payments"]
         ]
         
-        results = await self.db.payment_transactions.aggregate(pipeline).to_list(length=None)
-        
         # Calculate month-over-month growth
         trends = []
         previous_revenue = None
@@ -8,13 +8,17 @@ import json
 import logging
 import logging.handlers
 import os
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
 from enum import Enum
 from pathlib import Path
 import aiofiles
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
 from functools import wraps
 
 # Configure audit logger
@@ -22,7 +26,7 @@ audit_logger = logging.getLogger("audit")
 audit_logger.setLevel(logging.INFO)
 
 # Create audit log directory
-AUDIT_LOG_DIR = Path("logs/audit")
+AUDIT_LOG_DIR = Path(os.getenv("AUDIT_LOG_DIR", "logs/audit"))
 AUDIT_LOG_DIR.mkdir(parents=True, exist_ok=True)
 
 # File handler for audit logs
@@ -127,6 +131,200 @@ class AuditSeverity(str, Enum):
     ERROR = "error"
     CRITICAL = "critical"
 
+# Actions surfaced by security dashboards and kept in the hourly security buckets
+SECURITY_ACTIONS = {
+    AuditAction.SUSPICIOUS_ACTIVITY.value,
+    AuditAction.PERMISSION_DENIED.value,
+    AuditAction.LOGIN_FAILED.value,
+    AuditAction.BRUTE_FORCE_ATTEMPT.value,
+    AuditAction.PRIVILEGE_ESCALATION.value,
+    AuditAction.CROSS_BRANCH_ACCESS.value,
+    AuditAction.DATA_BREACH_ATTEMPT.value
+}
+
+# Per-minute rolling counters: counter name -> (action, entry field holding the key)
+ROLLING_COUNTERS = {
+    "login_failed_email": (AuditAction.LOGIN_FAILED.value, ("user", "email")),
+    "login_failed_ip": (AuditAction.LOGIN_FAILED.value, ("metadata", "ip_address")),
+    "permission_denied_user": (AuditAction.PERMISSION_DENIED.value, ("user", "id")),
+    "permission_denied_ip": (AuditAction.PERMISSION_DENIED.value, ("metadata", "ip_address")),
+}
+
+BUCKET_EVENT_LIMIT = 500       # events kept per hourly bucket; counts stay exact beyond it
+APPLIED_BATCH_LIMIT = 100      # batch ids remembered per bucket/counter so a retried batch is folded in once
+BUCKET_RETENTION_DAYS = 365
+COUNTER_RETENTION_HOURS = 24
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def minute_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def bucket_id(scope: str, key: str, start: datetime) -> str:
+    return f"{scope}:{key}:{start:%Y%m%d%H}"
+
+
+def counter_id(name: str, key: str, start: datetime) -> str:
+    return f"{name}:{key}:{start:%Y%m%d%H%M}"
+
+
+def _only_duplicate_keys(error: BulkWriteError) -> bool:
+    """True when every failure in a bulk write was a duplicate key"""
+    return not error.details.get("writeConcernErrors") and all(
+        e.get("code") == 11000 for e in error.details.get("writeErrors", [])
+    )
+
+
+class AuditWriteBuffer:
+    """
+    Bounded in-memory queue of audit entries drained by a background flusher.
+    Entries are written with insert_many every `batch_size` entries or `flush_interval_ms`,
+    whichever comes first. When the queue is full new entries are dropped (or, with
+    drop_policy="drop_oldest", the oldest queued entry is evicted); critical entries
+    always evict the oldest entry rather than being dropped. A batch whose write fails
+    goes back to the front of the queue and is retried on the next flush, up to
+    `max_attempts` times; after that it is handed to `spill` (if given) before being dropped.
+    A retried batch is written with exactly the same entries, so the writer can recognise it.
+    """
+    
+    def __init__(
+        self,
+        writer,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval_ms: int = 250,
+        drop_policy: str = "drop_newest",
+        max_attempts: int = 3,
+        spill=None
+    ):
+        self.writer = writer
+        self.spill = spill
+        self.max_attempts = max_attempts
+        self.failed_attempts = 0
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.drop_policy = drop_policy
+        
+        self.queue: deque = deque()
+        self.retry_batch: Optional[List[Dict[str, Any]]] = None
+        self.wakeup = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "retried_batches": 0,
+            "spilled": 0
+        }
+    
+    def submit(self, entry: Dict[str, Any]) -> bool:
+        """Queue an entry without waiting; returns False if it was dropped"""
+        if len(self.queue) >= self.max_queue:
+            if entry.get("severity") == AuditSeverity.CRITICAL.value or self.drop_policy == "drop_oldest":
+                self.queue.popleft()
+            else:
+                self.stats["dropped"] += 1
+                return False
+            self.stats["dropped"] += 1
+        
+        self.queue.append(entry)
+        self.stats["enqueued"] += 1
+        if len(self.queue) >= self.batch_size:
+            self.wakeup.set()
+        self.start()
+        return True
+    
+    def start(self):
+        """Start the flusher if it is not running (needs a running event loop)"""
+        if self.task is None or self.task.done():
+            try:
+                self.task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                self.task = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+    
+    async def flush(self):
+        """Write everything queued so far"""
+        async with self.flush_lock:
+            while self.retry_batch or self.queue:
+                batch = self.retry_batch or [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+                self.retry_batch = None
+                try:
+                    await self.writer(batch)
+                    self.stats["written"] += len(batch)
+                    self.stats["batches"] += 1
+                    self.failed_attempts = 0
+                except Exception as e:
+                    self.stats["failed_batches"] += 1
+                    self.failed_attempts += 1
+                    if self.failed_attempts < self.max_attempts:
+                        # Retry the same batch first on the next flush
+                        self.retry_batch = batch
+                        self.stats["retried_batches"] += 1
+                        audit_logger.warning(
+                            f"Failed to write {len(batch)} audit events (attempt {self.failed_attempts}), will retry: {e}"
+                        )
+                    else:
+                        self.failed_attempts = 0
+                        self._give_up(batch, e)
+                    return
+    
+    def _give_up(self, batch: List[Dict[str, Any]], error: Exception):
+        spilled = False
+        if self.spill is not None:
+            try:
+                self.spill(batch)
+                spilled = True
+            except Exception as e:
+                audit_logger.error(f"Failed to spill {len(batch)} audit events: {e}")
+        self.stats["spilled" if spilled else "dropped"] += len(batch)
+        audit_logger.error(
+            f"Gave up writing {len(batch)} audit events after {self.max_attempts} attempts"
+            f"{' (kept in the file log)' if spilled else ''}: {error}"
+        )
+    
+    async def close(self):
+        """Stop the flusher and write any remaining entries"""
+        if self.task is not None:
+            # Wait for an in-flight batch so its entries are not lost to the cancellation
+            async with self.flush_lock:
+                self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self.task = None
+        for _ in range(self.max_attempts):
+            await self.flush()
+            if not self.queue and not self.retry_batch:
+                return
+        # The database stayed unavailable; keep what is left in the file log
+        remaining = (self.retry_batch or []) + list(self.queue)
+        self.retry_batch = None
+        self.queue.clear()
+        self._give_up(remaining, RuntimeError("audit writer unavailable at shutdown"))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        queued = len(self.queue) + len(self.retry_batch or [])
+        return {**self.stats, "queued": queued, "max_queue": self.max_queue}
+
+
 class AuditLogger:
     """Main audit logging class for tracking all system activities"""
     
@@ -140,7 +338,18 @@ class AuditLogger:
         self.client = None
         self.db = None
         self.collection = None
+        self.buckets = None
+        self.counters = None
         self._initialized = False
+        self.buffer = AuditWriteBuffer(
+            self._write_batch,
+            max_queue=int(os.getenv("AUDIT_QUEUE_SIZE", "10000")),
+            batch_size=int(os.getenv("AUDIT_BATCH_SIZE", "500")),
+            flush_interval_ms=int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "250")),
+            drop_policy=os.getenv("AUDIT_DROP_POLICY", "drop_newest"),
+            max_attempts=int(os.getenv("AUDIT_WRITE_ATTEMPTS", "3")),
+            spill=self._spill_to_file
+        )
         
     async def initialize(self):
         """Initialize database connection for audit logs"""
@@ -152,6 +361,14 @@ class AuditLogger:
             self.db = self.client.school_db
             self.collection = self.db.audit_logs
             
+            # Optional write concern tuning, e.g. AUDIT_WRITE_CONCERN=1 and AUDIT_WRITE_JOURNAL=false
+            write_concern = os.getenv("AUDIT_WRITE_CONCERN")
+            if write_concern:
+                self.collection = self.collection.with_options(write_concern=WriteConcern(
+                    w=int(write_concern) if write_concern.isdigit() else write_concern,
+                    j=os.getenv("AUDIT_WRITE_JOURNAL", "false").lower() == "true"
+                ))
+            
             # Create indexes for efficient querying
             await self.collection.create_index([("timestamp", DESCENDING)])
             await self.collection.create_index([("user_id", ASCENDING)])
@@ -170,6 +387,18 @@ class AuditLogger:
                 expireAfterSeconds=365 * 24 * 60 * 60
             )
             
+            # Hourly buckets (per user, per IP, security, recent) and per-minute counters;
+            # without them queries fall back to scanning audit_logs
+            try:
+                buckets = self.db.audit_buckets
+                counters = self.db.audit_counters
+                await buckets.create_index([("scope", ASCENDING), ("key", ASCENDING), ("bucket_start", DESCENDING)])
+                await buckets.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+                await counters.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+                self.buckets, self.counters = buckets, counters
+            except Exception as e:
+                audit_logger.warning(f"Audit buckets unavailable, using raw audit log queries: {e}")
+            
             self._initialized = True
             audit_logger.info("Audit logger initialized successfully")
             
@@ -211,9 +440,6 @@ class AuditLogger:
             success: Whether the action was successful
             error_message: Error message if action failed
         """
-        if not self._initialized:
-            await self.initialize()
-        
         # Create audit log entry
         audit_entry = {
             "timestamp": datetime.utcnow(),
@@ -244,25 +470,245 @@ class AuditLogger:
         audit_entry["resource"] = {k: v for k, v in audit_entry["resource"].items() if v is not None}
         audit_entry["metadata"] = {k: v for k, v in audit_entry["metadata"].items() if v is not None}
         
-        try:
-            # Store in database
-            if self.collection:
-                await self.collection.insert_one(audit_entry)
-            
-            # Log to file
-            log_message = json.dumps(audit_entry, default=str, ensure_ascii=False)
+        # Queue for the background writer; no I/O happens on the caller's path
+        self.buffer.submit(audit_entry)
+    
+    async def _write_batch(self, entries: List[Dict[str, Any]]):
+        """Write a batch of entries to the database and the audit log file"""
+        if not self._initialized:
+            try:
+                await self.initialize()
+            except Exception:
+                pass
+        
+        # Ids are fixed on the first attempt, so a retried batch inserts and folds in the same entries
+        for entry in entries:
+            entry.setdefault("_id", ObjectId())
+        
+        if self.collection is not None:
+            try:
+                await self.collection.insert_many(entries, ordered=False)
+            except BulkWriteError as e:
+                # On a retry, entries stored by the failed attempt come back as duplicates
+                if not _only_duplicate_keys(e):
+                    raise
+        
+        if self.buckets is not None:
+            bucket_ops, counter_ops = self._bucket_updates(entries, batch_id=str(entries[0]["_id"]))
+            await self._apply_once(self.buckets, bucket_ops)
+            await self._apply_once(self.counters, counter_ops)
+        
+        self._log_to_file(entries)
+    
+    @staticmethod
+    async def _apply_once(collection, ops: List[UpdateOne]):
+        """
+        Run guarded upserts from _bucket_updates. A document that already holds the batch id does
+        not match its guard, so the upsert collides on _id; a second pass over those operations
+        tells that apart from two writers creating the same document at once.
+        """
+        for _ in range(2):
+            if not ops:
+                return
+            try:
+                await collection.bulk_write(ops, ordered=False)
+                return
+            except BulkWriteError as e:
+                if not _only_duplicate_keys(e):
+                    raise
+                ops = [ops[error["index"]] for error in e.details["writeErrors"]]
+        # Still colliding: the documents exist and already hold this batch
+    
+    def _spill_to_file(self, entries: List[Dict[str, Any]]):
+        """Keep entries that could not be stored in the database in the audit log file"""
+        self._log_to_file(entries, prefix="NOT STORED IN DATABASE: ")
+    
+    @staticmethod
+    def _log_to_file(entries: List[Dict[str, Any]], prefix: str = ""):
+        for entry in entries:
+            log_message = prefix + json.dumps(entry, default=str, ensure_ascii=False)
+            severity = entry.get("severity")
             
-            if severity == AuditSeverity.CRITICAL:
+            if severity == AuditSeverity.CRITICAL.value:
                 audit_logger.critical(log_message)
-            elif severity == AuditSeverity.ERROR:
+            elif severity == AuditSeverity.ERROR.value:
                 audit_logger.error(log_message)
-            elif severity == AuditSeverity.WARNING:
+            elif severity == AuditSeverity.WARNING.value:
                 audit_logger.warning(log_message)
             else:
                 audit_logger.info(log_message)
-                
-        except Exception as e:
-            audit_logger.error(f"Failed to log audit event: {e}")
+    
+    @staticmethod
+    def _bucket_updates(entries: List[Dict[str, Any]], batch_id: Optional[str] = None):
+        """
+        Fold a batch into one upsert per touched bucket and counter. With a batch_id, each
+        upsert only applies to a document that has not recorded that batch yet.
+        """
+        buckets: Dict[str, Dict[str, Any]] = {}
+        counters: Dict[str, Dict[str, Any]] = {}
+        
+        def add_to_bucket(scope: str, key: str, entry: Dict[str, Any], keep_event: bool):
+            start = hour_bucket(entry["timestamp"])
+            bucket = buckets.setdefault(bucket_id(scope, key, start), {
+                "scope": scope, "key": key, "start": start, "count": 0, "actions": {}, "failures": 0, "events": []
+            })
+            bucket["count"] += 1
+            bucket["actions"][entry["action"]] = bucket["actions"].get(entry["action"], 0) + 1
+            bucket["failures"] += 0 if entry.get("success", True) else 1
+            if keep_event:
+                bucket["events"].append(entry)
+        
+        for entry in entries:
+            action = entry["action"]
+            user_id = entry.get("user", {}).get("id")
+            ip_address = entry.get("metadata", {}).get("ip_address")
+            
+            add_to_bucket("recent", "all", entry, keep_event=True)
+            if user_id:
+                add_to_bucket("user", user_id, entry, keep_event=True)
+            if ip_address:
+                add_to_bucket("ip", ip_address, entry, keep_event=False)
+            if action in SECURITY_ACTIONS:
+                add_to_bucket("security", "all", entry, keep_event=True)
+            
+            for name, (counted_action, (section, field)) in ROLLING_COUNTERS.items():
+                key = entry.get(section, {}).get(field)
+                if action == counted_action and key:
+                    start = minute_bucket(entry["timestamp"])
+                    counter = counters.setdefault(counter_id(name, key, start), {"start": start, "count": 0})
+                    counter["count"] += 1
+        
+        def guarded_upsert(_id: str, update: Dict[str, Any]) -> UpdateOne:
+            if batch_id is None:
+                return UpdateOne({"_id": _id}, update, upsert=True)
+            update.setdefault("$push", {})["batches"] = {"$each": [batch_id], "$slice": -APPLIED_BATCH_LIMIT}
+            return UpdateOne({"_id": _id, "batches": {"$ne": batch_id}}, update, upsert=True)
+        
+        bucket_ops = []
+        for _id, bucket in buckets.items():
+            update = {
+                "$setOnInsert": {
+                    "scope": bucket["scope"],
+                    "key": bucket["key"],
+                    "bucket_start": bucket["start"],
+                    "expires_at": bucket["start"] + timedelta(days=BUCKET_RETENTION_DAYS)
+                },
+                "$inc": {
+                    "count": bucket["count"],
+                    "failures": bucket["failures"],
+                    **{f"actions.{action}": n for action, n in bucket["actions"].items()}
+                }
+            }
+            if bucket["events"]:
+                update["$push"] = {"events": {"$each": bucket["events"], "$slice": -BUCKET_EVENT_LIMIT}}
+            bucket_ops.append(guarded_upsert(_id, update))
+        
+        counter_ops = [
+            guarded_upsert(_id, {
+                "$inc": {"count": counter["count"]},
+                "$setOnInsert": {
+                    "minute": counter["start"],
+                    "expires_at": counter["start"] + timedelta(hours=COUNTER_RETENTION_HOURS)
+                }
+            })
+            for _id, counter in counters.items()
+        ]
+        return bucket_ops, counter_ops
+    
+    async def _read_bucket_events(
+        self,
+        scope: str,
+        key: str,
+        start: datetime,
+        end: datetime,
+        raw_query: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        keep: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Events from the hourly buckets overlapping [start, end] (and passing `keep`), newest
+        first. Hours with more events than a bucket keeps are read from the raw log with
+        `raw_query`; with a limit, older hours are not read once that many events were found.
+        """
+        cursor = self.buckets.find(
+            {"scope": scope, "key": key, "bucket_start": {"$gte": hour_bucket(start), "$lte": end}},
+            {"events": 1, "count": 1, "bucket_start": 1}
+        ).sort("bucket_start", -1)
+        events = []
+        async for bucket in cursor:
+            bucket_events = bucket.get("events", [])
+            if raw_query is not None and bucket.get("count", 0) > len(bucket_events):
+                # Busy hour overflowed the bucket; read that hour from the raw log
+                hour_start = bucket["bucket_start"]
+                raw = self.collection.find({
+                    **raw_query,
+                    "timestamp": {"$gte": hour_start, "$lt": hour_start + timedelta(hours=1)}
+                }).sort("timestamp", -1)
+                bucket_events = await (raw.limit(limit) if limit else raw).to_list(length=limit)
+            events.extend(e for e in bucket_events if start <= e["timestamp"] <= end and (keep is None or keep(e)))
+            if limit and len(events) >= limit:
+                break
+        events.sort(key=lambda e: e["timestamp"], reverse=True)
+        return events[:limit] if limit else events
+    
+    async def get_rolling_count(self, counter: str, key: str, window_minutes: int) -> int:
+        """Sum a per-minute counter over the last `window_minutes` (reads at most that many documents)"""
+        now = minute_bucket(datetime.utcnow())
+        ids = [counter_id(counter, key, now - timedelta(minutes=i)) for i in range(window_minutes + 1)]
+        total = 0
+        async for doc in self.counters.find({"_id": {"$in": ids}}, {"count": 1}):
+            total += doc.get("count", 0)
+        return total
+    
+    async def get_activity_summary(self, hours: int = 24) -> Dict[str, Any]:
+        """Action and failure totals from the hourly buckets"""
+        if not self._initialized:
+            await self.initialize()
+        await self.flush()
+        
+        if self.buckets is None:
+            return {"hours": hours, "events": None, "failures": None, "by_action": {}}
+        
+        since = hour_bucket(datetime.utcnow() - timedelta(hours=hours))
+        totals: Dict[str, int] = {}
+        events = failures = 0
+        async for bucket in self.buckets.find(
+            {"scope": "recent", "key": "all", "bucket_start": {"$gte": since}},
+            {"count": 1, "failures": 1, "actions": 1}
+        ):
+            events += bucket.get("count", 0)
+            failures += bucket.get("failures", 0)
+            for action, n in bucket.get("actions", {}).items():
+                totals[action] = totals.get(action, 0) + n
+        return {"hours": hours, "events": events, "failures": failures, "by_action": totals}
+    
+    async def get_recent_events(self, limit: int = 20, hours: int = 24) -> List[Dict[str, Any]]:
+        """Most recent audit events across all users"""
+        if not self._initialized:
+            await self.initialize()
+        await self.flush()
+        
+        end = datetime.utcnow()
+        if self.buckets is None:
+            cursor = self.collection.find({"timestamp": {"$gte": end - timedelta(hours=hours)}})
+            return await cursor.sort("timestamp", -1).limit(limit).to_list(length=limit)
+        
+        events = await self._read_bucket_events(
+            "recent", "all", end - timedelta(hours=hours), end, raw_query={}, limit=limit
+        )
+        return events
+    
+    async def flush(self):
+        """Write all queued audit events now"""
+        await self.buffer.flush()
+    
+    async def close(self):
+        """Flush queued events and stop the background writer"""
+        await self.buffer.close()
+    
+    def get_buffer_stats(self) -> Dict[str, Any]:
+        """Queue depth, write and drop counters of the audit pipeline"""
+        return self.buffer.get_stats()
     
     async def log_permission_check(
         self,
@@ -387,6 +833,29 @@ class AuditLogger:
         """
         if not self._initialized:
             await self.initialize()
+        await self.flush()
+        
+        if self.buckets is not None:
+            end = end_date or datetime.utcnow()
+            start = start_date or end - timedelta(days=BUCKET_RETENTION_DAYS)
+            events = []
+            cursor = self.buckets.find(
+                {"scope": "user", "key": user_id, "bucket_start": {"$gte": hour_bucket(start), "$lte": end}},
+                {"events": 1, "count": 1, "bucket_start": 1}
+            ).sort("bucket_start", -1)
+            async for bucket in cursor:
+                bucket_events = bucket.get("events", [])
+                if bucket.get("count", 0) > len(bucket_events):
+                    # Busy hour overflowed the bucket; read that hour from the raw log
+                    bucket_events = await self.collection.find({
+                        "user.id": user_id,
+                        "timestamp": {"$gte": bucket["bucket_start"], "$lt": bucket["bucket_start"] + timedelta(hours=1)}
+                    }).to_list(length=None)
+                events.extend(e for e in bucket_events if start <= e["timestamp"] <= end)
+                if len(events) >= limit:
+                    break
+            events.sort(key=lambda e: e["timestamp"], reverse=True)
+            return events[:limit]
         
         query = {"user.id": user_id}
         
@@ -410,24 +879,22 @@ class AuditLogger:
         """
         if not self._initialized:
             await self.initialize()
+        await self.flush()
         
         since = datetime.utcnow() - timedelta(hours=hours)
-        query = {
-            "timestamp": {"$gte": since},
-            "action": {"$in": [
-                AuditAction.SUSPICIOUS_ACTIVITY.value,
-                AuditAction.PERMISSION_DENIED.value,
-                AuditAction.LOGIN_FAILED.value,
-                AuditAction.BRUTE_FORCE_ATTEMPT.value,
-                AuditAction.PRIVILEGE_ESCALATION.value,
-                AuditAction.CROSS_BRANCH_ACCESS.value,
-                AuditAction.DATA_BREACH_ATTEMPT.value
-            ]}
-        }
         
+        query = {"action": {"$in": sorted(SECURITY_ACTIONS)}}
         if severity:
             query["severity"] = severity.value
         
+        if self.buckets is not None:
+            return await self._read_bucket_events(
+                "security", "all", since, datetime.utcnow(), raw_query=query, limit=1000,
+                keep=(lambda e: e.get("severity") == severity.value) if severity else None
+            )
+        
+        query["timestamp"] = {"$gte": since}
+        
         cursor = self.collection.find(query).sort("timestamp", -1)
         return await cursor.to_list(length=1000)
     
@@ -442,14 +909,18 @@ class AuditLogger:
         """
         if not self._initialized:
             await self.initialize()
+        await self.flush()
         
         since = datetime.utcnow() - timedelta(minutes=window_minutes)
         
-        count = await self.collection.count_documents({
-            "action": AuditAction.LOGIN_FAILED.value,
-            "user.email": email,
-            "timestamp": {"$gte": since}
-        })
+        if self.counters is not None:
+            count = await self.get_rolling_count("login_failed_email", email, window_minutes)
+        else:
+            count = await self.collection.count_documents({
+                "action": AuditAction.LOGIN_FAILED.value,
+                "user.email": email,
+                "timestamp": {"$gte": since}
+            })
         
         if count >= max_attempts:
             await self.log_security_event(
@@ -585,7 +1056,10 @@ def audit_action(
 __all__ = [
     'AuditAction',
     'AuditSeverity',
+    'AuditWriteBuffer',
     'AuditLogger',
+    'SECURITY_ACTIONS',
+    'ROLLING_COUNTERS',
     'get_audit_logger',
     'audit_action'
 ]
\ No newline at end of file
@@ -0,0 +1,426 @@
+"""
+Behavior Analytics
+Running point balances, incident counters and daily buckets maintained as discipline records are written
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+BALANCES_COLLECTION = "behavior_balances"
+DAILY_BUCKETS_COLLECTION = "behavior_daily_buckets"
+STUDENT_DAYS_COLLECTION = "behavior_student_days"
+
+REPEAT_OFFENDER_WINDOW_DAYS = 30
+REPEAT_OFFENDER_SHORT_WINDOW_DAYS = 7
+REPEAT_OFFENDER_THRESHOLD = 3
+TREND_DAYS = 30
+STUDENT_DAY_RETENTION_DAYS = 400
+META_ID = "meta"
+REBUILD_BATCH_SIZE = 1000
+
+# Fields whose change moves an incident or point between counters
+INCIDENT_FIELDS = ("student_id", "branch_id", "class_id", "incident_type", "severity", "incident_date", "status")
+POINT_FIELDS = ("student_id", "branch_id", "class_id", "point_type", "points", "date_awarded")
+
+
+def _field_key(value: Any) -> str:
+    """Make a value safe to use inside a dotted field path"""
+    return str(value if value is not None else "unknown").replace(".", "_").replace("$", "_")
+
+
+def _day(value: Any, fallback: Optional[datetime] = None) -> datetime:
+    if isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, date):
+        moment = datetime.combine(value, datetime.min.time())
+    elif isinstance(value, str):
+        try:
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            moment = fallback or datetime.utcnow()
+    else:
+        moment = fallback or datetime.utcnow()
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class BehaviorDelta:
+    """Counter changes for the materialized collections, accumulated and then written in bulk"""
+
+    def __init__(self):
+        # (collection, _id) -> {"$inc": {...}, "$set": {...}, "$max": {...}}
+        self.updates: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
+
+    def _update(self, collection: str, doc_id: str, fields: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        update = self.updates.get((collection, doc_id))
+        if update is None:
+            update = self.updates[(collection, doc_id)] = {"$inc": defaultdict(int), "$set": dict(fields), "$max": {}}
+        return update
+
+    def _balances(self, doc: Dict[str, Any], student: Dict[str, Any]):
+        """Balance documents an incident or point rolls up into: student, class and grade level"""
+        branch_id = doc.get("branch_id")
+        scopes = [("student", doc.get("student_id"))]
+        class_id = doc.get("class_id") or student.get("class_id")
+        if class_id:
+            scopes.append(("class", class_id))
+        if student.get("grade_level"):
+            scopes.append(("grade", student["grade_level"]))
+        for scope, key in scopes:
+            if key:
+                yield self._update(BALANCES_COLLECTION, f"{scope}:{branch_id}:{key}", {
+                    "scope": scope, "key": str(key), "branch_id": branch_id
+                })
+
+    def _bucket(self, doc: Dict[str, Any], day: datetime):
+        branch_id = doc.get("branch_id")
+        return self._update(DAILY_BUCKETS_COLLECTION, f"{branch_id}:{day:%Y%m%d}", {
+            "branch_id": branch_id, "day": day
+        })
+
+    def add_incident(self, incident: Dict[str, Any], student: Dict[str, Any], sign: int = 1):
+        day = _day(incident.get("incident_date"), incident.get("created_at"))
+        severity = _field_key(incident.get("severity"))
+        incident_type = _field_key(incident.get("incident_type"))
+        is_open = incident.get("status", "open") == "open"
+
+        for update in self._balances(incident, student):
+            update["$inc"]["incidents"] += sign
+            update["$inc"][f"incidents_by_severity.{severity}"] += sign
+            update["$inc"]["open_incidents"] += sign * is_open
+            if sign > 0:
+                update["$max"]["last_incident_at"] = day
+
+        bucket = self._bucket(incident, day)
+        bucket["$inc"]["incidents"] += sign
+        bucket["$inc"][f"incidents_by_type.{incident_type}"] += sign
+        bucket["$inc"][f"incidents_by_severity.{severity}"] += sign
+
+        student_id = incident.get("student_id")
+        if student_id:
+            student_day = self._update(STUDENT_DAYS_COLLECTION, f"{student_id}:{day:%Y%m%d}", {
+                "student_id": student_id,
+                "branch_id": incident.get("branch_id"),
+                "day": day,
+                "expires_at": day + timedelta(days=STUDENT_DAY_RETENTION_DAYS)
+            })
+            student_day["$inc"]["incidents"] += sign
+
+    def add_points(self, point: Dict[str, Any], student: Dict[str, Any], sign: int = 1):
+        amount = abs(int(point.get("points") or 0))
+        positive = point.get("point_type") == "positive"
+        field = "positive_points" if positive else "negative_points"
+        signed = amount if positive else -amount
+
+        for update in self._balances(point, student):
+            update["$inc"][field] += sign * amount
+            update["$inc"]["balance"] += sign * signed
+
+        bucket = self._bucket(point, _day(point.get("date_awarded"), point.get("created_at")))
+        bucket["$inc"][field] += sign * amount
+
+    def operations(self) -> Dict[str, List[UpdateOne]]:
+        ops: Dict[str, List[UpdateOne]] = defaultdict(list)
+        now = datetime.utcnow()
+        for (collection, doc_id), update in self.updates.items():
+            body: Dict[str, Any] = {"$set": {**update["$set"], "updated_at": now}}
+            increments = {k: v for k, v in update["$inc"].items() if v}
+            if increments:
+                body["$inc"] = increments
+            if update["$max"]:
+                body["$max"] = update["$max"]
+            if len(body) > 1:
+                ops[collection].append(UpdateOne({"_id": doc_id}, body, upsert=True))
+        return ops
+
+
+class BehaviorAnalytics:
+    """
+    Keeps behavior materializations current and builds the discipline statistics from them.
+
+    Incidents and behavior points are folded into per-student, per-class and per-grade
+    balances, daily branch buckets (trends) and per-student daily incident counts (repeat
+    offenders over sliding windows). Each write costs one bulk_write per collection.
+    Existing records are folded in by `rebuild`, run once on first use.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.balances = db[BALANCES_COLLECTION]
+        self.buckets = db[DAILY_BUCKETS_COLLECTION]
+        self.student_days = db[STUDENT_DAYS_COLLECTION]
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+
+    async def _student_context(self, student_ids) -> Dict[str, Dict[str, Any]]:
+        """Class and grade of students, found by custom student_id or by _id"""
+        ids = {str(s) for s in student_ids if s}
+        if not ids:
+            return {}
+        object_ids = [ObjectId(s) for s in ids if ObjectId.is_valid(s)]
+        context: Dict[str, Dict[str, Any]] = {}
+        cursor = self.db["students"].find(
+            {"$or": [{"student_id": {"$in": list(ids)}}, {"_id": {"$in": object_ids}}]},
+            {"student_id": 1, "class_id": 1, "grade_level": 1}
+        )
+        async for student in cursor:
+            for key in (student.get("student_id"), str(student["_id"])):
+                if key in ids:
+                    context[key] = student
+        return context
+
+    async def _write(self, delta: BehaviorDelta):
+        collections = {
+            BALANCES_COLLECTION: self.balances,
+            DAILY_BUCKETS_COLLECTION: self.buckets,
+            STUDENT_DAYS_COLLECTION: self.student_days
+        }
+        await asyncio.gather(*(
+            collections[name].bulk_write(ops, ordered=False)
+            for name, ops in delta.operations().items()
+        ))
+
+    async def _record(self, kind: str, changes: List[Tuple[Dict[str, Any], int]]):
+        try:
+            context = await self._student_context(doc.get("student_id") for doc, _ in changes)
+            delta = BehaviorDelta()
+            for doc, sign in changes:
+                student = context.get(str(doc.get("student_id")), {})
+                if kind == "incident":
+                    delta.add_incident(doc, student, sign)
+                else:
+                    delta.add_points(doc, student, sign)
+            await self._write(delta)
+        except Exception as e:
+            # Statistics must not fail the write that triggered them; rebuild repairs drift
+            logger.error(f"Failed to update behavior analytics for {kind}: {e}")
+
+    async def record_incident(self, incident: Dict[str, Any], sign: int = 1):
+        await self._record("incident", [(incident, sign)])
+
+    async def record_incident_change(self, before: Dict[str, Any], after: Dict[str, Any]):
+        if any(before.get(f) != after.get(f) for f in INCIDENT_FIELDS):
+            await self._record("incident", [(before, -1), (after, 1)])
+
+    async def record_points(self, point: Dict[str, Any], sign: int = 1):
+        await self._record("points", [(point, sign)])
+
+    async def record_points_change(self, before: Dict[str, Any], after: Dict[str, Any]):
+        if any(before.get(f) != after.get(f) for f in POINT_FIELDS):
+            await self._record("points", [(before, -1), (after, 1)])
+
+    @staticmethod
+    async def _create_indexes(balances, buckets, student_days):
+        await balances.create_index([("scope", ASCENDING), ("branch_id", ASCENDING)])
+        await buckets.create_index([("branch_id", ASCENDING), ("day", ASCENDING)])
+        await student_days.create_index([("branch_id", ASCENDING), ("day", ASCENDING)])
+        await student_days.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+    async def ensure_ready(self):
+        """Create indexes and fold in existing records the first time analytics are used"""
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if self._ready:
+                return
+            try:
+                await self._create_indexes(self.balances, self.buckets, self.student_days)
+            except Exception as e:
+                logger.warning(f"Could not create behavior analytics indexes: {str(e)}")
+            if await self.balances.find_one({"_id": META_ID}) is None:
+                await self.rebuild()
+            self._ready = True
+
+    async def _fold(self, delta: BehaviorDelta, kind: str, docs: List[Dict[str, Any]]):
+        context = await self._student_context(doc.get("student_id") for doc in docs)
+        for doc in docs:
+            student = context.get(str(doc.get("student_id")), {})
+            if kind == "incident":
+                delta.add_incident(doc, student)
+            else:
+                delta.add_points(doc, student)
+
+    async def rebuild(self):
+        """
+        Recompute every materialization from the incidents and behavior_points collections.
+        The counters are written to staging collections and renamed over the live ones,
+        balances (which carry META) last, so a failed build raises and leaves the previous
+        counters in place and concurrent builds each replace them instead of adding to
+        each other. Writes made while this runs can be missed, so run it when quiet.
+        """
+        delta = BehaviorDelta()
+        for kind, collection in (("incident", "incidents"), ("points", "behavior_points")):
+            batch: List[Dict[str, Any]] = []
+            async for doc in self.db[collection].find({}):
+                batch.append(doc)
+                if len(batch) >= REBUILD_BATCH_SIZE:
+                    await self._fold(delta, kind, batch)
+                    batch = []
+            if batch:
+                await self._fold(delta, kind, batch)
+
+        suffix = f"_rebuild_{ObjectId()}"
+        names = (DAILY_BUCKETS_COLLECTION, STUDENT_DAYS_COLLECTION, BALANCES_COLLECTION)
+        staging = {name: self.db[name + suffix] for name in names}
+        try:
+            await self._create_indexes(
+                staging[BALANCES_COLLECTION], staging[DAILY_BUCKETS_COLLECTION], staging[STUDENT_DAYS_COLLECTION]
+            )
+            for name, ops in delta.operations().items():
+                for start in range(0, len(ops), REBUILD_BATCH_SIZE):
+                    await staging[name].bulk_write(ops[start:start + REBUILD_BATCH_SIZE], ordered=False)
+            await staging[BALANCES_COLLECTION].insert_one(
+                {"_id": META_ID, "scope": META_ID, "rebuilt_at": datetime.utcnow()}
+            )
+            for name in names:
+                await staging[name].rename(name, dropTarget=True)
+        except Exception:
+            logger.exception("Behavior analytics rebuild failed; keeping the previous counters")
+            for collection in staging.values():
+                try:
+                    await collection.drop()
+                except Exception as e:
+                    logger.warning(f"Could not drop {collection.name}: {e}")
+            raise
+        logger.info(f"Rebuilt behavior analytics: {len(delta.updates)} counter documents")
+
+    async def statistics(self, branch_filter: Dict[str, Any], collections: Dict[str, Any]) -> Dict[str, Any]:
+        """The full discipline statistics payload; all queries run concurrently"""
+        await self.ensure_ready()
+        now = datetime.utcnow()
+        today = _day(now)
+        window_start = today - timedelta(days=REPEAT_OFFENDER_WINDOW_DAYS - 1)
+        short_window_start = today - timedelta(days=REPEAT_OFFENDER_SHORT_WINDOW_DAYS - 1)
+        trend_start = today - timedelta(days=TREND_DAYS - 1)
+
+        incident_pipeline = [
+            {"$match": branch_filter},
+            {"$facet": {
+                "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                "by_type": [{"$group": {"_id": "$incident_type", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}],
+                "by_severity": [{"$group": {"_id": "$severity", "count": {"$sum": 1}}}]
+            }}
+        ]
+        points_pipeline = [
+            {"$match": {**branch_filter, "scope": "student"}},
+            {"$group": {"_id": None, "positive": {"$sum": "$positive_points"}, "negative": {"$sum": "$negative_points"}}}
+        ]
+        offenders_pipeline = [
+            {"$match": {**branch_filter, "day": {"$gte": window_start}}},
+            {"$group": {
+                "_id": "$student_id",
+                "incidents": {"$sum": "$incidents"},
+                "recent_incidents": {"$sum": {"$cond": [{"$gte": ["$day", short_window_start]}, "$incidents", 0]}},
+                "last_incident": {"$max": "$day"}
+            }},
+            {"$match": {"incidents": {"$gte": REPEAT_OFFENDER_THRESHOLD}}},
+            {"$sort": {"incidents": -1, "last_incident": -1}},
+            {"$limit": 10}
+        ]
+
+        (
+            incident_facet, point_totals, offenders, trend_buckets, group_balances,
+            rewards_given, sessions_held, contracts_active, meetings_scheduled, actions_pending
+        ) = await asyncio.gather(
+            collections["incidents"].aggregate(incident_pipeline).to_list(1),
+            self.balances.aggregate(points_pipeline).to_list(1),
+            self.student_days.aggregate(offenders_pipeline).to_list(10),
+            self.buckets.find({**branch_filter, "day": {"$gte": trend_start}}).to_list(None),
+            self.balances.find({**branch_filter, "scope": {"$in": ["class", "grade"]}}).to_list(None),
+            collections["rewards"].count_documents(branch_filter),
+            collections["sessions"].count_documents({**branch_filter, "status": "completed"}),
+            collections["contracts"].count_documents({**branch_filter, "status": "active"}),
+            collections["meetings"].count_documents({**branch_filter, "status": {"$in": ["scheduled", "confirmed"]}}),
+            collections["actions"].count_documents({**branch_filter, "status": "pending"})
+        )
+
+        facet = (incident_facet or [{}])[0]
+        by_status = {row["_id"]: row["count"] for row in facet.get("by_status", [])}
+        by_type = facet.get("by_type", [])
+        totals = (point_totals or [{}])[0]
+
+        return {
+            "total_incidents": sum(by_status.values()),
+            "open_incidents": by_status.get("open", 0),
+            "resolved_incidents": by_status.get("resolved", 0),
+            "incidents_by_type": {row["_id"]: row["count"] for row in by_type},
+            "incidents_by_severity": {row["_id"]: row["count"] for row in facet.get("by_severity", [])},
+            "most_common_violations": [{"incident_type": row["_id"], "count": row["count"]} for row in by_type[:5]],
+            "repeat_offenders": [
+                {
+                    "student_id": row["_id"],
+                    "incidents": row["incidents"],
+                    "incidents_last_7_days": row["recent_incidents"],
+                    "window_days": REPEAT_OFFENDER_WINDOW_DAYS,
+                    "last_incident": row["last_incident"].date().isoformat()
+                }
+                for row in offenders
+            ],
+            "positive_behavior_points": int(totals.get("positive", 0)),
+            "negative_behavior_points": int(totals.get("negative", 0)),
+            "rewards_given": rewards_given,
+            "counseling_sessions_held": sessions_held,
+            "behavior_contracts_active": contracts_active,
+            "parent_meetings_scheduled": meetings_scheduled,
+            "disciplinary_actions_pending": actions_pending,
+            "trend_analysis": self._trend(trend_buckets, trend_start),
+            "class_behavior_summary": self._group_summary(group_balances, "class"),
+            "grade_level_analysis": self._group_summary(group_balances, "grade")
+        }
+
+    @staticmethod
+    def _trend(buckets: List[Dict[str, Any]], start: datetime) -> Dict[str, Any]:
+        """Daily incident and point totals across the trend window, branches merged"""
+        days = {(start + timedelta(days=i)).date().isoformat(): {"incidents": 0, "positive_points": 0, "negative_points": 0}
+                for i in range(TREND_DAYS)}
+        for bucket in buckets:
+            day = days.get(bucket["day"].date().isoformat())
+            if day is not None:
+                for field in day:
+                    day[field] += bucket.get(field, 0)
+        series = list(days.values())
+        half = TREND_DAYS // 2
+        earlier = sum(d["incidents"] for d in series[:half])
+        later = sum(d["incidents"] for d in series[half:])
+        direction = "stable" if earlier == later else ("increasing" if later > earlier else "decreasing")
+        return {"window_days": TREND_DAYS, "daily": days, "incident_direction": direction}
+
+    @staticmethod
+    def _group_summary(balances: List[Dict[str, Any]], scope: str) -> Dict[str, Any]:
+        summary: Dict[str, Dict[str, int]] = {}
+        for doc in balances:
+            if doc.get("scope") != scope:
+                continue
+            row = summary.setdefault(doc["key"], {
+                "incidents": 0, "open_incidents": 0, "positive_points": 0, "negative_points": 0, "balance": 0
+            })
+            for field in row:
+                row[field] += doc.get(field, 0)
+        return summary
+
+
+# Global behavior analytics, one per database
+_behavior_analytics: Dict[str, BehaviorAnalytics] = {}
+
+
+def get_behavior_analytics(db) -> BehaviorAnalytics:
+    """Get the process-wide behavior analytics for a database"""
+    analytics = _behavior_analytics.get(db.name)
+    if analytics is None:
+        analytics = _behavior_analytics[db.name] = BehaviorAnalytics(db)
+    return analytics
+
+
+# Export components
+__all__ = [
+    'BehaviorAnalytics',
+    'BehaviorDelta',
+    'get_behavior_analytics',
+    'REPEAT_OFFENDER_WINDOW_DAYS',
+    'REPEAT_OFFENDER_THRESHOLD'
+]
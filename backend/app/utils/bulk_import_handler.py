@@ -11,6 +11,8 @@ from motor.motor_asyncio import AsyncIOMotorCollection
 from ..models.payment import PaymentCreate
 from ..models.payment_detail import FeeItemCreate
 from ..utils.payment_validation import PaymentValidator, PaymentValidationError
+from ..utils.payment_search import payment_search_fields
+from ..utils.financial_rollup import get_financial_rollup
 
 
 class BulkImportError(Exception):
@@ -320,12 +322,15 @@ class PaymentBulkImporter:
                 self.payments_collection, branch_id
             )
 
+        payment_data.update(payment_search_fields(payment_data))
+
         # Insert payment
         payment_result = await self.payments_collection.insert_one(payment_data)
         payment_id = str(payment_result.inserted_id)
 
         # Insert payment details
         detail_ids = []
+        details = []
         for fee_item in fee_items:
             detail_data = {
                 "payment_id": payment_id,
@@ -356,6 +361,9 @@ class PaymentBulkImporter:
 
             detail_result = await self.payment_details_collection.insert_one(detail_data)
             detail_ids.append(str(detail_result.inserted_id))
+            details.append(detail_data)
+
+        await get_financial_rollup(self.payments_collection.database).record_payment(payment_data, details)
 
         return {
             "payment_id": payment_id,
@@ -1,17 +1,60 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
 from datetime import datetime, date, timedelta, time
+import asyncio
 import logging
 from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
 from app.models.academic_calendar import AcademicEventCreate, AcademicEvent
 from ..db import get_db
+from .event_recurrence import (
+    WEEKDAYS, as_datetime, interval_fields, with_interval_fields, find_occurrences
+)
 
 logger = logging.getLogger(__name__)
 
+# Events given index fields per round trip when backfilling
+EVENT_BACKFILL_BATCH = 1000
+
 class CalendarEventGenerator:
     """Handles automatic generation of calendar events from other modules"""
     
     def __init__(self):
         self.db = get_db()
+        self._indexes_ready = False
+        self._indexes_lock = asyncio.Lock()
+
+    async def ensure_event_indexes(self):
+        """Create the interval index and fill in index fields for events written before it"""
+        if self._indexes_ready:
+            return
+        async with self._indexes_lock:
+            if self._indexes_ready:
+                return
+            try:
+                await self.db.academic_events.create_index(
+                    [("interval_keys", ASCENDING), ("interval_start", ASCENDING)]
+                )
+                backfilled = 0
+                while True:
+                    batch = await self.db.academic_events.find(
+                        {"interval_keys": None, "start_date": {"$ne": None}}
+                    ).limit(EVENT_BACKFILL_BATCH).to_list(EVENT_BACKFILL_BATCH)
+                    updates = []
+                    for event in batch:
+                        try:
+                            updates.append(UpdateOne({"_id": event["_id"]}, {"$set": interval_fields(event)}))
+                        except (KeyError, TypeError, ValueError) as e:
+                            logger.warning(f"Could not index event {event['_id']} by interval: {e}")
+                    if updates:
+                        await self.db.academic_events.bulk_write(updates, ordered=False)
+                        backfilled += len(updates)
+                    if len(batch) < EVENT_BACKFILL_BATCH or not updates:
+                        break
+                if backfilled:
+                    logger.info(f"Indexed {backfilled} academic events by interval")
+            except Exception as e:
+                logger.warning(f"Could not create academic event interval index: {str(e)}")
+            self._indexes_ready = True
         
     async def generate_exam_events(self, exam_data: Dict[str, Any]) -> List[AcademicEvent]:
         """Generate calendar events for exam scheduling"""
@@ -49,7 +92,7 @@ class CalendarEventGenerator:
             )
             
             # Insert exam event
-            result = await self.db.academic_events.insert_one(exam_event.dict())
+            result = await self.db.academic_events.insert_one(with_interval_fields(exam_event.dict()))
             exam_event_id = str(result.inserted_id)
             
             events.append(AcademicEvent(
@@ -87,7 +130,7 @@ class CalendarEventGenerator:
                     }
                 )
                 
-                result = await self.db.academic_events.insert_one(reminder_event.dict())
+                result = await self.db.academic_events.insert_one(with_interval_fields(reminder_event.dict()))
                 reminder_event_id = str(result.inserted_id)
                 
                 events.append(AcademicEvent(
@@ -99,6 +142,8 @@ class CalendarEventGenerator:
         except Exception as e:
             logger.error(f"Error generating exam events: {str(e)}")
             
+        if events:
+            await self._events_changed()
         return events
     
     async def generate_payment_events(self, payment_data: Dict[str, Any]) -> List[AcademicEvent]:
@@ -133,7 +178,7 @@ class CalendarEventGenerator:
                 }
             )
             
-            result = await self.db.academic_events.insert_one(payment_event.dict())
+            result = await self.db.academic_events.insert_one(with_interval_fields(payment_event.dict()))
             payment_event_id = str(result.inserted_id)
             
             events.append(AcademicEvent(
@@ -168,7 +213,7 @@ class CalendarEventGenerator:
                 }
             )
             
-            result = await self.db.academic_events.insert_one(overdue_event.dict())
+            result = await self.db.academic_events.insert_one(with_interval_fields(overdue_event.dict()))
             overdue_event_id = str(result.inserted_id)
             
             events.append(AcademicEvent(
@@ -180,6 +225,8 @@ class CalendarEventGenerator:
         except Exception as e:
             logger.error(f"Error generating payment events: {str(e)}")
             
+        if events:
+            await self._events_changed()
         return events
     
     async def generate_report_events(self, report_data: Dict[str, Any]) -> List[AcademicEvent]:
@@ -215,7 +262,7 @@ class CalendarEventGenerator:
                 }
             )
             
-            result = await self.db.academic_events.insert_one(report_event.dict())
+            result = await self.db.academic_events.insert_one(with_interval_fields(report_event.dict()))
             report_event_id = str(result.inserted_id)
             
             events.append(AcademicEvent(
@@ -227,6 +274,8 @@ class CalendarEventGenerator:
         except Exception as e:
             logger.error(f"Error generating report events: {str(e)}")
             
+        if events:
+            await self._events_changed()
         return events
     
     async def generate_timetable_events(self, timetable_entries: List[Dict[str, Any]], academic_year: str, branch_id: str = None) -> List[AcademicEvent]:
@@ -252,6 +301,11 @@ class CalendarEventGenerator:
             subject_map = {str(subj['_id']): subj for subj in subjects}
             teacher_map = {str(teacher['_id']): teacher for teacher in teachers}
             
+            # Lessons repeat weekly through the academic year when its dates are known
+            year = await self.db.academic_years.find_one({"name": academic_year}, {"start_date": 1, "end_date": 1})
+            year_start = as_datetime(year.get("start_date")).date() if year and year.get("start_date") else None
+            year_end = as_datetime(year.get("end_date")) + timedelta(days=1) if year and year.get("end_date") else None
+            
             for entry in timetable_entries:
                 time_slot = time_slot_map.get(entry.get('time_slot_id'))
                 class_info = class_map.get(entry.get('class_id'))
@@ -292,12 +346,9 @@ class CalendarEventGenerator:
                 if target_weekday is None:
                     continue
                 
-                today = date.today()
-                days_ahead = target_weekday - today.weekday()
-                if days_ahead <= 0:  # Target day already happened this week
-                    days_ahead += 7
-                
-                next_occurrence = today + timedelta(days=days_ahead)
+                # The series starts on the first such weekday of the academic year (or from today)
+                series_from = year_start or date.today()
+                next_occurrence = series_from + timedelta(days=(target_weekday - series_from.weekday()) % 7)
                 
                 # Create datetime objects for start and end
                 start_time_str = time_slot.get('start_time', '09:00:00')
@@ -332,11 +383,9 @@ class CalendarEventGenerator:
                     visibility_roles=["admin", "principal", "teacher", "student", "parent"],
                     target_audience="all",
                     send_notifications=False,  # Don't send notifications for regular classes
-                    recurring_pattern={
-                        "type": "weekly",
-                        "day_of_week": entry.get('day_of_week'),
-                        "frequency": 1
-                    },
+                    is_recurring=True,
+                    recurrence_pattern=f"FREQ=WEEKLY;BYDAY={WEEKDAYS[target_weekday]}",
+                    recurrence_until=year_end,
                     metadata={
                         "day_of_week": entry.get('day_of_week'),
                         "period_number": time_slot.get('period_number'),
@@ -349,9 +398,15 @@ class CalendarEventGenerator:
                     }
                 )
                 
-                # Insert into database
-                result = await self.db.academic_events.insert_one(timetable_event.dict())
-                event_id = str(result.inserted_id)
+                # One recurring event per entry, replaced when the entry is synced again
+                result = await self.db.academic_events.find_one_and_update(
+                    {"source_type": "timetable", "source_id": timetable_event.source_id, "auto_generated": True},
+                    {"$set": with_interval_fields(timetable_event.dict())},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                    projection={"_id": 1}
+                )
+                event_id = str(result["_id"])
                 
                 events.append(AcademicEvent(
                     id=event_id,
@@ -362,6 +417,8 @@ class CalendarEventGenerator:
         except Exception as e:
             logger.error(f"Error generating timetable events: {str(e)}")
             
+        if events:
+            await self._events_changed()
         return events
     
     async def update_events_from_source(self, source_type: str, source_id: str, updated_data: Dict[str, Any]):
@@ -382,6 +439,7 @@ class CalendarEventGenerator:
                         {"_id": event["_id"]},
                         {"$set": {
                             "start_date": new_date,
+                            **interval_fields({**event, "start_date": new_date}),
                             "updated_at": datetime.now()
                         }}
                     )
@@ -391,11 +449,14 @@ class CalendarEventGenerator:
                         {"_id": event["_id"]},
                         {"$set": {
                             "start_date": new_due_date,
+                            **interval_fields({**event, "start_date": new_due_date}),
                             "updated_at": datetime.now()
                         }}
                     )
             
             logger.info(f"Updated {len(events)} events for {source_type} {source_id}")
+            if events:
+                await self._events_changed()
             
         except Exception as e:
             logger.error(f"Error updating events from source: {str(e)}")
@@ -410,60 +471,86 @@ class CalendarEventGenerator:
             })
             
             logger.info(f"Deleted {result.deleted_count} events for {source_type} {source_id}")
+            if result.deleted_count:
+                await self._events_changed()
             
         except Exception as e:
             logger.error(f"Error deleting events from source: {str(e)}")
 
+    async def _events_changed(self):
+        """Let calendar subscription feeds know academic events changed"""
+        from .calendar_feeds import touch_calendar_feeds, EVENTS_SCOPE
+        await touch_calendar_feeds(self.db, EVENTS_SCOPE)
+
     async def get_events_with_role_filter(self, query_params: Dict[str, Any], user_role: str, user_id: str = None) -> List[Dict[str, Any]]:
         """Get events filtered by user role and visibility settings"""
         try:
-            # Build base query
-            query = {}
-            
-            if query_params.get('start_date'):
-                query['start_date'] = {"$gte": datetime.fromisoformat(query_params['start_date'])}
-            if query_params.get('end_date'):
-                query['start_date'] = {**query.get('start_date', {}), "$lte": datetime.fromisoformat(query_params['end_date'])}
-            
-            if query_params.get('event_types'):
-                query['event_type'] = {"$in": query_params['event_types']}
-            
-            if query_params.get('branch_id'):
-                query['branch_id'] = query_params['branch_id']
-            
-            if query_params.get('class_ids'):
-                query['class_ids'] = {"$in": query_params['class_ids']}
-            
-            # Apply role-based visibility
-            if query_params.get('visibility_filter', True):
-                query['visibility_roles'] = {"$in": [user_role]}
-            
-            events = await self.db.academic_events.find(query).to_list(None)
-            
-            # Additional filtering based on target audience
-            filtered_events = []
-            for event in events:
-                target_audience = event.get('target_audience', 'all')
-                
-                if target_audience == 'all':
-                    filtered_events.append(event)
-                elif target_audience == 'staff' and user_role in ['admin', 'principal', 'teacher']:
-                    filtered_events.append(event)
-                elif target_audience == 'parents' and user_role == 'parent':
-                    filtered_events.append(event)
-                elif target_audience == 'students' and user_role == 'student':
-                    filtered_events.append(event)
-                elif target_audience == 'specific_class':
-                    # Check if user is associated with the class
-                    # This would need additional logic based on user's class associations
-                    filtered_events.append(event)
-            
-            return filtered_events
-            
+            return [event async for event in self.iter_events_with_role_filter(query_params, user_role, user_id)]
         except Exception as e:
             logger.error(f"Error getting role-filtered events: {str(e)}")
             return []
 
+    async def iter_events_with_role_filter(self, query_params: Dict[str, Any], user_role: str, user_id: str = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream role-filtered events from the cursor, for exports that should not hold them all"""
+        # Build base query
+        query = {}
+        window_start = datetime.fromisoformat(query_params['start_date']) if query_params.get('start_date') else None
+        window_end = datetime.fromisoformat(query_params['end_date']) if query_params.get('end_date') else None
+        windowed = window_start is not None and window_end is not None
+        
+        if not windowed:
+            if window_start:
+                query['start_date'] = {"$gte": window_start}
+            if window_end:
+                query['start_date'] = {**query.get('start_date', {}), "$lte": window_end}
+        
+        if query_params.get('event_types'):
+            query['event_type'] = {"$in": query_params['event_types']}
+        
+        if query_params.get('branch_id'):
+            query['branch_id'] = query_params['branch_id']
+        
+        if query_params.get('class_ids') and not windowed:
+            query['class_ids'] = {"$in": query_params['class_ids']}
+        
+        # Apply role-based visibility
+        if query_params.get('visibility_filter', True):
+            query['visibility_roles'] = {"$in": [user_role]}
+        
+        if windowed:
+            # Interval index lookup; recurring series come back once and are expanded to the window
+            await self.ensure_event_indexes()
+            scopes = [f"class:{class_id}" for class_id in query_params.get('class_ids') or []]
+            if query_params.get('teacher_id'):
+                scopes.append(f"teacher:{query_params['teacher_id']}")
+            for event in await find_occurrences(self.db.academic_events, window_start, window_end, query, scopes):
+                if self._audience_includes(event, user_role):
+                    yield event
+            return
+        
+        async for event in self.db.academic_events.find(query).sort("start_date", 1):
+            if self._audience_includes(event, user_role):
+                yield event
+
+    @staticmethod
+    def _audience_includes(event: Dict[str, Any], user_role: str) -> bool:
+        """Additional filtering based on target audience"""
+        target_audience = event.get('target_audience', 'all')
+        
+        if target_audience == 'all':
+            return True
+        elif target_audience == 'staff' and user_role in ['admin', 'principal', 'teacher']:
+            return True
+        elif target_audience == 'parents' and user_role == 'parent':
+            return True
+        elif target_audience == 'students' and user_role == 'student':
+            return True
+        elif target_audience == 'specific_class':
+            # Check if user is associated with the class
+            # This would need additional logic based on user's class associations
+            return True
+        return False
+
     async def get_upcoming_events_with_role_filter(self, user_role: str, user_id: str = None, branch_id: str = None, days_ahead: int = 30) -> List[Dict[str, Any]]:
         """Get upcoming events filtered by user role and visibility settings"""
         try:
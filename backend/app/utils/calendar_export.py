@@ -1,12 +1,50 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterable, AsyncIterator, Iterable
 from datetime import datetime, date
 import uuid
 import logging
 from app.models.academic_calendar import CalendarExportRequest, CalendarExportResponse
 from app.utils.calendar_events import calendar_event_generator
+from app.utils.event_recurrence import event_rule
 
 logger = logging.getLogger(__name__)
 
+# Lines buffered before a chunk of a streamed calendar is sent
+ICAL_CHUNK_LINES = 200
+# RFC 5545 limits content lines to 75 octets; longer ones continue on lines starting with a space
+ICAL_LINE_OCTETS = 75
+
+
+def fold_ical_line(line: str) -> str:
+    """Fold a content line at 75 octets without splitting a UTF-8 character"""
+    if len(line.encode("utf-8")) <= ICAL_LINE_OCTETS:
+        return line
+    parts, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        # Continuation lines spend one octet on the leading space
+        if size + width > (ICAL_LINE_OCTETS if not parts else ICAL_LINE_OCTETS - 1):
+            parts.append(current)
+            current, size = "", 0
+        current += char
+        size += width
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+
+def as_datetime(value: Any) -> datetime:
+    """Event dates as stored (datetime) or as serialized (ISO string)"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+
+
+async def _iterate(items: Iterable[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+
 class CalendarExporter:
     """Handles calendar export in various formats"""
     
@@ -17,17 +55,8 @@ class CalendarExporter:
         """Main export method that routes to specific format handlers"""
         try:
             # Get events based on request parameters
-            query_params = {
-                'start_date': export_request.date_range_start.isoformat() if export_request.date_range_start else None,
-                'end_date': export_request.date_range_end.isoformat() if export_request.date_range_end else None,
-                'event_types': export_request.include_event_types,
-                'branch_id': None,  # Would need to be passed from request context
-                'class_ids': export_request.class_ids,
-                'visibility_filter': not export_request.include_private_events
-            }
-            
             events = await calendar_event_generator.get_events_with_role_filter(
-                query_params, 
+                self._query_params(export_request), 
                 export_request.user_role, 
                 export_request.user_id
             )
@@ -46,31 +75,30 @@ class CalendarExporter:
             logger.error(f"Error exporting calendar: {str(e)}")
             raise
     
+    def _query_params(self, export_request: CalendarExportRequest) -> Dict[str, Any]:
+        return {
+            'start_date': export_request.date_range_start.isoformat() if export_request.date_range_start else None,
+            'end_date': export_request.date_range_end.isoformat() if export_request.date_range_end else None,
+            'event_types': export_request.include_event_types,
+            'branch_id': None,  # Would need to be passed from request context
+            'class_ids': export_request.class_ids,
+            'visibility_filter': not export_request.include_private_events
+        }
+    
+    async def stream_ical_export(self, export_request: CalendarExportRequest) -> AsyncIterator[str]:
+        """iCal export streamed from the events cursor instead of rendered in memory"""
+        events = calendar_event_generator.iter_events_with_role_filter(
+            self._query_params(export_request),
+            export_request.user_role,
+            export_request.user_id
+        )
+        async for chunk in self.stream_ical(await self.format_ical_event(event) async for event in events):
+            yield chunk
+    
     async def _export_ical(self, events: List[Dict[str, Any]], export_request: CalendarExportRequest) -> CalendarExportResponse:
         """Export events in iCal format"""
-        ical_content = []
-        
-        # iCal header
-        ical_content.extend([
-            "BEGIN:VCALENDAR",
-            "VERSION:2.0",
-            "PRODID:-//Spring of Knowledge Hub//Academic Calendar//EN",
-            "CALSCALE:GREGORIAN",
-            "METHOD:PUBLISH",
-            "X-WR-CALNAME:Academic Calendar",
-            "X-WR-CALDESC:Academic calendar events and schedules",
-            "X-WR-TIMEZONE:UTC"
-        ])
-        
-        # Process each event
-        for event in events:
-            event_lines = await self._format_ical_event(event)
-            ical_content.extend(event_lines)
-        
-        # iCal footer
-        ical_content.append("END:VCALENDAR")
-        
-        content = "\r\n".join(ical_content)
+        components = (await self.format_ical_event(event) async for event in _iterate(events))
+        content = "".join([chunk async for chunk in self.stream_ical(components)])
         filename = f"academic_calendar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ics"
         
         return CalendarExportResponse(
@@ -82,12 +110,38 @@ class CalendarExporter:
             generated_at=datetime.now()
         )
     
-    async def _format_ical_event(self, event: Dict[str, Any]) -> List[str]:
+    async def stream_ical(self, components: AsyncIterable[List[str]], calendar_name: str = "Academic Calendar",
+                          description: str = "Academic calendar events and schedules") -> AsyncIterator[str]:
+        """Yield a VCALENDAR in chunks as its VEVENT components (lists of lines) arrive"""
+        buffer = [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//Spring of Knowledge Hub//Academic Calendar//EN",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{self._escape_ical_text(calendar_name)}",
+            f"X-WR-CALDESC:{self._escape_ical_text(description)}",
+            "X-WR-TIMEZONE:UTC"
+        ]
+        
+        async for lines in components:
+            buffer.extend(lines)
+            if len(buffer) >= ICAL_CHUNK_LINES:
+                yield "".join(fold_ical_line(line) + "\r\n" for line in buffer)
+                buffer = []
+        
+        buffer.append("END:VCALENDAR")
+        yield "".join(fold_ical_line(line) + "\r\n" for line in buffer)
+    
+    async def format_ical_event(self, event: Dict[str, Any]) -> List[str]:
         """Format a single event for iCal"""
         lines = []
         
-        # Generate unique UID
-        event_uid = f"{event.get('id', uuid.uuid4())}@springofknowledgehub.com"
+        # Generate unique UID (an expanded occurrence of a series is its own event)
+        event_id = event.get('id') or event.get('_id') or uuid.uuid4()
+        if event.get('recurrence_id'):
+            event_id = f"{event_id}-{as_datetime(event['recurrence_id']).strftime('%Y%m%dT%H%M%S')}"
+        event_uid = f"{event_id}@springofknowledgehub.com"
         
         # Start event
         lines.append("BEGIN:VEVENT")
@@ -95,12 +149,13 @@ class CalendarExporter:
         # UID
         lines.append(f"UID:{event_uid}")
         
-        # DTSTAMP (creation time)
-        dtstamp = datetime.now().strftime("%Y%m%dT%H%M%SZ")
+        # DTSTAMP (last change, so re-rendering an unchanged event gives the same lines)
+        changed_at = event.get('updated_at') or event.get('created_at')
+        dtstamp = (as_datetime(changed_at) if changed_at else datetime.utcnow()).strftime("%Y%m%dT%H%M%SZ")
         lines.append(f"DTSTAMP:{dtstamp}")
         
         # Start date/time
-        start_dt = datetime.fromisoformat(event['start_date'].replace('Z', '+00:00'))
+        start_dt = as_datetime(event['start_date'])
         if event.get('is_all_day', True):
             lines.append(f"DTSTART;VALUE=DATE:{start_dt.strftime('%Y%m%d')}")
         else:
@@ -108,12 +163,23 @@ class CalendarExporter:
         
         # End date/time (if provided)
         if event.get('end_date'):
-            end_dt = datetime.fromisoformat(event['end_date'].replace('Z', '+00:00'))
+            end_dt = as_datetime(event['end_date'])
             if event.get('is_all_day', True):
                 lines.append(f"DTEND;VALUE=DATE:{end_dt.strftime('%Y%m%d')}")
             else:
                 lines.append(f"DTEND:{end_dt.strftime('%Y%m%dT%H%M%SZ')}")
         
+        # Recurrence, for a series written once rather than its occurrences
+        rule = event_rule(event) if not event.get('recurrence_id') else None
+        if rule is not None:
+            lines.append(f"RRULE:{rule.to_string()}")
+            for exception in event.get('recurrence_exceptions') or []:
+                exception_dt = as_datetime(exception)
+                if event.get('is_all_day', True):
+                    lines.append(f"EXDATE;VALUE=DATE:{exception_dt.strftime('%Y%m%d')}")
+                else:
+                    lines.append(f"EXDATE:{exception_dt.strftime('%Y%m%dT%H%M%SZ')}")
+        
         # Summary (title)
         summary = self._escape_ical_text(event.get('title', 'Academic Event'))
         lines.append(f"SUMMARY:{summary}")
@@ -201,7 +267,7 @@ class CalendarExporter:
     
     async def _format_google_calendar_event(self, event: Dict[str, Any]) -> List[str]:
         """Format a single event for Google Calendar CSV"""
-        start_dt = datetime.fromisoformat(event['start_date'].replace('Z', '+00:00'))
+        start_dt = as_datetime(event['start_date'])
         
         row = [
             f'"{event.get("title", "Academic Event")}"',  # Subject
@@ -251,7 +317,7 @@ class CalendarExporter:
     
     async def _format_outlook_event(self, event: Dict[str, Any]) -> List[str]:
         """Format a single event for Outlook CSV"""
-        start_dt = datetime.fromisoformat(event['start_date'].replace('Z', '+00:00'))
+        start_dt = as_datetime(event['start_date'])
         
         # Determine priority based on event type
         priority = "High" if event.get('event_type') in ['exam', 'deadline'] else "Normal"
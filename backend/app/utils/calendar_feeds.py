@@ -0,0 +1,264 @@
+"""
+Calendar Subscription Feeds
+Persistent .ics feed URLs with version-based ETags and a cache of rendered feeds
+"""
+import asyncio
+import hashlib
+import logging
+import secrets
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, Dict, Any, List, Mapping, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from ..models.timetable import TimetableExportRequest
+from .calendar_events import calendar_event_generator
+from .calendar_export import calendar_exporter
+from .timetable_export import TimetableExporter
+
+logger = logging.getLogger(__name__)
+
+FEEDS_COLLECTION = "calendar_feeds"
+VERSIONS_COLLECTION = "calendar_feed_versions"
+FEED_KINDS = ("user", "class", "teacher")
+
+# Version scopes; writers bump the scopes they touch and every feed built on them changes ETag
+# events                      - any academic event (all feeds that list events)
+# timetable:class:<class_id>  - timetable entries of one class
+# timetable:teacher:<id>      - timetable entries taught by one teacher
+# timetable:branch:<id>       - time slots or whole-branch timetable replacement
+EVENTS_SCOPE = "events"
+
+# Rendered feeds kept per process; larger feeds are streamed every time
+MAX_CACHED_FEEDS = 512
+MAX_CACHED_FEED_BYTES = 2 * 1024 * 1024
+FEED_MEDIA_TYPE = "text/calendar; charset=utf-8"
+
+
+def timetable_scope(kind: str, target_id: Optional[str]) -> str:
+    return f"timetable:{kind}:{target_id}"
+
+
+def feed_scopes(kind: str, target_id: str, branch_id: Optional[str]) -> List[str]:
+    """Version scopes a feed's content depends on"""
+    if kind == "user":
+        return [EVENTS_SCOPE]
+    scopes = [timetable_scope(kind, target_id), timetable_scope("branch", branch_id)]
+    return [EVENTS_SCOPE] + scopes if kind == "class" else scopes
+
+
+async def touch_calendar_feeds(db, *scopes: Optional[str]):
+    """Bump the version of each scope so feeds depending on it render afresh; never raises"""
+    scopes = sorted({scope for scope in scopes if scope})
+    if not scopes:
+        return
+    now = datetime.utcnow()
+    try:
+        await db[VERSIONS_COLLECTION].bulk_write([
+            UpdateOne({"_id": scope}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True)
+            for scope in scopes
+        ], ordered=False)
+    except Exception as e:
+        logger.error(f"Failed to bump calendar feed versions {scopes}: {e}")
+
+
+async def touch_timetable_feeds(db, entries: List[Dict[str, Any]]):
+    """Bump the class and teacher scopes of timetable entries that were written or removed"""
+    scopes = []
+    for entry in entries:
+        if entry.get("class_id"):
+            scopes.append(timetable_scope("class", entry["class_id"]))
+        if entry.get("teacher_id"):
+            scopes.append(timetable_scope("teacher", entry["teacher_id"]))
+    await touch_calendar_feeds(db, *scopes)
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+@dataclass
+class FeedState:
+    """A feed and what its content currently depends on, from one lookup"""
+    feed: Dict[str, Any]
+    etag: str
+    last_modified: datetime
+
+    @property
+    def token(self) -> str:
+        return self.feed["_id"]
+
+    def headers(self) -> Dict[str, str]:
+        return {"ETag": self.etag, "Last-Modified": http_date(self.last_modified),
+                "Cache-Control": "private, max-age=300"}
+
+    def not_modified(self, request_headers: Mapping[str, str]) -> bool:
+        """Conditional GET: If-None-Match wins over If-Modified-Since, as in RFC 9110"""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return self.last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+        return False
+
+
+class CalendarFeedService:
+    """
+    Subscription feeds keyed by an unguessable token, one per owner, kind and target.
+    A poll reads the feed with the versions of its scopes in a single aggregate on _id;
+    the ETag is derived from those versions, so an unchanged feed answers 304 (or from
+    the rendered-feed cache) without touching events or timetable entries. Renders
+    stream the calendar while it is generated and cache the result for the next poll.
+    Renames of subjects, rooms or teachers do not bump versions and show on the next change.
+    """
+
+    def __init__(self, db, max_cached_feeds: int = MAX_CACHED_FEEDS):
+        self.db = db
+        self.feeds = db[FEEDS_COLLECTION]
+        self.timetable_exporter = TimetableExporter()
+        self.max_cached_feeds = max_cached_feeds
+        # token -> (etag, rendered body), least recently used first
+        self._rendered: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+
+    async def ensure_ready(self):
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if self._ready:
+                return
+            try:
+                await self.feeds.create_index(
+                    [("owner_user_id", ASCENDING), ("kind", ASCENDING), ("target_id", ASCENDING)], unique=True
+                )
+            except Exception as e:
+                logger.warning(f"Could not create calendar feed indexes: {str(e)}")
+            self._ready = True
+
+    async def subscribe(self, owner: Dict[str, Any], kind: str, target_id: str,
+                        branch_id: Optional[str]) -> Dict[str, Any]:
+        """The owner's feed for a target, created on first request so its URL stays stable"""
+        await self.ensure_ready()
+        key = {"owner_user_id": str(owner.get("user_id")), "kind": kind, "target_id": target_id}
+        existing = await self.feeds.find_one(key)
+        if existing:
+            return existing
+        feed = {
+            "_id": secrets.token_urlsafe(24),
+            **key,
+            "branch_id": branch_id,
+            "owner_role": owner.get("role", "student"),
+            "scopes": feed_scopes(kind, target_id, branch_id),
+            "created_at": datetime.utcnow()
+        }
+        try:
+            await self.feeds.insert_one(feed)
+        except DuplicateKeyError:
+            # A concurrent request created it first
+            return await self.feeds.find_one(key)
+        return feed
+
+    async def revoke(self, token: str, owner_user_id: str) -> bool:
+        result = await self.feeds.delete_one({"_id": token, "owner_user_id": str(owner_user_id)})
+        self._rendered.pop(token, None)
+        return result.deleted_count > 0
+
+    async def lookup(self, token: str) -> Optional[FeedState]:
+        """The feed with its current ETag, or None if the token is unknown or revoked"""
+        docs = await self.feeds.aggregate([
+            {"$match": {"_id": token}},
+            {"$lookup": {"from": VERSIONS_COLLECTION, "localField": "scopes", "foreignField": "_id",
+                         "as": "versions"}}
+        ]).to_list(1)
+        if not docs:
+            return None
+        feed = docs[0]
+        scope_docs = feed.pop("versions", [])
+        versions = {v["_id"]: v.get("version", 0) for v in scope_docs}
+        fingerprint = ";".join(f"{scope}={versions.get(scope, 0)}" for scope in sorted(feed.get("scopes", [])))
+        etag = '"' + hashlib.sha1(f"{token}|{fingerprint}".encode()).hexdigest()[:20] + '"'
+        last_modified = max([v["updated_at"] for v in scope_docs if v.get("updated_at")]
+                            + [feed.get("created_at") or datetime.utcnow()])
+        return FeedState(feed, etag, last_modified)
+
+    def cached(self, state: FeedState) -> Optional[bytes]:
+        """The rendered feed if it was rendered at the current version"""
+        entry = self._rendered.get(state.token)
+        if entry is None or entry[0] != state.etag:
+            return None
+        self._rendered.move_to_end(state.token)
+        return entry[1]
+
+    def _store(self, state: FeedState, body: bytes):
+        if len(body) > MAX_CACHED_FEED_BYTES:
+            return
+        self._rendered[state.token] = (state.etag, body)
+        self._rendered.move_to_end(state.token)
+        while len(self._rendered) > self.max_cached_feeds:
+            self._rendered.popitem(last=False)
+
+    async def _components(self, feed: Dict[str, Any]) -> AsyncIterator[List[str]]:
+        kind, target_id, role = feed["kind"], feed["target_id"], feed.get("owner_role", "student")
+        if kind in ("user", "class"):
+            query_params = {"class_ids": [target_id] if kind == "class" else None, "visibility_filter": True}
+            async for event in calendar_event_generator.iter_events_with_role_filter(
+                query_params, role, feed["owner_user_id"]
+            ):
+                yield await calendar_exporter.format_ical_event(event)
+        if kind in ("class", "teacher"):
+            export_request = TimetableExportRequest(format="ical", view_type=kind, target_id=target_id)
+            timetable_data = await self.timetable_exporter.get_timetable_data(
+                export_request, self.db, feed.get("branch_id")
+            )
+            for entry in timetable_data["entries"]:
+                lines = self.timetable_exporter.ical_event_lines(entry, export_request.include_breaks)
+                if lines:
+                    yield lines
+
+    async def render(self, state: FeedState) -> AsyncIterator[bytes]:
+        """Stream the feed's .ics and cache it once fully sent"""
+        names = {"user": "Academic Calendar", "class": "Class Calendar", "teacher": "Teaching Timetable"}
+        chunks: List[bytes] = []
+        async for text in calendar_exporter.stream_ical(self._components(state.feed), names[state.feed["kind"]]):
+            chunk = text.encode("utf-8")
+            chunks.append(chunk)
+            yield chunk
+        self._store(state, b"".join(chunks))
+
+
+# Global feed services, one per database
+_feed_services: Dict[str, CalendarFeedService] = {}
+
+
+def get_calendar_feed_service(db) -> CalendarFeedService:
+    """Get the process-wide calendar feed service for a database"""
+    service = _feed_services.get(db.name)
+    if service is None:
+        service = _feed_services[db.name] = CalendarFeedService(db)
+    return service
+
+
+# Export components
+__all__ = [
+    'CalendarFeedService',
+    'FeedState',
+    'get_calendar_feed_service',
+    'touch_calendar_feeds',
+    'touch_timetable_feeds',
+    'feed_scopes',
+    'timetable_scope',
+    'EVENTS_SCOPE',
+    'FEED_KINDS',
+    'FEED_MEDIA_TYPE'
+]
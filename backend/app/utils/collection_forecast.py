@@ -0,0 +1,373 @@
+"""
+Collection Forecast Models
+Seasonal regression over daily collection series, updated incrementally as days complete
+"""
+import asyncio
+import logging
+import math
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .financial_rollup import get_financial_rollup
+
+logger = logging.getLogger(__name__)
+
+# Weekly pattern, first two weeks of a term, first days of a month
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+FEATURE_NAMES = ["intercept", "trend"] + [f"weekday_{name.lower()}" for name in WEEKDAY_NAMES[1:]] + [
+    "term_week_1", "term_week_2", "month_start"
+]
+MONTH_START_DAYS = 5
+# Per-day weight decay: an observation a year old counts about 2.5% as much as today's
+DEFAULT_DECAY = 0.99
+RIDGE = 1e-3
+# Two-sided 90% normal interval
+Z_90 = 1.6449
+# Rollup history loaded when a forecaster starts; older days carry almost no weight
+HISTORY_DAYS = 730
+# Series key for a branch's collections across all fee categories
+BRANCH_TOTAL = "*"
+# Rollup writes are stamped with the writing server's clock and may commit out of order, so each
+# sync re-reads this far behind the newest updated_at it saw; re-read documents change nothing
+SYNC_OVERLAP = timedelta(minutes=10)
+
+
+def design_matrix(days: Sequence[datetime], origin: datetime, term_starts: Sequence[datetime] = ()) -> np.ndarray:
+    """One row of features per day; built in bulk with array operations"""
+    ordinals = np.array([d.toordinal() for d in days], dtype=np.int64)
+    n = len(ordinals)
+    x = np.zeros((n, len(FEATURE_NAMES)))
+    x[:, 0] = 1.0
+    x[:, 1] = (ordinals - origin.toordinal()) / 365.0
+    weekdays = (ordinals - 1) % 7  # date.fromordinal(1) is a Monday
+    for w in range(1, 7):
+        x[:, 1 + w] = weekdays == w
+
+    if len(term_starts) and n:
+        starts = np.sort(np.array([s.toordinal() for s in term_starts], dtype=np.int64))
+        # Days since the latest term start on or before each day
+        idx = np.searchsorted(starts, ordinals, side="right") - 1
+        since = np.where(idx >= 0, ordinals - starts[np.clip(idx, 0, None)], -1)
+        x[:, 8] = (since >= 0) & (since < 7)
+        x[:, 9] = (since >= 7) & (since < 14)
+    x[:, 10] = np.array([d.day <= MONTH_START_DAYS for d in days], dtype=float)
+    return x
+
+
+class SeasonalRegression:
+    """
+    Least-squares regression of daily collections on trend, weekday, term-start and
+    month-start effects, kept as exponentially weighted sufficient statistics
+    (XᵀWX, XᵀWy, yᵀWy). Adding days or correcting an already-counted day is an O(p²)
+    update, so a fitted model is never refit from the raw history.
+    """
+
+    def __init__(self, origin: datetime, decay: float = DEFAULT_DECAY):
+        p = len(FEATURE_NAMES)
+        self.origin = origin
+        self.decay = decay
+        self.xtx = np.zeros((p, p))
+        self.xty = np.zeros(p)
+        self.yty = 0.0
+        self.weight = 0.0
+        self.observations = 0
+        self.last_day: Optional[datetime] = None
+        self._coef: Optional[np.ndarray] = None
+
+    def _age_weights(self, days: Sequence[datetime]) -> np.ndarray:
+        ages = np.array([(self.last_day - d).days for d in days], dtype=float)
+        return self.decay ** ages
+
+    def observe(self, days: Sequence[datetime], values: Sequence[float], term_starts: Sequence[datetime] = ()):
+        """Fold in consecutive new days after `last_day`"""
+        if not len(days):
+            return
+        x = design_matrix(days, self.origin, term_starts)
+        y = np.asarray(values, dtype=float)
+        if self.last_day is not None:
+            aging = self.decay ** (days[-1] - self.last_day).days
+            self.xtx *= aging
+            self.xty *= aging
+            self.yty *= aging
+            self.weight *= aging
+        self.last_day = days[-1]
+        w = self._age_weights(days)
+        xw = x * w[:, None]
+        self.xtx += xw.T @ x
+        self.xty += xw.T @ y
+        self.yty += float(w @ (y * y))
+        self.weight += float(w.sum())
+        self.observations += len(days)
+        self._coef = None
+
+    def revise(self, days: Sequence[datetime], old_values: Sequence[float], new_values: Sequence[float],
+               term_starts: Sequence[datetime] = ()):
+        """Replace the values of days already observed (late or backdated payments, refunds)"""
+        if not len(days):
+            return
+        x = design_matrix(days, self.origin, term_starts)
+        w = self._age_weights(days)
+        old, new = np.asarray(old_values, dtype=float), np.asarray(new_values, dtype=float)
+        self.xty += (x * w[:, None]).T @ (new - old)
+        self.yty += float(w @ (new * new - old * old))
+        self._coef = None
+
+    def _regularized(self) -> np.ndarray:
+        return self.xtx + RIDGE * max(self.weight, 1.0) * np.eye(len(FEATURE_NAMES))
+
+    @property
+    def coefficients(self) -> np.ndarray:
+        if self._coef is None:
+            self._coef = np.linalg.solve(self._regularized(), self.xty)
+        return self._coef
+
+    @property
+    def residual_variance(self) -> float:
+        beta = self.coefficients
+        sse = self.yty - 2 * beta @ self.xty + beta @ self.xtx @ beta
+        dof = max(self.weight - len(FEATURE_NAMES), 1.0)
+        return max(float(sse) / dof, 0.0)
+
+    def forecast(self, days: Sequence[datetime], term_starts: Sequence[datetime] = (),
+                 z: float = Z_90) -> Dict[str, Any]:
+        """Daily means with prediction intervals, and the total over `days` with its own interval"""
+        x = design_matrix(days, self.origin, term_starts)
+        mean = x @ self.coefficients
+        sigma2 = self.residual_variance
+        inverse = np.linalg.inv(self._regularized())
+        # Noise plus coefficient uncertainty, per day and for the sum of the days
+        daily_var = sigma2 * (1 + np.einsum("ij,jk,ik->i", x, inverse, x))
+        ones = x.sum(axis=0)
+        total_var = sigma2 * (len(days) + ones @ inverse @ ones)
+        daily_sd = np.sqrt(daily_var)
+        total = float(mean.sum())
+        total_sd = math.sqrt(max(float(total_var), 0.0))
+        return {
+            "mean": mean,
+            "lower": np.maximum(mean - z * daily_sd, 0.0),
+            "upper": mean + z * daily_sd,
+            "total": total,
+            "total_lower": max(total - z * total_sd, 0.0),
+            "total_upper": total + z * total_sd,
+            "total_variance": float(total_var)
+        }
+
+    def weekly_pattern(self) -> Dict[str, float]:
+        """Expected difference from Monday's collections for each weekday"""
+        beta = self.coefficients
+        return {name: round(float(beta[1 + i]) if i else 0.0, 2) for i, name in enumerate(WEEKDAY_NAMES)}
+
+
+def future_days(start: datetime, count: int) -> List[datetime]:
+    return [start + timedelta(days=i) for i in range(count)]
+
+
+@dataclass
+class SeriesState:
+    """A daily series and its model; days up to `fitted_through` are folded into the model"""
+    name: str
+    values: Dict[datetime, float] = field(default_factory=dict)
+    model: Optional[SeasonalRegression] = None
+    fitted_through: Optional[datetime] = None
+    # Already fitted days whose value has since changed -> the value the model saw
+    revised: Dict[datetime, float] = field(default_factory=dict)
+
+    def set_value(self, day: datetime, value: float) -> float:
+        old = self.values.get(day, 0.0)
+        if self.fitted_through is not None and day <= self.fitted_through:
+            self.revised.setdefault(day, old)
+        self.values[day] = value
+        return old
+
+    def advance(self, through: datetime, term_starts: Sequence[datetime]):
+        """Bring the model up to date with every complete day through `through`"""
+        if self.model is not None and self.revised:
+            days = sorted(d for d in self.revised if self.model.last_day and d <= self.model.last_day)
+            self.model.revise(days, [self.revised[d] for d in days], [self.values.get(d, 0.0) for d in days],
+                              term_starts)
+        self.revised.clear()
+
+        if self.model is None:
+            if not self.values:
+                return
+            first = min(self.values)
+            if first > through:
+                return
+            self.model = SeasonalRegression(origin=first)
+            start = first
+        else:
+            start = self.fitted_through + timedelta(days=1)
+        if start > through:
+            return
+        days = future_days(start, (through - start).days + 1)
+        self.model.observe(days, [self.values.get(d, 0.0) for d in days], term_starts)
+        self.fitted_through = through
+
+        cutoff = through - timedelta(days=HISTORY_DAYS)
+        for day in [d for d in self.values if d < cutoff]:
+            del self.values[day]
+
+
+class CollectionForecaster:
+    """
+    Keeps one SeriesState per branch and fee category (plus each branch's total) fed from
+    the financial rollup. The first forecast loads the rollup history once; after that each
+    call reads only the rollup documents written since the previous call (less SYNC_OVERLAP) and advances the
+    models by the days that have completed, so forecasting every branch costs two small
+    queries however much payment history there is.
+    """
+
+    def __init__(self, db, rollup=None, clock=datetime.now):
+        self.db = db
+        self.rollup = rollup or get_financial_rollup(db)
+        self.terms = db["terms"]
+        self.clock = clock
+        self.series: Dict[Tuple[str, str], SeriesState] = {}
+        # Per rollup document: the value folded into the series
+        self._seen: Dict[str, float] = {}
+        self.synced_at: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    async def _term_starts(self) -> Dict[Optional[str], List[datetime]]:
+        """Term start dates per branch; terms without a branch apply to every branch"""
+        starts: Dict[Optional[str], List[datetime]] = defaultdict(list)
+        try:
+            async for term in self.terms.find({}, {"start_date": 1, "branch_id": 1}):
+                if isinstance(term.get("start_date"), datetime):
+                    starts[term.get("branch_id")].append(term["start_date"])
+        except Exception as e:
+            logger.warning(f"Could not load term dates for forecasting: {str(e)}")
+        return starts
+
+    def _apply(self, doc: Dict[str, Any]):
+        branch_id, day, category_id = doc["branch_id"], doc["day"], doc["fee_category_id"]
+        value = float(doc["collected"])
+        old = self._seen.get(doc["_id"], 0.0)
+        self._seen[doc["_id"]] = value
+        # Documents are per payment method too, so each series sums the documents' changes
+        for key, name in (((branch_id, category_id), doc.get("fee_category_name") or category_id),
+                          ((branch_id, BRANCH_TOTAL), "All fee categories")):
+            state = self.series.setdefault(key, SeriesState(name))
+            state.set_value(day, state.values.get(day, 0.0) + value - old)
+
+    async def sync(self):
+        """Fold rollup changes into the series and advance the models through yesterday"""
+        today = datetime.combine(self.clock().date(), datetime.min.time())
+        if self.synced_at is None:
+            docs = await self.rollup.daily_documents(start=today - timedelta(days=HISTORY_DAYS))
+        else:
+            docs = await self.rollup.daily_documents(changed_since=self.synced_at - SYNC_OVERLAP)
+        cutoff = today - timedelta(days=HISTORY_DAYS)
+        for doc in docs:
+            if doc.get("day") and doc["day"] >= cutoff:
+                self._apply(doc)
+            if doc.get("updated_at") and (self.synced_at is None or doc["updated_at"] > self.synced_at):
+                self.synced_at = doc["updated_at"]
+        if self.synced_at is None:
+            self.synced_at = datetime.utcnow() - timedelta(minutes=1)
+
+        term_starts = await self._term_starts()
+        yesterday = today - timedelta(days=1)
+        for (branch_id, _), state in self.series.items():
+            state.advance(yesterday, term_starts.get(branch_id, []) + term_starts.get(None, []))
+        return today, term_starts
+
+    @staticmethod
+    def _summary(state: SeriesState, days: List[datetime], term_starts: Sequence[datetime]) -> Dict[str, Any]:
+        forecast = state.model.forecast(days, term_starts)
+        return {
+            "predicted_collections": round(forecast["total"], 2),
+            "lower_bound": round(forecast["total_lower"], 2),
+            "upper_bound": round(forecast["total_upper"], 2),
+            "variance": forecast["total_variance"],
+            "daily": forecast
+        }
+
+    async def forecast(self, branch_ids: Optional[List[str]] = None, forecast_days: int = 30) -> Dict[str, Any]:
+        """Forecasts with 90% intervals for each branch (default: every branch with collections)"""
+        async with self._lock:
+            today, term_starts = await self.sync()
+            days = future_days(today, forecast_days)
+            known = sorted({b for b, _ in self.series})
+            results: Dict[str, Any] = {}
+            for branch_id in (branch_ids if branch_ids is not None else known):
+                total = self.series.get((branch_id, BRANCH_TOTAL))
+                if total is None or total.model is None:
+                    results[branch_id] = {
+                        "branch_id": branch_id, "forecast_period": forecast_days,
+                        "predicted_collections": 0, "lower_bound": 0, "upper_bound": 0,
+                        "confidence": 0, "based_on_days": 0
+                    }
+                    continue
+                terms = term_starts.get(branch_id, []) + term_starts.get(None, [])
+                summary = self._summary(total, days, terms)
+                daily = summary.pop("daily")
+                recent = [total.values.get(today - timedelta(days=i), 0.0) for i in range(1, 91)]
+                categories = []
+                for (b, category_id), state in self.series.items():
+                    if b != branch_id or category_id == BRANCH_TOTAL or state.model is None:
+                        continue
+                    category = self._summary(state, days, terms)
+                    category.pop("daily")
+                    category.pop("variance")
+                    categories.append({"fee_category_id": category_id, "fee_category_name": state.name, **category})
+                results[branch_id] = {
+                    "branch_id": branch_id,
+                    "forecast_period": forecast_days,
+                    "start_date": days[0].date().isoformat(),
+                    "end_date": days[-1].date().isoformat(),
+                    **summary,
+                    "confidence_level": 90,
+                    "average_daily_collection": round(sum(recent) / len(recent), 2),
+                    "confidence": round(min(total.model.observations / 30, 1.0) * 100, 2),
+                    "based_on_days": total.model.observations,
+                    "fitted_through": total.fitted_through.date().isoformat(),
+                    "weekly_pattern": total.model.weekly_pattern(),
+                    "daily": [
+                        {"date": d.date().isoformat(), "predicted": round(float(m), 2),
+                         "lower": round(float(lo), 2), "upper": round(float(hi), 2)}
+                        for d, m, lo, hi in zip(days, daily["mean"], daily["lower"], daily["upper"])
+                    ],
+                    "by_fee_category": sorted(categories, key=lambda c: -c["predicted_collections"])
+                }
+
+        # Branch totals are treated as independent when combined
+        predicted = sum(r["predicted_collections"] for r in results.values())
+        spread = Z_90 * math.sqrt(sum(r.pop("variance", 0.0) for r in results.values()))
+        return {
+            "forecast_period": forecast_days,
+            "confidence_level": 90,
+            "predicted_collections": round(predicted, 2),
+            "lower_bound": round(max(predicted - spread, 0.0), 2),
+            "upper_bound": round(predicted + spread, 2),
+            "branches": results,
+            "generated_at": datetime.utcnow()
+        }
+
+
+# Global forecasters, one per database
+_forecasters: Dict[str, CollectionForecaster] = {}
+
+
+def get_collection_forecaster(db) -> CollectionForecaster:
+    """Get the process-wide collection forecaster for a database"""
+    forecaster = _forecasters.get(db.name)
+    if forecaster is None:
+        forecaster = _forecasters[db.name] = CollectionForecaster(db)
+    return forecaster
+
+
+# Export components
+__all__ = [
+    'CollectionForecaster',
+    'get_collection_forecaster',
+    'SeasonalRegression',
+    'design_matrix',
+    'future_days',
+    'FEATURE_NAMES',
+    'Z_90'
+]
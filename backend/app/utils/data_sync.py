@@ -52,6 +52,7 @@ class SyncEvent:
     full_document: Optional[Dict[str, Any]] = None
     full_document_before_change: Optional[Dict[str, Any]] = None
     updated_fields: Optional[Dict[str, Any]] = None
+    removed_fields: Optional[List[str]] = None
     timestamp: datetime = None
     priority: SyncPriority = SyncPriority.MEDIUM
     status: SyncStatus = SyncStatus.PENDING
@@ -419,6 +420,9 @@ class DataSyncManager:
             full_document = change.get("fullDocument")
             full_document_before = change.get("fullDocumentBeforeChange")
             updated_fields = change.get("updateDescription", {}).get("updatedFields")
+            removed_fields = change.get("updateDescription", {}).get("removedFields")
+            # The change stream resume token identifies the event across workers
+            resume_token = change.get("_id", {})
             
             # Determine priority based on collection and operation
             priority = self._determine_event_priority(collection_name, operation_type)
@@ -441,10 +445,11 @@ class DataSyncManager:
                 full_document=full_document,
                 full_document_before_change=full_document_before,
                 updated_fields=updated_fields,
+                removed_fields=removed_fields,
                 priority=priority,
                 branch_id=branch_id,
                 user_id=user_id,
-                correlation_id=change.get("_id", {}).get("$oid")
+                correlation_id=resume_token.get("$oid") or resume_token.get("_data")
             )
             
             return sync_event
@@ -0,0 +1,137 @@
+"""
+Discipline Code Allocator
+Issues incident, action, point, reward, session, contract, rubric and meeting codes from sequence counters
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, date
+from typing import Dict, Any, List, Optional
+from pymongo import ASCENDING
+
+from .sequence_counters import get_sequence_counter_service, counter_key, max_code_number
+
+logger = logging.getLogger(__name__)
+
+# kind -> (collection, code field, prefix)
+DISCIPLINE_CODE_TYPES = {
+    "incident": ("incidents", "incident_code", "INC"),
+    "action": ("disciplinary_actions", "action_code", "DA"),
+    "point": ("behavior_points", "point_code", "BP"),
+    "reward": ("rewards", "reward_code", "RW"),
+    "session": ("counseling_sessions", "session_code", "CS"),
+    "contract": ("behavior_contracts", "contract_code", "BC"),
+    "rubric": ("behavior_rubrics", "rubric_code", "BR"),
+    "meeting": ("parent_meetings", "meeting_code", "PM"),
+}
+CODE_DIGITS = 6
+
+
+def format_discipline_code(prefix: str, year: int, number: int) -> str:
+    """e.g. INC-2025-000042; the dashed form cannot collide with the older random INC123456 codes"""
+    return f"{prefix}-{year}-{number:0{CODE_DIGITS}d}"
+
+
+def _record_year(value: Any, default: int) -> int:
+    if isinstance(value, (datetime, date)):
+        return value.year
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).year
+        except ValueError:
+            pass
+    return default
+
+
+class DisciplineCodeAllocator:
+    """
+    Codes are numbered per record type and year from the shared `counters` collection, so each
+    code costs one find_one_and_update and no existence checks. Numbering is global rather than
+    per branch so a code alone identifies a record; a unique index on each code field backs that.
+    """
+
+    def __init__(self, db, counters=None):
+        self.db = db
+        self.counters = counters or get_sequence_counter_service(db)
+        self._indexed: set = set()
+
+    async def ensure_index(self, kind: str):
+        """Unique index on the kind's code field; records without a code are left out of it"""
+        if kind in self._indexed:
+            return
+        collection_name, field, _ = DISCIPLINE_CODE_TYPES[kind]
+        try:
+            await self.db[collection_name].create_index(
+                [(field, ASCENDING)], unique=True,
+                partialFilterExpression={field: {"$type": "string"}}
+            )
+        except Exception as e:
+            # Usually existing duplicate codes; the counter still issues unique codes, so carry on
+            logger.warning(f"Could not create unique index on {collection_name}.{field}: {str(e)}")
+        self._indexed.add(kind)
+
+    def _key_and_seed(self, kind: str, year: int):
+        collection_name, field, prefix = DISCIPLINE_CODE_TYPES[kind]
+
+        async def last_issued() -> int:
+            return await max_code_number(self.db[collection_name], field, f"^{prefix}-{year}-")
+
+        return counter_key("discipline", prefix, year=year), last_issued
+
+    async def next_code(self, kind: str, year: Optional[int] = None) -> str:
+        """Allocate one code, numbered within `year` (default: the current year)"""
+        await self.ensure_index(kind)
+        year = year or datetime.utcnow().year
+        key, seed = self._key_and_seed(kind, year)
+        number = await self.counters.next_value(key, seed=seed)
+        return format_discipline_code(DISCIPLINE_CODE_TYPES[kind][2], year, number)
+
+    async def allocate_codes(self, kind: str, count: int, year: Optional[int] = None) -> List[str]:
+        """Reserve `count` consecutive codes with a single counter update"""
+        if count <= 0:
+            return []
+        await self.ensure_index(kind)
+        year = year or datetime.utcnow().year
+        key, seed = self._key_and_seed(kind, year)
+        first, last = await self.counters.allocate_block(key, count, seed=seed)
+        prefix = DISCIPLINE_CODE_TYPES[kind][2]
+        return [format_discipline_code(prefix, year, n) for n in range(first, last + 1)]
+
+    async def assign_codes(self, kind: str, records: List[Dict[str, Any]], date_field: str) -> List[Dict[str, Any]]:
+        """
+        Fill in codes for a batch of records (e.g. an import of historic data), numbered in the
+        year of each record's `date_field`. Records that already carry a code keep it.
+        One counter update per distinct year, whatever the batch size.
+        """
+        field = DISCIPLINE_CODE_TYPES[kind][1]
+        current_year = datetime.utcnow().year
+        by_year: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for record in records:
+            if not record.get(field):
+                by_year[_record_year(record.get(date_field), current_year)].append(record)
+
+        for year in sorted(by_year):
+            pending = by_year[year]
+            for record, code in zip(pending, await self.allocate_codes(kind, len(pending), year)):
+                record[field] = code
+        return records
+
+
+# Global code allocators, one per database
+_code_allocators: Dict[str, DisciplineCodeAllocator] = {}
+
+
+def get_discipline_code_allocator(db) -> DisciplineCodeAllocator:
+    """Get the process-wide discipline code allocator for a database"""
+    allocator = _code_allocators.get(db.name)
+    if allocator is None:
+        allocator = _code_allocators[db.name] = DisciplineCodeAllocator(db)
+    return allocator
+
+
+# Export components
+__all__ = [
+    'DisciplineCodeAllocator',
+    'get_discipline_code_allocator',
+    'format_discipline_code',
+    'DISCIPLINE_CODE_TYPES'
+]
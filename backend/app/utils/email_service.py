@@ -11,12 +11,143 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import os
+import time
+import queue
+import threading
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import aiohttp
 
 logger = logging.getLogger(__name__)
 
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of authenticated SMTP connections.
+    Connections are reused across messages and replaced when the server drops them,
+    when they exceed their message budget or when they sit idle too long.
+    """
+    
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        size: int = 5,
+        max_messages_per_connection: int = 100,
+        max_idle_seconds: float = 60.0,
+        connection_factory=None
+    ):
+        self.config = config
+        self.size = size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.max_idle_seconds = max_idle_seconds
+        self.connection_factory = connection_factory or smtplib.SMTP
+        
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.stats = {"connections_opened": 0, "connections_closed": 0, "messages_sent": 0, "reconnects": 0}
+    
+    def _open(self) -> Dict[str, Any]:
+        """Open, secure and authenticate a new connection"""
+        server = self.connection_factory(self.config["host"], self.config["port"], timeout=30)
+        if self.config["use_tls"]:
+            server.starttls(context=ssl.create_default_context())
+        if self.config["username"]:
+            server.login(self.config["username"], self.config["password"])
+        with self._lock:
+            self.stats["connections_opened"] += 1
+        return {"server": server, "messages": 0, "last_used": time.monotonic()}
+    
+    @staticmethod
+    def _is_connection_error(error: Exception) -> bool:
+        """Errors after which the connection is discarded and the send retried on a fresh one"""
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return True
+        if isinstance(error, smtplib.SMTPResponseException):
+            # 421: service closing transmission channel
+            return error.smtp_code == 421
+        return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+    
+    def _close(self, conn: Dict[str, Any]):
+        try:
+            conn["server"].quit()
+        except Exception:
+            try:
+                conn["server"].close()
+            except Exception:
+                pass
+        with self._lock:
+            self.stats["connections_closed"] += 1
+    
+    def _checkout(self) -> Dict[str, Any]:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            
+            if time.monotonic() - conn["last_used"] > self.max_idle_seconds:
+                # Servers commonly drop idle sessions; probe before reuse
+                try:
+                    if conn["server"].noop()[0] == 250:
+                        return conn
+                except Exception:
+                    pass
+                self._close(conn)
+                continue
+            return conn
+    
+    def _checkin(self, conn: Dict[str, Any]):
+        conn["last_used"] = time.monotonic()
+        if conn["messages"] >= self.max_messages_per_connection:
+            self._close(conn)
+        else:
+            self._idle.put(conn)
+    
+    def send(self, from_addr: str, recipients: List[str], message: str) -> Dict[str, Any]:
+        """Send one message; returns the recipients the server refused"""
+        with self._slots:
+            conn = self._checkout()
+            try:
+                try:
+                    refused = conn["server"].sendmail(from_addr, recipients, message)
+                except Exception as e:
+                    if not self._is_connection_error(e):
+                        raise
+                    self._close(conn)
+                    conn = None
+                    with self._lock:
+                        self.stats["reconnects"] += 1
+                    conn = self._open()
+                    refused = conn["server"].sendmail(from_addr, recipients, message)
+            except smtplib.SMTPRecipientsRefused:
+                # Session is still usable, only the envelope was rejected
+                conn["messages"] += 1
+                self._checkin(conn)
+                raise
+            except Exception:
+                if conn is not None:
+                    self._close(conn)
+                raise
+            
+            conn["messages"] += 1
+            self._checkin(conn)
+            with self._lock:
+                self.stats["messages_sent"] += 1
+            return refused
+    
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "idle_connections": self._idle.qsize(), "pool_size": self.size}
+
+
 class EmailService:
     """Email delivery service with multiple provider support"""
     
@@ -35,8 +166,17 @@ class EmailService:
         # SendGrid configuration
         self.sendgrid_api_key = os.getenv("SENDGRID_API_KEY", "")
         
+        # Persistent SMTP connections; one executor thread per pooled connection
+        pool_size = int(os.getenv("SMTP_POOL_SIZE", "5"))
+        self.max_recipients_per_message = int(os.getenv("SMTP_MAX_RECIPIENTS_PER_MESSAGE", "50"))
+        self.smtp_pool = SMTPConnectionPool(
+            self.smtp_config,
+            size=pool_size,
+            max_messages_per_connection=int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+        )
+        
         # Thread pool for async email sending
-        self.executor = ThreadPoolExecutor(max_workers=10)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
     
     async def send_email(
         self,
@@ -106,6 +246,53 @@ class EmailService:
             logger.error(f"SMTP send error: {str(e)}")
             return False
     
+    def _build_message(
+        self,
+        to_header: str,
+        subject: str,
+        html_content: str,
+        text_content: Optional[str] = None,
+        attachments: List[str] = None,
+        reply_to: Optional[str] = None,
+        cc: List[str] = None
+    ) -> str:
+        """Build a MIME message and return it serialized"""
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = f"{self.smtp_config['from_name']} <{self.smtp_config['from_email']}>"
+        message["To"] = to_header
+        
+        if reply_to:
+            message["Reply-To"] = reply_to
+        if cc:
+            message["Cc"] = ", ".join(cc)
+        
+        # Add text content
+        if text_content:
+            text_part = MIMEText(text_content, "plain", "utf-8")
+            message.attach(text_part)
+        
+        # Add HTML content
+        html_part = MIMEText(html_content, "html", "utf-8")
+        message.attach(html_part)
+        
+        # Add attachments
+        if attachments:
+            for attachment_path in attachments:
+                if os.path.exists(attachment_path):
+                    with open(attachment_path, "rb") as attachment:
+                        part = MIMEBase("application", "octet-stream")
+                        part.set_payload(attachment.read())
+                    
+                    encoders.encode_base64(part)
+                    part.add_header(
+                        "Content-Disposition",
+                        f"attachment; filename= {os.path.basename(attachment_path)}"
+                    )
+                    message.attach(part)
+        
+        return message.as_string()
+    
     def _smtp_send_sync(
         self,
         to_email: str,
@@ -117,42 +304,11 @@ class EmailService:
         cc: List[str] = None,
         bcc: List[str] = None
     ) -> bool:
-        """Synchronous SMTP sending"""
+        """Synchronous SMTP sending over a pooled connection"""
         try:
-            # Create message
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = f"{self.smtp_config['from_name']} <{self.smtp_config['from_email']}>"
-            message["To"] = to_email
-            
-            if reply_to:
-                message["Reply-To"] = reply_to
-            if cc:
-                message["Cc"] = ", ".join(cc)
-            
-            # Add text content
-            if text_content:
-                text_part = MIMEText(text_content, "plain", "utf-8")
-                message.attach(text_part)
-            
-            # Add HTML content
-            html_part = MIMEText(html_content, "html", "utf-8")
-            message.attach(html_part)
-            
-            # Add attachments
-            if attachments:
-                for attachment_path in attachments:
-                    if os.path.exists(attachment_path):
-                        with open(attachment_path, "rb") as attachment:
-                            part = MIMEBase("application", "octet-stream")
-                            part.set_payload(attachment.read())
-                        
-                        encoders.encode_base64(part)
-                        part.add_header(
-                            "Content-Disposition",
-                            f"attachment; filename= {os.path.basename(attachment_path)}"
-                        )
-                        message.attach(part)
+            message = self._build_message(
+                to_email, subject, html_content, text_content, attachments, reply_to, cc
+            )
             
             # Prepare recipient list
             recipients = [to_email]
@@ -161,21 +317,7 @@ class EmailService:
             if bcc:
                 recipients.extend(bcc)
             
-            # Send email
-            context = ssl.create_default_context()
-            
-            with smtplib.SMTP(self.smtp_config["host"], self.smtp_config["port"]) as server:
-                if self.smtp_config["use_tls"]:
-                    server.starttls(context=context)
-                
-                if self.smtp_config["username"]:
-                    server.login(self.smtp_config["username"], self.smtp_config["password"])
-                
-                server.sendmail(
-                    self.smtp_config["from_email"],
-                    recipients,
-                    message.as_string()
-                )
+            self.smtp_pool.send(self.smtp_config["from_email"], recipients, message)
             
             logger.info(f"Email sent successfully to {to_email}")
             return True
@@ -184,6 +326,30 @@ class EmailService:
             logger.error(f"SMTP send error: {str(e)}")
             return False
     
+    def _smtp_send_batch_sync(
+        self,
+        recipients: List[str],
+        subject: str,
+        html_content: str,
+        text_content: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Send one identical message to many recipients in a single SMTP transaction.
+        Recipients only appear in the envelope, never in the headers.
+        Returns failed recipients mapped to the error.
+        """
+        try:
+            message = self._build_message(
+                "undisclosed-recipients:;", subject, html_content, text_content
+            )
+            refused = self.smtp_pool.send(self.smtp_config["from_email"], recipients, message)
+            return {email: str(error) for email, error in refused.items()}
+        except smtplib.SMTPRecipientsRefused as e:
+            return {email: str(error) for email, error in e.recipients.items()}
+        except Exception as e:
+            logger.error(f"SMTP batch send error: {str(e)}")
+            return {email: str(e) for email in recipients}
+    
     async def _send_via_sendgrid(
         self,
         to_email: str,
@@ -284,6 +450,11 @@ class EmailService:
         Returns:
             Dict with success/failure counts
         """
+        if self.provider != "sendgrid":
+            return await self._send_bulk_via_smtp(
+                recipients, subject, html_content, text_content, personalization_data
+            )
+        
         results = {"sent": 0, "failed": 0, "errors": []}
         
         # Process in batches to avoid overwhelming the server
@@ -330,6 +501,70 @@ class EmailService:
         
         return results
     
+    async def _send_bulk_via_smtp(
+        self,
+        recipients: List[Dict[str, str]],
+        subject: str,
+        html_content: str,
+        text_content: Optional[str] = None,
+        personalization_data: Optional[Dict[str, Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Bulk send over the connection pool.
+        Recipients without personalization share multi-recipient messages; personalized
+        ones get individual messages. All sends run concurrently, bounded by the pool size.
+        """
+        results = {"sent": 0, "failed": 0, "errors": []}
+        personalization_data = personalization_data or {}
+        loop = asyncio.get_event_loop()
+        
+        shared = []
+        jobs = []
+        for recipient in recipients:
+            email = recipient["email"]
+            if email not in personalization_data:
+                shared.append(email)
+                continue
+            
+            personalized_html = html_content
+            personalized_subject = subject
+            for key, value in personalization_data[email].items():
+                personalized_html = personalized_html.replace(f"{{{key}}}", value)
+                personalized_subject = personalized_subject.replace(f"{{{key}}}", value)
+            
+            jobs.append(([email], loop.run_in_executor(
+                self.executor, self._smtp_send_sync,
+                email, personalized_subject, personalized_html, text_content
+            )))
+        
+        for i in range(0, len(shared), self.max_recipients_per_message):
+            batch = shared[i:i + self.max_recipients_per_message]
+            jobs.append((batch, loop.run_in_executor(
+                self.executor, self._smtp_send_batch_sync,
+                batch, subject, html_content, text_content
+            )))
+        
+        outcomes = await asyncio.gather(*[job for _, job in jobs], return_exceptions=True)
+        
+        for (emails, _), outcome in zip(jobs, outcomes):
+            if isinstance(outcome, Exception):
+                failures = {email: str(outcome) for email in emails}
+            elif isinstance(outcome, dict):
+                failures = outcome
+            else:
+                failures = {} if outcome else {emails[0]: "Unknown error"}
+            
+            results["sent"] += len(emails) - len(failures)
+            results["failed"] += len(failures)
+            results["errors"].extend(f"{email}: {error}" for email, error in failures.items())
+        
+        return results
+    
+    async def close(self):
+        """Close pooled SMTP connections"""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self.smtp_pool.close_all)
+    
     async def validate_email_settings(self) -> Dict[str, Any]:
         """Validate email configuration"""
         try:
@@ -0,0 +1,282 @@
+"""
+Event Recurrence and Interval Index
+RRULE-style recurring events expanded per query window, and week-bucketed keys for window queries
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Week buckets count whole weeks from this Monday
+EPOCH_MONDAY = datetime(1970, 1, 5)
+# Events spanning more weeks than this, and recurring series, are keyed as open intervals
+MAX_INDEXED_WEEKS = 26
+OPEN_BUCKET = "open"
+# Stored as interval_end of series without an end so range filters still apply
+OPEN_END = datetime(9999, 12, 31)
+# Occurrences expanded per series and query; guards against a daily rule over a decade-long window
+MAX_OCCURRENCES = 1000
+
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+# Values the recurrence_pattern field held before it carried rules
+LEGACY_PATTERNS = {"daily": "FREQ=DAILY", "weekly": "FREQ=WEEKLY", "monthly": "FREQ=MONTHLY", "yearly": "FREQ=YEARLY"}
+
+
+def as_datetime(value: Any) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+def _add_months(value: datetime, months: int) -> Optional[datetime]:
+    """Same day and time `months` later, or None when that month has no such day (as RFC 5545 skips them)"""
+    month = value.month - 1 + months
+    try:
+        return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+    except ValueError:
+        return None
+
+
+def _parse_until(value: str) -> datetime:
+    value = value.rstrip("Z")
+    return datetime.strptime(value, "%Y%m%dT%H%M%S" if "T" in value else "%Y%m%d")
+
+
+@dataclass
+class RecurrenceRule:
+    """The RRULE subset the school calendar needs: FREQ, INTERVAL, BYDAY (weekly), COUNT and UNTIL"""
+    freq: str
+    interval: int = 1
+    by_day: Tuple[int, ...] = ()
+    count: Optional[int] = None
+    until: Optional[datetime] = None
+
+    @classmethod
+    def parse(cls, rule: str) -> "RecurrenceRule":
+        """Parse "FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20250630T000000Z"; raises ValueError"""
+        rule = LEGACY_PATTERNS.get(rule.strip().lower(), rule.strip())
+        if rule.upper().startswith("RRULE:"):
+            rule = rule[6:]
+        parts = {}
+        for part in filter(None, rule.split(";")):
+            name, _, value = part.partition("=")
+            parts[name.strip().upper()] = value.strip()
+        freq = parts.get("FREQ", "").upper()
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unsupported recurrence rule: {rule}")
+        by_day = tuple(sorted({WEEKDAYS.index(day.strip().upper()[-2:])
+                               for day in parts["BYDAY"].split(",")})) if parts.get("BYDAY") else ()
+        until = parts.get("UNTIL")
+        return cls(
+            freq=freq,
+            interval=max(1, int(parts.get("INTERVAL", 1))),
+            by_day=by_day,
+            count=int(parts["COUNT"]) if parts.get("COUNT") else None,
+            until=_parse_until(until) if until else None
+        )
+
+    def to_string(self) -> str:
+        parts = [f"FREQ={self.freq}"]
+        if self.interval > 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.by_day:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[d] for d in self.by_day))
+        if self.count:
+            parts.append(f"COUNT={self.count}")
+        if self.until:
+            parts.append(f"UNTIL={self.until:%Y%m%dT%H%M%SZ}")
+        return ";".join(parts)
+
+    def _candidates(self, dtstart: datetime) -> Iterator[datetime]:
+        """Every occurrence start from dtstart on, in order, ignoring COUNT and UNTIL"""
+        step = 0
+        while True:
+            if self.freq == "DAILY":
+                yield dtstart + timedelta(days=step * self.interval)
+            elif self.freq == "WEEKLY":
+                week_start = dtstart - timedelta(days=dtstart.weekday()) + timedelta(weeks=step * self.interval)
+                for weekday in self.by_day or (dtstart.weekday(),):
+                    candidate = week_start + timedelta(days=weekday)
+                    if candidate >= dtstart:
+                        yield candidate
+            else:
+                candidate = _add_months(dtstart, step * self.interval * (12 if self.freq == "YEARLY" else 1))
+                if candidate is not None:
+                    yield candidate
+            step += 1
+
+    def occurrences(self, dtstart: datetime, after: Optional[datetime] = None,
+                    before: Optional[datetime] = None) -> Iterator[datetime]:
+        """Occurrence starts in [after, before), counting COUNT from dtstart"""
+        for position, start in enumerate(self._candidates(dtstart)):
+            if (self.count is not None and position >= self.count) or (self.until and start > self.until) \
+                    or (before is not None and start >= before):
+                return
+            if after is None or start >= after:
+                yield start
+
+    def last_start(self, dtstart: datetime) -> Optional[datetime]:
+        """Start of the final occurrence, or None for a series without an end"""
+        if self.count is None:
+            return self.until
+        last = None
+        for last in self.occurrences(dtstart):
+            pass
+        return last
+
+
+def event_rule(event: Dict[str, Any]) -> Optional[RecurrenceRule]:
+    """The event's recurrence rule, or None if it happens once (or its rule cannot be read)"""
+    pattern = event.get("recurrence_pattern")
+    if not event.get("is_recurring") or not pattern:
+        return None
+    try:
+        rule = RecurrenceRule.parse(pattern)
+    except (ValueError, IndexError):
+        logger.warning(f"Ignoring unreadable recurrence rule {pattern!r} on event {event.get('_id')}")
+        return None
+    until = as_datetime(event.get("recurrence_until"))
+    if until and (rule.until is None or until < rule.until):
+        rule.until = until
+    return rule
+
+
+def event_bounds(event: Dict[str, Any]) -> Tuple[datetime, datetime]:
+    """Start and end of one occurrence; all-day events without an end last the day"""
+    start = as_datetime(event["start_date"])
+    end = as_datetime(event.get("end_date"))
+    if end is None or end < start:
+        end = start + timedelta(days=1) if event.get("is_all_day", True) else start
+    return start, end
+
+
+def week_bucket(value: datetime) -> int:
+    return (value - EPOCH_MONDAY).days // 7
+
+
+def week_buckets(start: datetime, end: datetime) -> range:
+    """Buckets of the weeks touched by [start, end]"""
+    return range(week_bucket(start), week_bucket(end) + 1)
+
+
+def event_scopes(event: Dict[str, Any]) -> List[str]:
+    """What an event can be looked up by besides time: each class and the teacher"""
+    scopes = [f"class:{class_id}" for class_id in event.get("class_ids") or [] if class_id]
+    teacher_id = (event.get("metadata") or {}).get("teacher_id")
+    if teacher_id:
+        scopes.append(f"teacher:{teacher_id}")
+    return scopes
+
+
+def interval_fields(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Index fields for an event. `interval_keys` holds "w<week>" and "w<week>:class:<id>"
+    style keys for every week the event touches, so one multikey index answers
+    "this week" and "this week for this class or teacher". Recurring series and very
+    long events get "open" keys instead and are narrowed by interval_start/interval_end.
+    """
+    start, end = event_bounds(event)
+    rule = event_rule(event)
+    if rule is not None:
+        last = rule.last_start(start)
+        end = last + (end - start) if last else OPEN_END
+    scopes = [""] + [f":{scope}" for scope in event_scopes(event)]
+    weeks = week_buckets(start, end) if end != OPEN_END else range(0)
+    if rule is not None or len(weeks) > MAX_INDEXED_WEEKS:
+        keys = [OPEN_BUCKET + scope for scope in scopes]
+    else:
+        keys = [f"w{week}{scope}" for week in weeks for scope in scopes]
+    return {"interval_keys": keys, "interval_start": start, "interval_end": end}
+
+
+def with_interval_fields(event: Dict[str, Any]) -> Dict[str, Any]:
+    """The event document with its index fields set, ready to insert"""
+    try:
+        event.update(interval_fields(event))
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Could not index event {event.get('title')!r} by interval: {e}")
+    return event
+
+
+def window_query(start: datetime, end: datetime, scopes: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Events overlapping [start, end), optionally only those for the given scopes
+    ("class:<id>", "teacher:<id>"). Each branch of the $or is a bounded scan of the
+    interval_keys index; events written without index fields are matched by start date
+    until they are backfilled.
+    """
+    suffixes = [f":{scope}" for scope in scopes] if scopes else [""]
+    overlaps = {"interval_start": {"$lt": end}, "interval_end": {"$gte": start}}
+    unindexed: Dict[str, Any] = {"interval_keys": None, "start_date": {"$gte": start, "$lt": end}}
+    class_ids = [scope.split(":", 1)[1] for scope in scopes or [] if scope.startswith("class:")]
+    if scopes:
+        unindexed["class_ids"] = {"$in": class_ids}
+    return {"$or": [
+        {"interval_keys": {"$in": [f"w{week}{suffix}" for week in week_buckets(start, end) for suffix in suffixes]},
+         **overlaps},
+        {"interval_keys": {"$in": [OPEN_BUCKET + suffix for suffix in suffixes]}, **overlaps},
+        unindexed
+    ]}
+
+
+def expand_event(event: Dict[str, Any], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """
+    The event's occurrences overlapping [start, end): the event itself if it happens once,
+    otherwise copies with their own start/end dates and a `recurrence_id` (the occurrence's
+    original start), skipping dates listed in `recurrence_exceptions`
+    """
+    first_start, first_end = event_bounds(event)
+    rule = event_rule(event)
+    if rule is None:
+        return [event] if first_start < end and first_end >= start else []
+
+    duration = first_end - first_start
+    exceptions = {as_datetime(value) for value in event.get("recurrence_exceptions") or []}
+    occurrences = []
+    for occurrence_start in rule.occurrences(first_start, after=start - duration, before=end):
+        if occurrence_start in exceptions:
+            continue
+        occurrence_end = occurrence_start + duration
+        if occurrence_end < start:
+            continue
+        occurrences.append({
+            **event,
+            "start_date": occurrence_start,
+            "end_date": occurrence_end if event.get("end_date") else None,
+            "recurrence_id": occurrence_start
+        })
+        if len(occurrences) >= MAX_OCCURRENCES:
+            logger.warning(f"Stopped expanding event {event.get('_id')} at {MAX_OCCURRENCES} occurrences")
+            break
+    return occurrences
+
+
+async def find_occurrences(collection, start: datetime, end: datetime, query: Optional[Dict[str, Any]] = None,
+                           scopes: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Occurrences of the matching events overlapping [start, end), by start date"""
+    window = window_query(start, end, scopes)
+    occurrences = []
+    async for event in collection.find({"$and": [window, query]} if query else window):
+        occurrences.extend(expand_event(event, start, end))
+    occurrences.sort(key=lambda occurrence: occurrence["start_date"])
+    return occurrences
+
+
+# Export components
+__all__ = [
+    'RecurrenceRule',
+    'event_rule',
+    'interval_fields',
+    'with_interval_fields',
+    'window_query',
+    'expand_event',
+    'find_occurrences',
+    'week_bucket',
+    'week_buckets',
+    'OPEN_BUCKET'
+]
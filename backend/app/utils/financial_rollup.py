@@ -0,0 +1,384 @@
+"""
+Financial Rollup
+Daily payment totals per branch, payment method and fee category, maintained as payments change
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Any, Hashable, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from pymongo import ASCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "financial_daily"
+META_ID = "meta"
+# Bumped whenever the document layout changes; an older rollup is rebuilt on first use
+SCHEMA_VERSION = 2
+UNCATEGORIZED = "uncategorized"
+UNKNOWN_METHOD = "unknown"
+CENT = Decimal("0.01")
+REBUILD_BATCH_SIZE = 1000
+
+# Money measures summed per document; all exclude cancelled payments
+AMOUNT_FIELDS = ("collected", "amount", "discount", "tax", "late_fees", "refunded")
+# Payment counts; `payments` counts each payment once (in its largest category),
+# `category_payments` once in every category it paid for
+COUNT_FIELDS = ("payments", "category_payments", "refunds")
+# Payment fields that decide where and how a payment is booked
+BOOKED_FIELDS = ("branch_id", "payment_method", "status", "amount", "total_amount", "refund_amount",
+                 "discount_amount", "tax_amount", "late_fee_amount")
+
+
+def to_decimal(value: Any) -> Decimal:
+    """Decimal from the string, Decimal128 or numeric amounts payments are stored with"""
+    if value is None:
+        return Decimal("0")
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    try:
+        return Decimal(str(value).strip() or "0")
+    except InvalidOperation:
+        return Decimal("0")
+
+
+def day_start(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return None
+
+
+def _key_part(value: Any, default: str) -> str:
+    """Ids and statuses as safe document keys"""
+    return str(value or default).replace(".", "_").replace("$", "_").replace(":", "_")
+
+
+def payment_amount(payment: Dict[str, Any]) -> Decimal:
+    return to_decimal(payment.get("amount", payment.get("total_amount")))
+
+
+def payment_contribution(payment: Optional[Dict[str, Any]]) -> Decimal:
+    """What a payment adds to collections: its amount less refunds, nothing once cancelled"""
+    if not payment or payment.get("status") == "cancelled":
+        return Decimal("0")
+    return max(Decimal("0"), payment_amount(payment) - to_decimal(payment.get("refund_amount")))
+
+
+def category_shares(details: Iterable[Dict[str, Any]]) -> List[Tuple[str, str, Decimal]]:
+    """
+    (fee category id, name, fraction of the payment) from a payment's detail rows,
+    largest share first
+    """
+    paid: Dict[Tuple[str, str], Decimal] = defaultdict(Decimal)
+    for detail in details:
+        key = (_key_part(detail.get("fee_category_id"), UNCATEGORIZED),
+               detail.get("fee_category_name") or "Uncategorized")
+        paid[key] += to_decimal(detail.get("paid_amount"))
+    total = sum(paid.values())
+    if total <= 0:
+        return [(UNCATEGORIZED, "Uncategorized", Decimal("1"))]
+    shares = [(category_id, name, amount / total) for (category_id, name), amount in paid.items()]
+    return sorted(shares, key=lambda s: (-s[2], s[0]))
+
+
+def split_amount(amount: Decimal, shares: List[Tuple[str, str, Decimal]]) -> List[Decimal]:
+    """Split to the cent, putting the rounding remainder on the last category so parts sum to the amount"""
+    parts, allocated = [], Decimal("0")
+    for i, (_, _, share) in enumerate(shares):
+        part = amount - allocated if i == len(shares) - 1 else (amount * share).quantize(CENT)
+        allocated += part
+        parts.append(part)
+    return parts
+
+
+def booking_changed(before: Dict[str, Any], after: Dict[str, Any]) -> bool:
+    return (any(before.get(f) != after.get(f) for f in BOOKED_FIELDS)
+            or day_start(before.get("payment_date")) != day_start(after.get("payment_date")))
+
+
+class RollupDelta:
+    """Accumulates $inc updates for rollup documents keyed branch:YYYYMMDD:method:category"""
+
+    def __init__(self):
+        self.updates: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, payment: Dict[str, Any], shares: List[Tuple[str, str, Decimal]], sign: int = 1):
+        day = day_start(payment.get("payment_date"))
+        branch_id = payment.get("branch_id")
+        if day is None or not branch_id:
+            return
+        method = _key_part(payment.get("payment_method"), UNKNOWN_METHOD)
+        status = _key_part(payment.get("status"), "unknown")
+        cancelled = payment.get("status") == "cancelled"
+        refund = to_decimal(payment.get("refund_amount"))
+        measures = {
+            "collected": payment_contribution(payment),
+            "amount": payment_amount(payment),
+            "discount": to_decimal(payment.get("discount_amount")),
+            "tax": to_decimal(payment.get("tax_amount")),
+            "late_fees": to_decimal(payment.get("late_fee_amount")),
+            "refunded": refund
+        }
+        splits = {name: split_amount(value, shares) for name, value in measures.items()}
+
+        for i, (category_id, category_name, _) in enumerate(shares):
+            doc_id = f"{branch_id}:{day:%Y%m%d}:{method}:{category_id}"
+            update = self.updates.setdefault(doc_id, {
+                "$inc": defaultdict(int),
+                "$set": {"branch_id": branch_id, "day": day, "payment_method": method,
+                         "fee_category_id": category_id, "fee_category_name": category_name}
+            })
+            inc = update["$inc"]
+            primary = i == 0
+            inc[f"statuses.{status}.amount"] += sign * splits["amount"][i]
+            if primary:
+                inc[f"statuses.{status}.count"] += sign
+            if cancelled:
+                continue
+            for name in AMOUNT_FIELDS:
+                inc[name] += sign * splits[name][i]
+            inc["category_payments"] += sign
+            if primary:
+                inc["payments"] += sign
+                inc["refunds"] += sign if refund > 0 else 0
+
+    def operations(self) -> List[UpdateOne]:
+        now = datetime.utcnow()
+        ops = []
+        for doc_id, update in self.updates.items():
+            inc = {k: Decimal128(v) if isinstance(v, Decimal) else v for k, v in update["$inc"].items() if v}
+            if not inc:
+                continue
+            ops.append(UpdateOne({"_id": doc_id}, {
+                "$inc": inc,
+                "$set": {**update["$set"], "updated_at": now}
+            }, upsert=True))
+        return ops
+
+
+class RollupTotals:
+    """Sums of rollup documents: money measures, counts and per-status counts and amounts"""
+
+    def __init__(self):
+        self.amounts: Dict[str, Decimal] = {name: Decimal("0") for name in AMOUNT_FIELDS}
+        self.counts: Dict[str, int] = {name: 0 for name in COUNT_FIELDS}
+        self.status_counts: Dict[str, int] = defaultdict(int)
+        self.status_amounts: Dict[str, Decimal] = defaultdict(Decimal)
+
+    def add(self, doc: Dict[str, Any]):
+        for name in AMOUNT_FIELDS:
+            self.amounts[name] += to_decimal(doc.get(name))
+        for name in COUNT_FIELDS:
+            self.counts[name] += doc.get(name, 0)
+        for status, values in (doc.get("statuses") or {}).items():
+            self.status_counts[status] += values.get("count", 0)
+            self.status_amounts[status] += to_decimal(values.get("amount"))
+
+    def __getitem__(self, name: str):
+        return self.amounts[name] if name in self.amounts else self.counts[name]
+
+
+class FinancialRollup:
+    """
+    One `financial_daily` document per branch, day, payment method and fee category with
+    the money collected, gross amounts, discounts, taxes, late fees and refunds, payment
+    counts, and counts and amounts per payment status. Payments are booked on their payment
+    date and split across fee categories in proportion to their detail rows; a cancel,
+    refund or edit takes the old booking back and books the new one. Reports over any
+    period read one document per day and cell instead of every payment, and each
+    document's `updated_at` lets readers pick up just what changed since they last looked.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.rollup = db[ROLLUP_COLLECTION]
+        self.payments = db["payments"]
+        self.details = db["payment_details"]
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+
+    async def _details_for(self, payment_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        by_payment: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        if payment_ids:
+            async for detail in self.details.find(
+                {"payment_id": {"$in": payment_ids}},
+                {"payment_id": 1, "fee_category_id": 1, "fee_category_name": 1, "paid_amount": 1}
+            ):
+                by_payment[detail["payment_id"]].append(detail)
+        return by_payment
+
+    async def _write(self, delta: RollupDelta):
+        ops = delta.operations()
+        if not ops:
+            return
+        try:
+            await self.rollup.bulk_write(ops, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to update financial rollup: {e}")
+
+    async def record_payment(self, payment: Dict[str, Any], details: Optional[List[Dict[str, Any]]] = None,
+                             sign: int = 1):
+        """Book a new payment (or take one back with sign=-1)"""
+        if details is None:
+            details = (await self._details_for([str(payment["_id"])]))[str(payment["_id"])]
+        delta = RollupDelta()
+        delta.add(payment, category_shares(details), sign)
+        await self._write(delta)
+
+    async def record_payment_change(self, before: Dict[str, Any], after: Dict[str, Any],
+                                    details: Optional[List[Dict[str, Any]]] = None):
+        """Rebook a payment after a cancel, refund or edit of anything the rollup counts"""
+        if not booking_changed(before, after):
+            return
+        if details is None:
+            details = (await self._details_for([str(after["_id"])]))[str(after["_id"])]
+        shares = category_shares(details)
+        delta = RollupDelta()
+        delta.add(before, shares, -1)
+        delta.add(after, shares, 1)
+        await self._write(delta)
+
+    @staticmethod
+    async def _create_indexes(collection):
+        await collection.create_index([("branch_id", ASCENDING), ("day", ASCENDING)])
+        await collection.create_index([("day", ASCENDING)])
+        await collection.create_index([("updated_at", ASCENDING)])
+
+    async def ensure_ready(self):
+        """
+        Create indexes and build the rollup from existing payments the first time it is used;
+        raises if that build fails, so no report is served from a partial rollup
+        """
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if self._ready:
+                return
+            try:
+                await self._create_indexes(self.rollup)
+            except Exception as e:
+                logger.warning(f"Could not create financial rollup indexes: {str(e)}")
+            meta = await self.rollup.find_one({"_id": META_ID})
+            if meta is None or meta.get("schema_version", 1) < SCHEMA_VERSION:
+                await self.rebuild()
+            self._ready = True
+
+    async def rebuild(self):
+        """
+        Recompute the rollup from the payments and payment_details collections.
+        The new rollup is written to a collection of its own, stamped valid only once every
+        write succeeded, and renamed over the live one, so a failed build raises and leaves
+        the previous rollup in place and concurrent builds each replace it whole instead of
+        adding to each other. Payments written while this runs can be missed, so run it when quiet.
+        """
+        delta = RollupDelta()
+        projection = {field: 1 for field in BOOKED_FIELDS + ("payment_date",)}
+        batch: List[Dict[str, Any]] = []
+
+        async def fold(payments: List[Dict[str, Any]]):
+            details = await self._details_for([str(p["_id"]) for p in payments])
+            for payment in payments:
+                delta.add(payment, category_shares(details.get(str(payment["_id"]), [])))
+
+        async for payment in self.payments.find({}, projection):
+            batch.append(payment)
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                await fold(batch)
+                batch = []
+        if batch:
+            await fold(batch)
+
+        staging = self.db[f"{ROLLUP_COLLECTION}_rebuild_{ObjectId()}"]
+        try:
+            await self._create_indexes(staging)
+            ops = delta.operations()
+            for start in range(0, len(ops), REBUILD_BATCH_SIZE):
+                await staging.bulk_write(ops[start:start + REBUILD_BATCH_SIZE], ordered=False)
+            await staging.insert_one(
+                {"_id": META_ID, "rebuilt_at": datetime.utcnow(), "schema_version": SCHEMA_VERSION}
+            )
+            await staging.rename(ROLLUP_COLLECTION, dropTarget=True)
+        except Exception:
+            logger.exception("Financial rollup rebuild failed; keeping the previous rollup")
+            try:
+                await staging.drop()
+            except Exception as e:
+                logger.warning(f"Could not drop {staging.name}: {e}")
+            raise
+        logger.info(f"Rebuilt financial rollup: {len(delta.updates)} daily documents")
+        return len(delta.updates)
+
+    @staticmethod
+    def _query(branch_ids: Optional[List[str]], start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
+        query: Dict[str, Any] = {"_id": {"$ne": META_ID}}
+        if branch_ids is not None:
+            query["branch_id"] = {"$in": branch_ids}
+        if start or end:
+            query["day"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+        return query
+
+    async def daily_documents(self, branch_ids: Optional[List[str]] = None, start: Optional[datetime] = None,
+                              end: Optional[datetime] = None,
+                              changed_since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Rollup documents for the branches (default: all) within [start, end). With
+        `changed_since`, only those whose `updated_at` is at or after that time. The stamps come
+        from the writers' clocks and need not commit in order, so incremental readers should
+        resume some way behind the newest `updated_at` they saw
+        """
+        await self.ensure_ready()
+        query = self._query(branch_ids, start, end)
+        if changed_since is not None:
+            query["updated_at"] = {"$gte": changed_since}
+        docs = await self.rollup.find(query).to_list(None)
+        for doc in docs:
+            doc["collected"] = to_decimal(doc.get("collected"))
+        return docs
+
+    async def totals(self, branch_ids: Optional[List[str]] = None, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None,
+                     **groupings: Callable[[Dict[str, Any]], Hashable]) -> Dict[str, Any]:
+        """
+        Totals over [start, end) for the branches (default: all) in a single pass:
+        result["all"] is the overall RollupTotals and, for each keyword grouping such as
+        `by_month=lambda doc: doc["day"].strftime("%Y-%m")`, result[name] maps each key to its totals
+        """
+        await self.ensure_ready()
+        result: Dict[str, Any] = {"all": RollupTotals()}
+        result.update({name: defaultdict(RollupTotals) for name in groupings})
+        async for doc in self.rollup.find(self._query(branch_ids, start, end), {"updated_at": 0}):
+            result["all"].add(doc)
+            for name, key in groupings.items():
+                result[name][key(doc)].add(doc)
+        return result
+
+
+# Global rollups, one per database
+_rollups: Dict[str, FinancialRollup] = {}
+
+
+def get_financial_rollup(db) -> FinancialRollup:
+    """Get the process-wide financial rollup for a database"""
+    rollup = _rollups.get(db.name)
+    if rollup is None:
+        rollup = _rollups[db.name] = FinancialRollup(db)
+    return rollup
+
+
+# Export components
+__all__ = [
+    'FinancialRollup',
+    'RollupDelta',
+    'RollupTotals',
+    'get_financial_rollup',
+    'payment_contribution',
+    'category_shares',
+    'to_decimal',
+    'ROLLUP_COLLECTION'
+]
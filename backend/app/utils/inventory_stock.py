@@ -0,0 +1,276 @@
+"""
+Inventory Stock Engine
+Atomic supply quantity changes with an outbox-backed transaction journal
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .sequence_counters import (
+    get_sequence_counter_service, counter_key, max_code_number, INVENTORY_CODE_START
+)
+
+logger = logging.getLogger(__name__)
+
+# Journal entries written with a stock change but not yet copied to inventory_transactions
+OUTBOX_FIELD = "pending_transactions"
+TRANSACTION_PREFIX = "TXN"
+DUPLICATE_KEY = 11000
+
+
+class StockError(Exception):
+    """A stock movement could not be applied"""
+
+    def __init__(self, message: str, supply_id: Optional[str] = None):
+        super().__init__(message)
+        self.supply_id = supply_id
+
+
+class SupplyNotFoundError(StockError):
+    pass
+
+
+class InsufficientStockError(StockError):
+    pass
+
+
+@dataclass
+class StockMovement:
+    """A signed quantity change for one supply"""
+    supply_id: str
+    quantity_change: int
+    reason: Optional[str] = None
+    transaction_type: Optional[str] = None  # defaults to in/out from the sign
+    reference_type: Optional[str] = None
+    reference_id: Optional[str] = None
+    unit_cost: Optional[float] = None
+    notes: Optional[str] = None
+
+
+def _object_id(value) -> ObjectId:
+    if isinstance(value, ObjectId):
+        return value
+    if not ObjectId.is_valid(str(value)):
+        raise SupplyNotFoundError("Supply not found", str(value))
+    return ObjectId(str(value))
+
+
+def _stock_filter(movement: StockMovement) -> Dict[str, Any]:
+    """Match the supply only while it holds enough stock for a decrement"""
+    query: Dict[str, Any] = {"_id": _object_id(movement.supply_id)}
+    if movement.quantity_change < 0:
+        query["quantity_in_stock"] = {"$gte": -movement.quantity_change}
+    return query
+
+
+class InventoryStockEngine:
+    """
+    Applies stock movements as single conditional `$inc` updates, so concurrent changes
+    never overwrite each other and stock cannot go negative.
+
+    The transaction record is pushed into the supply's outbox array by that same update,
+    which makes the change and its journal entry atomic without a replica-set transaction.
+    The entry is then copied to inventory_transactions under a pre-assigned `_id` and pulled
+    from the outbox; `relay_outbox` finishes any copies interrupted between those steps.
+    """
+
+    def __init__(self, db, counters=None, transaction_block_size: int = 20):
+        self.db = db
+        self.supplies = db["supplies"]
+        self.transactions = db["inventory_transactions"]
+        self.counters = counters
+        self.transaction_block_size = transaction_block_size
+
+    async def _transaction_codes(self, count: int) -> List[str]:
+        async def last_issued() -> int:
+            last = await max_code_number(
+                self.transactions, "transaction_code", f"^{TRANSACTION_PREFIX}-", position=1
+            )
+            return max(last, INVENTORY_CODE_START - 1)
+
+        counters = self.counters or get_sequence_counter_service(self.db)
+        key = counter_key("inventory", TRANSACTION_PREFIX)
+        if count == 1:
+            numbers = [await counters.next_value(key, seed=last_issued, block_size=self.transaction_block_size)]
+        else:
+            first, last = await counters.allocate_block(key, count, seed=last_issued)
+            numbers = range(first, last + 1)
+        return [f"{TRANSACTION_PREFIX}-{n:06d}" for n in numbers]
+
+    @staticmethod
+    def _journal_entry(movement: StockMovement, code: str, user_id: str, now: datetime) -> Dict[str, Any]:
+        quantity = abs(movement.quantity_change)
+        return {
+            "_id": ObjectId(),
+            "transaction_code": code,
+            "transaction_type": movement.transaction_type or ("in" if movement.quantity_change > 0 else "out"),
+            "item_type": "supply",
+            "item_id": str(movement.supply_id),
+            "quantity": quantity,
+            "reason": movement.reason,
+            "notes": movement.notes,
+            "reference_type": movement.reference_type,
+            "reference_id": movement.reference_id,
+            "unit_cost": movement.unit_cost,
+            "total_cost": movement.unit_cost * quantity if movement.unit_cost is not None else None,
+            "documents": [],
+            "created_by": user_id,
+            "created_at": now
+        }
+
+    @staticmethod
+    def _update(movement: StockMovement, entry: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        return {
+            "$inc": {"quantity_in_stock": movement.quantity_change},
+            "$set": {"updated_at": now},
+            "$push": {OUTBOX_FIELD: entry}
+        }
+
+    async def _missing_or_short(self, movement: StockMovement) -> StockError:
+        """Explain why a guarded update matched nothing; only runs on the failure path"""
+        supply = await self.supplies.find_one({"_id": _object_id(movement.supply_id)}, {"quantity_in_stock": 1})
+        if supply is None:
+            return SupplyNotFoundError("Supply not found", str(movement.supply_id))
+        return InsufficientStockError(
+            f"Insufficient stock: {supply.get('quantity_in_stock', 0)} available, "
+            f"{-movement.quantity_change} requested",
+            str(movement.supply_id)
+        )
+
+    async def apply(self, movement: StockMovement, user_id: str) -> Dict[str, Any]:
+        """Apply one movement and return the updated supply"""
+        now = datetime.utcnow()
+        code = (await self._transaction_codes(1))[0]
+        entry = self._journal_entry(movement, code, user_id, now)
+
+        supply = await self.supplies.find_one_and_update(
+            _stock_filter(movement),
+            self._update(movement, entry, now),
+            projection={OUTBOX_FIELD: 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if supply is None:
+            raise await self._missing_or_short(movement)
+
+        entry["item_name"] = supply.get("name", "")
+        entry["branch_id"] = supply.get("branch_id")
+        await self._publish([entry])
+        return supply
+
+    async def apply_bulk(self, movements: List[StockMovement], user_id: str) -> List[Dict[str, Any]]:
+        """
+        Apply several movements with one bulk_write, all or nothing.
+        If any guarded decrement fails, the movements that did apply are reversed
+        and the first failure is raised. Returns the journal entries written.
+        """
+        if not movements:
+            return []
+        now = datetime.utcnow()
+        codes = await self._transaction_codes(len(movements))
+        entries = [self._journal_entry(m, code, user_id, now) for m, code in zip(movements, codes)]
+        ops = [
+            UpdateOne(_stock_filter(m), self._update(m, entry, now))
+            for m, entry in zip(movements, entries)
+        ]
+
+        result = await self.supplies.bulk_write(ops, ordered=False)
+        if result.matched_count != len(ops):
+            applied = await self._compensate(movements, entries)
+            failed = next(m for m, entry in zip(movements, entries) if entry["_id"] not in applied)
+            raise await self._missing_or_short(failed)
+
+        names = await self._supply_fields({m.supply_id for m in movements})
+        for entry in entries:
+            entry["item_name"], entry["branch_id"] = names.get(entry["item_id"], ("", None))
+        await self._publish(entries)
+        return entries
+
+    async def _supply_fields(self, supply_ids) -> Dict[str, tuple]:
+        cursor = self.supplies.find(
+            {"_id": {"$in": [_object_id(i) for i in supply_ids]}}, {"name": 1, "branch_id": 1}
+        )
+        return {str(doc["_id"]): (doc.get("name", ""), doc.get("branch_id")) async for doc in cursor}
+
+    async def _compensate(self, movements: List[StockMovement], entries: List[Dict[str, Any]]) -> set:
+        """Reverse the movements of a partially applied batch, found by their outbox entries"""
+        applied = set()
+        cursor = self.supplies.find(
+            {f"{OUTBOX_FIELD}._id": {"$in": [e["_id"] for e in entries]}}, {f"{OUTBOX_FIELD}._id": 1}
+        )
+        async for doc in cursor:
+            applied.update(item["_id"] for item in doc.get(OUTBOX_FIELD, []))
+
+        reversals = []
+        for movement, entry in zip(movements, entries):
+            if entry["_id"] in applied:
+                reversals.append(UpdateOne(
+                    {"_id": _object_id(movement.supply_id), f"{OUTBOX_FIELD}._id": entry["_id"]},
+                    {
+                        "$inc": {"quantity_in_stock": -movement.quantity_change},
+                        "$pull": {OUTBOX_FIELD: {"_id": entry["_id"]}}
+                    }
+                ))
+        if reversals:
+            await self.supplies.bulk_write(reversals, ordered=False)
+        logger.warning(f"Rolled back {len(reversals)} of {len(movements)} stock movements")
+        return applied
+
+    async def _publish(self, entries: List[Dict[str, Any]]):
+        """Copy journal entries to inventory_transactions, then clear them from the outbox"""
+        await self._insert_journal(entries)
+        await self.supplies.update_many(
+            {f"{OUTBOX_FIELD}._id": {"$in": [e["_id"] for e in entries]}},
+            {"$pull": {OUTBOX_FIELD: {"_id": {"$in": [e["_id"] for e in entries]}}}}
+        )
+
+    async def _insert_journal(self, entries: List[Dict[str, Any]]):
+        try:
+            await self.transactions.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            # Entries relayed before are already present under the same _id
+            if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                raise
+
+    async def relay_outbox(self, limit: int = 500) -> int:
+        """Publish journal entries left in supply outboxes by interrupted requests"""
+        supplies = await self.supplies.find(
+            {f"{OUTBOX_FIELD}.0": {"$exists": True}}, {"name": 1, "branch_id": 1, OUTBOX_FIELD: 1}
+        ).to_list(limit)
+        entries = []
+        for supply in supplies:
+            for entry in supply[OUTBOX_FIELD]:
+                entry.setdefault("item_name", supply.get("name", ""))
+                entry.setdefault("branch_id", supply.get("branch_id"))
+                entries.append(entry)
+        if entries:
+            await self._publish(entries)
+            logger.info(f"Relayed {len(entries)} inventory journal entries from the outbox")
+        return len(entries)
+
+
+# Global stock engines, one per database
+_stock_engines: Dict[str, InventoryStockEngine] = {}
+
+
+def get_inventory_stock_engine(db) -> InventoryStockEngine:
+    """Get the process-wide stock engine for a database"""
+    engine = _stock_engines.get(db.name)
+    if engine is None:
+        engine = _stock_engines[db.name] = InventoryStockEngine(db)
+    return engine
+
+
+# Export components
+__all__ = [
+    'InventoryStockEngine',
+    'StockMovement',
+    'StockError',
+    'SupplyNotFoundError',
+    'InsufficientStockError',
+    'get_inventory_stock_engine',
+    'OUTBOX_FIELD'
+]
@@ -0,0 +1,241 @@
+"""
+Messaging Engine
+Bulk recipient fan-out, joined inbox reads with keyset pagination and per-user unread counters
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+UNREAD_COUNTERS_COLLECTION = "message_unread_counters"
+FANOUT_CHUNK_SIZE = 1000
+# Counts tried when seeding a counter that keeps changing under the count
+UNREAD_SEED_ATTEMPTS = 3
+
+INBOX_MESSAGE_FIELDS = {
+    "subject": 1, "content": 1, "message_type": 1, "priority": 1,
+    "sender_id": 1, "sent_at": 1, "attachments": 1
+}
+
+
+def encode_inbox_cursor(row: Dict[str, Any]) -> str:
+    """Opaque position after an inbox row: its created_at and recipient id"""
+    return f"{row['created_at'].isoformat()}_{row['_id']}"
+
+
+def decode_inbox_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_inbox_cursor; raises ValueError for malformed cursors"""
+    created_at, _, row_id = cursor.rpartition("_")
+    if not ObjectId.is_valid(row_id):
+        raise ValueError("Invalid cursor")
+    return datetime.fromisoformat(created_at), ObjectId(row_id)
+
+
+class MessagingEngine:
+    """
+    Stores one message_recipients row per recipient, written with insert_many.
+
+    Unread totals live in a counter document per user, adjusted on delivery and when a
+    row is first marked read. A user's counter is seeded by counting their unread rows
+    the first time it is read, so deliveries only need to update counters that exist.
+
+    Every row write is bracketed by counter updates: a token is pushed to `pending_writes`
+    before the rows change and pulled together with the unread adjustment afterwards, and both
+    steps bump `version`. A seed only stores its count when no write is pending and the
+    version is unchanged, so no seed can count a row and then see it counted again.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.messages = db["messages"]
+        self.recipients = db["message_recipients"]
+        self.counters = db[UNREAD_COUNTERS_COLLECTION]
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        """Indexes backing the inbox sort order and its unread filter"""
+        if self._indexes_ready:
+            return
+        try:
+            await self.recipients.create_index([
+                ("recipient_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)
+            ])
+            await self.recipients.create_index([
+                ("recipient_id", ASCENDING), ("is_read", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)
+            ])
+            self._indexes_ready = True
+        except Exception as e:
+            logger.warning(f"Could not create message recipient indexes: {str(e)}")
+
+    async def fan_out(self, message_id: str, recipient_ids: List[str], recipient_type: str,
+                      now: datetime) -> int:
+        """Write recipient rows in bulk and bump the recipients' unread counters"""
+        await self.ensure_indexes()
+        unique_ids = list(dict.fromkeys(str(r) for r in recipient_ids))
+        for start in range(0, len(unique_ids), FANOUT_CHUNK_SIZE):
+            chunk = unique_ids[start:start + FANOUT_CHUNK_SIZE]
+            token = await self._begin_write(chunk, now)
+            try:
+                await self.recipients.insert_many([
+                    {
+                        "message_id": message_id,
+                        "recipient_id": recipient_id,
+                        "recipient_type": recipient_type,
+                        "is_read": False,
+                        "is_acknowledged": False,
+                        "created_at": now
+                    }
+                    for recipient_id in chunk
+                ], ordered=False)
+            except BaseException:
+                # Some rows may have been written; recount these users on their next read
+                await self._end_write(chunk, token, None, now)
+                raise
+            await self._end_write(chunk, token, 1, now)
+        return len(unique_ids)
+
+    async def _begin_write(self, user_ids: List[str], now: datetime) -> ObjectId:
+        """Mark a row write in progress on the users' existing counters"""
+        token = ObjectId()
+        await self.counters.update_many(
+            {"_id": {"$in": user_ids}},
+            {"$push": {"pending_writes": token}, "$inc": {"version": 1}, "$set": {"updated_at": now}}
+        )
+        return token
+
+    async def _end_write(self, user_ids: List[str], token: ObjectId, change: Optional[int], now: datetime):
+        """
+        Apply a finished row write to the counters that saw it begin. Counters created while it
+        was in flight (and all of them when `change` is None) are left to be recounted.
+        """
+        # Counters created after this one began; any created from here on count the rows already
+        await self.counters.update_many(
+            {"_id": {"$in": user_ids}, "pending_writes": {"$ne": token}},
+            {"$inc": {"version": 1}, "$set": {"updated_at": now, "verified": False}}
+        )
+        increments = {"version": 1, **({"unread": change} if change else {})}
+        fields = {"updated_at": now, **({"verified": False} if change is None else {})}
+        await self.counters.update_many(
+            {"_id": {"$in": user_ids}, "pending_writes": token},
+            {"$pull": {"pending_writes": token}, "$inc": increments, "$set": fields}
+        )
+
+    async def inbox(self, user_id: str, is_read: Optional[bool] = None, limit: int = 100,
+                    cursor: Optional[str] = None, skip: int = 0) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of a user's inbox joined to its messages, newest first.
+        Returns the rows and the cursor for the next page (None on the last page).
+        """
+        query: Dict[str, Any] = {"recipient_id": user_id}
+        if is_read is not None:
+            # Rows written before is_read was stored count as unread
+            query["is_read"] = True if is_read else {"$ne": True}
+        if cursor:
+            created_at, row_id = decode_inbox_cursor(cursor)
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": row_id}}
+            ]
+
+        pipeline: List[Dict[str, Any]] = [
+            {"$match": query},
+            {"$sort": {"created_at": -1, "_id": -1}}
+        ]
+        if skip and not cursor:
+            pipeline.append({"$skip": skip})
+        pipeline.extend([
+            {"$limit": limit},
+            {"$lookup": {
+                "from": "messages",
+                "let": {"message_id": {"$convert": {"input": "$message_id", "to": "objectId", "onError": None}}},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$message_id"]}}},
+                    {"$project": INBOX_MESSAGE_FIELDS}
+                ],
+                "as": "message"
+            }},
+            # Rows whose message was deleted are kept until the cursor is taken, so they
+            # cannot make a full page look like the last one
+            {"$unwind": {"path": "$message", "preserveNullAndEmptyArrays": True}}
+        ])
+
+        rows = await self.recipients.aggregate(pipeline).to_list(limit)
+        next_cursor = encode_inbox_cursor(rows[-1]) if len(rows) == limit else None
+        return [row for row in rows if row.get("message")], next_cursor
+
+    async def mark_read(self, row_id: ObjectId, user_id: str) -> Optional[bool]:
+        """
+        Mark one inbox row read. Returns None if the row is not the user's,
+        False if it was already read and True if this call changed it.
+        """
+        now = datetime.utcnow()
+        token = await self._begin_write([user_id], now)
+        try:
+            result = await self.recipients.update_one(
+                {"_id": row_id, "recipient_id": user_id, "is_read": {"$ne": True}},
+                {"$set": {"is_read": True, "read_at": now}}
+            )
+        except BaseException:
+            await self._end_write([user_id], token, None, now)
+            raise
+        await self._end_write([user_id], token, -1 if result.modified_count else 0, now)
+        if result.modified_count:
+            return True
+        if await self.recipients.find_one({"_id": row_id, "recipient_id": user_id}, {"_id": 1}) is None:
+            return None
+        return False
+
+    async def unread_count(self, user_id: str) -> int:
+        counter = await self.counters.find_one({"_id": user_id})
+        if counter is not None and counter.get("verified") and counter.get("unread", 0) >= 0:
+            return int(counter["unread"])
+        return await self._seed_counter(user_id)
+
+    async def _seed_counter(self, user_id: str) -> int:
+        """
+        Set the counter from a count of unread rows. The counter exists before counting so
+        deliveries and reads made meanwhile bump its version; the count is only stored if
+        no write is pending and the version is unchanged, and counted again otherwise.
+        A counter left unverified (or gone negative) is seeded again on the next read.
+        """
+        unread = 0
+        for _ in range(UNREAD_SEED_ATTEMPTS):
+            counter = await self.counters.find_one_and_update(
+                {"_id": user_id},
+                {"$setOnInsert": {"unread": 0, "version": 0}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            unread = await self.recipients.count_documents({"recipient_id": user_id, "is_read": {"$ne": True}})
+            result = await self.counters.update_one(
+                {"_id": user_id, "version": counter.get("version"), "pending_writes.0": {"$exists": False}},
+                {"$set": {"unread": unread, "verified": True, "updated_at": datetime.utcnow()}}
+            )
+            if result.matched_count:
+                break
+        return unread
+
+
+# Global messaging engines, one per database
+_messaging_engines: Dict[str, MessagingEngine] = {}
+
+
+def get_messaging_engine(db) -> MessagingEngine:
+    """Get the process-wide messaging engine for a database"""
+    engine = _messaging_engines.get(db.name)
+    if engine is None:
+        engine = _messaging_engines[db.name] = MessagingEngine(db)
+    return engine
+
+
+# Export components
+__all__ = [
+    'MessagingEngine',
+    'get_messaging_engine',
+    'encode_inbox_cursor',
+    'decode_inbox_cursor',
+    'UNREAD_COUNTERS_COLLECTION'
+]
@@ -21,6 +21,7 @@ from .email_service import EmailService
 from .sms_service import SMSService
 from .push_service import PushService
 from .websocket_manager import get_websocket_manager
+from .notification_worker import NotificationDeliveryWorker
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +41,8 @@ class NotificationEngine:
         # Template cache for performance
         self._template_cache = {}
         self._cache_expiry = {}
+        
+        self._delivery_worker: Optional[NotificationDeliveryWorker] = None
     
     async def send_notification(
         self,
@@ -294,43 +297,36 @@ class NotificationEngine:
         
         return None
     
+    # Only the fields needed to build a recipient entry are read from users
+    RECIPIENT_USER_PROJECTION = {
+        "first_name": 1,
+        "last_name": 1,
+        "role": 1,
+        "email": 1,
+        "phone_number": 1,
+        "branch_id": 1
+    }
+    
+    # Upper bound on ids per $in query when loading preferences
+    PREFERENCE_BATCH_SIZE = 5000
+    
     async def _resolve_recipients(
         self,
         recipients: Union[List[str], RecipientType],
         notification_type: NotificationType,
         branch_id: str = None
     ) -> List[Dict[str, Any]]:
-        """Resolve recipients based on type or list"""
-        resolved = []
-        
+        """
+        Resolve recipients based on type or list.
+        Users are read with a projection and their preferences are loaded in bulk,
+        so a branch-wide broadcast costs a couple of queries instead of 1-2 per user.
+        """
         if isinstance(recipients, list):
             # Direct user ID list
-            users_cursor = self.db.users.find({"_id": {"$in": [ObjectId(uid) for uid in recipients]}})
-            async for user in users_cursor:
-                # Check user preferences
-                if await self._should_send_to_user(str(user["_id"]), notification_type):
-                    resolved.append({
-                        "user_id": str(user["_id"]),
-                        "user_name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
-                        "user_role": user.get("role", "user"),
-                        "user_email": user.get("email"),
-                        "user_phone": user.get("phone_number"),
-                        "branch_id": user.get("branch_id")
-                    })
+            query = {"_id": {"$in": [ObjectId(uid) for uid in recipients]}}
                     
         elif recipients == RecipientType.ALL_USERS:
             query = {"branch_id": branch_id} if branch_id else {}
-            users_cursor = self.db.users.find(query)
-            async for user in users_cursor:
-                if await self._should_send_to_user(str(user["_id"]), notification_type):
-                    resolved.append({
-                        "user_id": str(user["_id"]),
-                        "user_name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
-                        "user_role": user.get("role", "user"),
-                        "user_email": user.get("email"),
-                        "user_phone": user.get("phone_number"),
-                        "branch_id": user.get("branch_id")
-                    })
                     
         elif recipients in [RecipientType.STUDENTS, RecipientType.PARENTS, RecipientType.TEACHERS, RecipientType.ADMINS]:
             role_map = {
@@ -344,36 +340,61 @@ class NotificationEngine:
             query = {"role": {"$in": roles}}
             if branch_id:
                 query["branch_id"] = branch_id
-                
-            users_cursor = self.db.users.find(query)
-            async for user in users_cursor:
-                if await self._should_send_to_user(str(user["_id"]), notification_type):
-                    resolved.append({
-                        "user_id": str(user["_id"]),
-                        "user_name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
-                        "user_role": user.get("role", "user"),
-                        "user_email": user.get("email"),
-                        "user_phone": user.get("phone_number"),
-                        "branch_id": user.get("branch_id")
-                    })
+        else:
+            return []
+        
+        users = await self.db.users.find(query, self.RECIPIENT_USER_PROJECTION).to_list(None)
+        if not users:
+            return []
+        
+        prefs_by_user, created_defaults = await self._load_preferences_bulk(
+            [str(user["_id"]) for user in users]
+        )
+        type_field = notification_type.value
+        
+        resolved = []
+        for user in users:
+            user_id = str(user["_id"])
+            prefs = prefs_by_user[user_id]
+            # Users seeing their first notification always receive it, as before
+            if user_id not in created_defaults and not prefs.get(type_field, True):
+                continue
+            resolved.append({
+                "user_id": user_id,
+                "user_name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
+                "user_role": user.get("role", "user"),
+                "user_email": user.get("email"),
+                "user_phone": user.get("phone_number"),
+                "branch_id": user.get("branch_id"),
+                "channel_preferences": self._channel_preferences_from(prefs)
+            })
         
         return resolved
     
-    async def _should_send_to_user(self, user_id: str, notification_type: NotificationType) -> bool:
-        """Check if user should receive this notification type"""
-        prefs = await self.db.notification_preferences.find_one({"user_id": user_id})
+    async def _load_preferences_bulk(self, user_ids: List[str]) -> tuple[Dict[str, Dict[str, Any]], set]:
+        """
+        Load preferences for many users with $in queries, inserting defaults for users without any.
+        Returns the preferences by user id and the ids whose defaults were just created.
+        """
+        prefs_by_user: Dict[str, Dict[str, Any]] = {}
         
-        if not prefs:
-            # Create default preferences
-            default_prefs = NotificationPreference(user_id=user_id)
-            await self.db.notification_preferences.insert_one(default_prefs.model_dump())
-            return True
+        for i in range(0, len(user_ids), self.PREFERENCE_BATCH_SIZE):
+            chunk = user_ids[i:i + self.PREFERENCE_BATCH_SIZE]
+            async for prefs in self.db.notification_preferences.find({"user_id": {"$in": chunk}}):
+                prefs_by_user.setdefault(prefs["user_id"], prefs)
         
-        # Check type preferences
-        type_field = notification_type.value
-        result = prefs.get(type_field, True)
-        logger.debug(f"User {user_id} preference for {type_field}: {result} (prefs has system: {prefs.get('system')})")
-        return result
+        missing = [user_id for user_id in user_ids if user_id not in prefs_by_user]
+        if missing:
+            defaults = [NotificationPreference(user_id=user_id).dict() for user_id in missing]
+            try:
+                await self.db.notification_preferences.insert_many(defaults, ordered=False)
+            except Exception as e:
+                # Defaults are still applied in memory; a concurrent insert is harmless
+                logger.warning(f"Failed to store default notification preferences: {str(e)}")
+            for doc in defaults:
+                prefs_by_user[doc["user_id"]] = doc
+        
+        return prefs_by_user, set(missing)
     
     def _render_template(self, template_str: str, variables: Dict[str, Any]) -> str:
         """Render Jinja2 template with variables"""
@@ -401,12 +422,16 @@ class NotificationEngine:
         # Create recipient records
         recipient_docs = []
         queue_items = []
+        in_app_user_ids = []
         
         for recipient in recipients:
             recipient_id = str(ObjectId())
             
-            # Get user preferences
-            user_prefs = await self._get_user_channel_preferences(recipient["user_id"])
+            # Get user preferences (preloaded by _resolve_recipients)
+            recipient = dict(recipient)
+            user_prefs = recipient.pop("channel_preferences", None)
+            if user_prefs is None:
+                user_prefs = await self._get_user_channel_preferences(recipient["user_id"])
             
             # Determine which channels to use for this recipient
             active_channels = []
@@ -434,8 +459,8 @@ class NotificationEngine:
             # Create queue items for each channel
             for channel in active_channels:
                 if channel == NotificationChannel.IN_APP:
-                    # Send in-app immediately
-                    await self._send_in_app_notification(notification, recipient)
+                    # Sent immediately below in a single broadcast
+                    in_app_user_ids.append(recipient["user_id"])
                     delivery_results["in_app"]["sent"] += 1
                 else:
                     # Queue for background processing
@@ -457,6 +482,9 @@ class NotificationEngine:
                     )
                     queue_items.append(queue_item.dict())
         
+        if in_app_user_ids:
+            await self._send_in_app_notification(notification, in_app_user_ids)
+        
         # Bulk insert recipients and queue items
         if recipient_docs:
             await self.db.notification_recipients.insert_many(recipient_docs)
@@ -472,6 +500,11 @@ class NotificationEngine:
         """Get user's channel preferences"""
         prefs = await self.db.notification_preferences.find_one({"user_id": user_id})
         
+        return self._channel_preferences_from(prefs)
+    
+    @staticmethod
+    def _channel_preferences_from(prefs: Optional[Dict[str, Any]]) -> Dict[str, bool]:
+        """Extract channel switches from a preferences document"""
         if not prefs:
             return {
                 "email_enabled": True,
@@ -498,12 +531,12 @@ class NotificationEngine:
         
         return channel_prefs.get(channel, True)
     
-    async def _send_in_app_notification(self, notification: Notification, recipient: Dict[str, Any]):
+    async def _send_in_app_notification(self, notification: Notification, user_ids: List[str]):
         """Send in-app notification immediately via WebSocket"""
         try:
             ws_manager = get_websocket_manager(self.db)
             await ws_manager.broadcast_notification(
-                [recipient["user_id"]],
+                user_ids,
                 {
                     "type": "notification",
                     "id": notification.id,
@@ -520,96 +553,23 @@ class NotificationEngine:
         except Exception as e:
             logger.error(f"Failed to send in-app notification: {str(e)}")
     
+    @property
+    def delivery_worker(self) -> NotificationDeliveryWorker:
+        """Lazily created queue worker shared by all drains in this process"""
+        if self._delivery_worker is None:
+            self._delivery_worker = NotificationDeliveryWorker(self)
+        return self._delivery_worker
+    
+    async def close(self):
+        """Stop the delivery worker and close pooled SMTP connections"""
+        if self._delivery_worker is not None:
+            await self._delivery_worker.stop()
+        await self.email_service.close()
+    
     async def _process_notification_queue(self):
         """Background task to process notification queue"""
         try:
-            # Get pending queue items
-            queue_items = await self.db.notification_queue.find({
-                "status": NotificationStatus.SCHEDULED,
-                "scheduled_for": {"$lte": datetime.utcnow()},
-                "attempts": {"$lt": 3}  # Max 3 attempts
-            }).limit(100).to_list(None)  # Process 100 at a time
-            
-            for item in queue_items:
-                try:
-                    # Mark as processing
-                    await self.db.notification_queue.update_one(
-                        {"_id": item["_id"]},
-                        {
-                            "$set": {"processing_started_at": datetime.utcnow()},
-                            "$inc": {"attempts": 1}
-                        }
-                    )
-                    
-                    success = False
-                    error_message = None
-                    
-                    # Send based on channel
-                    if item["channel"] == NotificationChannel.EMAIL:
-                        success, error_message = await self._send_email_notification(item)
-                    elif item["channel"] == NotificationChannel.SMS:
-                        success, error_message = await self._send_sms_notification(item)
-                    elif item["channel"] == NotificationChannel.PUSH:
-                        success, error_message = await self._send_push_notification(item)
-                    
-                    # Update status
-                    if success:
-                        await self.db.notification_queue.update_one(
-                            {"_id": item["_id"]},
-                            {
-                                "$set": {
-                                    "status": NotificationStatus.DELIVERED,
-                                    "processed_at": datetime.utcnow()
-                                }
-                            }
-                        )
-                        
-                        # Update recipient status
-                        await self._update_recipient_status(
-                            item["notification_id"],
-                            item["recipient_id"],
-                            item["channel"],
-                            NotificationStatus.DELIVERED
-                        )
-                    else:
-                        status = NotificationStatus.FAILED if item["attempts"] >= 3 else NotificationStatus.SCHEDULED
-                        update_data = {
-                            "status": status,
-                            "error_message": error_message
-                        }
-                        
-                        if status == NotificationStatus.FAILED:
-                            update_data["processed_at"] = datetime.utcnow()
-                        else:
-                            # Retry later
-                            update_data["scheduled_for"] = datetime.utcnow() + timedelta(minutes=5 * item["attempts"])
-                        
-                        await self.db.notification_queue.update_one(
-                            {"_id": item["_id"]},
-                            {"$set": update_data}
-                        )
-                        
-                        if status == NotificationStatus.FAILED:
-                            await self._update_recipient_status(
-                                item["notification_id"],
-                                item["recipient_id"],
-                                item["channel"],
-                                NotificationStatus.FAILED
-                            )
-                
-                except Exception as e:
-                    logger.error(f"Error processing queue item {item['_id']}: {str(e)}")
-                    await self.db.notification_queue.update_one(
-                        {"_id": item["_id"]},
-                        {
-                            "$set": {
-                                "status": NotificationStatus.FAILED,
-                                "error_message": str(e),
-                                "processed_at": datetime.utcnow()
-                            }
-                        }
-                    )
-                    
+            await self.delivery_worker.drain()
         except Exception as e:
             logger.error(f"Error in notification queue processing: {str(e)}")
     
@@ -677,7 +637,7 @@ class NotificationEngine:
         status: NotificationStatus
     ):
         """Update recipient delivery status"""
-        channel_field = f"{channel.value}_status"
+        channel_field = f"{NotificationChannel(channel).value}_status"
         timestamp_field = "delivered_at" if status == NotificationStatus.DELIVERED else None
         
         update_data = {channel_field: status}
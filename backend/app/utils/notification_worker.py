@@ -0,0 +1,359 @@
+"""
+Notification Delivery Worker
+Drains the notification queue with lease-based claiming, per-channel concurrency and rate limits
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne, ASCENDING, DESCENDING
+
+from ..models.notifications import NotificationChannel, NotificationStatus
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChannelPolicy:
+    """Delivery limits for one channel"""
+    concurrency: int
+    rate_per_second: float
+    burst: int
+
+
+# Defaults sized for typical SMTP relays, SMS gateways and FCM; override per deployment
+DEFAULT_CHANNEL_POLICIES: Dict[str, ChannelPolicy] = {
+    NotificationChannel.EMAIL.value: ChannelPolicy(concurrency=10, rate_per_second=20, burst=40),
+    NotificationChannel.SMS.value: ChannelPolicy(concurrency=5, rate_per_second=10, burst=10),
+    NotificationChannel.PUSH.value: ChannelPolicy(concurrency=20, rate_per_second=100, burst=200),
+    NotificationChannel.WHATSAPP.value: ChannelPolicy(concurrency=5, rate_per_second=5, burst=5),
+}
+
+
+class TokenBucket:
+    """Async token bucket limiting the sustained send rate of a channel"""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DeliveryMetrics:
+    """Throughput, lag and outcome counters for the delivery worker"""
+
+    def __init__(self, window_seconds: int = 60):
+        self.window_seconds = window_seconds
+        self.completions: deque = deque()  # monotonic timestamps of finished deliveries
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.batches_claimed = 0
+
+    def record(self, channel: str, outcome: str):
+        self.counters[channel][outcome] += 1
+        if outcome in ("delivered", "failed"):
+            self.completions.append(time.monotonic())
+
+    def record_lag(self, scheduled_for: Optional[datetime]):
+        if scheduled_for is None:
+            return
+        lag = max(0.0, (datetime.utcnow() - scheduled_for).total_seconds())
+        self.last_lag_seconds = lag
+        self.max_lag_seconds = max(self.max_lag_seconds, lag)
+
+    def throughput(self) -> float:
+        """Deliveries finished per second over the sliding window"""
+        cutoff = time.monotonic() - self.window_seconds
+        while self.completions and self.completions[0] < cutoff:
+            self.completions.popleft()
+        return len(self.completions) / self.window_seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "throughput_per_second": round(self.throughput(), 2),
+            "last_lag_seconds": round(self.last_lag_seconds, 2),
+            "max_lag_seconds": round(self.max_lag_seconds, 2),
+            "batches_claimed": self.batches_claimed,
+            "by_channel": {channel: dict(counts) for channel, counts in self.counters.items()}
+        }
+
+
+class NotificationDeliveryWorker:
+    """
+    Claims queue items in batches under a lease token, delivers them concurrently within
+    per-channel limits and writes all status changes back with bulk_write.
+    Several processes can run a worker against the same queue safely; an item whose
+    lease expires (worker crashed mid-batch) becomes claimable again.
+    """
+
+    def __init__(
+        self,
+        engine,
+        batch_size: int = 200,
+        lease_seconds: int = 120,
+        max_attempts: int = 3,
+        backoff_base_seconds: float = 30.0,
+        backoff_max_seconds: float = 3600.0,
+        poll_interval: float = 2.0,
+        policies: Optional[Dict[str, ChannelPolicy]] = None
+    ):
+        self.engine = engine
+        self.db = engine.db
+        self.worker_id = f"{os.getpid()}-{ObjectId()}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.poll_interval = poll_interval
+        self.policies = policies or DEFAULT_CHANNEL_POLICIES
+
+        self.semaphores = {channel: asyncio.Semaphore(p.concurrency) for channel, p in self.policies.items()}
+        self.buckets = {channel: TokenBucket(p.rate_per_second, p.burst) for channel, p in self.policies.items()}
+        self.senders = {
+            NotificationChannel.EMAIL.value: engine._send_email_notification,
+            NotificationChannel.SMS.value: engine._send_sms_notification,
+            NotificationChannel.PUSH.value: engine._send_push_notification,
+        }
+
+        self.metrics = DeliveryMetrics()
+        self.wake_event = asyncio.Event()
+        self.drain_lock = asyncio.Lock()
+        self.run_task: Optional[asyncio.Task] = None
+        self.is_running = False
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        """Indexes backing the claim query and lease recovery"""
+        if self._indexes_ready:
+            return
+        try:
+            await self.db.notification_queue.create_index([
+                ("status", ASCENDING), ("scheduled_for", ASCENDING), ("priority", DESCENDING)
+            ])
+            await self.db.notification_queue.create_index([("lease_token", ASCENDING)], sparse=True)
+            self._indexes_ready = True
+        except Exception as e:
+            logger.warning(f"Could not create notification queue indexes: {str(e)}")
+
+    def backoff_delay(self, attempts: int) -> timedelta:
+        """Exponential backoff with full jitter"""
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** max(attempts - 1, 0)))
+        return timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
+    def _claimable_filter(self, now: datetime) -> Dict[str, Any]:
+        return {
+            "status": NotificationStatus.SCHEDULED,
+            "scheduled_for": {"$lte": now},
+            "attempts": {"$lt": self.max_attempts},
+            "$or": [
+                {"lease_expires_at": None},
+                {"lease_expires_at": {"$lt": now}}
+            ]
+        }
+
+    async def claim_batch(self) -> List[Dict[str, Any]]:
+        """
+        Atomically lease up to batch_size due items.
+        Candidates are re-checked by update_many, so an item leased concurrently by
+        another worker is skipped rather than delivered twice.
+        """
+        now = datetime.utcnow()
+        claimable = self._claimable_filter(now)
+
+        candidates = await self.db.notification_queue.find(
+            claimable, {"_id": 1}
+        ).sort([("priority", DESCENDING), ("scheduled_for", ASCENDING)]).limit(self.batch_size).to_list(None)
+        if not candidates:
+            return []
+
+        lease_token = f"{self.worker_id}:{ObjectId()}"
+        await self.db.notification_queue.update_many(
+            {**claimable, "_id": {"$in": [c["_id"] for c in candidates]}},
+            {
+                "$set": {
+                    "lease_token": lease_token,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "processing_started_at": now
+                },
+                "$inc": {"attempts": 1}
+            }
+        )
+
+        claimed = await self.db.notification_queue.find({"lease_token": lease_token}).to_list(None)
+        if claimed:
+            self.metrics.batches_claimed += 1
+        return claimed
+
+    async def _deliver(self, item: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+        """Send one item within its channel's concurrency and rate limits"""
+        channel = NotificationChannel(item["channel"]).value
+        sender = self.senders.get(channel)
+        if sender is None:
+            return False, f"Unsupported channel {channel}"
+
+        async with self.semaphores[channel]:
+            await self.buckets[channel].acquire()
+            try:
+                return await sender(item)
+            except Exception as e:
+                return False, str(e)
+
+    async def process_batch(self, items: List[Dict[str, Any]]) -> int:
+        """Deliver a claimed batch and persist outcomes with one bulk_write per collection"""
+        for item in items:
+            self.metrics.record_lag(item.get("scheduled_for"))
+
+        results = await asyncio.gather(*(self._deliver(item) for item in items))
+
+        now = datetime.utcnow()
+        queue_ops = []
+        recipient_ops = []
+        for item, (success, error_message) in zip(items, results):
+            channel = NotificationChannel(item["channel"]).value
+            release = {"lease_token": "", "lease_expires_at": ""}
+
+            if success:
+                queue_ops.append(UpdateOne(
+                    {"_id": item["_id"], "lease_token": item["lease_token"]},
+                    {"$set": {"status": NotificationStatus.DELIVERED, "processed_at": now, "updated_at": now},
+                     "$unset": release}
+                ))
+                recipient_ops.append(self._recipient_update(item, channel, NotificationStatus.DELIVERED, now))
+                self.metrics.record(channel, "delivered")
+            elif item["attempts"] >= self.max_attempts:
+                queue_ops.append(UpdateOne(
+                    {"_id": item["_id"], "lease_token": item["lease_token"]},
+                    {"$set": {"status": NotificationStatus.FAILED, "error_message": error_message,
+                              "processed_at": now, "updated_at": now},
+                     "$unset": release}
+                ))
+                recipient_ops.append(self._recipient_update(item, channel, NotificationStatus.FAILED, now))
+                self.metrics.record(channel, "failed")
+            else:
+                queue_ops.append(UpdateOne(
+                    {"_id": item["_id"], "lease_token": item["lease_token"]},
+                    {"$set": {"status": NotificationStatus.SCHEDULED, "error_message": error_message,
+                              "scheduled_for": now + self.backoff_delay(item["attempts"]), "updated_at": now},
+                     "$unset": release}
+                ))
+                self.metrics.record(channel, "retried")
+
+        if queue_ops:
+            await self.db.notification_queue.bulk_write(queue_ops, ordered=False)
+        if recipient_ops:
+            await self.db.notification_recipients.bulk_write(recipient_ops, ordered=False)
+        return len(items)
+
+    @staticmethod
+    def _recipient_update(item: Dict[str, Any], channel: str, status: NotificationStatus, now: datetime) -> UpdateOne:
+        update_data = {f"{channel}_status": status}
+        if status == NotificationStatus.DELIVERED:
+            update_data["delivered_at"] = now
+        return UpdateOne(
+            {"notification_id": item["notification_id"], "user_id": item["recipient_id"]},
+            {"$set": update_data}
+        )
+
+    async def drain(self) -> int:
+        """Process batches until nothing is due; concurrent calls in one process coalesce"""
+        if self.drain_lock.locked():
+            self.wake_event.set()
+            return 0
+
+        async with self.drain_lock:
+            await self.ensure_indexes()
+            processed = 0
+            while True:
+                self.wake_event.clear()
+                items = await self.claim_batch()
+                if not items:
+                    if self.wake_event.is_set():
+                        continue
+                    return processed
+                processed += await self.process_batch(items)
+
+    def wake(self):
+        """Signal that new items were queued"""
+        self.wake_event.set()
+
+    async def run_forever(self):
+        """Background loop: drain, then sleep until woken or the poll interval elapses"""
+        self.is_running = True
+        while self.is_running:
+            try:
+                await self.drain()
+                try:
+                    await asyncio.wait_for(self.wake_event.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in notification delivery worker: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self.run_task is None or self.run_task.done():
+            self.run_task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        self.is_running = False
+        if self.run_task:
+            self.run_task.cancel()
+            try:
+                await self.run_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            # Items claimed by a cancelled batch become claimable again when their lease expires
+            self.run_task = None
+
+    async def get_metrics(self) -> Dict[str, Any]:
+        """Worker metrics plus current queue depth and age of the oldest due item"""
+        now = datetime.utcnow()
+        due_filter = {"status": NotificationStatus.SCHEDULED, "scheduled_for": {"$lte": now}}
+        queue_depth = await self.db.notification_queue.count_documents(due_filter)
+        oldest = await self.db.notification_queue.find_one(
+            due_filter, {"scheduled_for": 1}, sort=[("scheduled_for", ASCENDING)]
+        )
+        return {
+            "worker_id": self.worker_id,
+            "queue_depth": queue_depth,
+            "oldest_due_lag_seconds": (now - oldest["scheduled_for"]).total_seconds() if oldest else 0,
+            **self.metrics.snapshot()
+        }
+
+
+# Export components
+__all__ = [
+    'ChannelPolicy',
+    'DEFAULT_CHANNEL_POLICIES',
+    'TokenBucket',
+    'DeliveryMetrics',
+    'NotificationDeliveryWorker'
+]
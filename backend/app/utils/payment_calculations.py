@@ -4,6 +4,8 @@ from datetime import datetime, date, timedelta
 from motor.motor_asyncio import AsyncIOMotorCollection
 import calendar
 
+from .sequence_counters import get_sequence_counter_service, counter_key, max_code_number
+
 
 async def calculate_payment_totals(
     fee_items: List[Dict],
@@ -234,29 +236,23 @@ async def generate_receipt_number(
     branch_id: str,
     prefix: str = "RCP"
 ) -> str:
-    """Generate unique receipt number"""
+    """Generate unique receipt number from the branch's yearly receipt counter"""
 
     current_year = datetime.now().year
 
-    # Find the last receipt number for this year and branch
-    last_receipt = await collection.find_one(
-        {
-            "branch_id": branch_id,
-            "receipt_no": {"$regex": f"^{prefix}-{current_year}-"}
-        },
-        sort=[("receipt_no", -1)]
+    async def last_issued() -> int:
+        # Payments written by different endpoints store the code as receipt_no or receipt_number
+        pattern = f"^{prefix}-{current_year}-"
+        return max([
+            await max_code_number(collection, field, pattern, extra_filter={"branch_id": branch_id})
+            for field in ("receipt_no", "receipt_number")
+        ])
+
+    counters = get_sequence_counter_service(collection.database)
+    next_sequence = await counters.next_value(
+        counter_key("receipt", prefix, branch_id, current_year), seed=last_issued
     )
 
-    if last_receipt and last_receipt.get("receipt_no"):
-        # Extract sequence number from last receipt
-        try:
-            last_sequence = int(last_receipt["receipt_no"].split("-")[-1])
-            next_sequence = last_sequence + 1
-        except (ValueError, IndexError):
-            next_sequence = 1
-    else:
-        next_sequence = 1
-
     # Format: RCP-2024-000001
     receipt_no = f"{prefix}-{current_year}-{next_sequence:06d}"
 
@@ -0,0 +1,257 @@
+"""
+Payment Search Index
+Prefix search keys, keyset cursors and cached totals for payment listings
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from .result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+# Search keys longer than this are truncated; prefixes beyond it add nothing for cashiers
+MAX_KEY_LENGTH = 64
+# Students whose payments a name search may include
+MAX_MATCHING_STUDENTS = 100
+# Totals are counted up to this many matches and reported as estimates beyond it
+TOTAL_COUNT_CAP = 10000
+BACKFILL_BATCH_SIZE = 1000
+
+PAYMENT_KEY_FIELDS = ("receipt_number", "receipt_no", "payment_reference", "payer_name", "remarks")
+STUDENT_KEY_FIELDS = ("first_name", "father_name", "grandfather_name", "last_name")
+# Bumped whenever the keys built for a document change; older documents are re-keyed by backfill
+SEARCH_KEYS_VERSION = 2
+# Separators inside codes such as RCP-2025-000123, after which a key may also start
+CODE_SEPARATORS = re.compile(r"[-/_.:#]+")
+# Sort order of payment listings; the cursor is the last row's position in it
+LISTING_SORT = [("payment_date", DESCENDING), ("_id", DESCENDING)]
+
+
+def normalize_search_text(value: Any) -> str:
+    """Lowercase with whitespace collapsed, the form keys are stored and searched in"""
+    return " ".join(str(value).split()).lower() if value is not None else ""
+
+
+def code_suffixes(word: str) -> List[str]:
+    """
+    The parts of a code after each separator, so "rcp-2025-000123" is also found by
+    "2025-000123", "000123" or the bare sequence number "123"
+    """
+    suffixes = [word[match.end():] for match in CODE_SEPARATORS.finditer(word) if match.end() < len(word)]
+    if word.isdigit() or (suffixes and suffixes[-1].isdigit()):
+        number = (suffixes[-1] if suffixes else word).lstrip("0")
+        if number:
+            suffixes.append(number)
+    return suffixes
+
+
+def search_keys(*values: Any) -> List[str]:
+    """
+    Index keys for free-text values: each whole value plus its words and the parts of
+    coded words, so a prefix of the full value ("abebe ke"), of any word ("kebede") or
+    of a receipt's sequence number ("000123") finds the record
+    """
+    keys: List[str] = []
+    for value in values:
+        text = normalize_search_text(value)
+        if not text:
+            continue
+        for word in [text] + text.split(" "):
+            for key in [word] + code_suffixes(word):
+                key = key[:MAX_KEY_LENGTH]
+                if key not in keys:
+                    keys.append(key)
+    return keys
+
+
+def payment_search_keys(payment: Dict[str, Any]) -> List[str]:
+    """Keys for receipt number, payment reference, payer name and remarks"""
+    return search_keys(*(payment.get(field) for field in PAYMENT_KEY_FIELDS))
+
+
+def student_search_keys(student: Dict[str, Any]) -> List[str]:
+    """Keys for the student code, each name and the full name in display order"""
+    full_name = " ".join(str(student[f]) for f in STUDENT_KEY_FIELDS if student.get(f))
+    return search_keys(student.get("student_id"), full_name)
+
+
+def payment_search_fields(payment: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields to store on a payment so it can be searched"""
+    return {"search_keys": payment_search_keys(payment), "search_keys_version": SEARCH_KEYS_VERSION}
+
+
+def student_search_fields(student: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields to store on a student so their payments can be searched by name or code"""
+    return {"search_keys": student_search_keys(student), "search_keys_version": SEARCH_KEYS_VERSION}
+
+
+def prefix_match(term: str) -> Dict[str, str]:
+    """Case-sensitive anchored regex over normalized keys, which MongoDB answers from index bounds"""
+    return {"$regex": "^" + re.escape(normalize_search_text(term)[:MAX_KEY_LENGTH])}
+
+
+def encode_cursor(payment: Dict[str, Any]) -> str:
+    """Opaque cursor for the position after `payment` in LISTING_SORT order"""
+    payment_date = payment.get("payment_date")
+    raw = json.dumps([payment_date.isoformat() if isinstance(payment_date, datetime) else None,
+                      str(payment["_id"])])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], ObjectId]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payment_date, payment_id = json.loads(raw)
+        return (datetime.fromisoformat(payment_date) if payment_date else None), ObjectId(payment_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def after_cursor(cursor: str) -> Dict[str, Any]:
+    """Filter for the rows after a cursor in LISTING_SORT order"""
+    payment_date, payment_id = decode_cursor(cursor)
+    if payment_date is None:
+        # Undated payments sort last; only their _id order remains
+        return {"payment_date": None, "_id": {"$lt": payment_id}}
+    return {"$or": [
+        {"payment_date": {"$lt": payment_date}},
+        {"payment_date": payment_date, "_id": {"$lt": payment_id}},
+        {"payment_date": None}
+    ]}
+
+
+class PaymentSearchIndex:
+    """
+    Keeps `search_keys` arrays on payments and students, indexed together with branch_id,
+    so a search is a handful of index range scans instead of regexes over every document.
+    Listings are served from a (branch_id, payment_date, _id) index and paged by cursor.
+    Totals are cached briefly per query and counted only up to TOTAL_COUNT_CAP.
+    """
+
+    def __init__(self, db, totals_ttl_seconds: Optional[float] = None):
+        self.db = db
+        self.payments = db["payments"]
+        self.students = db["students"]
+        ttl = totals_ttl_seconds if totals_ttl_seconds is not None \
+            else float(os.getenv("PAYMENT_TOTALS_TTL_SECONDS", "15"))
+        self.totals = ResultCache(ttl_seconds=ttl, maxsize=1024)
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+
+    async def ensure_ready(self):
+        """Create the indexes and key any payments or students written before keys existed"""
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if self._ready:
+                return
+            try:
+                await self.payments.create_index(
+                    [("branch_id", ASCENDING), ("payment_date", DESCENDING), ("_id", DESCENDING)]
+                )
+                await self.payments.create_index([("branch_id", ASCENDING), ("search_keys", ASCENDING)])
+                await self.students.create_index([("branch_id", ASCENDING), ("search_keys", ASCENDING)])
+            except Exception as e:
+                logger.warning(f"Could not create payment search indexes: {str(e)}")
+            await self.backfill()
+            self._ready = True
+
+    async def backfill(self) -> Dict[str, int]:
+        """Key documents that have no keys or keys from an older version; safe to run repeatedly"""
+        keyed = {}
+        for collection, build, fields in (
+            (self.payments, payment_search_fields, PAYMENT_KEY_FIELDS),
+            (self.students, student_search_fields, STUDENT_KEY_FIELDS + ("student_id",))
+        ):
+            keyed[collection.name] = 0
+            try:
+                cursor = collection.find({"search_keys_version": {"$ne": SEARCH_KEYS_VERSION}},
+                                         {f: 1 for f in fields})
+                batch: List[UpdateOne] = []
+                async for doc in cursor:
+                    batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": build(doc)}))
+                    if len(batch) >= BACKFILL_BATCH_SIZE:
+                        await collection.bulk_write(batch, ordered=False)
+                        keyed[collection.name] += len(batch)
+                        batch = []
+                if batch:
+                    await collection.bulk_write(batch, ordered=False)
+                    keyed[collection.name] += len(batch)
+            except Exception as e:
+                logger.error(f"Failed to backfill search keys for {collection.name}: {e}")
+        if any(keyed.values()):
+            logger.info(f"Backfilled search keys: {keyed}")
+        return keyed
+
+    async def matching_student_ids(self, branch_id: str, term: str) -> List[str]:
+        """
+        Ids and student codes of students in the branch whose code or name starts with
+        the term; payments refer to students by either
+        """
+        docs = await self.students.find(
+            {"branch_id": branch_id, "search_keys": prefix_match(term)}, {"_id": 1, "student_id": 1}
+        ).limit(MAX_MATCHING_STUDENTS).to_list(MAX_MATCHING_STUDENTS)
+        return [str(doc["_id"]) for doc in docs] + [doc["student_id"] for doc in docs if doc.get("student_id")]
+
+    async def search_filter(self, branch_id: str, term: str) -> Dict[str, Any]:
+        """Payments whose receipt, reference, payer or remarks start with the term, or whose student does"""
+        conditions: List[Dict[str, Any]] = [{"search_keys": prefix_match(term)}]
+        student_ids = await self.matching_student_ids(branch_id, term)
+        if student_ids:
+            conditions.append({"student_id": {"$in": student_ids}})
+        return {"$or": conditions}
+
+    async def count(self, branch_id: str, query: Dict[str, Any]) -> Tuple[int, bool]:
+        """(total, is_estimate) for a listing query, cached per branch and query"""
+        key = (branch_id, json.dumps(query, sort_keys=True, default=str))
+
+        async def compute():
+            total = await self.payments.count_documents(query, limit=TOTAL_COUNT_CAP)
+            return total, total >= TOTAL_COUNT_CAP
+
+        return await self.totals.get_or_compute(key, compute)
+
+    def invalidate_branch(self, branch_id: Optional[str]):
+        """Forget cached totals after payments in the branch change"""
+        self.totals.invalidate_branch(branch_id)
+
+
+# Global search indexes, one per database
+_search_indexes: Dict[str, PaymentSearchIndex] = {}
+
+
+def get_payment_search_index(db) -> PaymentSearchIndex:
+    """Get the process-wide payment search index for a database"""
+    index = _search_indexes.get(db.name)
+    if index is None:
+        index = _search_indexes[db.name] = PaymentSearchIndex(db)
+    return index
+
+
+# Export components
+__all__ = [
+    'PaymentSearchIndex',
+    'get_payment_search_index',
+    'payment_search_keys',
+    'student_search_keys',
+    'payment_search_fields',
+    'student_search_fields',
+    'normalize_search_text',
+    'prefix_match',
+    'encode_cursor',
+    'decode_cursor',
+    'after_cursor',
+    'LISTING_SORT',
+    'STUDENT_KEY_FIELDS',
+    'SEARCH_KEYS_VERSION'
+]
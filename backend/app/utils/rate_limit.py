@@ -1,17 +1,245 @@
-from datetime import datetime, timedelta
-from typing import Dict, Optional
-from fastapi import HTTPException, Request, status
+"""
+Rate Limiting
+GCRA limiter with striped in-memory state, per-route policies and an optional shared MongoDB backend
+"""
 import asyncio
-from collections import defaultdict
+import functools
+import inspect
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Callable, Tuple
+from fastapi import HTTPException, Request, status
+from pymongo import ReturnDocument
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """
+    Allow `max_requests` per `window_seconds`, as a burst or spread out.
+    After a rejection the client is blocked for `block_seconds` (0 disables blocking).
+    """
+    name: str
+    max_requests: int
+    window_seconds: float
+    block_seconds: float = 0
+
+    @property
+    def emission_interval(self) -> float:
+        return self.window_seconds / self.max_requests
+
+    @property
+    def tolerance(self) -> float:
+        return self.window_seconds - self.emission_interval
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    """Applies a policy to every path starting with `path_prefix`"""
+    path_prefix: str
+    policy: RateLimitPolicy
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    retry_after: float = 0
+    blocked: bool = False
+
+
+DEFAULT_POLICY = RateLimitPolicy("default", max_requests=100, window_seconds=60, block_seconds=900)
+
+# Checked in order; the first matching prefix wins
+ROUTE_POLICIES: List[RoutePolicy] = [
+    RoutePolicy("/users/login", RateLimitPolicy("login", max_requests=5, window_seconds=60, block_seconds=900)),
+    RoutePolicy(
+        "/registration-payments/bulk-import",
+        RateLimitPolicy("bulk_import", max_requests=10, window_seconds=300, block_seconds=900)
+    ),
+]
+
+
+def resolve_policy(path: str, route_policies: List[RoutePolicy] = None,
+                   default: RateLimitPolicy = DEFAULT_POLICY) -> RateLimitPolicy:
+    """Pick the policy for a request path"""
+    for route in route_policies if route_policies is not None else ROUTE_POLICIES:
+        if path.startswith(route.path_prefix):
+            return route.policy
+    return default
+
+
+def gcra(tat: float, blocked_until: float, now: float,
+         policy: RateLimitPolicy) -> Tuple[RateLimitDecision, float, float]:
+    """
+    Generic cell rate algorithm step.
+    State is one theoretical arrival time (TAT) per key, so each check is O(1) in time and memory.
+    Returns the decision and the new (tat, blocked_until).
+    """
+    if blocked_until > now:
+        return RateLimitDecision(False, blocked_until - now, blocked=True), tat, blocked_until
+
+    tat = max(tat, now)
+    if tat - now > policy.tolerance:
+        if policy.block_seconds:
+            blocked_until = now + policy.block_seconds
+            return RateLimitDecision(False, policy.block_seconds, blocked=True), tat, blocked_until
+        return RateLimitDecision(False, tat - now - policy.tolerance), tat, blocked_until
+
+    return RateLimitDecision(True), tat + policy.emission_interval, blocked_until
+
+
+class InMemoryRateLimitBackend:
+    """
+    Per-process limiter state split across lock-striped shards.
+    Sync endpoints run in FastAPI's thread pool, so shards are guarded by thread locks;
+    a check touches a single shard and never waits on unrelated clients.
+    """
+
+    def __init__(self, shards: int = 64, clock: Callable[[], float] = time.monotonic):
+        self.shard_count = shards
+        self.shards: List[Dict[str, List[float]]] = [{} for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.clock = clock
+
+    def _index(self, key: str) -> int:
+        return hash(key) % self.shard_count
+
+    async def hit(self, key: str, policy: RateLimitPolicy) -> RateLimitDecision:
+        index = self._index(key)
+        shard = self.shards[index]
+        with self.locks[index]:
+            now = self.clock()
+            state = shard.get(key)
+            tat, blocked_until = state if state else (now, 0.0)
+            decision, tat, blocked_until = gcra(tat, blocked_until, now, policy)
+            shard[key] = [tat, blocked_until]
+        return decision
+
+    async def cleanup(self) -> int:
+        """Drop keys whose state has fully decayed; walks one shard at a time"""
+        removed = 0
+        for index, shard in enumerate(self.shards):
+            with self.locks[index]:
+                now = self.clock()
+                idle = [key for key, (tat, blocked_until) in shard.items() if tat <= now and blocked_until <= now]
+                for key in idle:
+                    del shard[key]
+                removed += len(idle)
+            await asyncio.sleep(0)
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+
+class MongoRateLimitBackend:
+    """
+    Limiter state shared by all workers, one document per key.
+    Each check is a single atomic pipeline update; idle documents expire via a TTL index.
+    Uses wall-clock time since the state is compared across hosts.
+    """
+
+    def __init__(self, collection, clock: Callable[[], float] = time.time):
+        self.collection = collection
+        self.clock = clock
+        self._indexes_ready = False
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    async def hit(self, key: str, policy: RateLimitPolicy) -> RateLimitDecision:
+        await self.ensure_indexes()
+        now = self.clock()
+        tat = {"$max": [{"$ifNull": ["$tat", now]}, now]}
+        blocked = {"$gt": [{"$ifNull": ["$blocked_until", 0]}, now]}
+        over_limit = {"$gt": [{"$subtract": [tat, now]}, policy.tolerance]}
+
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "blocked": blocked,
+                    "allowed": {"$and": [{"$not": [blocked]}, {"$not": [over_limit]}]}
+                }},
+                {"$set": {
+                    "tat": {"$cond": ["$allowed", {"$add": [tat, policy.emission_interval]}, tat]},
+                    "blocked_until": {"$cond": [
+                        {"$and": [{"$not": ["$allowed"]}, {"$not": ["$blocked"]}, policy.block_seconds > 0]},
+                        now + policy.block_seconds,
+                        {"$ifNull": ["$blocked_until", 0]}
+                    ]}
+                }},
+                {"$set": {
+                    "expires_at": {"$toDate": {"$multiply": [
+                        {"$max": ["$tat", "$blocked_until"]}, 1000
+                    ]}}
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        if doc["allowed"]:
+            return RateLimitDecision(True)
+        if doc["blocked_until"] > now:
+            return RateLimitDecision(False, doc["blocked_until"] - now, blocked=True)
+        return RateLimitDecision(False, doc["tat"] - now - policy.tolerance)
+
+    async def cleanup(self) -> int:
+        # Expired documents are removed by the TTL monitor
+        return 0
+
+
+def create_rate_limit_backend():
+    """Select the limiter backend from RATE_LIMIT_BACKEND (memory or mongo)"""
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    if backend == "mongo":
+        from ..db import db
+        return MongoRateLimitBackend(db["rate_limits"])
+    return InMemoryRateLimitBackend()
+
 
 class RateLimiter:
-    """Simple in-memory rate limiter for API endpoints."""
-    
-    def __init__(self):
-        self.requests: Dict[str, list] = defaultdict(list)
-        self.blocked_ips: Dict[str, datetime] = {}
-        self.lock = asyncio.Lock()
-    
+    """Rate limiter for API endpoints."""
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else InMemoryRateLimitBackend()
+
+    async def hit(self, client_key: str, policy: RateLimitPolicy) -> RateLimitDecision:
+        """Record a request and return the decision without raising"""
+        try:
+            return await self.backend.hit(client_key, policy)
+        except Exception as e:
+            # Fail open: a broken shared store must not take the API down
+            logger.error(f"Rate limit backend error: {str(e)}")
+            return RateLimitDecision(True)
+
+    async def enforce(self, client_key: str, policy: RateLimitPolicy) -> bool:
+        """Record a request; raises HTTPException 429 when the policy is exceeded"""
+        decision = await self.hit(f"{policy.name}:{client_key}", policy)
+        if decision.allowed:
+            return True
+
+        retry_after = max(1, math.ceil(decision.retry_after))
+        if decision.blocked and policy.block_seconds and retry_after >= policy.block_seconds:
+            detail = f"Rate limit exceeded. You have been temporarily blocked for {math.ceil(policy.block_seconds / 60)} minutes."
+        else:
+            detail = f"Rate limit exceeded. Please try again in {retry_after} seconds."
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)}
+        )
+
     async def check_rate_limit(
         self,
         client_ip: str,
@@ -21,76 +249,32 @@ class RateLimiter:
     ) -> bool:
         """
         Check if a client has exceeded the rate limit.
-        
+
         Args:
             client_ip: Client IP address
             max_requests: Maximum number of requests allowed
             window_seconds: Time window in seconds
             block_duration_minutes: How long to block an IP after exceeding limits
-        
+
         Returns:
             True if request is allowed, raises HTTPException if blocked
         """
-        async with self.lock:
-            now = datetime.utcnow()
-            
-            # Check if IP is blocked
-            if client_ip in self.blocked_ips:
-                block_expiry = self.blocked_ips[client_ip]
-                if now < block_expiry:
-                    remaining_seconds = (block_expiry - now).seconds
-                    raise HTTPException(
-                        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                        detail=f"Rate limit exceeded. Please try again in {remaining_seconds} seconds.",
-                        headers={"Retry-After": str(remaining_seconds)}
-                    )
-                else:
-                    # Unblock IP
-                    del self.blocked_ips[client_ip]
-            
-            # Clean old requests
-            window_start = now - timedelta(seconds=window_seconds)
-            self.requests[client_ip] = [
-                req_time for req_time in self.requests[client_ip]
-                if req_time > window_start
-            ]
-            
-            # Check rate limit
-            if len(self.requests[client_ip]) >= max_requests:
-                # Block the IP
-                self.blocked_ips[client_ip] = now + timedelta(minutes=block_duration_minutes)
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail=f"Rate limit exceeded. You have been temporarily blocked for {block_duration_minutes} minutes.",
-                    headers={"Retry-After": str(block_duration_minutes * 60)}
-                )
-            
-            # Record the request
-            self.requests[client_ip].append(now)
-            return True
-    
+        policy = RateLimitPolicy(
+            f"{max_requests}/{window_seconds}s",
+            max_requests=max_requests,
+            window_seconds=window_seconds,
+            block_seconds=block_duration_minutes * 60
+        )
+        return await self.enforce(client_ip, policy)
+
     async def cleanup_old_entries(self, older_than_hours: int = 24):
-        """Clean up old entries to prevent memory bloat."""
-        async with self.lock:
-            cutoff_time = datetime.utcnow() - timedelta(hours=older_than_hours)
-            
-            # Clean old requests
-            for ip in list(self.requests.keys()):
-                self.requests[ip] = [
-                    req_time for req_time in self.requests[ip]
-                    if req_time > cutoff_time
-                ]
-                if not self.requests[ip]:
-                    del self.requests[ip]
-            
-            # Clean expired blocks
-            now = datetime.utcnow()
-            for ip in list(self.blocked_ips.keys()):
-                if self.blocked_ips[ip] < now:
-                    del self.blocked_ips[ip]
+        """Clean up decayed entries to prevent memory bloat."""
+        removed = await self.backend.cleanup()
+        if removed:
+            logger.debug(f"Removed {removed} idle rate limit entries")
 
 # Global rate limiter instance
-rate_limiter = RateLimiter()
+rate_limiter = RateLimiter(create_rate_limit_backend())
 
 async def get_client_ip(request: Request) -> str:
     """Extract client IP from request, considering proxy headers."""
@@ -99,58 +283,79 @@ async def get_client_ip(request: Request) -> str:
     if forwarded_for:
         # Take the first IP in the chain
         return forwarded_for.split(",")[0].strip()
-    
+
     real_ip = request.headers.get("X-Real-IP")
     if real_ip:
         return real_ip
-    
+
     # Fallback to direct connection IP
     if request.client:
         return request.client.host
-    
+
     return "unknown"
 
+def rate_limit(max_requests: int = 60, window_seconds: int = 60, block_seconds: int = 0,
+               name: Optional[str] = None):
+    """
+    Decorator applying a policy to a single endpoint. The endpoint must take a parameter
+    annotated `Request`; decorating one without it raises TypeError instead of leaving it unthrottled.
+    """
+    def decorator(func):
+        parameters = list(inspect.signature(func).parameters.values())
+        position = next(
+            (i for i, p in enumerate(parameters) if p.annotation in (Request, "Request")), None
+        )
+        if position is None:
+            raise TypeError(f"@rate_limit on {func.__qualname__} needs a `Request` parameter to identify clients")
+        request_name = parameters[position].name
+
+        policy = RateLimitPolicy(
+            name or f"{func.__module__}.{func.__qualname__}",
+            max_requests=max_requests,
+            window_seconds=window_seconds,
+            block_seconds=block_seconds
+        )
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = kwargs[request_name] if request_name in kwargs else args[position]
+            await rate_limiter.enforce(await get_client_ip(request), policy)
+            return await func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
 class RateLimitMiddleware:
     """Middleware for applying rate limits to all endpoints."""
-    
+
     def __init__(
         self,
         max_requests: int = 100,
         window_seconds: int = 60,
-        exclude_paths: Optional[list] = None
+        exclude_paths: Optional[list] = None,
+        route_policies: Optional[List[RoutePolicy]] = None
     ):
-        self.max_requests = max_requests
-        self.window_seconds = window_seconds
+        self.default_policy = RateLimitPolicy(
+            "default", max_requests=max_requests, window_seconds=window_seconds,
+            block_seconds=DEFAULT_POLICY.block_seconds
+        )
+        self.route_policies = route_policies if route_policies is not None else ROUTE_POLICIES
         self.exclude_paths = exclude_paths or ["/docs", "/openapi.json", "/health"]
-    
+
     async def __call__(self, request: Request, call_next):
         # Skip rate limiting for excluded paths
         if request.url.path in self.exclude_paths:
             return await call_next(request)
-        
+
         # Get client IP
         client_ip = await get_client_ip(request)
-        
+
         # Apply different limits based on endpoint
-        if request.url.path.startswith("/users/login"):
-            # Stricter limits for login endpoint
-            max_requests = 5
-            window_seconds = 60
-        elif request.url.path.startswith("/registration-payments/bulk-import"):
-            # Lower limits for bulk operations
-            max_requests = 10
-            window_seconds = 300  # 5 minutes
-        else:
-            max_requests = self.max_requests
-            window_seconds = self.window_seconds
-        
+        policy = resolve_policy(request.url.path, self.route_policies, self.default_policy)
+
         # Check rate limit
         try:
-            await rate_limiter.check_rate_limit(
-                client_ip,
-                max_requests=max_requests,
-                window_seconds=window_seconds
-            )
+            await rate_limiter.enforce(client_ip, policy)
         except HTTPException as e:
             # Return rate limit error response
             from fastapi.responses import JSONResponse
@@ -159,7 +364,7 @@ class RateLimitMiddleware:
                 content={"detail": e.detail},
                 headers=e.headers
             )
-        
+
         # Continue with the request
         response = await call_next(request)
         return response
@@ -169,4 +374,4 @@ async def periodic_cleanup():
     """Run periodic cleanup of old rate limit entries."""
     while True:
         await asyncio.sleep(3600)  # Run every hour
-        await rate_limiter.cleanup_old_entries()
\ No newline at end of file
+        await rate_limiter.cleanup_old_entries()
@@ -5,7 +5,6 @@ from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from .auth import decode_access_token
 from .audit_logger import get_audit_logger, AuditAction, AuditSeverity
-import asyncio
 
 security = HTTPBearer()
 
@@ -324,13 +323,14 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if request and hasattr(request, 'client'):
             ip_address = request.client.host if request.client else None
         
-        asyncio.create_task(audit_log.log_event(
+        # log_event only queues the entry for the batched writer
+        await audit_log.log_event(
             action=AuditAction.LOGIN_FAILED,
             details={"reason": "No authorization header"},
             severity=AuditSeverity.WARNING,
             ip_address=ip_address,
             success=False
-        ))
+        )
         raise HTTPException(status_code=401, detail="Authorization header required")
     
     payload = decode_access_token(credentials.credentials)
@@ -341,13 +341,13 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if request and hasattr(request, 'client'):
             ip_address = request.client.host if request.client else None
         
-        asyncio.create_task(audit_log.log_event(
+        await audit_log.log_event(
             action=AuditAction.LOGIN_FAILED,
             details={"reason": "Invalid or expired token"},
             severity=AuditSeverity.WARNING,
             ip_address=ip_address,
             success=False
-        ))
+        )
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
     # Normalize role format for legacy compatibility
@@ -383,8 +383,8 @@ def require_permission(permission: Permission):
             if request and hasattr(request, 'client'):
                 ip_address = request.client.host if request.client else None
             
-            # Use asyncio.create_task to avoid blocking
-            asyncio.create_task(audit_log.log_permission_check(
+            # Queued for the batched audit writer; does not block the request
+            await audit_log.log_permission_check(
                 user_id=current_user.get('user_id'),
                 user_role=user_role,
                 required_permission=permission.value,
@@ -393,7 +393,7 @@ def require_permission(permission: Permission):
                 method="DECORATOR",
                 ip_address=ip_address,
                 branch_id=current_user.get('branch_id')
-            ))
+            )
             
             if not granted:
                 raise RBACError(f"Permission '{permission}' required")
@@ -0,0 +1,357 @@
+"""
+Cross-worker Realtime Event Bus
+Pub/sub backplane that lets every uvicorn worker deliver WebSocket broadcasts to its own clients
+"""
+import asyncio
+import logging
+import os
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Set, Callable, Awaitable, Iterable
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, PyMongoError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Topic layout
+# branch:<branch_id>  - sync events and branch alerts for one branch
+# branch:global       - events that carry no branch_id
+# branch:*            - wildcard used by superadmin/hq_admin connections
+# users:<bucket>      - user-targeted notifications, hashed into a fixed number of buckets
+GLOBAL_BRANCH = "global"
+USER_TOPIC_BUCKETS = 64
+
+BackplaneHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def branch_topic(branch_id: Optional[str]) -> str:
+    """Topic carrying events for a single branch"""
+    return f"branch:{branch_id or GLOBAL_BRANCH}"
+
+
+def user_topic(user_id: str) -> str:
+    """Topic carrying notifications for a user; users are hashed into buckets to bound the topic set"""
+    bucket = zlib.crc32(str(user_id).encode("utf-8")) % USER_TOPIC_BUCKETS
+    return f"users:{bucket}"
+
+
+def topic_matches(subscribed: Iterable[str], topic: str) -> bool:
+    """Check a topic against a set of subscriptions, honouring `prefix:*` wildcards"""
+    for pattern in subscribed:
+        if pattern == topic:
+            return True
+        if pattern.endswith(":*") and topic.startswith(pattern[:-1]):
+            return True
+    return False
+
+
+class RealtimeBackplane(ABC):
+    """Base class for pub/sub transports shared between workers"""
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or f"{os.getpid()}-{ObjectId()}"
+        self.topics: Set[str] = set()
+        self.handler: Optional[BackplaneHandler] = None
+        self.is_running = False
+        self.stats = {
+            "published": 0,
+            "publish_failed": 0,
+            "received": 0,
+            "duplicates_skipped": 0
+        }
+
+    async def start(self, handler: BackplaneHandler):
+        """Start receiving messages for the subscribed topics"""
+        self.handler = handler
+        self.is_running = True
+
+    async def stop(self):
+        """Stop receiving messages"""
+        self.is_running = False
+
+    def subscribe(self, topic: str):
+        """Receive messages published on a topic"""
+        if topic not in self.topics:
+            self.topics.add(topic)
+            self._on_topics_changed()
+
+    def unsubscribe(self, topic: str):
+        """Stop receiving messages published on a topic"""
+        if topic in self.topics:
+            self.topics.discard(topic)
+            self._on_topics_changed()
+
+    def _on_topics_changed(self):
+        """Hook for transports that need to rebuild their server-side filter"""
+
+    @abstractmethod
+    async def publish(self, topic: str, message: Dict[str, Any], dedupe_key: Optional[str] = None) -> bool:
+        """
+        Publish a message to every other worker subscribed to the topic.
+        Messages sharing a dedupe_key are delivered at most once across the cluster.
+        """
+
+    async def _dispatch(self, topic: str, message: Dict[str, Any]):
+        """Hand a received message to the local handler"""
+        if not self.handler:
+            return
+        self.stats["received"] += 1
+        try:
+            await self.handler(topic, message)
+        except Exception as e:
+            logger.error(f"Error handling backplane message on {topic}: {e}")
+
+
+class InMemoryHub:
+    """Process-local hub connecting InMemoryBackplane instances, used to simulate workers in tests"""
+
+    def __init__(self):
+        self.backplanes: Set["InMemoryBackplane"] = set()
+        self.seen_keys: "OrderedDict[str, None]" = OrderedDict()
+        self.max_seen_keys = 10000
+
+    def claim(self, dedupe_key: Optional[str]) -> bool:
+        """Return False when a message with this key was already published"""
+        if dedupe_key is None:
+            return True
+        if dedupe_key in self.seen_keys:
+            return False
+        self.seen_keys[dedupe_key] = None
+        if len(self.seen_keys) > self.max_seen_keys:
+            self.seen_keys.popitem(last=False)
+        return True
+
+
+class InMemoryBackplane(RealtimeBackplane):
+    """Backplane that delivers synchronously to other instances attached to the same hub"""
+
+    def __init__(self, hub: Optional[InMemoryHub] = None, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        self.hub = hub or InMemoryHub()
+
+    async def start(self, handler: BackplaneHandler):
+        await super().start(handler)
+        self.hub.backplanes.add(self)
+
+    async def stop(self):
+        await super().stop()
+        self.hub.backplanes.discard(self)
+
+    async def publish(self, topic: str, message: Dict[str, Any], dedupe_key: Optional[str] = None) -> bool:
+        if not self.hub.claim(dedupe_key):
+            self.stats["duplicates_skipped"] += 1
+            return False
+
+        self.stats["published"] += 1
+        for backplane in list(self.hub.backplanes):
+            if backplane is self or not backplane.is_running:
+                continue
+            if topic_matches(backplane.topics, topic):
+                await backplane._dispatch(topic, message)
+        return True
+
+
+class MongoCappedBackplane(RealtimeBackplane):
+    """
+    Backplane built on a MongoDB capped collection read through a tailable cursor.
+    Needs no infrastructure beyond the database the API already uses.
+    """
+
+    def __init__(self, db, collection_name: str = "realtime_events",
+                 size_bytes: int = 64 * 1024 * 1024, max_documents: int = 100000,
+                 max_await_ms: int = 500, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        self.db = db
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.max_documents = max_documents
+        self.max_await_ms = max_await_ms
+        self.collection = None
+        self.tail_task: Optional[asyncio.Task] = None
+        self.topics_changed = asyncio.Event()
+        # Resume point used whenever the cursor is rebuilt; a small overlap plus
+        # the seen-id cache tolerates clock skew between publishing workers
+        self.resume_from: Optional[datetime] = None
+        self.resume_overlap = timedelta(seconds=2)
+        self.seen_ids: "OrderedDict[Any, None]" = OrderedDict()
+        self.max_seen_ids = 4096
+
+    async def _ensure_collection(self):
+        """Create the capped collection if it does not exist yet"""
+        try:
+            await self.db.create_collection(
+                self.collection_name,
+                capped=True,
+                size=self.size_bytes,
+                max=self.max_documents
+            )
+            logger.info(f"Created capped collection {self.collection_name} for realtime backplane")
+        except CollectionInvalid:
+            pass
+        self.collection = self.db[self.collection_name]
+
+        # A tailable cursor on an empty capped collection dies immediately
+        if await self.collection.estimated_document_count() == 0:
+            await self.collection.insert_one({
+                "topic": "_bootstrap",
+                "origin": self.worker_id,
+                "published_at": datetime.utcnow()
+            })
+
+    async def start(self, handler: BackplaneHandler):
+        await super().start(handler)
+        await self._ensure_collection()
+        self.resume_from = datetime.utcnow()
+        self.tail_task = asyncio.create_task(self._tail())
+        logger.info(f"Realtime backplane started for worker {self.worker_id}")
+
+    async def stop(self):
+        await super().stop()
+        if self.tail_task:
+            self.tail_task.cancel()
+            self.tail_task = None
+
+    def _on_topics_changed(self):
+        self.topics_changed.set()
+
+    def _build_filter(self) -> Dict[str, Any]:
+        """Server-side filter so this worker only reads topics its clients care about"""
+        exact = [t for t in self.topics if not t.endswith(":*")]
+        prefixes = [t[:-1] for t in self.topics if t.endswith(":*")]
+
+        topic_clauses = []
+        if exact:
+            topic_clauses.append({"topic": {"$in": exact}})
+        for prefix in prefixes:
+            topic_clauses.append({"topic": {"$regex": f"^{prefix}"}})
+
+        query: Dict[str, Any] = {
+            "published_at": {"$gte": self.resume_from - self.resume_overlap},
+            "origin": {"$ne": self.worker_id}
+        }
+        if len(topic_clauses) == 1:
+            query.update(topic_clauses[0])
+        else:
+            query["$or"] = topic_clauses
+        return query
+
+    def _mark_seen(self, doc_id) -> bool:
+        """Return False if the document was already dispatched by a previous cursor"""
+        if doc_id in self.seen_ids:
+            self.stats["duplicates_skipped"] += 1
+            return False
+        self.seen_ids[doc_id] = None
+        if len(self.seen_ids) > self.max_seen_ids:
+            self.seen_ids.popitem(last=False)
+        return True
+
+    async def _tail(self):
+        """Follow the capped collection, rebuilding the cursor when the topic set changes"""
+        while self.is_running:
+            if not self.topics:
+                self.topics_changed.clear()
+                await self.topics_changed.wait()
+                continue
+
+            self.topics_changed.clear()
+            cursor = self.collection.find(
+                self._build_filter(),
+                cursor_type=CursorType.TAILABLE_AWAIT,
+                max_await_time_ms=self.max_await_ms
+            )
+            try:
+                while self.is_running and cursor.alive and not self.topics_changed.is_set():
+                    async for doc in cursor:
+                        self.resume_from = max(self.resume_from, doc["published_at"])
+                        if self._mark_seen(doc["_id"]):
+                            await self._dispatch(doc["topic"], doc.get("message", {}))
+                        if self.topics_changed.is_set():
+                            break
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.error(f"Realtime backplane cursor error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await cursor.close()
+
+            if self.is_running and not self.topics_changed.is_set():
+                # Cursor died (no match yet or the collection rolled over); back off before re-tailing
+                await asyncio.sleep(0.1)
+
+    async def publish(self, topic: str, message: Dict[str, Any], dedupe_key: Optional[str] = None) -> bool:
+        if self.collection is None:
+            self.collection = self.db[self.collection_name]
+
+        doc = {
+            "_id": dedupe_key or ObjectId(),
+            "topic": topic,
+            "origin": self.worker_id,
+            "message": message,
+            "published_at": datetime.utcnow()
+        }
+        try:
+            await self.collection.insert_one(doc)
+            self.stats["published"] += 1
+            return True
+        except DuplicateKeyError:
+            # Another worker already published the same change stream event
+            self.stats["duplicates_skipped"] += 1
+            return False
+        except PyMongoError as e:
+            self.stats["publish_failed"] += 1
+            logger.error(f"Error publishing realtime event on {topic}: {e}")
+            return False
+
+
+class TopicRefCounter:
+    """Tracks how many local connections need each topic and (un)subscribes the backplane on 0/1 transitions"""
+
+    def __init__(self, backplane: Optional[RealtimeBackplane]):
+        self.backplane = backplane
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def acquire(self, topic: str):
+        self.counts[topic] += 1
+        if self.counts[topic] == 1 and self.backplane:
+            self.backplane.subscribe(topic)
+
+    def release(self, topic: str):
+        if self.counts.get(topic, 0) <= 0:
+            return
+        self.counts[topic] -= 1
+        if self.counts[topic] == 0:
+            del self.counts[topic]
+            if self.backplane:
+                self.backplane.unsubscribe(topic)
+
+
+def create_backplane(db) -> Optional[RealtimeBackplane]:
+    """
+    Build the backplane selected by REALTIME_BACKPLANE (mongo, memory or none).
+    Defaults to the MongoDB capped collection when a database is available.
+    """
+    kind = os.getenv("REALTIME_BACKPLANE", "mongo" if db is not None else "none").lower()
+    if kind == "mongo" and db is not None:
+        return MongoCappedBackplane(db)
+    if kind == "memory":
+        return InMemoryBackplane()
+    return None
+
+
+# Export components
+__all__ = [
+    'RealtimeBackplane',
+    'InMemoryHub',
+    'InMemoryBackplane',
+    'MongoCappedBackplane',
+    'TopicRefCounter',
+    'branch_topic',
+    'user_topic',
+    'topic_matches',
+    'create_backplane'
+]
@@ -0,0 +1,126 @@
+"""
+Result Cache
+In-process TTL cache for computed API results with single-flight refresh and stale-while-revalidate
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CacheEntry:
+    value: Any
+    stored_at: float
+
+
+class ResultCache:
+    """
+    Caches coroutine results per key.
+
+    Concurrent misses for one key share a single computation. Entries are fresh for
+    `ttl_seconds`; for a further `stale_seconds` the old value is served at once while one
+    background task recomputes it. Invalidation bumps a generation counter so a computation
+    that started before a write cannot store its now-outdated result.
+    """
+
+    def __init__(self, ttl_seconds: float, stale_seconds: float = 0, maxsize: int = 256,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = self.clock() - entry.stored_at
+            if age < self.ttl_seconds:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if age < self.ttl_seconds + self.stale_seconds:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self._start(key, compute).add_done_callback(self._log_refresh_failure)
+                return entry.value
+
+        self.misses += 1
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = self._start(key, compute)
+        return await asyncio.shield(inflight)
+
+    def _start(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        task = asyncio.ensure_future(self._compute(key, compute, self._generation))
+        self._inflight[key] = task
+        return task
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        try:
+            value = await compute()
+            if generation == self._generation:
+                self._entries[key] = _CacheEntry(value, self.clock())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background cache refresh failed: {task.exception()}")
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None):
+        """Drop matching entries (all when no predicate) and discard results of running computations"""
+        for store in (self._entries, self._inflight):
+            for key in [k for k in store if predicate is None or predicate(k)]:
+                # Detached computations still answer their current waiters
+                del store[key]
+        self._generation += 1
+
+    def update(self, key: Hashable, apply: Callable[[Any], None]) -> bool:
+        """
+        Patch a cached value in place. A computation already running for the key
+        might not include the change, so the key is invalidated instead.
+        """
+        if key in self._inflight:
+            self.invalidate(lambda k: k == key)
+            return False
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        apply(entry.value)
+        return True
+
+    def invalidate_branch(self, branch_id: Optional[str]):
+        """Drop entries keyed by (branch_id, ...) together with the all-branches (None, ...) view"""
+        self.invalidate(lambda key: isinstance(key, tuple) and key[:1] in ((branch_id,), (None,)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "inflight": len(self._inflight)
+        }
+
+
+# Export components
+__all__ = [
+    'ResultCache'
+]
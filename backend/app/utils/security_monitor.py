@@ -6,15 +6,16 @@ Monitors audit logs for suspicious patterns and triggers alerts
 import asyncio
 import json
 import logging
+import math
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Set
 from enum import Enum
 from dataclasses import dataclass
 from collections import defaultdict, deque
-import statistics
 
 from .audit_logger import get_audit_logger, AuditAction, AuditSeverity
 from .rbac import Role
+from .stream_sketches import DecayedCounter, WindowedCountMinSketch, HyperLogLog, LRUState
 
 # Configure security monitor logger
 security_logger = logging.getLogger("security_monitor")
@@ -58,24 +59,74 @@ class SecurityAlert:
     resolved: bool = False
     resolution_notes: Optional[str] = None
 
+class _UserStreamState:
+    """Bounded per-user detector state"""
+
+    __slots__ = (
+        "activity", "denials", "events_seen", "hour_index", "hour_count",
+        "hourly_mean", "hourly_var", "hours_seen", "resource_panes", "resource_types",
+        "attempted_branches"
+    )
+
+    def __init__(self, failure_half_life: float):
+        self.activity = DecayedCounter(failure_half_life)
+        self.denials = DecayedCounter(failure_half_life)
+        self.events_seen = 0
+        self.hour_index: Optional[int] = None
+        self.hour_count = 0
+        self.hourly_mean = 0.0
+        self.hourly_var = 0.0
+        self.hours_seen = 0
+        self.resource_panes: deque = deque()
+        self.resource_types: Set[str] = set()
+        self.attempted_branches: Set[str] = set()
+
+
+def _epoch(timestamp) -> float:
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp.timestamp()
+
+
 class SecurityPatternDetector:
     """
-    Detects suspicious security patterns from audit logs
+    Detects suspicious security patterns from audit logs.
+    All state is fixed-size: rates come from windowed count-min sketches, distinct
+    resources from HyperLogLog, failure trends from decayed counters, and per-user
+    state is LRU-bounded, so memory does not grow with traffic or distinct IPs.
     """
     
-    def __init__(self):
-        self.user_activity_windows = defaultdict(lambda: deque(maxlen=100))
-        self.ip_activity_windows = defaultdict(lambda: deque(maxlen=100))
-        self.failed_attempts = defaultdict(lambda: deque(maxlen=50))
-        self.bulk_access_tracking = defaultdict(lambda: deque(maxlen=200))
-        
+    def __init__(
+        self,
+        max_tracked_users: int = 10000,
+        max_tracked_identifiers: int = 10000,
+        sketch_width: int = 4096
+    ):
         # Thresholds for pattern detection
         self.BRUTE_FORCE_THRESHOLD = 5  # Failed attempts in window
         self.BRUTE_FORCE_WINDOW = 300   # 5 minutes
         self.BULK_ACCESS_THRESHOLD = 20  # Records accessed in window
         self.BULK_ACCESS_WINDOW = 60     # 1 minute
+        self.BULK_UNIQUE_RESOURCES = 10  # Distinct records in window
         self.UNUSUAL_ACTIVITY_THRESHOLD = 3  # Standard deviations
+        self.UNUSUAL_ACTIVITY_MIN_EVENTS = 20
         self.CROSS_BRANCH_THRESHOLD = 3  # Cross-branch attempts in window
+        self.CROSS_BRANCH_WINDOW = 300
+        self.REPEATED_FAILURE_THRESHOLD = 5  # Decayed permission denials
+        self.REPEATED_FAILURE_HALF_LIFE = 300
+        self.BASELINE_HOURS = 24  # Span of the hourly activity baseline
+        
+        self.failure_counts = WindowedCountMinSketch(self.BRUTE_FORCE_WINDOW, panes=5, width=sketch_width)
+        self.ip_failure_counts = WindowedCountMinSketch(self.BRUTE_FORCE_WINDOW, panes=5, width=sketch_width)
+        self.ip_activity_counts = WindowedCountMinSketch(self.BULK_ACCESS_WINDOW, panes=4, width=sketch_width)
+        self.read_counts = WindowedCountMinSketch(self.BULK_ACCESS_WINDOW, panes=4, width=sketch_width)
+        self.cross_branch_counts = WindowedCountMinSketch(self.CROSS_BRANCH_WINDOW, panes=5, width=sketch_width)
+        
+        self.users = LRUState(
+            max_tracked_users, lambda: _UserStreamState(self.REPEATED_FAILURE_HALF_LIFE)
+        )
+        # Last few failure timestamps per identifier, kept only as alert evidence
+        self.failure_evidence = LRUState(max_tracked_identifiers, lambda: deque(maxlen=10))
     
     async def analyze_event(self, event: Dict) -> List[SecurityAlert]:
         """
@@ -91,25 +142,22 @@ class SecurityPatternDetector:
             ip_address = event.get("metadata", {}).get("ip_address")
             action = event.get("action")
             success = event.get("success", True)
-            timestamp = event.get("timestamp", datetime.utcnow())
+            timestamp = event.get("timestamp") or datetime.utcnow()
+            now = _epoch(timestamp)
             
             # Track user activity
+            user_state = None
             if user_id:
-                self.user_activity_windows[user_id].append({
-                    "timestamp": timestamp,
-                    "action": action,
-                    "success": success,
-                    "ip": ip_address
-                })
+                user_state = self.users.get(user_id)
+                user_state.events_seen += 1
+                user_state.activity.add(now)
+                self._record_hourly_activity(user_state, now)
+                if action == "permission_denied" and not success:
+                    user_state.denials.add(now)
             
             # Track IP activity
             if ip_address:
-                self.ip_activity_windows[ip_address].append({
-                    "timestamp": timestamp,
-                    "user_id": user_id,
-                    "action": action,
-                    "success": success
-                })
+                self.ip_activity_counts.add(ip_address, now)
             
             # Check for brute force attacks
             if not success and action in ["login_failed", "permission_denied"]:
@@ -136,7 +184,7 @@ class SecurityPatternDetector:
                 ))
             
             # Check for unusual activity patterns
-            if user_id and len(self.user_activity_windows[user_id]) >= 10:
+            if user_state is not None and user_state.events_seen >= self.UNUSUAL_ACTIVITY_MIN_EVENTS:
                 alerts.extend(await self._detect_unusual_activity(
                     user_id, user_role, timestamp
                 ))
@@ -151,6 +199,33 @@ class SecurityPatternDetector:
         
         return alerts
     
+    def _record_hourly_activity(self, state: _UserStreamState, now: float):
+        """
+        Count events in the current hour and fold finished hours into an
+        exponentially weighted mean/variance spanning roughly BASELINE_HOURS
+        """
+        hour = int(now // 3600)
+        if state.hour_index is None:
+            state.hour_index = hour
+        elif hour > state.hour_index:
+            alpha = 1 / self.BASELINE_HOURS
+            idle_hours = min(hour - state.hour_index - 1, self.BASELINE_HOURS)
+            for count in [state.hour_count] + [0] * idle_hours:
+                if state.hours_seen == 0:
+                    state.hourly_mean = float(count)
+                else:
+                    diff = count - state.hourly_mean
+                    increment = alpha * diff
+                    state.hourly_mean += increment
+                    state.hourly_var = (1 - alpha) * (state.hourly_var + diff * increment)
+                state.hours_seen += 1
+            state.hour_index = hour
+            state.hour_count = 0
+        elif hour < state.hour_index:
+            # Late event for an hour already folded into the baseline
+            return
+        state.hour_count += 1
+    
     async def _detect_brute_force(
         self, 
         identifier: str, 
@@ -164,19 +239,16 @@ class SecurityPatternDetector:
         if not identifier:
             return alerts
         
-        # Track failed attempts by identifier
-        self.failed_attempts[identifier].append(timestamp)
-        
-        # Check if threshold exceeded in time window
-        cutoff = timestamp - timedelta(seconds=self.BRUTE_FORCE_WINDOW)
-        recent_failures = [
-            t for t in self.failed_attempts[identifier] 
-            if t > cutoff
-        ]
+        # Track failed attempts by identifier and source IP
+        now = _epoch(timestamp)
+        failed_attempts = self.failure_counts.add(identifier, now)
+        ip_failed_attempts = self.ip_failure_counts.add(ip_address, now) if ip_address else 0
+        recent_failures = self.failure_evidence.get(identifier)
+        recent_failures.append(timestamp)
         
-        if len(recent_failures) >= self.BRUTE_FORCE_THRESHOLD:
+        if failed_attempts >= self.BRUTE_FORCE_THRESHOLD:
             alert = SecurityAlert(
-                alert_id=f"brute_force_{identifier}_{int(timestamp.timestamp())}",
+                alert_id=f"brute_force_{identifier}_{int(now)}",
                 alert_type=AlertType.BRUTE_FORCE,
                 threat_level=ThreatLevel.HIGH,
                 title="Brute Force Attack Detected",
@@ -187,9 +259,10 @@ class SecurityPatternDetector:
                 ip_address=ip_address,
                 affected_resources=[identifier],
                 evidence={
-                    "failed_attempts": len(recent_failures),
+                    "failed_attempts": failed_attempts,
+                    "ip_failed_attempts": ip_failed_attempts,
                     "time_window": f"{self.BRUTE_FORCE_WINDOW} seconds",
-                    "attempts_timestamps": [t.isoformat() for t in recent_failures[-10:]]
+                    "attempts_timestamps": [t.isoformat() for t in recent_failures]
                 },
                 timestamp=timestamp
             )
@@ -262,12 +335,13 @@ class SecurityPatternDetector:
             return alerts
         
         # Count recent cross-branch attempts
-        recent_violations = []
-        for activity in list(self.user_activity_windows[user_id])[-20:]:
-            if "cross_branch" in str(activity.get("action", "")):
-                recent_violations.append(activity)
+        violation_count = self.cross_branch_counts.add(user_id, _epoch(timestamp))
+        state = self.users.get(user_id)
+        attempted_branch = (event.get("details", {}).get("event_details") or {}).get("attempted_branch")
+        if attempted_branch and len(state.attempted_branches) < 10:
+            state.attempted_branches.add(str(attempted_branch))
         
-        if len(recent_violations) >= self.CROSS_BRANCH_THRESHOLD:
+        if violation_count >= self.CROSS_BRANCH_THRESHOLD:
             alert = SecurityAlert(
                 alert_id=f"cross_branch_{user_id}_{int(timestamp.timestamp())}",
                 alert_type=AlertType.CROSS_BRANCH_VIOLATION,
@@ -280,12 +354,9 @@ class SecurityPatternDetector:
                 ip_address=event.get("metadata", {}).get("ip_address"),
                 affected_resources=["branch_isolation"],
                 evidence={
-                    "violation_count": len(recent_violations),
+                    "violation_count": violation_count,
                     "user_branch": event.get("details", {}).get("user_branch"),
-                    "attempted_branches": list(set([
-                        v.get("attempted_branch") for v in recent_violations 
-                        if v.get("attempted_branch")
-                    ]))
+                    "attempted_branches": sorted(state.attempted_branches)
                 },
                 timestamp=timestamp
             )
@@ -306,48 +377,48 @@ class SecurityPatternDetector:
         if not user_id:
             return alerts
         
-        # Track data access by user
-        self.bulk_access_tracking[user_id].append({
-            "timestamp": timestamp,
-            "resource_type": event.get("resource", {}).get("type"),
-            "resource_id": event.get("resource", {}).get("id")
-        })
-        
-        # Check access rate in recent window
-        cutoff = timestamp - timedelta(seconds=self.BULK_ACCESS_WINDOW)
-        recent_access = [
-            access for access in self.bulk_access_tracking[user_id]
-            if access["timestamp"] > cutoff
-        ]
-        
-        if len(recent_access) >= self.BULK_ACCESS_THRESHOLD:
+        # Track data access rate by user
+        now = _epoch(timestamp)
+        access_count = self.read_counts.add(user_id, now)
+        
+        # Distinct records per pane; a window is the union of its live panes
+        state = self.users.get(user_id)
+        resource_type = event.get("resource", {}).get("type")
+        resource_id = event.get("resource", {}).get("id")
+        pane = int(now // self.read_counts.pane_seconds)
+        while state.resource_panes and state.resource_panes[0][0] <= pane - self.read_counts.panes:
+            state.resource_panes.popleft()
+        if resource_type and resource_id:
+            if not state.resource_panes or state.resource_panes[-1][0] < pane:
+                state.resource_panes.append((pane, HyperLogLog()))
+            state.resource_panes[-1][1].add(f"{resource_type}_{resource_id}")
+            if len(state.resource_types) < 20:
+                state.resource_types.add(resource_type)
+        
+        if access_count >= self.BULK_ACCESS_THRESHOLD and state.resource_panes:
             # Check if accessing diverse resources (potential data scraping)
-            unique_resources = len(set([
-                f"{access['resource_type']}_{access['resource_id']}"
-                for access in recent_access
-                if access['resource_type'] and access['resource_id']
-            ]))
+            distinct = state.resource_panes[0][1]
+            for _, sketch in list(state.resource_panes)[1:]:
+                distinct = distinct.merge(sketch)
+            unique_resources = distinct.count()
             
-            if unique_resources >= 10:  # Accessing many different records
+            if unique_resources >= self.BULK_UNIQUE_RESOURCES:  # Accessing many different records
                 alert = SecurityAlert(
-                    alert_id=f"bulk_access_{user_id}_{int(timestamp.timestamp())}",
+                    alert_id=f"bulk_access_{user_id}_{int(now)}",
                     alert_type=AlertType.BULK_DATA_ACCESS,
                     threat_level=ThreatLevel.MEDIUM,
                     title="Bulk Data Access Detected",
-                    description=f"User {user_id} accessed {len(recent_access)} records in {self.BULK_ACCESS_WINDOW} seconds",
+                    description=f"User {user_id} accessed {access_count} records in {self.BULK_ACCESS_WINDOW} seconds",
                     user_id=user_id,
                     user_email=event.get("user", {}).get("email"),
                     user_role=event.get("user", {}).get("role"),
                     ip_address=event.get("metadata", {}).get("ip_address"),
-                    affected_resources=[f"bulk_data_access_{len(recent_access)}_records"],
+                    affected_resources=[f"bulk_data_access_{access_count}_records"],
                     evidence={
-                        "access_count": len(recent_access),
+                        "access_count": access_count,
                         "unique_resources": unique_resources,
                         "time_window": f"{self.BULK_ACCESS_WINDOW} seconds",
-                        "resource_types": list(set([
-                            access["resource_type"] for access in recent_access
-                            if access["resource_type"]
-                        ]))
+                        "resource_types": sorted(state.resource_types)
                     },
                     timestamp=timestamp
                 )
@@ -365,51 +436,36 @@ class SecurityPatternDetector:
         
         alerts = []
         
-        user_activities = list(self.user_activity_windows[user_id])
-        if len(user_activities) < 20:  # Need enough data
+        state = self.users.peek(user_id)
+        if state is None or state.hours_seen < 5:  # Need enough history
             return alerts
         
-        # Calculate activity rate (actions per hour)
-        activity_rates = []
-        current_time = timestamp
+        # Compare the current hour with the decayed hourly baseline
+        avg_rate = state.hourly_mean
+        std_rate = math.sqrt(state.hourly_var)
+        current_rate = state.hour_count
         
-        for i in range(24):  # Last 24 hours
-            hour_start = current_time - timedelta(hours=i+1)
-            hour_end = current_time - timedelta(hours=i)
-            
-            hour_activities = [
-                a for a in user_activities
-                if hour_start <= a["timestamp"] <= hour_end
-            ]
-            activity_rates.append(len(hour_activities))
-        
-        if len(activity_rates) >= 5:
-            # Check if current activity is unusually high
-            avg_rate = statistics.mean(activity_rates[1:])  # Exclude current hour
-            std_rate = statistics.stdev(activity_rates[1:]) if len(activity_rates) > 2 else 0
-            current_rate = activity_rates[0]
-            
-            if std_rate > 0 and current_rate > avg_rate + (self.UNUSUAL_ACTIVITY_THRESHOLD * std_rate):
-                alert = SecurityAlert(
-                    alert_id=f"unusual_activity_{user_id}_{int(timestamp.timestamp())}",
-                    alert_type=AlertType.UNUSUAL_ACTIVITY,
-                    threat_level=ThreatLevel.MEDIUM,
-                    title="Unusual Activity Pattern",
-                    description=f"User {user_id} showing unusual activity levels",
-                    user_id=user_id,
-                    user_email=None,
-                    user_role=user_role,
-                    ip_address=None,
-                    affected_resources=[f"user_activity_{user_id}"],
-                    evidence={
-                        "current_rate": current_rate,
-                        "average_rate": round(avg_rate, 2),
-                        "standard_deviation": round(std_rate, 2),
-                        "threshold_exceeded": round(current_rate - avg_rate, 2)
-                    },
-                    timestamp=timestamp
-                )
-                alerts.append(alert)
+        if std_rate > 0 and current_rate > avg_rate + (self.UNUSUAL_ACTIVITY_THRESHOLD * std_rate):
+            alert = SecurityAlert(
+                alert_id=f"unusual_activity_{user_id}_{int(timestamp.timestamp())}",
+                alert_type=AlertType.UNUSUAL_ACTIVITY,
+                threat_level=ThreatLevel.MEDIUM,
+                title="Unusual Activity Pattern",
+                description=f"User {user_id} showing unusual activity levels",
+                user_id=user_id,
+                user_email=None,
+                user_role=user_role,
+                ip_address=None,
+                affected_resources=[f"user_activity_{user_id}"],
+                evidence={
+                    "current_rate": current_rate,
+                    "average_rate": round(avg_rate, 2),
+                    "standard_deviation": round(std_rate, 2),
+                    "threshold_exceeded": round(current_rate - avg_rate, 2)
+                },
+                timestamp=timestamp
+            )
+            alerts.append(alert)
         
         return alerts
     
@@ -426,35 +482,49 @@ class SecurityPatternDetector:
         if not user_id:
             return alerts
         
-        # Count recent permission denials for user
-        user_activities = list(self.user_activity_windows[user_id])
-        recent_failures = [
-            a for a in user_activities[-20:]  # Last 20 activities
-            if not a.get("success", True) and a.get("action") == "permission_denied"
-        ]
+        # Recent permission denials, decayed so old failures fade out
+        state = self.users.peek(user_id)
+        if state is None:
+            return alerts
+        now = _epoch(timestamp)
+        failures = state.denials.value_at(now)
+        activities = state.activity.value_at(now)
         
-        if len(recent_failures) >= 5:
+        if failures >= self.REPEATED_FAILURE_THRESHOLD:
             alert = SecurityAlert(
-                alert_id=f"repeated_failures_{user_id}_{int(timestamp.timestamp())}",
+                alert_id=f"repeated_failures_{user_id}_{int(now)}",
                 alert_type=AlertType.REPEATED_FAILURES,
                 threat_level=ThreatLevel.MEDIUM,
                 title="Repeated Authorization Failures",
-                description=f"User {user_id} has {len(recent_failures)} recent permission denials",
+                description=f"User {user_id} has {round(failures)} recent permission denials",
                 user_id=user_id,
                 user_email=None,
                 user_role=None,
                 ip_address=ip_address,
                 affected_resources=[f"authorization_failures_{user_id}"],
                 evidence={
-                    "failure_count": len(recent_failures),
-                    "recent_activities": len(user_activities),
-                    "failure_rate": round(len(recent_failures) / len(user_activities), 2) if user_activities else 0
+                    "failure_count": round(failures, 2),
+                    "recent_activities": round(activities, 2),
+                    "failure_rate": round(failures / activities, 2) if activities else 0
                 },
                 timestamp=timestamp
             )
             alerts.append(alert)
         
         return alerts
+    
+    def get_state_stats(self) -> Dict:
+        """Size of the detector state; bounded by construction"""
+        sketches = [
+            self.failure_counts, self.ip_failure_counts, self.ip_activity_counts,
+            self.read_counts, self.cross_branch_counts
+        ]
+        return {
+            "tracked_users": len(self.users),
+            "user_evictions": self.users.evictions,
+            "tracked_identifiers": len(self.failure_evidence),
+            "sketch_bytes": sum(s.memory_bytes for s in sketches)
+        }
 
 class SecurityMonitor:
     """
@@ -625,7 +695,8 @@ class SecurityMonitor:
             ]),
             "alert_types": dict(alert_counts),
             "threat_levels": dict(threat_counts),
-            "monitoring_active": self.monitoring_active
+            "monitoring_active": self.monitoring_active,
+            "detector_state": self.pattern_detector.get_state_stats()
         }
 
 # Global security monitor instance
@@ -0,0 +1,208 @@
+"""
+Atomic Sequence Counters
+Allocates receipt, inventory and student numbers from per-key counter documents
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+COUNTERS_COLLECTION = "counters"
+
+INVENTORY_CODE_START = 1000
+INVENTORY_CODE_SOURCES = [
+    ("assets", "asset_code", "AST"),
+    ("supplies", "supply_code", "SUP"),
+    ("maintenance_records", "maintenance_code", "MNT"),
+    ("inventory_transactions", "transaction_code", "TXN"),
+    ("inventory_requests", "request_code", "REQ"),
+    ("vendors", "vendor_code", "VND"),
+    ("purchase_orders", "po_number", "PO"),
+]
+STUDENT_ID_PREFIX = "SCH"
+
+# Returns the last number already issued for a key (0 if none); used once per key to seed it
+SeedFunction = Callable[[], Awaitable[int]]
+
+
+def counter_key(namespace: str, prefix: str, branch_id: Optional[str] = None, year: Optional[int] = None) -> str:
+    """Build a counter document id, e.g. `receipt:RCP:<branch>:2025`"""
+    parts = [namespace, prefix]
+    if branch_id is not None:
+        parts.append(str(branch_id))
+    if year is not None:
+        parts.append(str(year))
+    return ":".join(parts)
+
+
+class SequenceCounterService:
+    """
+    Hands out numbers with a single find_one_and_update + $inc per allocation.
+    With block_size > 1 a process reserves a range of numbers at once and serves them
+    locally; unused numbers of a reserved block are lost on restart, so blocks are only
+    meant for codes where gaps are acceptable.
+    """
+
+    def __init__(self, db, collection_name: str = COUNTERS_COLLECTION):
+        self.db = db
+        self.collection = db[collection_name]
+        self._seeded: set = set()
+        # key -> [next_value, last_value] of the locally reserved block
+        self._blocks: Dict[str, list] = {}
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def seed(self, key: str, value: int):
+        """Raise a counter to at least `value`; safe to run repeatedly and concurrently"""
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$max": {"value": int(value)}, "$setOnInsert": {"created_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race; the document exists now, so apply $max to it
+            await self.collection.update_one({"_id": key}, {"$max": {"value": int(value)}})
+        self._seeded.add(key)
+
+    async def _ensure_seeded(self, key: str, seed: Optional[SeedFunction]):
+        if seed is None or key in self._seeded:
+            return
+        if await self.collection.find_one({"_id": key}, {"_id": 1}) is None:
+            await self.seed(key, await seed())
+        self._seeded.add(key)
+
+    async def allocate_block(self, key: str, size: int, seed: Optional[SeedFunction] = None) -> Tuple[int, int]:
+        """Reserve `size` consecutive numbers; returns (first, last) inclusive"""
+        await self._ensure_seeded(key, seed)
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": key},
+                {"$inc": {"value": size}, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Concurrent first allocation; retry as a plain update now that the document exists
+            doc = await self.collection.find_one_and_update(
+                {"_id": key},
+                {"$inc": {"value": size}, "$set": {"updated_at": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER
+            )
+        last = int(doc["value"])
+        return last - size + 1, last
+
+    async def next_value(self, key: str, seed: Optional[SeedFunction] = None, block_size: int = 1) -> int:
+        """Return the next number for a key"""
+        if block_size <= 1:
+            first, _ = await self.allocate_block(key, 1, seed)
+            return first
+
+        async with self._locks[key]:
+            block = self._blocks.get(key)
+            if block is None or block[0] > block[1]:
+                first, last = await self.allocate_block(key, block_size, seed)
+                block = self._blocks[key] = [first, last]
+            value = block[0]
+            block[0] += 1
+            return value
+
+    async def current_value(self, key: str) -> int:
+        """Last number issued from the shared counter (ignores unused local blocks)"""
+        doc = await self.collection.find_one({"_id": key}, {"value": 1})
+        return int(doc["value"]) if doc else 0
+
+
+async def max_code_number(collection, field: str, pattern: str, position: int = -1,
+                          extra_filter: Optional[Dict[str, Any]] = None) -> int:
+    """Largest numeric segment among existing codes matching `pattern`; used to seed counters"""
+    query = {field: {"$regex": pattern}, **(extra_filter or {})}
+    last = await collection.find_one(query, {field: 1}, sort=[(field, -1)])
+    if last and last.get(field):
+        try:
+            return int(last[field].split("-")[position])
+        except (ValueError, IndexError):
+            pass
+    return 0
+
+
+async def seed_sequence_counters(db) -> Dict[str, int]:
+    """
+    Seed counters from codes already stored in the database.
+    Uses $max, so it can run against live data and be re-run at any time.
+    """
+    service = SequenceCounterService(db)
+    seeded: Dict[str, int] = {}
+
+    async def apply(key: str, value: int):
+        await service.seed(key, value)
+        seeded[key] = value
+
+    # Receipts: RCP-<year>-<seq> per branch; payments store either receipt_no or receipt_number
+    for field in ("receipt_no", "receipt_number"):
+        pipeline = [
+            {"$match": {field: {"$regex": r"^[A-Z]+-\d{4}-\d+$"}}},
+            {"$project": {"branch_id": 1, "parts": {"$split": [f"${field}", "-"]}}},
+            {"$group": {
+                "_id": {
+                    "branch_id": "$branch_id",
+                    "prefix": {"$arrayElemAt": ["$parts", 0]},
+                    "year": {"$arrayElemAt": ["$parts", 1]}
+                },
+                "max_seq": {"$max": {"$toInt": {"$arrayElemAt": ["$parts", 2]}}}
+            }}
+        ]
+        async for row in db.payments.aggregate(pipeline):
+            group = row["_id"]
+            key = counter_key("receipt", group["prefix"], group.get("branch_id"), int(group["year"]))
+            await apply(key, max(row["max_seq"], seeded.get(key, 0)))
+
+    # Inventory codes: <PREFIX>-<seq>, numbering starts at 1000
+    for collection_name, field, prefix in INVENTORY_CODE_SOURCES:
+        last = await max_code_number(db[collection_name], field, f"^{prefix}-", position=1)
+        await apply(counter_key("inventory", prefix), max(last, INVENTORY_CODE_START - 1))
+
+    # Student IDs: SCH-<year>-<seq>
+    pipeline = [
+        {"$match": {"student_id": {"$regex": r"^SCH-\d{4}-\d+$"}}},
+        {"$project": {"parts": {"$split": ["$student_id", "-"]}}},
+        {"$group": {
+            "_id": {"$arrayElemAt": ["$parts", 1]},
+            "max_seq": {"$max": {"$toInt": {"$arrayElemAt": ["$parts", 2]}}}
+        }}
+    ]
+    async for row in db.students.aggregate(pipeline):
+        await apply(counter_key("student_id", STUDENT_ID_PREFIX, year=int(row["_id"])), row["max_seq"])
+
+    logger.info(f"Seeded {len(seeded)} sequence counters")
+    return seeded
+
+
+# Global counter services, one per database
+_sequence_services: Dict[str, SequenceCounterService] = {}
+
+
+def get_sequence_counter_service(db) -> SequenceCounterService:
+    """Get the process-wide counter service for a database"""
+    service = _sequence_services.get(db.name)
+    if service is None:
+        service = _sequence_services[db.name] = SequenceCounterService(db)
+    return service
+
+
+# Export components
+__all__ = [
+    'SequenceCounterService',
+    'counter_key',
+    'max_code_number',
+    'seed_sequence_counters',
+    'get_sequence_counter_service',
+    'INVENTORY_CODE_START',
+    'INVENTORY_CODE_SOURCES',
+    'STUDENT_ID_PREFIX'
+]
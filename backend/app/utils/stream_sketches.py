@@ -0,0 +1,187 @@
+"""
+Streaming Sketches
+Fixed-memory counters and cardinality estimators for high-volume event streams
+"""
+
+import hashlib
+import math
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+def hash64(key: str) -> int:
+    """Stable 64-bit hash; unlike hash() it does not change between processes"""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class DecayedCounter:
+    """
+    Exponentially time-decayed count: each event contributes 1 and halves every `half_life` seconds.
+    Two floats of state replace a list of event timestamps.
+    """
+
+    __slots__ = ("half_life", "value", "updated_at")
+
+    def __init__(self, half_life: float):
+        self.half_life = half_life
+        self.value = 0.0
+        self.updated_at: Optional[float] = None
+
+    def _decay(self, now: float) -> float:
+        if self.updated_at is None or now <= self.updated_at:
+            return self.value
+        return self.value * math.pow(0.5, (now - self.updated_at) / self.half_life)
+
+    def add(self, now: float, amount: float = 1.0) -> float:
+        self.value = self._decay(now) + amount
+        self.updated_at = max(now, self.updated_at or now)
+        return self.value
+
+    def value_at(self, now: float) -> float:
+        return self._decay(now)
+
+
+class WindowedCountMinSketch:
+    """
+    Count-min sketch over a sliding window of `window_seconds`, split into `panes` tumbling panes.
+    Memory is panes * depth * width counters whatever the number of distinct keys.
+    Estimates never undercount; conservative update keeps the overcount from
+    colliding keys small, so width should be a few times the keys active per window.
+    """
+
+    def __init__(self, window_seconds: float, panes: int = 5, width: int = 4096, depth: int = 4):
+        self.window_seconds = window_seconds
+        self.panes = panes
+        self.pane_seconds = window_seconds / panes
+        self.width = width
+        self.depth = depth
+        self.pane_size = width * depth
+        self.counters = array("I", bytes(4 * self.pane_size * panes))
+        self.pane_ids = [None] * panes
+        self._zero_pane = array("I", bytes(4 * self.pane_size))
+
+    def _columns(self, key: str):
+        h = hash64(key)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def _pane_min(self, slot: int, columns) -> int:
+        base = slot * self.pane_size
+        counters = self.counters
+        return min(counters[base + c] for c in columns)
+
+    def add(self, key: str, now: float, amount: int = 1) -> int:
+        """Count `amount` occurrences of key at time `now`; returns the windowed estimate"""
+        pane = int(now // self.pane_seconds)
+        slot = pane % self.panes
+        columns = self._columns(key)
+        current = self.pane_ids[slot]
+        if current != pane:
+            if current is not None and current > pane:
+                # Older than everything retained; it no longer falls in any live window
+                return self._estimate(columns, pane)
+            base = slot * self.pane_size
+            self.counters[base:base + self.pane_size] = self._zero_pane
+            self.pane_ids[slot] = pane
+
+        # Conservative update: only raise the counters that hold the current minimum
+        base = slot * self.pane_size
+        target = self._pane_min(slot, columns) + amount
+        counters = self.counters
+        for c in columns:
+            if counters[base + c] < target:
+                counters[base + c] = target
+        return self._estimate(columns, pane)
+
+    def _estimate(self, columns, pane: int) -> int:
+        oldest = pane - self.panes
+        total = 0
+        for slot, pane_id in enumerate(self.pane_ids):
+            if pane_id is not None and oldest < pane_id <= pane:
+                total += self._pane_min(slot, columns)
+        return total
+
+    def estimate(self, key: str, now: float) -> int:
+        return self._estimate(self._columns(key), int(now // self.pane_seconds))
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.counters.itemsize * len(self.counters)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with 2^precision one-byte registers.
+    Small cardinalities fall back to linear counting, which is near exact below ~2.5 * registers.
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 7):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item: str):
+        h = hash64(item)
+        index = h >> (64 - self.precision)
+        remainder = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 64 - self.precision + 1 if remainder == 0 else 65 - remainder.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        merged = HyperLogLog(self.precision)
+        merged.registers = bytearray(map(max, self.registers, other.registers))
+        return merged
+
+    def count(self) -> int:
+        m = len(self.registers)
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.673)
+        raw = alpha * m * m / sum(math.ldexp(1.0, -r) for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+
+class LRUState:
+    """Mapping capped at `maxsize` keys; the least recently touched key is evicted first"""
+
+    def __init__(self, maxsize: int, factory: Callable[[], Any]):
+        self.maxsize = maxsize
+        self.factory = factory
+        self.items: "OrderedDict[str, Any]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str):
+        """Return the state for key, creating it (and evicting if full) when missing"""
+        state = self.items.get(key)
+        if state is None:
+            state = self.factory()
+            self.items[key] = state
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.items.move_to_end(key)
+        return state
+
+    def peek(self, key: str):
+        return self.items.get(key)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+# Export components
+__all__ = [
+    'hash64',
+    'DecayedCounter',
+    'WindowedCountMinSketch',
+    'HyperLogLog',
+    'LRUState'
+]
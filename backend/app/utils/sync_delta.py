@@ -0,0 +1,189 @@
+"""
+Field-level Delta Protocol for Realtime Sync
+Document versioning, delta construction and per-subscription field projection for sync events
+"""
+import logging
+from collections import OrderedDict
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Change tokens remembered per document; a replayed event older than this many changes bumps again
+APPLIED_TOKEN_LIMIT = 100
+
+
+def json_safe(value: Any) -> Any:
+    """Convert BSON values (ObjectId, datetime, Decimal) into JSON-serializable equivalents"""
+    if isinstance(value, dict):
+        return {k: json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _root(path: str) -> str:
+    """Top-level field of a dotted update path (e.g. `address.city` -> `address`)"""
+    return path.split(".", 1)[0]
+
+
+def build_delta(updated_fields: Optional[Dict[str, Any]],
+                removed_fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Build a delta from a change stream updateDescription"""
+    return {
+        "set": json_safe(updated_fields or {}),
+        "unset": list(removed_fields or [])
+    }
+
+
+def project_document(document: Optional[Dict[str, Any]], fields: Optional[Iterable[str]]) -> Optional[Dict[str, Any]]:
+    """Keep only the requested top-level fields (plus _id); None means all fields"""
+    if document is None or fields is None:
+        return document
+    wanted = set(fields) | {"_id"}
+    return {k: v for k, v in document.items() if k in wanted}
+
+
+def project_delta(delta: Dict[str, Any], fields: Optional[Iterable[str]]) -> Dict[str, Any]:
+    """Keep only delta entries touching the requested top-level fields"""
+    if fields is None:
+        return delta
+    wanted = set(fields)
+    return {
+        "set": {k: v for k, v in delta.get("set", {}).items() if _root(k) in wanted},
+        "unset": [k for k in delta.get("unset", []) if _root(k) in wanted]
+    }
+
+
+def project_sync_payload(payload: Dict[str, Any], fields: Optional[Iterable[str]]) -> Dict[str, Any]:
+    """Apply a subscription's field projection to a sync payload"""
+    if fields is None:
+        return payload
+    projected = dict(payload)
+    if "data" in projected:
+        projected["data"] = project_document(projected["data"], fields)
+    if "delta" in projected:
+        projected["delta"] = project_delta(projected["delta"], fields)
+    return projected
+
+
+class DocumentVersionStore:
+    """
+    Per-document version counters for sync events.
+    Versions are bumped once per change stream token, so every worker handling the same
+    event agrees on the number and clients can detect gaps by comparing base_version.
+    Each document remembers the versions its last APPLIED_TOKEN_LIMIT tokens got, so an
+    event replayed by a lagging or restarted worker gets its original version back.
+    """
+
+    def __init__(self, db=None, collection_name: str = "sync_document_versions", cache_size: int = 10000):
+        self.db = db
+        self.collection = db[collection_name] if db is not None else None
+        self.cache_size = cache_size
+        # key -> (version, {token: version}); used as the store when no database is configured
+        self.cache: "OrderedDict[str, Tuple[int, Dict[str, int]]]" = OrderedDict()
+
+    @staticmethod
+    def _key(collection_name: str, document_id: str) -> str:
+        return f"{collection_name}:{document_id}"
+
+    def _remember(self, key: str, version: int, token: Optional[str], token_version: Optional[int] = None):
+        latest, applied = self.cache.get(key, (0, {}))
+        if token is not None:
+            applied = {**applied, token: version if token_version is None else token_version}
+            while len(applied) > APPLIED_TOKEN_LIMIT:
+                del applied[next(iter(applied))]
+        self.cache[key] = (max(latest, version), applied)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    @staticmethod
+    def _bump(change_token: Optional[str]) -> List[Dict[str, Any]]:
+        """Pipeline update incrementing the version and recording the token it was given"""
+        stages: List[Dict[str, Any]] = [
+            {"$set": {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}, "updated_at": datetime.utcnow()}}
+        ]
+        if change_token is not None:
+            stages.append({"$set": {"applied": {"$slice": [
+                {"$concatArrays": [{"$ifNull": ["$applied", []]}, [{"token": change_token, "version": "$version"}]]},
+                -APPLIED_TOKEN_LIMIT
+            ]}}})
+        return stages
+
+    @staticmethod
+    def _applied_version(doc: Optional[Dict[str, Any]], change_token: str) -> Optional[int]:
+        for applied in (doc or {}).get("applied", []):
+            if applied.get("token") == change_token:
+                return int(applied["version"])
+        return None
+
+    async def next_version(self, collection_name: str, document_id: str,
+                           change_token: Optional[str] = None) -> int:
+        """Bump and return the document version; a change token seen before gets its original version"""
+        key = self._key(collection_name, document_id)
+
+        if self.collection is None:
+            version, applied = self.cache.get(key, (0, {}))
+            if change_token is not None and change_token in applied:
+                return applied[change_token]
+            self._remember(key, version + 1, change_token)
+            return version + 1
+
+        doc = None
+        try:
+            # A second pass covers an upsert that raced with another token creating the document
+            for _ in range(2):
+                try:
+                    doc = await self.collection.find_one_and_update(
+                        {"_id": key, "applied.token": {"$ne": change_token}} if change_token else {"_id": key},
+                        self._bump(change_token),
+                        upsert=True,
+                        return_document=ReturnDocument.AFTER
+                    )
+                    break
+                except DuplicateKeyError:
+                    # The document exists but did not match: this token may already be applied
+                    doc = await self.collection.find_one({"_id": key})
+                    applied_version = self._applied_version(doc, change_token)
+                    if applied_version is not None:
+                        self._remember(key, int(doc["version"]), change_token, applied_version)
+                        return applied_version
+                    doc = None
+        except PyMongoError as e:
+            logger.error(f"Error bumping document version for {key}: {e}")
+
+        version = int(doc["version"]) if doc else self.cache.get(key, (0, {}))[0] + 1
+        self._remember(key, version, change_token)
+        return version
+
+    async def current_version(self, collection_name: str, document_id: str) -> int:
+        """Return the latest known version of a document (0 if it never changed)"""
+        key = self._key(collection_name, document_id)
+        if self.collection is None:
+            return self.cache.get(key, (0, {}))[0]
+
+        doc = await self.collection.find_one({"_id": key}, {"version": 1})
+        return int(doc["version"]) if doc else 0
+
+
+# Export components
+__all__ = [
+    'DocumentVersionStore',
+    'json_safe',
+    'build_delta',
+    'project_document',
+    'project_delta',
+    'project_sync_payload'
+]
@@ -1,19 +1,56 @@
 """
 Timetable conflict detection and resolution algorithms
 """
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+import os
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, time, date
-from bson import ObjectId
 
 from ..models.timetable import TimetableConflict, ConflictType
+from .timetable_occupancy import TimetableOccupancyIndex
 
 logger = logging.getLogger(__name__)
 
+HEAVY_SUBJECTS = ["mathematics", "physics", "chemistry", "biology"]
+PHYSICAL_SUBJECTS = ["physical education", "sports", "pe"]
+LUNCH_PERIODS = [4, 5]  # Configurable based on school policy
+MAX_CONSECUTIVE_PERIODS = 3
+
+@dataclass
+class BulkReservation:
+    """Provisional index entries for a bulk submission that has not been written yet"""
+    batch_id: str
+    indexes: List[TimetableOccupancyIndex] = field(default_factory=list)
+    conflicts: List[List[TimetableConflict]] = field(default_factory=list)
+    
+    def pending_id(self, position: int) -> str:
+        return f"pending:{self.batch_id}:{position}"
+    
+    def update(self, position: int, entry: Dict[str, Any]):
+        """(Re)place the reservation, e.g. after auto-resolution changed the room"""
+        self.indexes[position].add(self.pending_id(position), entry)
+    
+    def commit(self, inserted_ids: List[Any]):
+        for position, entry_id in enumerate(inserted_ids):
+            self.indexes[position].rekey(self.pending_id(position), str(entry_id))
+    
+    def release(self):
+        for position, index in enumerate(self.indexes):
+            index.remove(self.pending_id(position))
+
 class TimetableConflictDetector:
-    """Advanced conflict detection for timetable scheduling"""
+    """
+    Advanced conflict detection for timetable scheduling.
+    Checks run against a per (branch, academic year) occupancy index loaded once and
+    kept current by this process's writes; it is reloaded after `index_ttl_seconds`
+    to pick up changes made by other workers.
+    """
     
-    def __init__(self):
+    def __init__(self, index_ttl_seconds: Optional[float] = None):
         self.conflict_rules = {
             "teacher_overlap": self._check_teacher_overlap,
             "room_overlap": self._check_room_overlap,
@@ -21,18 +58,49 @@ class TimetableConflictDetector:
             "resource_overlap": self._check_resource_overlap,
             "time_constraint": self._check_time_constraints
         }
+        self.index_ttl_seconds = index_ttl_seconds if index_ttl_seconds is not None else float(
+            os.getenv("TIMETABLE_INDEX_TTL_SECONDS", "300")
+        )
+        self.indexes: Dict[Tuple[Optional[str], str], TimetableOccupancyIndex] = {}
+        self.index_locks: Dict[Tuple[Optional[str], str], asyncio.Lock] = defaultdict(asyncio.Lock)
     
-    async def detect_entry_conflicts(self, entry_data: Dict[str, Any], db) -> List[TimetableConflict]:
+    async def get_index(self, db, branch_id: Optional[str], academic_year: str) -> TimetableOccupancyIndex:
+        """Return the occupancy index for a branch and academic year, loading it on first use"""
+        key = (branch_id, academic_year)
+        index = self.indexes.get(key)
+        if index is not None and not index.is_stale(self.index_ttl_seconds):
+            return index
+        
+        async with self.index_locks[key]:
+            index = self.indexes.get(key)
+            if index is None or index.is_stale(self.index_ttl_seconds):
+                index = await TimetableOccupancyIndex.load(db, branch_id, academic_year)
+                self.indexes[key] = index
+        return index
+    
+    def invalidate(self, branch_id: Optional[str] = None, academic_year: Optional[str] = None):
+        """Drop cached indexes, e.g. after time slots change"""
+        for key in list(self.indexes):
+            if branch_id is not None and key[0] != branch_id:
+                continue
+            if academic_year is not None and key[1] != academic_year:
+                continue
+            del self.indexes[key]
+    
+    async def detect_entry_conflicts(
+        self,
+        entry_data: Dict[str, Any],
+        db,
+        index: Optional[TimetableOccupancyIndex] = None
+    ) -> List[TimetableConflict]:
         """
         Detect all possible conflicts for a timetable entry
         """
-        conflicts = []
-        
         try:
-            # Run all conflict detection rules
-            for conflict_type, check_function in self.conflict_rules.items():
-                detected_conflicts = await check_function(entry_data, db)
-                conflicts.extend(detected_conflicts)
+            if index is None:
+                index = await self.get_index(db, entry_data.get("branch_id"), entry_data["academic_year"])
+            await index.ensure_reference_data(db, [entry_data])
+            conflicts = self.check_entry(entry_data, index)
             
             logger.info(f"Detected {len(conflicts)} conflicts for entry")
             return conflicts
@@ -41,457 +109,343 @@ class TimetableConflictDetector:
             logger.error(f"Error detecting conflicts: {str(e)}")
             return []
     
-    async def _check_teacher_overlap(self, entry_data: Dict[str, Any], db) -> List[TimetableConflict]:
-        """Check for teacher scheduling conflicts"""
+    def check_entry(self, entry_data: Dict[str, Any], index: TimetableOccupancyIndex) -> List[TimetableConflict]:
+        """Run every rule for one entry against the index; no database access"""
         conflicts = []
-        
-        teacher_id = entry_data.get("teacher_id")
-        if not teacher_id:
-            return conflicts
-        
-        try:
-            # Find overlapping entries for the same teacher
-            overlap_query = {
+        for conflict_type, check_function in self.conflict_rules.items():
+            conflicts.extend(check_function(entry_data, index))
+        return conflicts
+    
+    async def validate_bulk(self, entries: List[Dict[str, Any]], db) -> "BulkReservation":
+        """
+        Check a whole submission in memory. Entries are checked in order and reserved
+        under provisional ids, so later entries also conflict with earlier ones in the
+        same batch; commit or release the returned reservation once the write finishes.
+        """
+        reservation = BulkReservation(uuid.uuid4().hex)
+        for position, entry in enumerate(entries):
+            index = await self.get_index(db, entry.get("branch_id"), entry["academic_year"])
+            await index.ensure_reference_data(db, [entry])
+            reservation.conflicts.append(self.check_entry(entry, index))
+            reservation.indexes.append(index)
+            reservation.update(position, entry)
+        return reservation
+    
+    def record_entry(self, entry_id: Any, entry_data: Dict[str, Any]):
+        """Keep a loaded index current after a single insert"""
+        index = self.indexes.get((entry_data.get("branch_id"), entry_data["academic_year"]))
+        if index is not None:
+            index.add(str(entry_id), entry_data)
+    
+    def scan_conflicts(self, index: TimetableOccupancyIndex) -> List[TimetableConflict]:
+        """Every overlap in a stored timetable, found from the index's shared cells"""
+        conflicts = []
+        builders = {
+            "teacher": self._teacher_conflict,
+            "room": self._room_conflict,
+            "class": self._class_conflict,
+            "resource": self._resource_conflict
+        }
+        for kind, key, cell, owners in index.clashes():
+            day, slot = index.describe_cell(cell)
+            first = index.entries[owners[0]]
+            for other_id in owners[1:]:
+                conflict = builders[kind](key, day, slot, first, index.entries[other_id], index)
+                conflict.affected_entries = [owners[0], other_id]
+                conflicts.append(conflict)
+        return conflicts
+    
+    @staticmethod
+    def _time_desc(slot: Optional[Dict[str, Any]]) -> str:
+        return f"{slot.get('start_time')} - {slot.get('end_time')}" if slot else "Unknown Time"
+    
+    @staticmethod
+    def _day(entry_data: Dict[str, Any]) -> str:
+        return getattr(entry_data["day_of_week"], "value", entry_data["day_of_week"])
+    
+    def _overlaps(self, kind: str, key: str, entry_data: Dict[str, Any], index: TimetableOccupancyIndex):
+        exclude = str(entry_data["_id"]) if entry_data.get("_id") else None
+        for entry_id in index.occupants(kind, key, entry_data["day_of_week"], entry_data["time_slot_id"], exclude):
+            yield entry_id, index.entries[entry_id]
+    
+    def _teacher_conflict(self, teacher_id, day, slot, entry_data, overlap_entry, index) -> TimetableConflict:
+        teacher_name = index.teacher_names.get(str(teacher_id)) or "Unknown Teacher"
+        time_desc = self._time_desc(slot)
+        return TimetableConflict(
+            conflict_type=ConflictType.TEACHER_OVERLAP,
+            severity="critical",
+            description=f"Teacher {teacher_name} is already scheduled at {time_desc} on {day}",
+            affected_entries=[],
+            suggested_resolution=f"Reschedule one of the classes or assign a different teacher",
+            detected_at=datetime.now(),
+            metadata={
                 "teacher_id": teacher_id,
-                "day_of_week": entry_data["day_of_week"],
-                "time_slot_id": entry_data["time_slot_id"],
-                "academic_year": entry_data["academic_year"]
+                "teacher_name": teacher_name,
+                "conflicting_class_id": overlap_entry.get("class_id"),
+                "time_slot": time_desc,
+                "day": day
             }
-            
-            # Exclude current entry if updating
-            if entry_data.get("_id"):
-                overlap_query["_id"] = {"$ne": ObjectId(entry_data["_id"])}
-            
-            overlapping_entries = await db.timetable_entries.find(overlap_query).to_list(None)
-            
-            for overlap_entry in overlapping_entries:
-                # Get teacher and time slot information for better conflict description
-                teacher = await db.teachers.find_one({"_id": ObjectId(teacher_id)})
-                time_slot = await db.time_slots.find_one({"_id": ObjectId(entry_data["time_slot_id"])})
-                
-                teacher_name = f"{teacher.get('first_name', '')} {teacher.get('last_name', '')}".strip() if teacher else "Unknown Teacher"
-                time_desc = f"{time_slot.get('start_time')} - {time_slot.get('end_time')}" if time_slot else "Unknown Time"
-                
-                conflict = TimetableConflict(
-                    conflict_type=ConflictType.TEACHER_OVERLAP,
-                    severity="critical",
-                    description=f"Teacher {teacher_name} is already scheduled at {time_desc} on {entry_data['day_of_week']}",
-                    affected_entries=[str(overlap_entry["_id"])],
-                    suggested_resolution=f"Reschedule one of the classes or assign a different teacher",
-                    detected_at=datetime.now(),
-                    metadata={
-                        "teacher_id": teacher_id,
-                        "teacher_name": teacher_name,
-                        "conflicting_class_id": overlap_entry.get("class_id"),
-                        "time_slot": time_desc,
-                        "day": entry_data["day_of_week"]
-                    }
-                )
-                conflicts.append(conflict)
-        
-        except Exception as e:
-            logger.error(f"Error checking teacher overlap: {str(e)}")
-        
+        )
+    
+    def _room_conflict(self, room_number, day, slot, entry_data, overlap_entry, index) -> TimetableConflict:
+        time_desc = self._time_desc(slot)
+        return TimetableConflict(
+            conflict_type=ConflictType.ROOM_OVERLAP,
+            severity="high",
+            description=f"Room {room_number} is already booked at {time_desc} on {day}",
+            affected_entries=[],
+            suggested_resolution=f"Use a different room or reschedule one of the classes",
+            detected_at=datetime.now(),
+            metadata={
+                "room_number": room_number,
+                "conflicting_class_id": overlap_entry.get("class_id"),
+                "time_slot": time_desc,
+                "day": day
+            }
+        )
+    
+    def _class_conflict(self, class_id, day, slot, entry_data, overlap_entry, index) -> TimetableConflict:
+        class_name = index.class_names.get(str(class_id)) or "Unknown Class"
+        time_desc = self._time_desc(slot)
+        return TimetableConflict(
+            conflict_type=ConflictType.CLASS_OVERLAP,
+            severity="critical",
+            description=f"Class {class_name} already has a scheduled class at {time_desc} on {day}",
+            affected_entries=[],
+            suggested_resolution=f"Reschedule to a different time slot",
+            detected_at=datetime.now(),
+            metadata={
+                "class_id": class_id,
+                "class_name": class_name,
+                "conflicting_subject": overlap_entry.get("subject_id"),
+                "time_slot": time_desc,
+                "day": day
+            }
+        )
+    
+    def _resource_conflict(self, resource, day, slot, entry_data, overlap_entry, index) -> TimetableConflict:
+        time_desc = self._time_desc(slot)
+        return TimetableConflict(
+            conflict_type=ConflictType.RESOURCE_OVERLAP,
+            severity="medium",
+            description=f"Resource '{resource}' is already booked at {time_desc} on {day}",
+            affected_entries=[],
+            suggested_resolution=f"Use alternative resources or reschedule one of the classes",
+            detected_at=datetime.now(),
+            metadata={
+                "resource": resource,
+                "conflicting_class_id": overlap_entry.get("class_id"),
+                "time_slot": time_desc,
+                "day": day
+            }
+        )
+    
+    def _check_overlap(self, kind: str, key, build, entry_data, index) -> List[TimetableConflict]:
+        conflicts = []
+        slot = index.slot(entry_data["time_slot_id"])
+        for overlap_id, overlap_entry in self._overlaps(kind, str(key), entry_data, index):
+            conflict = build(key, self._day(entry_data), slot, entry_data, overlap_entry, index)
+            conflict.affected_entries = [overlap_id]
+            conflicts.append(conflict)
         return conflicts
     
-    async def _check_room_overlap(self, entry_data: Dict[str, Any], db) -> List[TimetableConflict]:
+    def _check_teacher_overlap(self, entry_data: Dict[str, Any], index: TimetableOccupancyIndex) -> List[TimetableConflict]:
+        """Check for teacher scheduling conflicts"""
+        teacher_id = entry_data.get("teacher_id")
+        if not teacher_id:
+            return []
+        return self._check_overlap("teacher", teacher_id, self._teacher_conflict, entry_data, index)
+    
+    def _check_room_overlap(self, entry_data: Dict[str, Any], index: TimetableOccupancyIndex) -> List[TimetableConflict]:
         """Check for room scheduling conflicts"""
-        conflicts = []
-        
         room_number = entry_data.get("room_number")
         if not room_number:
-            return conflicts
-        
-        try:
-            overlap_query = {
-                "room_number": room_number,
-                "day_of_week": entry_data["day_of_week"],
-                "time_slot_id": entry_data["time_slot_id"],
-                "academic_year": entry_data["academic_year"]
-            }
-            
-            if entry_data.get("_id"):
-                overlap_query["_id"] = {"$ne": ObjectId(entry_data["_id"])}
-            
-            overlapping_entries = await db.timetable_entries.find(overlap_query).to_list(None)
-            
-            for overlap_entry in overlapping_entries:
-                time_slot = await db.time_slots.find_one({"_id": ObjectId(entry_data["time_slot_id"])})
-                time_desc = f"{time_slot.get('start_time')} - {time_slot.get('end_time')}" if time_slot else "Unknown Time"
-                
-                conflict = TimetableConflict(
-                    conflict_type=ConflictType.ROOM_OVERLAP,
-                    severity="high",
-                    description=f"Room {room_number} is already booked at {time_desc} on {entry_data['day_of_week']}",
-                    affected_entries=[str(overlap_entry["_id"])],
-                    suggested_resolution=f"Use a different room or reschedule one of the classes",
-                    detected_at=datetime.now(),
-                    metadata={
-                        "room_number": room_number,
-                        "conflicting_class_id": overlap_entry.get("class_id"),
-                        "time_slot": time_desc,
-                        "day": entry_data["day_of_week"]
-                    }
-                )
-                conflicts.append(conflict)
-        
-        except Exception as e:
-            logger.error(f"Error checking room overlap: {str(e)}")
-        
-        return conflicts
+            return []
+        return self._check_overlap("room", room_number, self._room_conflict, entry_data, index)
     
-    async def _check_class_overlap(self, entry_data: Dict[str, Any], db) -> List[TimetableConflict]:
+    def _check_class_overlap(self, entry_data: Dict[str, Any], index: TimetableOccupancyIndex) -> List[TimetableConflict]:
         """Check for class scheduling conflicts"""
-        conflicts = []
-        
         class_id = entry_data.get("class_id")
         if not class_id:
-            return conflicts
-        
-        try:
-            overlap_query = {
-                "class_id": class_id,
-                "day_of_week": entry_data["day_of_week"],
-                "time_slot_id": entry_data["time_slot_id"],
-                "academic_year": entry_data["academic_year"]
-            }
-            
-            if entry_data.get("_id"):
-                overlap_query["_id"] = {"$ne": ObjectId(entry_data["_id"])}
-            
-            overlapping_entries = await db.timetable_entries.find(overlap_query).to_list(None)
-            
-            for overlap_entry in overlapping_entries:
-                class_info = await db.classes.find_one({"_id": ObjectId(class_id)})
-                time_slot = await db.time_slots.find_one({"_id": ObjectId(entry_data["time_slot_id"])})
-                
-                class_name = class_info.get("class_name", "Unknown Class") if class_info else "Unknown Class"
-                time_desc = f"{time_slot.get('start_time')} - {time_slot.get('end_time')}" if time_slot else "Unknown Time"
-                
-                conflict = TimetableConflict(
-                    conflict_type=ConflictType.CLASS_OVERLAP,
-                    severity="critical",
-                    description=f"Class {class_name} already has a scheduled class at {time_desc} on {entry_data['day_of_week']}",
-                    affected_entries=[str(overlap_entry["_id"])],
-                    suggested_resolution=f"Reschedule to a different time slot",
-                    detected_at=datetime.now(),
-                    metadata={
-                        "class_id": class_id,
-                        "class_name": class_name,
-                        "conflicting_subject": overlap_entry.get("subject_id"),
-                        "time_slot": time_desc,
-                        "day": entry_data["day_of_week"]
-                    }
-                )
-                conflicts.append(conflict)
-        
-        except Exception as e:
-            logger.error(f"Error checking class overlap: {str(e)}")
-        
-        return conflicts
+            return []
+        return self._check_overlap("class", class_id, self._class_conflict, entry_data, index)
     
-    async def _check_resource_overlap(self, entry_data: Dict[str, Any], db) -> List[TimetableConflict]:
+    def _check_resource_overlap(self, entry_data: Dict[str, Any], index: TimetableOccupancyIndex) -> List[TimetableConflict]:
         """Check for resource conflicts (labs, equipment, etc.)"""
         conflicts = []
-        
-        resources_needed = entry_data.get("resources_needed", [])
-        if not resources_needed:
-            return conflicts
-        
-        try:
-            # Find other entries that need the same resources at the same time
-            for resource in resources_needed:
-                overlap_query = {
-                    "resources_needed": resource,
-                    "day_of_week": entry_data["day_of_week"],
-                    "time_slot_id": entry_data["time_slot_id"],
-                    "academic_year": entry_data["academic_year"]
-                }
-                
-                if entry_data.get("_id"):
-                    overlap_query["_id"] = {"$ne": ObjectId(entry_data["_id"])}
-                
-                overlapping_entries = await db.timetable_entries.find(overlap_query).to_list(None)
-                
-                for overlap_entry in overlapping_entries:
-                    time_slot = await db.time_slots.find_one({"_id": ObjectId(entry_data["time_slot_id"])})
-                    time_desc = f"{time_slot.get('start_time')} - {time_slot.get('end_time')}" if time_slot else "Unknown Time"
-                    
-                    conflict = TimetableConflict(
-                        conflict_type=ConflictType.RESOURCE_OVERLAP,
-                        severity="medium",
-                        description=f"Resource '{resource}' is already booked at {time_desc} on {entry_data['day_of_week']}",
-                        affected_entries=[str(overlap_entry["_id"])],
-                        suggested_resolution=f"Use alternative resources or reschedule one of the classes",
-                        detected_at=datetime.now(),
-                        metadata={
-                            "resource": resource,
-                            "conflicting_class_id": overlap_entry.get("class_id"),
-                            "time_slot": time_desc,
-                            "day": entry_data["day_of_week"]
-                        }
-                    )
-                    conflicts.append(conflict)
-        
-        except Exception as e:
-            logger.error(f"Error checking resource overlap: {str(e)}")
-        
+        for resource in entry_data.get("resources_needed") or []:
+            conflicts.extend(self._check_overlap("resource", resource, self._resource_conflict, entry_data, index))
         return conflicts
     
-    async def _check_time_constraints(self, entry_data: Dict[str, Any], db) -> List[TimetableConflict]:
+    def _check_time_constraints(self, entry_data: Dict[str, Any], index: TimetableOccupancyIndex) -> List[TimetableConflict]:
         """Check for time-based constraints and rules"""
         conflicts = []
         
         try:
             teacher_id = entry_data.get("teacher_id")
             class_id = entry_data.get("class_id")
-            day_of_week = entry_data["day_of_week"]
-            time_slot_id = entry_data["time_slot_id"]
+            day_of_week = self._day(entry_data)
             
             # Get current time slot details
-            current_slot = await db.time_slots.find_one({"_id": ObjectId(time_slot_id)})
+            current_slot = index.slot(entry_data["time_slot_id"])
             if not current_slot:
                 return conflicts
             
             # Check for maximum consecutive periods for teacher
             if teacher_id:
-                consecutive_conflicts = await self._check_consecutive_periods(
-                    teacher_id, day_of_week, current_slot["period_number"], db, entry_data
-                )
-                conflicts.extend(consecutive_conflicts)
+                conflicts.extend(self._check_consecutive_periods(
+                    teacher_id, day_of_week, current_slot["period_number"], index
+                ))
             
             # Check for lunch break violations
-            lunch_conflicts = await self._check_lunch_break_violations(
-                class_id, day_of_week, current_slot["period_number"], db, entry_data
-            )
-            conflicts.extend(lunch_conflicts)
+            conflicts.extend(self._check_lunch_break_violations(
+                class_id, day_of_week, current_slot["period_number"], index
+            ))
             
             # Check for subject-specific constraints (e.g., labs should not be scheduled back-to-back)
-            subject_conflicts = await self._check_subject_constraints(entry_data, db)
-            conflicts.extend(subject_conflicts)
+            conflicts.extend(self._check_subject_constraints(entry_data, current_slot, index))
         
         except Exception as e:
             logger.error(f"Error checking time constraints: {str(e)}")
         
         return conflicts
     
-    async def _check_consecutive_periods(self, teacher_id: str, day: str, period_num: int, db, entry_data: Dict) -> List[TimetableConflict]:
+    def _check_consecutive_periods(self, teacher_id: str, day: str, period_num: int, index: TimetableOccupancyIndex) -> List[TimetableConflict]:
         """Check if teacher has too many consecutive periods"""
         conflicts = []
         
-        try:
-            # Get all entries for this teacher on this day
-            teacher_entries = await db.timetable_entries.find({
-                "teacher_id": teacher_id,
-                "day_of_week": day,
-                "academic_year": entry_data["academic_year"]
-            }).to_list(None)
-            
-            # Get time slots to determine sequence
-            time_slots = await db.time_slots.find({}).sort("period_number", 1).to_list(None)
-            slot_map = {str(slot["_id"]): slot["period_number"] for slot in time_slots}
-            
-            # Find consecutive periods
-            occupied_periods = set()
-            for entry in teacher_entries:
-                slot_id = entry["time_slot_id"]
-                if slot_id in slot_map:
-                    occupied_periods.add(slot_map[slot_id])
-            
-            occupied_periods.add(period_num)  # Add current period
-            sorted_periods = sorted(occupied_periods)
-            
-            # Check for consecutive sequences longer than 3 periods
-            consecutive_count = 1
-            max_consecutive = 3
-            
-            for i in range(1, len(sorted_periods)):
-                if sorted_periods[i] == sorted_periods[i-1] + 1:
-                    consecutive_count += 1
-                else:
-                    consecutive_count = 1
-                
-                if consecutive_count > max_consecutive:
-                    conflict = TimetableConflict(
-                        conflict_type=ConflictType.TIME_CONSTRAINT,
-                        severity="medium",
-                        description=f"Teacher has {consecutive_count} consecutive periods on {day}, exceeding recommended limit of {max_consecutive}",
-                        affected_entries=[],
-                        suggested_resolution="Add a break period or redistribute classes",
-                        detected_at=datetime.now(),
-                        metadata={
-                            "teacher_id": teacher_id,
-                            "consecutive_count": consecutive_count,
-                            "max_allowed": max_consecutive,
-                            "day": day
-                        }
-                    )
-                    conflicts.append(conflict)
-                    break  # Only report once per sequence
+        sorted_periods = sorted(set(index.occupied_periods("teacher", teacher_id, day)) | {period_num})
         
-        except Exception as e:
-            logger.error(f"Error checking consecutive periods: {str(e)}")
+        # Check for consecutive sequences longer than the limit
+        consecutive_count = 1
+        for i in range(1, len(sorted_periods)):
+            if sorted_periods[i] == sorted_periods[i-1] + 1:
+                consecutive_count += 1
+            else:
+                consecutive_count = 1
+            
+            if consecutive_count > MAX_CONSECUTIVE_PERIODS:
+                conflicts.append(TimetableConflict(
+                    conflict_type=ConflictType.TIME_CONSTRAINT,
+                    severity="medium",
+                    description=f"Teacher has {consecutive_count} consecutive periods on {day}, exceeding recommended limit of {MAX_CONSECUTIVE_PERIODS}",
+                    affected_entries=[],
+                    suggested_resolution="Add a break period or redistribute classes",
+                    detected_at=datetime.now(),
+                    metadata={
+                        "teacher_id": teacher_id,
+                        "consecutive_count": consecutive_count,
+                        "max_allowed": MAX_CONSECUTIVE_PERIODS,
+                        "day": day
+                    }
+                ))
+                break  # Only report once per sequence
         
         return conflicts
     
-    async def _check_lunch_break_violations(self, class_id: str, day: str, period_num: int, db, entry_data: Dict) -> List[TimetableConflict]:
+    def _check_lunch_break_violations(self, class_id: str, day: str, period_num: int, index: TimetableOccupancyIndex) -> List[TimetableConflict]:
         """Check if class has proper lunch break"""
         conflicts = []
         
-        try:
-            # Typically lunch is around period 4-5, check if class has break
-            lunch_periods = [4, 5]  # Configurable based on school policy
-            
-            if period_num in lunch_periods:
-                # Check if this class already has a lunch break scheduled
-                class_entries = await db.timetable_entries.find({
-                    "class_id": class_id,
-                    "day_of_week": day,
-                    "academic_year": entry_data["academic_year"]
-                }).to_list(None)
-                
-                # Get time slots to check for break periods
-                time_slots = await db.time_slots.find({}).to_list(None)
-                slot_map = {str(slot["_id"]): slot for slot in time_slots}
-                
-                has_lunch_break = False
-                for entry in class_entries:
-                    slot = slot_map.get(entry["time_slot_id"])
-                    if slot and slot.get("period_type") == "lunch":
-                        has_lunch_break = True
-                        break
-                
-                if not has_lunch_break:
-                    conflict = TimetableConflict(
-                        conflict_type=ConflictType.TIME_CONSTRAINT,
-                        severity="low",
-                        description=f"Class {class_id} may not have a proper lunch break scheduled on {day}",
-                        affected_entries=[],
-                        suggested_resolution="Ensure a lunch break is scheduled during lunch hours",
-                        detected_at=datetime.now(),
-                        metadata={
-                            "class_id": class_id,
-                            "day": day,
-                            "recommended_action": "schedule_lunch_break"
-                        }
-                    )
-                    conflicts.append(conflict)
+        if period_num not in LUNCH_PERIODS or not class_id:
+            return conflicts
         
-        except Exception as e:
-            logger.error(f"Error checking lunch break: {str(e)}")
+        # Check if this class already has a lunch break scheduled
+        has_lunch_break = any(
+            slot.get("period_type") == "lunch" and not index.is_free("class", class_id, day, slot["_id"])
+            for slot in index.slots
+        )
+        
+        if not has_lunch_break:
+            conflicts.append(TimetableConflict(
+                conflict_type=ConflictType.TIME_CONSTRAINT,
+                severity="low",
+                description=f"Class {class_id} may not have a proper lunch break scheduled on {day}",
+                affected_entries=[],
+                suggested_resolution="Ensure a lunch break is scheduled during lunch hours",
+                detected_at=datetime.now(),
+                metadata={
+                    "class_id": class_id,
+                    "day": day,
+                    "recommended_action": "schedule_lunch_break"
+                }
+            ))
         
         return conflicts
     
-    async def _check_subject_constraints(self, entry_data: Dict[str, Any], db) -> List[TimetableConflict]:
+    def _check_subject_constraints(self, entry_data: Dict[str, Any], current_slot: Dict[str, Any], index: TimetableOccupancyIndex) -> List[TimetableConflict]:
         """Check subject-specific scheduling constraints"""
         conflicts = []
         
-        try:
-            subject_id = entry_data.get("subject_id")
-            if not subject_id:
-                return conflicts
-            
-            # Get subject information
-            subject = await db.subjects.find_one({"_id": ObjectId(subject_id)})
-            if not subject:
-                return conflicts
-            
-            subject_name = subject.get("subject_name", "").lower()
-            
-            # Check for subjects that shouldn't be scheduled back-to-back
-            heavy_subjects = ["mathematics", "physics", "chemistry", "biology"]
-            physical_subjects = ["physical education", "sports", "pe"]
-            
-            if any(heavy in subject_name for heavy in heavy_subjects):
-                # Check if there are other heavy subjects adjacent to this period
-                adjacent_conflicts = await self._check_adjacent_heavy_subjects(entry_data, db)
-                conflicts.extend(adjacent_conflicts)
-            
-            if any(physical in subject_name for physical in physical_subjects):
-                # Physical education should not be last period
-                time_slot = await db.time_slots.find_one({"_id": ObjectId(entry_data["time_slot_id"])})
-                if time_slot:
-                    # Get total periods for the day
-                    all_slots = await db.time_slots.find({}).sort("period_number", -1).limit(1).to_list(1)
-                    if all_slots and time_slot["period_number"] == all_slots[0]["period_number"]:
-                        conflict = TimetableConflict(
-                            conflict_type=ConflictType.TIME_CONSTRAINT,
-                            severity="low",
-                            description=f"Physical Education scheduled as last period may not be ideal for student cleanup",
-                            affected_entries=[],
-                            suggested_resolution="Consider scheduling PE earlier in the day",
-                            detected_at=datetime.now(),
-                            metadata={
-                                "subject": subject_name,
-                                "period": time_slot["period_number"],
-                                "constraint_type": "last_period_pe"
-                            }
-                        )
-                        conflicts.append(conflict)
+        subject_id = entry_data.get("subject_id")
+        subject_name = (index.subject_names.get(str(subject_id)) or "").lower() if subject_id else ""
+        if not subject_name:
+            return conflicts
         
-        except Exception as e:
-            logger.error(f"Error checking subject constraints: {str(e)}")
+        if any(heavy in subject_name for heavy in HEAVY_SUBJECTS):
+            # Check if there are other heavy subjects adjacent to this period
+            conflicts.extend(self._check_adjacent_heavy_subjects(entry_data, current_slot, index))
+        
+        if any(physical in subject_name for physical in PHYSICAL_SUBJECTS):
+            # Physical education should not be last period
+            if current_slot["period_number"] == index.last_period():
+                conflicts.append(TimetableConflict(
+                    conflict_type=ConflictType.TIME_CONSTRAINT,
+                    severity="low",
+                    description=f"Physical Education scheduled as last period may not be ideal for student cleanup",
+                    affected_entries=[],
+                    suggested_resolution="Consider scheduling PE earlier in the day",
+                    detected_at=datetime.now(),
+                    metadata={
+                        "subject": subject_name,
+                        "period": current_slot["period_number"],
+                        "constraint_type": "last_period_pe"
+                    }
+                ))
         
         return conflicts
     
-    async def _check_adjacent_heavy_subjects(self, entry_data: Dict[str, Any], db) -> List[TimetableConflict]:
+    def _check_adjacent_heavy_subjects(self, entry_data: Dict[str, Any], current_slot: Dict[str, Any], index: TimetableOccupancyIndex) -> List[TimetableConflict]:
         """Check for heavy subjects scheduled back-to-back"""
         conflicts = []
         
-        try:
-            current_slot = await db.time_slots.find_one({"_id": ObjectId(entry_data["time_slot_id"])})
-            if not current_slot:
-                return conflicts
-            
-            current_period = current_slot["period_number"]
-            adjacent_periods = [current_period - 1, current_period + 1]
+        current_period = current_slot["period_number"]
+        exclude = str(entry_data["_id"]) if entry_data.get("_id") else None
+        
+        for adj_period in [current_period - 1, current_period + 1]:
+            if adj_period < 1:  # Skip invalid periods
+                continue
             
-            # Check adjacent periods for heavy subjects
-            for adj_period in adjacent_periods:
-                if adj_period < 1:  # Skip invalid periods
+            for adj_id in index.entries_at_period("class", entry_data["class_id"], entry_data["day_of_week"], adj_period):
+                if adj_id == exclude:
                     continue
+                adj_entry = index.entries[adj_id]
+                adj_subject_name = (index.subject_names.get(str(adj_entry.get("subject_id"))) or "").lower()
                 
-                # Find time slot for adjacent period
-                adj_slot = await db.time_slots.find_one({"period_number": adj_period})
-                if not adj_slot:
-                    continue
-                
-                # Find entries scheduled in adjacent period
-                adjacent_entries = await db.timetable_entries.find({
-                    "class_id": entry_data["class_id"],
-                    "day_of_week": entry_data["day_of_week"],
-                    "time_slot_id": str(adj_slot["_id"]),
-                    "academic_year": entry_data["academic_year"]
-                }).to_list(None)
-                
-                for adj_entry in adjacent_entries:
-                    adj_subject = await db.subjects.find_one({"_id": ObjectId(adj_entry["subject_id"])})
-                    if adj_subject:
-                        adj_subject_name = adj_subject.get("subject_name", "").lower()
-                        heavy_subjects = ["mathematics", "physics", "chemistry", "biology"]
-                        
-                        if any(heavy in adj_subject_name for heavy in heavy_subjects):
-                            conflict = TimetableConflict(
-                                conflict_type=ConflictType.TIME_CONSTRAINT,
-                                severity="low",
-                                description=f"Heavy subjects scheduled consecutively may be challenging for students",
-                                affected_entries=[str(adj_entry["_id"])],
-                                suggested_resolution="Consider spacing heavy subjects with lighter subjects or breaks",
-                                detected_at=datetime.now(),
-                                metadata={
-                                    "current_subject": entry_data.get("subject_id"),
-                                    "adjacent_subject": adj_entry["subject_id"],
-                                    "periods": [current_period, adj_period]
-                                }
-                            )
-                            conflicts.append(conflict)
-        
-        except Exception as e:
-            logger.error(f"Error checking adjacent heavy subjects: {str(e)}")
+                if any(heavy in adj_subject_name for heavy in HEAVY_SUBJECTS):
+                    conflicts.append(TimetableConflict(
+                        conflict_type=ConflictType.TIME_CONSTRAINT,
+                        severity="low",
+                        description=f"Heavy subjects scheduled consecutively may be challenging for students",
+                        affected_entries=[adj_id],
+                        suggested_resolution="Consider spacing heavy subjects with lighter subjects or breaks",
+                        detected_at=datetime.now(),
+                        metadata={
+                            "current_subject": entry_data.get("subject_id"),
+                            "adjacent_subject": adj_entry.get("subject_id"),
+                            "periods": [current_period, adj_period]
+                        }
+                    ))
         
         return conflicts
     
-    async def auto_resolve_conflicts(self, entry_data: Dict[str, Any], conflicts: List[TimetableConflict], db) -> Dict[str, Any]:
+    async def auto_resolve_conflicts(
+        self,
+        entry_data: Dict[str, Any],
+        conflicts: List[TimetableConflict],
+        db,
+        index: Optional[TimetableOccupancyIndex] = None
+    ) -> Dict[str, Any]:
         """Attempt to automatically resolve conflicts"""
         resolved_entry = entry_data.copy()
         
@@ -501,7 +455,7 @@ class TimetableConflictDetector:
                     # Attempt simple resolutions
                     if conflict.conflict_type == ConflictType.ROOM_OVERLAP:
                         # Find alternative room
-                        alternative_room = await self._find_alternative_room(entry_data, db)
+                        alternative_room = await self._find_alternative_room(entry_data, db, index)
                         if alternative_room:
                             resolved_entry["room_number"] = alternative_room["room_number"]
                             logger.info(f"Auto-resolved room conflict by assigning room {alternative_room['room_number']}")
@@ -515,7 +469,12 @@ class TimetableConflictDetector:
         
         return resolved_entry
     
-    async def _find_alternative_room(self, entry_data: Dict[str, Any], db) -> Optional[Dict[str, Any]]:
+    async def _find_alternative_room(
+        self,
+        entry_data: Dict[str, Any],
+        db,
+        index: Optional[TimetableOccupancyIndex] = None
+    ) -> Optional[Dict[str, Any]]:
         """Find an alternative room for the same time slot"""
         try:
             # Get available rooms of the same type
@@ -532,6 +491,11 @@ class TimetableConflictDetector:
             
             # Check which rooms are free at this time
             for room in alternative_rooms:
+                if index is not None:
+                    if index.is_free("room", room["room_number"], entry_data["day_of_week"], entry_data["time_slot_id"]):
+                        return room
+                    continue
+                
                 existing_booking = await db.timetable_entries.find_one({
                     "room_number": room["room_number"],
                     "day_of_week": entry_data["day_of_week"],
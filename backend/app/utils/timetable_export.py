@@ -33,7 +33,7 @@ class TimetableExporter:
                 raise ValueError(f"Unsupported view type: {export_request.view_type}")
             
             # Get timetable data
-            timetable_data = await self._get_timetable_data(export_request, db, branch_filter)
+            timetable_data = await self.get_timetable_data(export_request, db, branch_filter)
             
             # Generate export based on format
             if export_request.format == 'json':
@@ -53,7 +53,7 @@ class TimetableExporter:
             logger.error(f"Export failed: {str(e)}")
             raise
     
-    async def _get_timetable_data(self, export_request, db, branch_filter: Optional[str] = None) -> Dict[str, Any]:
+    async def get_timetable_data(self, export_request, db, branch_filter: Optional[str] = None) -> Dict[str, Any]:
         """
         Retrieve timetable data based on export request
         """
@@ -70,6 +70,11 @@ class TimetableExporter:
                 "$lte": datetime.combine(export_request.date_range_end, datetime.max.time())
             }
         
+        # Narrow to the target in the query rather than after loading every entry
+        target_field = {'class': 'class_id', 'teacher': 'teacher_id', 'room': 'room_number'}.get(export_request.view_type)
+        if export_request.target_id and target_field:
+            query[target_field] = export_request.target_id
+        
         # Get basic data
         entries = await db.timetable_entries.find(query).to_list(None)
         time_slots = await db.time_slots.find({}).to_list(None)
@@ -78,15 +83,6 @@ class TimetableExporter:
         subjects = await db.subjects.find({}).to_list(None)
         rooms = await db.rooms.find({}).to_list(None)
         
-        # Apply target-specific filtering
-        if export_request.target_id:
-            if export_request.view_type == 'class':
-                entries = [e for e in entries if e.get('class_id') == export_request.target_id]
-            elif export_request.view_type == 'teacher':
-                entries = [e for e in entries if e.get('teacher_id') == export_request.target_id]
-            elif export_request.view_type == 'room':
-                entries = [e for e in entries if e.get('room_number') == export_request.target_id]
-        
         # Create lookup maps
         time_slot_map = {str(slot['_id']): slot for slot in time_slots}
         class_map = {str(cls['_id']): cls for cls in classes}
@@ -271,56 +267,17 @@ class TimetableExporter:
             temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.ics', delete=False)
             
             # Write iCal header
-            temp_file.write("BEGIN:VCALENDAR\n")
-            temp_file.write("VERSION:2.0\n")
-            temp_file.write("PRODID:-//School Management System//Timetable//EN\n")
-            temp_file.write("CALSCALE:GREGORIAN\n")
+            temp_file.write("BEGIN:VCALENDAR\r\n")
+            temp_file.write("VERSION:2.0\r\n")
+            temp_file.write("PRODID:-//School Management System//Timetable//EN\r\n")
+            temp_file.write("CALSCALE:GREGORIAN\r\n")
             
-            # Write events
+            # Write events one at a time rather than building the calendar in memory
             for entry in timetable_data['entries']:
-                if not export_request.include_breaks and entry.get('period_type') == 'break':
-                    continue
-                
-                # Generate recurring events for each day of the week
-                day_mapping = {
-                    'monday': 'MO', 'tuesday': 'TU', 'wednesday': 'WE',
-                    'thursday': 'TH', 'friday': 'FR', 'saturday': 'SA', 'sunday': 'SU'
-                }
-                
-                day_code = day_mapping.get(entry.get('day_of_week', '').lower())
-                if not day_code:
-                    continue
-                
-                # Create event UID
-                event_uid = f"timetable-{entry.get('_id', 'unknown')}@school.edu"
-                
-                temp_file.write("BEGIN:VEVENT\n")
-                temp_file.write(f"UID:{event_uid}\n")
-                temp_file.write(f"DTSTART;TZID=UTC:{self._format_ical_time(entry.get('start_time'))}\n")
-                temp_file.write(f"DTEND;TZID=UTC:{self._format_ical_time(entry.get('end_time'))}\n")
-                temp_file.write(f"RRULE:FREQ=WEEKLY;BYDAY={day_code}\n")
-                temp_file.write(f"SUMMARY:{entry.get('subject_name', 'Class')}\n")
-                
-                # Description with details
-                description_parts = []
-                if entry.get('teacher_name'):
-                    description_parts.append(f"Teacher: {entry['teacher_name']}")
-                if entry.get('room_number'):
-                    description_parts.append(f"Room: {entry['room_number']}")
-                if entry.get('class_name'):
-                    description_parts.append(f"Class: {entry['class_name']}")
-                if entry.get('notes'):
-                    description_parts.append(f"Notes: {entry['notes']}")
-                
-                if description_parts:
-                    temp_file.write(f"DESCRIPTION:{' | '.join(description_parts)}\n")
-                
-                if entry.get('room_number'):
-                    temp_file.write(f"LOCATION:Room {entry['room_number']}\n")
-                
-                temp_file.write("END:VEVENT\n")
+                for line in self.ical_event_lines(entry, export_request.include_breaks):
+                    temp_file.write(f"{line}\r\n")
             
-            temp_file.write("END:VCALENDAR\n")
+            temp_file.write("END:VCALENDAR\r\n")
             temp_file.close()
             
             filename = f"timetable_{export_request.view_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ics"
@@ -336,6 +293,53 @@ class TimetableExporter:
             logger.error(f"iCal export failed: {str(e)}")
             raise
     
+    def ical_event_lines(self, entry: Dict[str, Any], include_breaks: bool = True) -> List[str]:
+        """VEVENT lines for a weekly recurring timetable entry; empty for skipped entries"""
+        if not include_breaks and entry.get('period_type') == 'break':
+            return []
+        
+        # Generate recurring events for each day of the week
+        day_mapping = {
+            'monday': 'MO', 'tuesday': 'TU', 'wednesday': 'WE',
+            'thursday': 'TH', 'friday': 'FR', 'saturday': 'SA', 'sunday': 'SU'
+        }
+        
+        day_code = day_mapping.get(entry.get('day_of_week', '').lower())
+        if not day_code:
+            return []
+        
+        # Create event UID
+        event_uid = f"timetable-{entry.get('_id', 'unknown')}@school.edu"
+        
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{event_uid}",
+            f"DTSTART;TZID=UTC:{self._format_ical_time(entry.get('start_time'))}",
+            f"DTEND;TZID=UTC:{self._format_ical_time(entry.get('end_time'))}",
+            f"RRULE:FREQ=WEEKLY;BYDAY={day_code}",
+            f"SUMMARY:{entry.get('subject_name', 'Class')}"
+        ]
+        
+        # Description with details
+        description_parts = []
+        if entry.get('teacher_name'):
+            description_parts.append(f"Teacher: {entry['teacher_name']}")
+        if entry.get('room_number'):
+            description_parts.append(f"Room: {entry['room_number']}")
+        if entry.get('class_name'):
+            description_parts.append(f"Class: {entry['class_name']}")
+        if entry.get('notes'):
+            description_parts.append(f"Notes: {entry['notes']}")
+        
+        if description_parts:
+            lines.append(f"DESCRIPTION:{' | '.join(description_parts)}")
+        
+        if entry.get('room_number'):
+            lines.append(f"LOCATION:Room {entry['room_number']}")
+        
+        lines.append("END:VEVENT")
+        return lines
+    
     async def _export_pdf(self, timetable_data: Dict[str, Any], export_request) -> Dict[str, Any]:
         """Export timetable as PDF"""
         try:
@@ -0,0 +1,237 @@
+"""
+Timetable occupancy index
+In-memory bitsets of who and what is booked per day and time slot for one branch and academic year
+"""
+import logging
+import time
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from bson import ObjectId
+
+from ..models.timetable import DayOfWeek
+
+logger = logging.getLogger(__name__)
+
+DAYS = [day.value for day in DayOfWeek]
+DAY_COUNT = len(DAYS)
+
+# Occupancy dimensions; a "resource" is any item in resources_needed
+OCCUPANCY_KINDS = ("teacher", "room", "class", "resource")
+
+ENTRY_FIELDS = {
+    "class_id": 1, "subject_id": 1, "teacher_id": 1, "room_number": 1,
+    "day_of_week": 1, "time_slot_id": 1, "resources_needed": 1
+}
+
+
+def _day_value(day) -> str:
+    return getattr(day, "value", day)
+
+
+def _object_ids(ids: Iterable[str]) -> List[Any]:
+    return [ObjectId(i) if ObjectId.is_valid(i) else i for i in ids]
+
+
+def entry_keys(entry: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """The (kind, key) pairs an entry occupies"""
+    keys = []
+    if entry.get("teacher_id"):
+        keys.append(("teacher", str(entry["teacher_id"])))
+    if entry.get("room_number"):
+        keys.append(("room", str(entry["room_number"])))
+    if entry.get("class_id"):
+        keys.append(("class", str(entry["class_id"])))
+    for resource in entry.get("resources_needed") or []:
+        keys.append(("resource", str(resource)))
+    return keys
+
+
+class TimetableOccupancyIndex:
+    """
+    Occupancy of teachers, rooms, classes and shared resources for one (branch, academic year).
+
+    Each tracked key owns an integer bitset with one bit per (time slot, day) cell, so
+    "is this teacher free on Tuesday period 3" is a shift and a mask. The entry ids behind
+    a set bit are kept alongside for conflict reports. Slot columns are appended as new
+    time slots are seen, which keeps existing cell numbers stable.
+    """
+
+    def __init__(self, branch_id: Optional[str], academic_year: str, time_slots: List[Dict[str, Any]] = None):
+        self.branch_id = branch_id
+        self.academic_year = academic_year
+        self.slot_columns: Dict[str, int] = {}
+        self.slots: List[Dict[str, Any]] = []
+        self.masks: Dict[str, Dict[str, int]] = {kind: {} for kind in OCCUPANCY_KINDS}
+        self.owners: Dict[Tuple[str, str, int], List[str]] = {}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.teacher_names: Dict[str, str] = {}
+        self.class_names: Dict[str, str] = {}
+        self.subject_names: Dict[str, str] = {}
+        self.loaded_at = time.monotonic()
+        for slot in time_slots or []:
+            self.add_time_slot(slot)
+
+    @classmethod
+    async def load(cls, db, branch_id: Optional[str], academic_year: str) -> "TimetableOccupancyIndex":
+        """Build the index with one query per collection"""
+        scope = {"academic_year": academic_year}
+        if branch_id:
+            scope["branch_id"] = branch_id
+
+        time_slots = await db.time_slots.find(scope).sort("period_number", 1).to_list(None)
+        if not time_slots:
+            # Older data keeps time slots without branch scoping
+            time_slots = await db.time_slots.find({}).sort("period_number", 1).to_list(None)
+
+        index = cls(branch_id, academic_year, time_slots)
+        entries = await db.timetable_entries.find(scope, ENTRY_FIELDS).to_list(None)
+        for entry in entries:
+            index.add(str(entry["_id"]), entry)
+        await index.ensure_reference_data(db, entries)
+        logger.info(
+            f"Loaded timetable occupancy index for branch {branch_id} / {academic_year}: "
+            f"{len(entries)} entries, {len(index.slots)} time slots"
+        )
+        return index
+
+    async def ensure_reference_data(self, db, entries: List[Dict[str, Any]]):
+        """Fetch time slots and display names the index has not seen yet, batched per collection"""
+        missing_slots = {
+            str(e["time_slot_id"]) for e in entries
+            if e.get("time_slot_id") and str(e["time_slot_id"]) not in self.slot_columns
+        }
+        if missing_slots:
+            async for slot in db.time_slots.find({"_id": {"$in": _object_ids(missing_slots)}}):
+                self.add_time_slot(slot)
+
+        lookups = [
+            ("teacher_id", self.teacher_names, "teachers",
+             lambda d: f"{d.get('first_name', '')} {d.get('last_name', '')}".strip()),
+            ("class_id", self.class_names, "classes", lambda d: d.get("class_name", "Unknown Class")),
+            ("subject_id", self.subject_names, "subjects", lambda d: d.get("subject_name", ""))
+        ]
+        for field, names, collection, display in lookups:
+            missing = {str(e[field]) for e in entries if e.get(field) and str(e[field]) not in names}
+            if not missing:
+                continue
+            async for doc in db[collection].find({"_id": {"$in": _object_ids(missing)}}):
+                names[str(doc["_id"])] = display(doc)
+            for key in missing:
+                # Remember misses so unknown ids are not looked up again
+                names.setdefault(key, None)
+
+    def add_time_slot(self, slot: Dict[str, Any]) -> int:
+        slot_id = str(slot["_id"])
+        column = self.slot_columns.get(slot_id)
+        if column is None:
+            column = len(self.slots)
+            self.slot_columns[slot_id] = column
+            self.slots.append(slot)
+        return column
+
+    def slot(self, slot_id) -> Optional[Dict[str, Any]]:
+        column = self.slot_columns.get(str(slot_id))
+        return self.slots[column] if column is not None else None
+
+    def cell(self, day, slot_id) -> Optional[int]:
+        column = self.slot_columns.get(str(slot_id))
+        day = _day_value(day)
+        if column is None or day not in DAYS:
+            return None
+        return column * DAY_COUNT + DAYS.index(day)
+
+    def add(self, entry_id: str, entry: Dict[str, Any]):
+        """Record an entry; re-adding an id replaces its previous placement"""
+        if entry_id in self.entries:
+            self.remove(entry_id)
+        compact = {field: entry.get(field) for field in ENTRY_FIELDS}
+        compact["day_of_week"] = _day_value(compact["day_of_week"])
+        self.entries[entry_id] = compact
+        cell = self.cell(compact["day_of_week"], compact["time_slot_id"])
+        if cell is None:
+            return
+        bit = 1 << cell
+        for kind, key in entry_keys(compact):
+            self.masks[kind][key] = self.masks[kind].get(key, 0) | bit
+            self.owners.setdefault((kind, key, cell), []).append(entry_id)
+
+    def remove(self, entry_id: str):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        cell = self.cell(entry["day_of_week"], entry["time_slot_id"])
+        if cell is None:
+            return
+        for kind, key in entry_keys(entry):
+            owners = self.owners.get((kind, key, cell), [])
+            if entry_id in owners:
+                owners.remove(entry_id)
+            if not owners:
+                self.owners.pop((kind, key, cell), None)
+                mask = self.masks[kind].get(key, 0) & ~(1 << cell)
+                if mask:
+                    self.masks[kind][key] = mask
+                else:
+                    self.masks[kind].pop(key, None)
+
+    def rekey(self, old_id: str, new_id: str):
+        """Swap a provisional id for the stored document id"""
+        entry = self.entries.get(old_id)
+        if entry is not None:
+            self.remove(old_id)
+            self.add(new_id, entry)
+
+    def is_free(self, kind: str, key: str, day, slot_id) -> bool:
+        cell = self.cell(day, slot_id)
+        return cell is None or not (self.masks[kind].get(str(key), 0) >> cell) & 1
+
+    def occupants(self, kind: str, key: str, day, slot_id, exclude: Optional[str] = None) -> List[str]:
+        """Entry ids holding `key` in a cell"""
+        cell = self.cell(day, slot_id)
+        if cell is None or not (self.masks[kind].get(str(key), 0) >> cell) & 1:
+            return []
+        return [i for i in self.owners.get((kind, str(key), cell), []) if i != exclude]
+
+    def occupied_periods(self, kind: str, key: str, day) -> List[int]:
+        """Period numbers in which `key` is booked on a day"""
+        mask = self.masks[kind].get(str(key), 0)
+        day = _day_value(day)
+        if not mask or day not in DAYS:
+            return []
+        offset = DAYS.index(day)
+        return sorted({
+            slot["period_number"] for column, slot in enumerate(self.slots)
+            if (mask >> (column * DAY_COUNT + offset)) & 1 and slot.get("period_number") is not None
+        })
+
+    def entries_at_period(self, kind: str, key: str, day, period_number: int) -> List[str]:
+        """Entry ids for `key` in every slot with the given period number on a day"""
+        found = []
+        for slot in self.slots:
+            if slot.get("period_number") == period_number:
+                found.extend(self.occupants(kind, key, day, slot["_id"]))
+        return found
+
+    def last_period(self) -> Optional[int]:
+        periods = [slot["period_number"] for slot in self.slots if slot.get("period_number") is not None]
+        return max(periods) if periods else None
+
+    def clashes(self) -> Iterable[Tuple[str, str, int, List[str]]]:
+        """Every cell held by more than one entry, as (kind, key, cell, entry ids)"""
+        for (kind, key, cell), owners in self.owners.items():
+            if len(owners) > 1:
+                yield kind, key, cell, owners
+
+    def describe_cell(self, cell: int) -> Tuple[str, Dict[str, Any]]:
+        column, day_index = divmod(cell, DAY_COUNT)
+        return DAYS[day_index], self.slots[column]
+
+    def is_stale(self, ttl_seconds: float) -> bool:
+        return time.monotonic() - self.loaded_at > ttl_seconds
+
+
+# Export components
+__all__ = [
+    'TimetableOccupancyIndex',
+    'OCCUPANCY_KINDS',
+    'entry_keys'
+]
@@ -0,0 +1,636 @@
+"""
+Timetable generation engine
+Greedy construction plus tabu local search over flat occupancy arrays, with warm starts for re-solves
+"""
+import asyncio
+import logging
+import multiprocessing
+import random
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Hard violations dominate every soft preference
+HARD_WEIGHT = 1000
+SPREAD_WEIGHT = 10      # A subject more often than allowed on one day
+CONSECUTIVE_WEIGHT = 5  # Each period past a teacher's consecutive limit
+STABILITY_WEIGHT = 3    # Moving a lesson away from where it was before a re-solve
+
+NON_TEACHING_PERIOD_TYPES = {"break", "lunch", "assembly"}
+UNLIMITED = 0xFFFF
+# Timetables solved at once; more requests queue for a free worker
+SOLVER_WORKERS = 2
+
+
+@dataclass
+class Lesson:
+    """One weekly period of a subject for a class"""
+    class_id: str
+    subject_id: str
+    teacher_id: Optional[str]
+    room_type: str = "classroom"
+
+
+@dataclass
+class TimetableProblem:
+    """
+    Everything the solver needs, already resolved to plain values.
+    `fixed_teacher_cells` / `fixed_room_cells` / `fixed_class_cells` mark (day index, slot index)
+    cells that entries outside this problem already occupy.
+    """
+    lessons: List[Lesson]
+    days: List[str]
+    slots: List[Dict[str, Any]]
+    rooms: List[Dict[str, Any]] = field(default_factory=list)
+    fixed_teacher_cells: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict)
+    fixed_room_cells: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict)
+    fixed_class_cells: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict)
+    preferred: Dict[int, Tuple[int, int, Optional[str]]] = field(default_factory=dict)
+    max_consecutive_periods: int = 3
+    max_periods_per_subject_per_day: int = 2
+
+
+@dataclass
+class TimetableSolution:
+    placements: List[Optional[Dict[str, Any]]]
+    unplaced: List[int]
+    hard_violations: int
+    soft_penalty: int
+    iterations: int
+    elapsed_seconds: float
+    moved_lessons: int
+    warnings: List[str]
+
+
+def teaching_slots(time_slots: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Time slots lessons can go in, ordered by period"""
+    slots = [
+        slot for slot in time_slots
+        if not slot.get("is_break") and slot.get("period_type", "regular") not in NON_TEACHING_PERIOD_TYPES
+    ]
+    return sorted(slots, key=lambda slot: slot.get("period_number", 0))
+
+
+class TimetableSolver:
+    """
+    State is a handful of flat arrays: per (teacher, cell), (class, cell) and (room type, cell)
+    load counters plus one cell per lesson. Cost changes are computed incrementally from the
+    counters, so evaluating a move touches a few array slots instead of the whole timetable.
+    """
+
+    def __init__(self, problem: TimetableProblem, seed: int = 0):
+        self.problem = problem
+        self.rng = random.Random(seed)
+        self.day_count = len(problem.days)
+        self.period_count = len(problem.slots)
+        self.cell_count = self.day_count * self.period_count
+        self.warnings: List[str] = []
+
+        lessons = problem.lessons
+        self.teachers = sorted({l.teacher_id for l in lessons if l.teacher_id} | set(problem.fixed_teacher_cells))
+        self.classes = sorted({l.class_id for l in lessons})
+        teacher_index = {t: i for i, t in enumerate(self.teachers)}
+        class_index = {c: i for i, c in enumerate(self.classes)}
+
+        # Room types are pooled; concrete rooms are handed out once the cells are settled
+        self.rooms_by_type: Dict[str, List[str]] = {}
+        for room in problem.rooms:
+            self.rooms_by_type.setdefault(room.get("room_type", "classroom"), []).append(str(room["room_number"]))
+        self.room_types = sorted({l.room_type for l in lessons})
+        room_type_index = {r: i for i, r in enumerate(self.room_types)}
+        self.capacity = [len(self.rooms_by_type.get(r, [])) or UNLIMITED for r in self.room_types]
+        for room_type in self.room_types:
+            if problem.rooms and room_type not in self.rooms_by_type:
+                self.warnings.append(f"No rooms of type '{room_type}'; lessons needing it get no room")
+
+        pairs: Dict[Tuple[str, str], int] = {}
+        self.lesson_teacher = array("i", [teacher_index[l.teacher_id] if l.teacher_id else -1 for l in lessons])
+        self.lesson_class = array("i", [class_index[l.class_id] for l in lessons])
+        self.lesson_room_type = array("i", [room_type_index[l.room_type] for l in lessons])
+        self.lesson_pair = array("i", [pairs.setdefault((l.class_id, l.subject_id), len(pairs)) for l in lessons])
+        self.preferred = array("i", [-1] * len(lessons))
+        for position, (day, period, _) in problem.preferred.items():
+            self.preferred[position] = day * self.period_count + period
+
+        cells = self.cell_count
+        self.teacher_load = array("H", [0] * (len(self.teachers) * cells))
+        self.class_load = array("H", [0] * (len(self.classes) * cells))
+        self.room_load = array("H", [0] * (len(self.room_types) * cells))
+        self.pair_day = array("H", [0] * (len(pairs) * max(self.day_count, 1)))
+        self.cell = array("i", [-1] * len(lessons))
+        # Lessons per (class, cell) for swap moves
+        self.class_cell_lessons: Dict[int, List[int]] = {}
+
+        # Teacher-day occupancy bitmasks; penalties come from a lookup table for normal day lengths
+        self.teacher_day_mask = [0] * (len(self.teachers) * self.day_count)
+        self.penalty_table = (
+            [self._run_penalty(mask) for mask in range(1 << self.period_count)]
+            if self.period_count <= 12 else None
+        )
+        for teacher_id, fixed in problem.fixed_teacher_cells.items():
+            base = teacher_index[teacher_id] * cells
+            for day, period in fixed:
+                self.teacher_load[base + day * self.period_count + period] += 1
+                self.teacher_day_mask[teacher_index[teacher_id] * self.day_count + day] |= 1 << period
+        for class_id, fixed in problem.fixed_class_cells.items():
+            if class_id in class_index:
+                base = class_index[class_id] * cells
+                for day, period in fixed:
+                    self.class_load[base + day * self.period_count + period] += 1
+        self.fixed_room_cells = {
+            room: {day * self.period_count + period for day, period in fixed}
+            for room, fixed in problem.fixed_room_cells.items()
+        }
+        for room_type, index in room_type_index.items():
+            for room in self.rooms_by_type.get(room_type, []):
+                for cell in self.fixed_room_cells.get(room, ()):
+                    self.room_load[index * cells + cell] += 1
+
+        self.hard = 0
+        self.soft = 0
+        self._check_feasibility()
+
+    def _check_feasibility(self):
+        per_class = [0] * len(self.classes)
+        per_teacher = [0] * len(self.teachers)
+        for position in range(len(self.problem.lessons)):
+            per_class[self.lesson_class[position]] += 1
+            if self.lesson_teacher[position] >= 0:
+                per_teacher[self.lesson_teacher[position]] += 1
+        for index, load in enumerate(per_class):
+            base = index * self.cell_count
+            free = sum(1 for cell in range(self.cell_count) if self.class_load[base + cell] == 0)
+            if load > free:
+                self.warnings.append(
+                    f"Class {self.classes[index]} needs {load} periods but the week has {free} free"
+                )
+        for index, load in enumerate(per_teacher):
+            base = index * self.cell_count
+            free = sum(1 for cell in range(self.cell_count) if self.teacher_load[base + cell] == 0)
+            if load > free:
+                self.warnings.append(
+                    f"Teacher {self.teachers[index]} is assigned {load} periods but has {free} free"
+                )
+
+    # Incremental state changes; each returns (hard delta, soft delta)
+
+    def _run_penalty(self, mask: int) -> int:
+        """Periods past the consecutive limit in one teacher-day, from its occupancy bitmask"""
+        limit = self.problem.max_consecutive_periods
+        penalty = run = 0
+        for period in range(self.period_count):
+            if (mask >> period) & 1:
+                run += 1
+                if run > limit:
+                    penalty += 1
+            else:
+                run = 0
+        return penalty
+
+    def _set_busy(self, teacher: int, day: int, period: int, busy: bool) -> int:
+        """Flip a teacher's occupancy bit and return the consecutive-period penalty change"""
+        slot = teacher * self.day_count + day
+        mask = self.teacher_day_mask[slot]
+        updated = mask | (1 << period) if busy else mask & ~(1 << period)
+        self.teacher_day_mask[slot] = updated
+        if self.penalty_table is not None:
+            return self.penalty_table[updated] - self.penalty_table[mask]
+        return self._run_penalty(updated) - self._run_penalty(mask)
+
+    def _remove(self, lesson: int) -> Tuple[int, int]:
+        cell = self.cell[lesson]
+        hard = soft = 0
+        day = cell // self.period_count
+        teacher = self.lesson_teacher[lesson]
+        if teacher >= 0:
+            slot = teacher * self.cell_count + cell
+            if self.teacher_load[slot] > 1:
+                hard -= 1
+            self.teacher_load[slot] -= 1
+            if self.teacher_load[slot] == 0:
+                soft += CONSECUTIVE_WEIGHT * self._set_busy(teacher, day, cell - day * self.period_count, False)
+        klass = self.lesson_class[lesson]
+        slot = klass * self.cell_count + cell
+        if self.class_load[slot] > 1:
+            hard -= 1
+        self.class_load[slot] -= 1
+        self.class_cell_lessons[slot].remove(lesson)
+        room_type = self.lesson_room_type[lesson]
+        slot = room_type * self.cell_count + cell
+        if self.room_load[slot] > self.capacity[room_type]:
+            hard -= 1
+        self.room_load[slot] -= 1
+        slot = self.lesson_pair[lesson] * self.day_count + day
+        if self.pair_day[slot] > self.problem.max_periods_per_subject_per_day:
+            soft -= SPREAD_WEIGHT
+        self.pair_day[slot] -= 1
+        if self.preferred[lesson] >= 0 and self.preferred[lesson] != cell:
+            soft -= STABILITY_WEIGHT
+        self.cell[lesson] = -1
+        self.hard += hard
+        self.soft += soft
+        return hard, soft
+
+    def _place(self, lesson: int, cell: int) -> Tuple[int, int]:
+        hard = soft = 0
+        day = cell // self.period_count
+        teacher = self.lesson_teacher[lesson]
+        if teacher >= 0:
+            slot = teacher * self.cell_count + cell
+            if self.teacher_load[slot] >= 1:
+                hard += 1
+            else:
+                soft += CONSECUTIVE_WEIGHT * self._set_busy(teacher, day, cell - day * self.period_count, True)
+            self.teacher_load[slot] += 1
+        klass = self.lesson_class[lesson]
+        slot = klass * self.cell_count + cell
+        if self.class_load[slot] >= 1:
+            hard += 1
+        self.class_load[slot] += 1
+        self.class_cell_lessons.setdefault(slot, []).append(lesson)
+        room_type = self.lesson_room_type[lesson]
+        slot = room_type * self.cell_count + cell
+        if self.room_load[slot] >= self.capacity[room_type]:
+            hard += 1
+        self.room_load[slot] += 1
+        slot = self.lesson_pair[lesson] * self.day_count + day
+        if self.pair_day[slot] >= self.problem.max_periods_per_subject_per_day:
+            soft += SPREAD_WEIGHT
+        self.pair_day[slot] += 1
+        if self.preferred[lesson] >= 0 and self.preferred[lesson] != cell:
+            soft += STABILITY_WEIGHT
+        self.cell[lesson] = cell
+        self.hard += hard
+        self.soft += soft
+        return hard, soft
+
+    def _conflicted(self, lesson: int) -> bool:
+        cell = self.cell[lesson]
+        teacher = self.lesson_teacher[lesson]
+        room_type = self.lesson_room_type[lesson]
+        return (
+            (teacher >= 0 and self.teacher_load[teacher * self.cell_count + cell] > 1)
+            or self.class_load[self.lesson_class[lesson] * self.cell_count + cell] > 1
+            or self.room_load[room_type * self.cell_count + cell] > self.capacity[room_type]
+        )
+
+    def _penalized(self, lesson: int) -> bool:
+        """Whether a lesson contributes to the soft penalty where it sits"""
+        cell = self.cell[lesson]
+        day, period = divmod(cell, self.period_count)
+        if self.preferred[lesson] >= 0 and self.preferred[lesson] != cell:
+            return True
+        if self.pair_day[self.lesson_pair[lesson] * self.day_count + day] > self.problem.max_periods_per_subject_per_day:
+            return True
+        teacher = self.lesson_teacher[lesson]
+        if teacher >= 0:
+            mask = self.teacher_day_mask[teacher * self.day_count + day]
+            penalty = self.penalty_table[mask] if self.penalty_table is not None else self._run_penalty(mask)
+            return penalty > 0
+        return False
+
+    def _placement_cost(self, lesson: int, cell: int) -> int:
+        """Cheap cost of adding a lesson to a cell, used while constructing"""
+        cost = 0
+        teacher = self.lesson_teacher[lesson]
+        if teacher >= 0 and self.teacher_load[teacher * self.cell_count + cell]:
+            cost += HARD_WEIGHT
+        if self.class_load[self.lesson_class[lesson] * self.cell_count + cell]:
+            cost += HARD_WEIGHT
+        room_type = self.lesson_room_type[lesson]
+        if self.room_load[room_type * self.cell_count + cell] >= self.capacity[room_type]:
+            cost += HARD_WEIGHT
+        day = cell // self.period_count
+        if self.pair_day[self.lesson_pair[lesson] * self.day_count + day] >= self.problem.max_periods_per_subject_per_day:
+            cost += SPREAD_WEIGHT
+        return cost
+
+    # Search
+
+    def construct(self):
+        """Warm-started lessons keep their cell; the rest go in most-constrained-first order"""
+        pending = []
+        for lesson in range(len(self.problem.lessons)):
+            if self.preferred[lesson] >= 0:
+                self._place(lesson, self.preferred[lesson])
+            else:
+                pending.append(lesson)
+
+        teacher_load = {}
+        for lesson in pending:
+            teacher_load[self.lesson_teacher[lesson]] = teacher_load.get(self.lesson_teacher[lesson], 0) + 1
+        pending.sort(key=lambda l: (-teacher_load[self.lesson_teacher[l]], self.lesson_class[l], self.rng.random()))
+
+        cells = list(range(self.cell_count))
+        for lesson in pending:
+            self.rng.shuffle(cells)
+            best = min(cells, key=lambda cell: self._placement_cost(lesson, cell))
+            self._place(lesson, best)
+
+    def _evaluate(self, lesson: int, target: int) -> Tuple[int, Optional[int]]:
+        """
+        Total cost change of the best way to put `lesson` in `target`: a plain move, or a
+        swap with a lesson of the same class already there. Returns (delta, swapped lesson).
+        """
+        origin = self.cell[lesson]
+        h1, s1 = self._remove(lesson)
+        h2, s2 = self._place(lesson, target)
+        best = (h1 + h2) * HARD_WEIGHT + s1 + s2, None
+        self._remove(lesson)
+        self._place(lesson, origin)
+
+        occupants = self.class_cell_lessons.get(self.lesson_class[lesson] * self.cell_count + target) or []
+        for other in occupants[:1]:
+            h1, s1 = self._remove(lesson)
+            h2, s2 = self._remove(other)
+            h3, s3 = self._place(lesson, target)
+            h4, s4 = self._place(other, origin)
+            delta = (h1 + h2 + h3 + h4) * HARD_WEIGHT + s1 + s2 + s3 + s4
+            self._remove(other)
+            self._remove(lesson)
+            self._place(other, target)
+            self._place(lesson, origin)
+            if delta < best[0]:
+                best = delta, other
+        return best
+
+    def search(self, deadline: float, max_stall: int = 1000) -> int:
+        """Tabu search from the current state; leaves the best state found in place"""
+        lesson_count = len(self.problem.lessons)
+        if not lesson_count:
+            return 0
+        tabu: Dict[Tuple[int, int], int] = {}
+        best_cost = self.hard * HARD_WEIGHT + self.soft
+        best_cells = array("i", self.cell)
+        iterations = stall = 0
+        conflicted: List[int] = []
+        penalized: List[int] = []
+
+        while time.monotonic() < deadline and stall < max_stall:
+            iterations += 1
+            if self.hard > 0:
+                conflicted = [l for l in conflicted if self._conflicted(l)]
+                if not conflicted:
+                    conflicted = [l for l in range(lesson_count) if self._conflicted(l)]
+                lesson = self.rng.choice(conflicted)
+            else:
+                if self.soft <= 0:
+                    break
+                # Work on lessons that carry penalty; refresh the candidates now and then
+                if not penalized or iterations % 50 == 0:
+                    penalized = [l for l in range(lesson_count) if self._penalized(l)]
+                lesson = self.rng.choice(penalized) if penalized else self.rng.randrange(lesson_count)
+
+            origin = self.cell[lesson]
+            current = self.hard * HARD_WEIGHT + self.soft
+            choice = None
+            for target in range(self.cell_count):
+                if target == origin:
+                    continue
+                delta, other = self._evaluate(lesson, target)
+                is_tabu = tabu.get((lesson, target), 0) > iterations or (
+                    other is not None and tabu.get((other, origin), 0) > iterations
+                )
+                # Aspiration: a tabu move is fine if it beats the best state seen
+                if is_tabu and current + delta >= best_cost:
+                    continue
+                if choice is None or delta < choice[0] or (delta == choice[0] and self.rng.random() < 0.3):
+                    choice = (delta, target, other)
+            if choice is None:
+                stall += 1
+                continue
+
+            _, target, other = choice
+            tenure = 7 + self.rng.randrange(6)
+            tabu[(lesson, origin)] = iterations + tenure
+            self._remove(lesson)
+            if other is not None:
+                tabu[(other, target)] = iterations + tenure
+                self._remove(other)
+                self._place(other, origin)
+            self._place(lesson, target)
+
+            cost = self.hard * HARD_WEIGHT + self.soft
+            if cost < best_cost:
+                best_cost = cost
+                best_cells = array("i", self.cell)
+                stall = 0
+            else:
+                stall += 1
+
+        if best_cost < self.hard * HARD_WEIGHT + self.soft:
+            self.load_cells(best_cells)
+        return iterations
+
+    def load_cells(self, cells):
+        for lesson in range(len(self.problem.lessons)):
+            if self.cell[lesson] >= 0:
+                self._remove(lesson)
+        for lesson, cell in enumerate(cells):
+            self._place(lesson, cell)
+
+    # Output
+
+    def _assign_rooms(self) -> List[Optional[str]]:
+        """Give each lesson a concrete room of its type, preferring its previous room, then the class's usual one"""
+        rooms: List[Optional[str]] = [None] * len(self.problem.lessons)
+        by_cell: Dict[int, List[int]] = {}
+        for lesson, cell in enumerate(self.cell):
+            by_cell.setdefault(cell, []).append(lesson)
+
+        for cell, lessons in by_cell.items():
+            taken = {room for room, cells in self.fixed_room_cells.items() if cell in cells}
+            for lesson in sorted(lessons, key=lambda l: self.preferred[l] != cell):
+                room_type = self.room_types[self.lesson_room_type[lesson]]
+                candidates = self.rooms_by_type.get(room_type, [])
+                if not candidates:
+                    continue
+                previous = self.problem.preferred.get(lesson, (None, None, None))[2]
+                home = candidates[self.lesson_class[lesson] % len(candidates)]
+                for room in [previous, home] + candidates:
+                    if room and room in candidates and room not in taken:
+                        rooms[lesson] = room
+                        taken.add(room)
+                        break
+        return rooms
+
+    def solution(self, iterations: int, started: float) -> TimetableSolution:
+        rooms = self._assign_rooms()
+        placements: List[Optional[Dict[str, Any]]] = []
+        unplaced = []
+        for lesson, cell in enumerate(self.cell):
+            # Hand back only a conflict-free timetable; leftovers are reported
+            if cell < 0 or self._conflicted(lesson):
+                placements.append(None)
+                unplaced.append(lesson)
+                continue
+            day, period = divmod(cell, self.period_count)
+            placements.append({
+                "day_of_week": self.problem.days[day],
+                "time_slot_id": str(self.problem.slots[period]["_id"]),
+                "room_number": rooms[lesson]
+            })
+        moved = sum(
+            1 for lesson, cell in enumerate(self.cell)
+            if self.preferred[lesson] >= 0 and self.preferred[lesson] != cell
+        )
+        return TimetableSolution(
+            placements=placements,
+            unplaced=unplaced,
+            hard_violations=self.hard,
+            soft_penalty=self.soft,
+            iterations=iterations,
+            elapsed_seconds=round(time.monotonic() - started, 3),
+            moved_lessons=moved,
+            warnings=self.warnings
+        )
+
+
+def build_timetable_problem(
+    classes: List[Dict[str, Any]],
+    index,
+    rooms: List[Dict[str, Any]],
+    days: List[str],
+    subject_periods: Dict[str, int],
+    class_subject_periods: Optional[Dict[str, Dict[str, int]]] = None,
+    subject_room_types: Optional[Dict[str, str]] = None,
+    keep_existing: bool = True,
+    max_consecutive_periods: int = 3,
+    max_periods_per_subject_per_day: int = 2
+) -> TimetableProblem:
+    """
+    Turn class documents and a TimetableOccupancyIndex into a solver problem.
+    Teachers come from each class's `subject_teachers`, falling back to the class teacher.
+    Entries of classes outside `classes`, and of subjects a solved class is not being
+    scheduled for, stay where they are and block their class, teachers and rooms; with
+    `keep_existing` the solved lessons' current entries seed a warm start.
+    """
+    class_subject_periods = class_subject_periods or {}
+    subject_room_types = subject_room_types or {}
+    slots = teaching_slots(index.slots)
+    slot_positions = {str(slot["_id"]): position for position, slot in enumerate(slots)}
+    day_positions = {day: position for position, day in enumerate(days)}
+    class_ids = {str(c["_id"]) for c in classes}
+
+    lessons: List[Lesson] = []
+    for klass in classes:
+        class_id = str(klass["_id"])
+        teachers = {
+            str(pair["subject_id"]): str(pair["teacher_id"])
+            for pair in klass.get("subject_teachers") or []
+            if pair.get("subject_id") and pair.get("teacher_id")
+        }
+        requirements = class_subject_periods.get(class_id)
+        if requirements is None:
+            requirements = {
+                subject: periods for subject, periods in subject_periods.items()
+                if not teachers or subject in teachers
+            }
+        for subject_id, periods in requirements.items():
+            teacher_id = teachers.get(subject_id) or klass.get("teacher_id")
+            room_type = subject_room_types.get(subject_id, "classroom")
+            lessons.extend(
+                Lesson(class_id, subject_id, str(teacher_id) if teacher_id else None, room_type)
+                for _ in range(periods)
+            )
+
+    fixed_teacher_cells: Dict[str, List[Tuple[int, int]]] = {}
+    fixed_room_cells: Dict[str, List[Tuple[int, int]]] = {}
+    fixed_class_cells: Dict[str, List[Tuple[int, int]]] = {}
+    existing: Dict[Tuple[str, str], List[Tuple[int, int, Optional[str]]]] = {}
+    scheduled = {(lesson.class_id, lesson.subject_id) for lesson in lessons}
+    for entry in index.entries.values():
+        position = slot_positions.get(str(entry.get("time_slot_id")))
+        day = day_positions.get(entry.get("day_of_week"))
+        if position is None or day is None:
+            continue
+        pair = (str(entry.get("class_id")), str(entry.get("subject_id")))
+        if pair in scheduled:
+            existing.setdefault(pair, []).append((day, position, entry.get("room_number")))
+            continue
+        if pair[0] in class_ids:
+            fixed_class_cells.setdefault(pair[0], []).append((day, position))
+        if entry.get("teacher_id"):
+            fixed_teacher_cells.setdefault(str(entry["teacher_id"]), []).append((day, position))
+        if entry.get("room_number"):
+            fixed_room_cells.setdefault(str(entry["room_number"]), []).append((day, position))
+
+    preferred: Dict[int, Tuple[int, int, Optional[str]]] = {}
+    if keep_existing:
+        for position, lesson in enumerate(lessons):
+            cells = existing.get((lesson.class_id, lesson.subject_id))
+            if cells:
+                preferred[position] = cells.pop()
+
+    return TimetableProblem(
+        lessons=lessons,
+        days=days,
+        slots=slots,
+        rooms=rooms,
+        fixed_teacher_cells=fixed_teacher_cells,
+        fixed_room_cells=fixed_room_cells,
+        fixed_class_cells=fixed_class_cells,
+        preferred=preferred,
+        max_consecutive_periods=max_consecutive_periods,
+        max_periods_per_subject_per_day=max_periods_per_subject_per_day
+    )
+
+
+def solve_timetable(problem: TimetableProblem, time_budget_seconds: float = 10.0, seed: int = 0) -> TimetableSolution:
+    """Build a weekly timetable for `problem` within the time budget"""
+    started = time.monotonic()
+    if not problem.slots or not problem.days:
+        return TimetableSolution(
+            placements=[None] * len(problem.lessons), unplaced=list(range(len(problem.lessons))),
+            hard_violations=0, soft_penalty=0, iterations=0, elapsed_seconds=0.0, moved_lessons=0,
+            warnings=["No teaching time slots or working days to schedule into"]
+        )
+
+    solver = TimetableSolver(problem, seed)
+    solver.construct()
+    iterations = solver.search(started + time_budget_seconds)
+    solution = solver.solution(iterations, started)
+    logger.info(
+        f"Timetable solver placed {len(problem.lessons) - len(solution.unplaced)}/{len(problem.lessons)} lessons "
+        f"in {solution.elapsed_seconds}s ({iterations} iterations, soft penalty {solution.soft_penalty})"
+    )
+    return solution
+
+
+# Searches run in worker processes; a pure-Python search on a thread would still hold the GIL
+_solver_pool: Optional[ProcessPoolExecutor] = None
+
+
+async def solve_timetable_in_process(problem: TimetableProblem, time_budget_seconds: float = 10.0,
+                                     seed: int = 0) -> TimetableSolution:
+    """solve_timetable in a worker process, so the event loop keeps serving requests meanwhile"""
+    global _solver_pool
+    if _solver_pool is None:
+        _solver_pool = ProcessPoolExecutor(max_workers=SOLVER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_solver_pool, solve_timetable, problem, time_budget_seconds, seed)
+
+
+def shutdown_solver_pool():
+    global _solver_pool
+    if _solver_pool is not None:
+        _solver_pool.shutdown(wait=False, cancel_futures=True)
+        _solver_pool = None
+
+
+# Export components
+__all__ = [
+    'Lesson',
+    'TimetableProblem',
+    'TimetableSolution',
+    'TimetableSolver',
+    'build_timetable_problem',
+    'solve_timetable',
+    'solve_timetable_in_process',
+    'shutdown_solver_pool',
+    'teaching_slots'
+]
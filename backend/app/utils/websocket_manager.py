@@ -13,7 +13,7 @@ from bson import ObjectId
 from enum import Enum
 import jwt
 import weakref
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from dataclasses import dataclass, asdict
 import time
 
@@ -22,6 +22,10 @@ from .auth import decode_access_token
 from .rbac import has_permission, Permission
 from .branch_context import BranchContext
 from .data_sync import SyncEvent, SyncEventType, get_sync_manager
+from .realtime_bus import (
+    RealtimeBackplane, TopicRefCounter, branch_topic, user_topic, create_backplane
+)
+from .sync_delta import DocumentVersionStore, build_delta, json_safe, project_document, project_sync_payload
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -50,6 +54,10 @@ class MessageType(Enum):
     DATA_INSERT = "data_insert"
     DATA_OPTIMISTIC = "data_optimistic"  # For optimistic UI updates
     
+    # Delta protocol: clients request a snapshot when they detect a version gap
+    RESYNC_REQUEST = "resync_request"
+    DATA_SNAPSHOT = "data_snapshot"
+    
     # Notifications
     NOTIFICATION = "notification"
     SYSTEM_ALERT = "system_alert"
@@ -108,6 +116,7 @@ class Subscription:
     permissions: List[str]
     created_at: datetime
     last_activity: datetime
+    fields: Optional[List[str]] = None  # top-level fields the client renders; None means all
     
     def __post_init__(self):
         if self.created_at is None:
@@ -128,6 +137,7 @@ class WebSocketConnection:
         self.connected_at = datetime.utcnow()
         self.last_activity = datetime.utcnow()
         self.subscriptions: Dict[str, Subscription] = {}
+        self.bus_topics: List[str] = []  # backplane topics held on behalf of this connection
         self.message_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
         self.is_active = True
         self.ping_interval = 30  # seconds
@@ -206,7 +216,7 @@ class WebSocketConnection:
 class WebSocketManager:
     """Manages WebSocket connections and real-time communication"""
     
-    def __init__(self, db):
+    def __init__(self, db, backplane: Optional[RealtimeBackplane] = None):
         self.db = db
         self.connections: Dict[str, WebSocketConnection] = {}
         self.subscriptions: Dict[str, Set[str]] = defaultdict(set)  # resource -> connection_ids
@@ -214,6 +224,15 @@ class WebSocketManager:
         self.branch_connections: Dict[str, Set[str]] = defaultdict(set)  # branch_id -> connection_ids
         self.audit_logger = get_audit_logger()
         
+        # Cross-worker backplane; topics are reference counted per local connection
+        self.backplane = backplane
+        self.topic_refs = TopicRefCounter(backplane)
+        self.recent_sync_keys: "OrderedDict[str, None]" = OrderedDict()
+        self.max_recent_sync_keys = 4096
+        
+        # Per-document versions for the delta protocol
+        self.version_store = DocumentVersionStore(db)
+        
         # Background tasks
         self.cleanup_task: Optional[asyncio.Task] = None
         self.ping_task: Optional[asyncio.Task] = None
@@ -231,7 +250,9 @@ class WebSocketManager:
             "optimistic_updates": 0,
             "grade_notifications": 0,
             "report_notifications": 0,
-            "exam_notifications": 0
+            "exam_notifications": 0,
+            "bus_published": 0,
+            "bus_received": 0
         }
         
         # Message batching for efficient updates
@@ -248,6 +269,7 @@ class WebSocketManager:
             MessageType.SUBSCRIBE: self._handle_subscribe,
             MessageType.UNSUBSCRIBE: self._handle_unsubscribe,
             MessageType.PING: self._handle_ping,
+            MessageType.RESYNC_REQUEST: self._handle_resync_request,
         }
         
         # Setup sync integration
@@ -287,6 +309,9 @@ class WebSocketManager:
         self.ping_task = asyncio.create_task(self._ping_connections())
         self.batch_task = asyncio.create_task(self._process_batched_messages())
         
+        if self.backplane:
+            await self.backplane.start(self._handle_backplane_message)
+        
         logger.info("WebSocket manager started")
     
     async def stop(self):
@@ -304,6 +329,9 @@ class WebSocketManager:
         if self.batch_task:
             self.batch_task.cancel()
         
+        if self.backplane:
+            await self.backplane.stop()
+        
         # Close all connections
         for connection in list(self.connections.values()):
             await connection.close(code=1001, reason="Server shutdown")
@@ -361,6 +389,9 @@ class WebSocketManager:
                 self.user_connections[connection.user_id].discard(connection_id)
             if connection.branch_id:
                 self.branch_connections[connection.branch_id].discard(connection_id)
+            for topic in connection.bus_topics:
+                self.topic_refs.release(topic)
+            connection.bus_topics = []
             
             # Remove subscriptions
             for subscription_id in list(connection.subscriptions.keys()):
@@ -462,6 +493,7 @@ class WebSocketManager:
                 self.user_connections[connection.user_id].add(connection.connection_id)
             if connection.branch_id:
                 self.branch_connections[connection.branch_id].add(connection.connection_id)
+            self._acquire_bus_topics(connection)
             
             await connection.send_message(WebSocketMessage(
                 type=MessageType.AUTH_SUCCESS,
@@ -485,6 +517,55 @@ class WebSocketManager:
                 payload={"error": "Authentication failed"}
             ))
     
+    def _acquire_bus_topics(self, connection: WebSocketConnection):
+        """Subscribe this worker to the backplane topics an authenticated connection needs"""
+        for topic in connection.bus_topics:
+            self.topic_refs.release(topic)
+        
+        if connection.user_role in ["superadmin", "hq_admin"]:
+            topics = ["branch:*"]
+        else:
+            topics = [branch_topic(connection.branch_id), branch_topic(None)]
+        if connection.user_id:
+            topics.append(user_topic(connection.user_id))
+        
+        for topic in topics:
+            self.topic_refs.acquire(topic)
+        connection.bus_topics = topics
+    
+    async def _publish(self, topic: str, message: Dict[str, Any], dedupe_key: Optional[str] = None):
+        """Publish a broadcast so clients connected to other workers receive it too"""
+        if not self.backplane:
+            return
+        if await self.backplane.publish(topic, message, dedupe_key):
+            self.stats["bus_published"] += 1
+    
+    async def _handle_backplane_message(self, topic: str, message: Dict[str, Any]):
+        """Deliver a broadcast published by another worker to local clients only"""
+        self.stats["bus_received"] += 1
+        kind = message.get("kind")
+        
+        if kind == "sync":
+            dedupe_key = message.get("dedupe_key")
+            if dedupe_key and not self._remember_sync_key(dedupe_key):
+                return  # already delivered from this worker's own change stream
+            await self._deliver_sync_payload(message["payload"], message.get("correlation_id"))
+        elif kind == "notification":
+            await self._deliver_notification(message.get("user_ids", []), message["payload"])
+        elif kind == "system_alert":
+            await self._deliver_system_alert(message["payload"], message.get("branch_id"))
+        else:
+            logger.warning(f"Unknown backplane message kind on {topic}: {kind}")
+    
+    def _remember_sync_key(self, dedupe_key: str) -> bool:
+        """Record a delivered sync event; returns False if it was delivered before"""
+        if dedupe_key in self.recent_sync_keys:
+            return False
+        self.recent_sync_keys[dedupe_key] = None
+        if len(self.recent_sync_keys) > self.max_recent_sync_keys:
+            self.recent_sync_keys.popitem(last=False)
+        return True
+    
     async def _handle_subscribe(self, connection: WebSocketConnection, payload: Dict[str, Any]):
         """Handle subscription message"""
         if not connection.authenticated:
@@ -498,6 +579,9 @@ class WebSocketManager:
             subscription_type = SubscriptionType(payload.get("type"))
             resource = payload.get("resource")
             filters = payload.get("filters", {})
+            fields = payload.get("fields")
+            if fields is not None and (not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)):
+                raise ValueError("fields must be a list of field names")
             
             # Validate subscription permissions
             if not await self._validate_subscription_permissions(connection, subscription_type, resource):
@@ -517,7 +601,8 @@ class WebSocketManager:
                 filters=filters,
                 permissions=self._get_user_permissions(connection),
                 created_at=datetime.utcnow(),
-                last_activity=datetime.utcnow()
+                last_activity=datetime.utcnow(),
+                fields=fields
             )
             
             connection.subscriptions[subscription_id] = subscription
@@ -530,7 +615,8 @@ class WebSocketManager:
                 payload={
                     "subscription_id": subscription_id,
                     "resource": resource,
-                    "type": subscription_type.value
+                    "type": subscription_type.value,
+                    "fields": fields
                 }
             ))
             
@@ -552,6 +638,46 @@ class WebSocketManager:
                 payload={"subscription_id": subscription_id, "action": "unsubscribed"}
             ))
     
+    async def _handle_resync_request(self, connection: WebSocketConnection, payload: Dict[str, Any]):
+        """Send a full (projected) snapshot of a document after the client detected a version gap"""
+        collection_name = payload.get("collection")
+        document_id = payload.get("document_id")
+        
+        if collection_name not in self.subscriptions or connection.connection_id not in self.subscriptions[collection_name]:
+            await connection.send_message(WebSocketMessage(
+                type=MessageType.ERROR,
+                payload={"error": "Not subscribed to collection", "collection": collection_name}
+            ))
+            return
+        
+        if self.db is None or not document_id or not ObjectId.is_valid(document_id):
+            await connection.send_message(WebSocketMessage(
+                type=MessageType.ERROR,
+                payload={"error": "Invalid resync request", "document_id": document_id}
+            ))
+            return
+        
+        fields = self._subscription_fields(connection, collection_name)
+        projection = {field: 1 for field in fields + ["branch_id"]} if fields is not None else None
+        document = await self.db[collection_name].find_one({"_id": ObjectId(document_id)}, projection)
+        
+        if document and document.get("branch_id") and document.get("branch_id") != connection.branch_id \
+                and connection.user_role not in ["superadmin", "hq_admin"]:
+            document = None
+        
+        version = await self.version_store.current_version(collection_name, document_id)
+        await connection.send_message(WebSocketMessage(
+            type=MessageType.DATA_SNAPSHOT,
+            payload={
+                "collection": collection_name,
+                "document_id": document_id,
+                "version": version,
+                "exists": document is not None,
+                "data": json_safe(project_document(document, fields))
+            },
+            correlation_id=payload.get("request_id")
+        ))
+    
     async def _handle_ping(self, connection: WebSocketConnection, payload: Dict[str, Any]):
         """Handle ping message"""
         await connection.send_message(WebSocketMessage(
@@ -618,39 +744,92 @@ class WebSocketManager:
     async def _handle_sync_event(self, sync_event: SyncEvent):
         """Handle sync events and broadcast to relevant clients"""
         try:
-            # Determine which clients should receive this update
-            resource_key = f"{sync_event.collection_name}"
-            connection_ids = self.subscriptions.get(resource_key, set())
+            # Every worker may consume the same change stream event; the change
+            # stream token lets the backplane and peers drop the duplicates
+            dedupe_key = f"sync:{sync_event.correlation_id}" if sync_event.correlation_id else None
+            if dedupe_key and not self._remember_sync_key(dedupe_key):
+                return  # a peer already published it and we delivered it from the backplane
             
-            if not connection_ids:
-                return
+            version = await self.version_store.next_version(
+                sync_event.collection_name, sync_event.document_id, sync_event.correlation_id
+            )
+            payload = {
+                "collection": sync_event.collection_name,
+                "document_id": sync_event.document_id,
+                "event_type": sync_event.event_type.value,
+                "branch_id": sync_event.branch_id,
+                "version": version,
+                "base_version": version - 1,
+                "timestamp": sync_event.timestamp.isoformat() if sync_event.timestamp else None
+            }
             
-            # Create WebSocket message based on sync event
-            message_type = {
-                SyncEventType.INSERT: MessageType.DATA_INSERT,
-                SyncEventType.UPDATE: MessageType.DATA_UPDATE,
-                SyncEventType.DELETE: MessageType.DATA_DELETE,
-                SyncEventType.REPLACE: MessageType.DATA_UPDATE
-            }.get(sync_event.event_type, MessageType.DATA_UPDATE)
+            # Updates only carry the changed fields; clients apply them on top of
+            # base_version and send a resync_request when their version differs
+            if sync_event.event_type == SyncEventType.UPDATE and sync_event.updated_fields is not None:
+                payload["delta"] = build_delta(sync_event.updated_fields, sync_event.removed_fields)
+            elif sync_event.event_type != SyncEventType.DELETE:
+                payload["data"] = json_safe(sync_event.full_document)
+
+            await self._deliver_sync_payload(payload, sync_event.correlation_id)
+            await self._publish(
+                branch_topic(sync_event.branch_id),
+                {
+                    "kind": "sync",
+                    "payload": payload,
+                    "correlation_id": sync_event.correlation_id,
+                    "dedupe_key": dedupe_key
+                },
+                dedupe_key
+            )
             
+        except Exception as e:
+            logger.error(f"Error handling sync event: {e}")
+    
+    async def _deliver_sync_payload(self, payload: Dict[str, Any], correlation_id: Optional[str] = None):
+        """Send a sync event to clients connected to this worker"""
+        # Determine which clients should receive this update
+        connection_ids = self.subscriptions.get(payload["collection"], set())
+        
+        if not connection_ids:
+            return
+        
+        # Create WebSocket message based on sync event
+        message_type = {
+            SyncEventType.INSERT.value: MessageType.DATA_INSERT,
+            SyncEventType.UPDATE.value: MessageType.DATA_UPDATE,
+            SyncEventType.DELETE.value: MessageType.DATA_DELETE,
+            SyncEventType.REPLACE.value: MessageType.DATA_UPDATE
+        }.get(payload["event_type"], MessageType.DATA_UPDATE)
+        
+        # Group subscribers by field projection so each distinct projection is built once
+        groups: Dict[Optional[tuple], Set[str]] = defaultdict(set)
+        for connection_id in connection_ids:
+            connection = self.connections.get(connection_id)
+            if not connection:
+                continue
+            fields = self._subscription_fields(connection, payload["collection"])
+            groups[tuple(sorted(fields)) if fields is not None else None].add(connection_id)
+        
+        for fields, group_ids in groups.items():
             message = WebSocketMessage(
                 type=message_type,
-                payload={
-                    "collection": sync_event.collection_name,
-                    "document_id": sync_event.document_id,
-                    "event_type": sync_event.event_type.value,
-                    "data": sync_event.full_document,
-                    "branch_id": sync_event.branch_id,
-                    "timestamp": sync_event.timestamp.isoformat() if sync_event.timestamp else None
-                },
-                correlation_id=sync_event.correlation_id
+                payload=project_sync_payload(payload, fields),
+                correlation_id=correlation_id
             )
             
             # Broadcast to relevant clients
-            await self._broadcast_message(connection_ids, message, sync_event.branch_id)
-            
-        except Exception as e:
-            logger.error(f"Error handling sync event: {e}")
+            await self._broadcast_message(group_ids, message, payload.get("branch_id"))
+    
+    def _subscription_fields(self, connection: WebSocketConnection, resource: str) -> Optional[List[str]]:
+        """Union of the fields requested by a connection's subscriptions to a resource (None = all)"""
+        fields: Set[str] = set()
+        for subscription in connection.subscriptions.values():
+            if subscription.resource != resource:
+                continue
+            if subscription.fields is None:
+                return None
+            fields.update(subscription.fields)
+        return sorted(fields) if fields else None
     
     async def _broadcast_message(self, connection_ids: Set[str], message: WebSocketMessage, 
                                branch_filter: Optional[str] = None, batch: bool = False):
@@ -832,6 +1011,22 @@ class WebSocketManager:
     
     async def broadcast_notification(self, user_ids: List[str], notification: Dict[str, Any]):
         """Broadcast notification to specific users"""
+        await self._deliver_notification(user_ids, notification)
+        
+        if self.backplane:
+            # Partition recipients by topic so each worker only sees users it may hold
+            users_by_topic: Dict[str, List[str]] = defaultdict(list)
+            for user_id in user_ids:
+                users_by_topic[user_topic(user_id)].append(user_id)
+            for topic, topic_user_ids in users_by_topic.items():
+                await self._publish(topic, {
+                    "kind": "notification",
+                    "user_ids": topic_user_ids,
+                    "payload": notification
+                })
+    
+    async def _deliver_notification(self, user_ids: List[str], notification: Dict[str, Any]):
+        """Send a notification to the given users' connections on this worker"""
         message = WebSocketMessage(
             type=MessageType.NOTIFICATION,
             payload=notification
@@ -841,7 +1036,8 @@ class WebSocketManager:
         for user_id in user_ids:
             connection_ids.update(self.user_connections.get(user_id, set()))
         
-        await self._broadcast_message(connection_ids, message)
+        if connection_ids:
+            await self._broadcast_message(connection_ids, message)
     
     async def broadcast_grade_notification(self, parent_ids: List[str], grade_data: Dict[str, Any], student_name: str):
         """Broadcast grade notification to parents"""
@@ -909,6 +1105,15 @@ class WebSocketManager:
     
     async def broadcast_system_alert(self, alert: Dict[str, Any], branch_id: Optional[str] = None):
         """Broadcast system alert to all relevant users"""
+        await self._deliver_system_alert(alert, branch_id)
+        await self._publish(branch_topic(branch_id), {
+            "kind": "system_alert",
+            "payload": alert,
+            "branch_id": branch_id
+        })
+    
+    async def _deliver_system_alert(self, alert: Dict[str, Any], branch_id: Optional[str] = None):
+        """Send a system alert to clients connected to this worker"""
         message = WebSocketMessage(
             type=MessageType.SYSTEM_ALERT,
             payload=alert
@@ -1023,7 +1228,12 @@ class WebSocketManager:
                 "grade_notifications_sent": self.stats.get("grade_notifications", 0),
                 "report_notifications_sent": self.stats.get("report_notifications", 0),
                 "exam_notifications_sent": self.stats.get("exam_notifications", 0)
-            }
+            },
+            "backplane": {
+                "worker_id": self.backplane.worker_id,
+                "topics": sorted(self.backplane.topics),
+                **self.backplane.stats
+            } if self.backplane else None
         }
 
 # Global WebSocket manager instance
@@ -1033,7 +1243,7 @@ def get_websocket_manager(db) -> WebSocketManager:
     """Get global WebSocket manager instance"""
     global _websocket_manager
     if _websocket_manager is None:
-        _websocket_manager = WebSocketManager(db)
+        _websocket_manager = WebSocketManager(db, backplane=create_backplane(db))
     return _websocket_manager
 
 # WebSocket endpoint dependency
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Sequence Counter Migration Script
+Seeds the counters collection from existing receipt, inventory and student codes
+"""
+
+import asyncio
+import os
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.utils.sequence_counters import seed_sequence_counters
+
+# MongoDB connection, from the same settings as app/db.py
+load_dotenv()
+MONGO_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+DB_NAME = os.getenv("MONGODB_DB_NAME", "spring_of_knowledge")
+
+async def migrate_sequence_counters():
+    """Seed counters so new codes continue after the highest existing ones"""
+    print("🔧 Starting Sequence Counter Migration")
+    print(f"Database: {DB_NAME}")
+    print("=" * 50)
+
+    client = AsyncIOMotorClient(MONGO_URI)
+    db = client[DB_NAME]
+
+    try:
+        seeded = await seed_sequence_counters(db)
+
+        for key, value in sorted(seeded.items()):
+            print(f"  {key}: {value}")
+
+        print(f"✅ Seeded {len(seeded)} counters (safe to re-run; counters only move forward)")
+
+    except Exception as e:
+        print(f"❌ Error during migration: {e}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_sequence_counters())
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep audit log files written during tests out of the repository's logs/ directory
+os.environ.setdefault("AUDIT_LOG_DIR", os.path.join(tempfile.mkdtemp(prefix="audit-logs-"), "audit"))
@@ -0,0 +1,305 @@
+"""
+Audit write buffer tests
+Checks batching, drop policy and shutdown flush of the audit pipeline
+"""
+
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import BulkWriteError
+
+from app.utils.audit_logger import AuditWriteBuffer, AuditLogger, AuditAction, AuditSeverity, bucket_id
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, batch):
+        self.batches.append(list(batch))
+
+
+class FakeAuditCollection:
+    def __init__(self):
+        self.insert_many_calls = []
+
+    async def insert_many(self, docs, ordered=True):
+        self.insert_many_calls.append(len(docs))
+
+
+class TestAuditWriteBuffer:
+
+    @pytest.mark.asyncio
+    async def test_full_batch_wakes_flusher(self):
+        writer = RecordingWriter()
+        buffer = AuditWriteBuffer(writer, batch_size=10, flush_interval_ms=60000)
+
+        for i in range(25):
+            buffer.submit({"n": i})
+        await asyncio.sleep(0.01)
+
+        assert [len(b) for b in writer.batches] == [10, 10, 5]
+        await buffer.close()
+
+    @pytest.mark.asyncio
+    async def test_interval_flush(self):
+        writer = RecordingWriter()
+        buffer = AuditWriteBuffer(writer, batch_size=100, flush_interval_ms=20)
+
+        buffer.submit({"n": 1})
+        await asyncio.sleep(0.06)
+
+        assert writer.batches == [[{"n": 1}]]
+        await buffer.close()
+
+    @pytest.mark.asyncio
+    async def test_drop_newest_when_full_but_keep_critical(self):
+        writer = RecordingWriter()
+        buffer = AuditWriteBuffer(writer, max_queue=3, batch_size=100, flush_interval_ms=60000)
+
+        results = [buffer.submit({"n": i, "severity": "warning"}) for i in range(5)]
+        buffer.submit({"n": 99, "severity": AuditSeverity.CRITICAL.value})
+
+        assert results == [True, True, True, False, False]
+        assert [e["n"] for e in buffer.queue] == [1, 2, 99]
+        assert buffer.get_stats()["dropped"] == 3
+        await buffer.close()
+
+    @pytest.mark.asyncio
+    async def test_close_flushes_pending_entries(self):
+        writer = RecordingWriter()
+        buffer = AuditWriteBuffer(writer, batch_size=100, flush_interval_ms=60000)
+        for i in range(7):
+            buffer.submit({"n": i})
+
+        await buffer.close()
+
+        assert sum(len(b) for b in writer.batches) == 7
+        assert buffer.get_stats()["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_is_retried_then_spilled(self):
+        attempts = []
+
+        async def flaky_writer(batch):
+            attempts.append(list(batch))
+            if len(attempts) in (1, 4, 5, 6):
+                raise ConnectionError("primary stepped down")
+
+        spilled = []
+        buffer = AuditWriteBuffer(flaky_writer, batch_size=100, flush_interval_ms=60000,
+                                  max_attempts=3, spill=spilled.extend)
+        buffer.submit({"n": 1})
+        buffer.submit({"n": 2})
+
+        # A transient failure keeps the batch, unchanged, for the next flush
+        await buffer.flush()
+        buffer.submit({"n": 4})
+        assert [e["n"] for e in buffer.retry_batch] == [1, 2]
+        await buffer.flush()
+        assert attempts[1:] == [[{"n": 1}, {"n": 2}], [{"n": 4}]] and not buffer.queue
+
+        # A batch that keeps failing goes to the spill rather than being lost
+        buffer.submit({"n": 3})
+        for _ in range(3):
+            await buffer.flush()
+        assert spilled == [{"n": 3}] and not buffer.queue
+        stats = buffer.get_stats()
+        assert stats["written"] == 3 and stats["spilled"] == 1 and stats["dropped"] == 0
+        await buffer.close()
+
+
+class TestAuditLoggerBatching:
+
+    @pytest.mark.asyncio
+    async def test_log_event_storm_uses_insert_many(self):
+        audit = AuditLogger()
+        audit._initialized = True
+        audit.collection = FakeAuditCollection()
+
+        for _ in range(1200):
+            await audit.log_event(
+                action=AuditAction.LOGIN_FAILED,
+                details={"reason": "Invalid or expired token"},
+                severity=AuditSeverity.WARNING,
+                success=False
+            )
+        await audit.close()
+
+        assert audit.collection.insert_many_calls == [500, 500, 200]
+        assert audit.get_buffer_stats()["written"] == 1200
+
+
+class FakeCounterStore:
+    """Applies $inc upserts from bulk_write and answers _id $in lookups"""
+
+    def __init__(self):
+        self.docs = {}
+        self.bulk_writes = 0
+
+    async def bulk_write(self, ops, ordered=True):
+        self.bulk_writes += 1
+        for op in ops:
+            doc = self.docs.setdefault(op._filter["_id"], {"_id": op._filter["_id"]})
+            for field, n in op._doc["$inc"].items():
+                doc[field] = doc.get(field, 0) + n
+
+    def find(self, query, projection=None):
+        ids = query["_id"]["$in"]
+        docs = [self.docs[i] for i in ids if i in self.docs]
+
+        async def iterate():
+            for doc in docs:
+                yield doc
+        return iterate()
+
+
+class GuardedStore:
+    """Applies guarded upserts like MongoDB: a guard miss on an existing _id is a duplicate key"""
+
+    def __init__(self, fail_once=False):
+        self.docs = {}
+        self.fail_once = fail_once
+
+    async def bulk_write(self, ops, ordered=True):
+        if self.fail_once:
+            self.fail_once = False
+            raise ConnectionError("connection reset")
+        errors = []
+        for index, op in enumerate(ops):
+            _id, batch = op._filter["_id"], op._filter["batches"]["$ne"]
+            doc = self.docs.get(_id)
+            if doc is not None and batch in doc["batches"]:
+                errors.append({"index": index, "code": 11000})
+                continue
+            doc = self.docs.setdefault(_id, {"batches": []})
+            for field, n in op._doc["$inc"].items():
+                doc[field] = doc.get(field, 0) + n
+            doc["batches"].append(batch)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+class TestAuditBatchRetry:
+
+    @pytest.mark.asyncio
+    async def test_retried_batch_is_folded_into_buckets_once(self):
+        audit = AuditLogger()
+        audit._initialized = True
+        audit.collection = FakeAuditCollection()
+        audit.buckets = GuardedStore()
+        audit.counters = GuardedStore(fail_once=True)
+        entries = [{"timestamp": datetime(2025, 3, 1, 9, 15), "action": AuditAction.LOGIN_FAILED.value,
+                    "success": False, "user": {"email": "parent@example.com"}} for _ in range(3)]
+
+        # Buckets were updated before the counters failed; the retry must not count them again
+        with pytest.raises(ConnectionError):
+            await audit._write_batch(entries)
+        await audit._write_batch(entries)
+
+        assert audit.buckets.docs[bucket_id("recent", "all", datetime(2025, 3, 1, 9))]["count"] == 3
+        assert [doc["count"] for doc in audit.counters.docs.values()] == [3]
+
+
+class TestAuditBuckets:
+
+    def test_batch_folds_into_one_update_per_bucket(self):
+        entries = [
+            {
+                "timestamp": datetime(2025, 3, 1, 9, 15, 30),
+                "action": AuditAction.LOGIN_FAILED.value,
+                "severity": "warning",
+                "success": False,
+                "user": {"email": "parent@example.com"},
+                "metadata": {"ip_address": "10.0.0.9"}
+            }
+            for _ in range(300)
+        ]
+
+        bucket_ops, counter_ops = AuditLogger._bucket_updates(entries)
+
+        assert sorted(op._filter["_id"] for op in bucket_ops) == [
+            "ip:10.0.0.9:2025030109", "recent:all:2025030109", "security:all:2025030109"
+        ]
+        security = next(op for op in bucket_ops if op._filter["_id"].startswith("security"))
+        assert security._doc["$inc"]["actions.login_failed"] == 300
+        assert security._doc["$push"]["events"]["$slice"] == -500
+        assert {op._filter["_id"]: op._doc["$inc"]["count"] for op in counter_ops} == {
+            "login_failed_email:parent@example.com:202503010915": 300,
+            "login_failed_ip:10.0.0.9:202503010915": 300
+        }
+
+    @pytest.mark.asyncio
+    async def test_brute_force_detection_reads_rolling_counters(self):
+        audit = AuditLogger()
+        audit._initialized = True
+        audit.collection = FakeAuditCollection()
+        audit.buckets = FakeCounterStore()
+        audit.counters = FakeCounterStore()
+
+        for _ in range(6):
+            await audit.log_login_attempt("parent@example.com", success=False, ip_address="10.0.0.9")
+
+        assert await audit.detect_brute_force("parent@example.com") is True
+        assert await audit.detect_brute_force("other@example.com") is False
+        await audit.close()
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length] if length else self.docs
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class TestSecurityEventOverflow:
+
+    @pytest.mark.asyncio
+    async def test_overflowed_hour_is_read_from_raw_log(self):
+        hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        burst = [{"timestamp": hour + timedelta(seconds=i), "action": AuditAction.LOGIN_FAILED.value,
+                  "severity": "warning"} for i in range(700)]
+        raw_queries = []
+
+        class Buckets:
+            def find(self, query, projection=None):
+                return FakeCursor([{"bucket_start": hour, "count": 700, "events": burst[-500:]}])
+
+        class Raw(FakeAuditCollection):
+            def find(self, query):
+                raw_queries.append(query)
+                return FakeCursor(sorted(burst, key=lambda e: e["timestamp"], reverse=True))
+
+        audit = AuditLogger()
+        audit._initialized = True
+        audit.collection = Raw()
+        audit.buckets = Buckets()
+
+        events = await audit.get_security_events(hours=2)
+
+        assert len(events) == 700
+        assert raw_queries[0]["action"]["$in"] and raw_queries[0]["timestamp"]["$gte"] == hour
+        await audit.close()
@@ -0,0 +1,98 @@
+"""
+Behavior analytics tests
+Checks counter deltas for incidents and points, reversals on change and the derived summaries
+"""
+
+import pytest
+from datetime import datetime, timedelta
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.behavior_analytics import BehaviorAnalytics, BehaviorDelta, TREND_DAYS
+
+
+def incident(**overrides):
+    doc = {
+        "student_id": "S1", "branch_id": "b1", "class_id": "c1", "incident_type": "tardiness",
+        "severity": "minor", "incident_date": datetime(2025, 3, 4, 10, 30), "status": "open"
+    }
+    doc.update(overrides)
+    return doc
+
+
+def applied(delta):
+    """The $inc and $max parts of each update, keyed by collection and _id"""
+    return {key: ({k: v for k, v in u["$inc"].items() if v}, u["$max"]) for key, u in delta.updates.items()}
+
+
+class TestBehaviorDelta:
+
+    def test_incident_rolls_up_to_student_class_grade_and_day(self):
+        delta = BehaviorDelta()
+        delta.add_incident(incident(), {"grade_level": "Grade 5"})
+
+        updates = applied(delta)
+        for doc_id in ("student:b1:S1", "class:b1:c1", "grade:b1:Grade 5"):
+            increments, maxima = updates[("behavior_balances", doc_id)]
+            assert increments == {"incidents": 1, "incidents_by_severity.minor": 1, "open_incidents": 1}
+            assert maxima == {"last_incident_at": datetime(2025, 3, 4)}
+        assert updates[("behavior_daily_buckets", "b1:20250304")][0]["incidents_by_type.tardiness"] == 1
+        assert updates[("behavior_student_days", "S1:20250304")][0] == {"incidents": 1}
+
+    def test_unchanged_fields_cancel_out_on_update(self):
+        delta = BehaviorDelta()
+        delta.add_incident(incident(), {}, sign=-1)
+        delta.add_incident(incident(status="resolved", severity="major.level"), {})
+
+        increments, _ = applied(delta)[("behavior_balances", "student:b1:S1")]
+        assert increments == {
+            "incidents_by_severity.minor": -1, "incidents_by_severity.major_level": 1, "open_incidents": -1
+        }
+        assert ("behavior_student_days", "S1:20250304") not in {
+            key for key, ops in applied(delta).items() if ops[0]
+        }
+
+    def test_points_are_counted_by_magnitude(self):
+        delta = BehaviorDelta()
+        delta.add_points({"student_id": "S1", "branch_id": "b1", "point_type": "negative", "points": -5,
+                          "date_awarded": datetime(2025, 3, 4)}, {})
+        delta.add_points({"student_id": "S1", "branch_id": "b1", "point_type": "positive", "points": 8,
+                          "date_awarded": datetime(2025, 3, 4)}, {})
+
+        increments, _ = applied(delta)[("behavior_balances", "student:b1:S1")]
+        assert increments == {"negative_points": 5, "positive_points": 8, "balance": 3}
+        ops = delta.operations()
+        assert len(ops["behavior_balances"]) == 1 and len(ops["behavior_daily_buckets"]) == 1
+
+
+class TestBehaviorSummaries:
+
+    def test_trend_merges_branches_and_reports_direction(self):
+        start = datetime(2025, 3, 1)
+        last_day = start + timedelta(days=TREND_DAYS - 1)
+        buckets = [
+            {"day": start, "incidents": 1},
+            {"day": last_day, "incidents": 2, "positive_points": 4},
+            {"day": last_day, "incidents": 1},
+            {"day": start - timedelta(days=1), "incidents": 50}
+        ]
+
+        trend = BehaviorAnalytics._trend(buckets, start)
+
+        assert len(trend["daily"]) == TREND_DAYS
+        assert trend["daily"][last_day.date().isoformat()] == {"incidents": 3, "positive_points": 4, "negative_points": 0}
+        assert trend["incident_direction"] == "increasing"
+
+    def test_group_summary_sums_branches_per_key(self):
+        balances = [
+            {"scope": "grade", "key": "Grade 5", "incidents": 2, "balance": -3},
+            {"scope": "grade", "key": "Grade 5", "incidents": 1, "balance": 4},
+            {"scope": "class", "key": "c1", "incidents": 7}
+        ]
+
+        summary = BehaviorAnalytics._group_summary(balances, "grade")
+
+        assert summary == {"Grade 5": {"incidents": 3, "open_incidents": 0, "positive_points": 0,
+                                       "negative_points": 0, "balance": 1}}
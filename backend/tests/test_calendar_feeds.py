@@ -0,0 +1,83 @@
+"""
+Calendar feed tests
+Checks streamed iCal output, line folding and conditional GET handling for subscription feeds
+"""
+
+import pytest
+from datetime import datetime
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.calendar_export import CalendarExporter, fold_ical_line, ICAL_CHUNK_LINES
+from app.utils.calendar_feeds import FeedState, feed_scopes, http_date, EVENTS_SCOPE
+from app.utils.timetable_export import TimetableExporter
+
+
+async def components(events, exporter):
+    for event in events:
+        yield await exporter.format_ical_event(event)
+
+
+class TestStreamedIcal:
+
+    @pytest.mark.asyncio
+    async def test_stream_yields_chunks_of_one_calendar(self):
+        exporter = CalendarExporter()
+        events = [{"_id": f"e{i}", "title": f"Event {i}", "start_date": datetime(2025, 3, 1 + i % 28),
+                   "updated_at": datetime(2025, 2, 1), "event_type": "exam"} for i in range(60)]
+
+        chunks = [chunk async for chunk in exporter.stream_ical(components(events, exporter))]
+        body = "".join(chunks)
+
+        assert len(chunks) > 1 and all(chunk.endswith("\r\n") for chunk in chunks)
+        assert body.startswith("BEGIN:VCALENDAR\r\n") and body.endswith("END:VCALENDAR\r\n")
+        assert body.count("BEGIN:VEVENT") == 60 and "UID:e0@springofknowledgehub.com" in body
+        # Stored datetimes and change times make renders repeatable
+        assert "DTSTAMP:20250201T000000Z" in body
+        assert "".join([c async for c in exporter.stream_ical(components(events, exporter))]) == body
+        assert ICAL_CHUNK_LINES < body.count("\r\n")
+
+    def test_long_lines_are_folded_at_75_octets(self):
+        line = "DESCRIPTION:" + "é" * 100
+        folded = fold_ical_line(line)
+        parts = folded.split("\r\n")
+        assert all(len(part.encode("utf-8")) <= 75 for part in parts)
+        assert all(part.startswith(" ") for part in parts[1:])
+        assert "".join(part[1:] if i else part for i, part in enumerate(parts)) == line
+        assert fold_ical_line("SUMMARY:Math") == "SUMMARY:Math"
+
+    def test_timetable_entry_lines(self):
+        exporter = TimetableExporter()
+        entry = {"_id": "t1", "day_of_week": "monday", "start_time": "08:00:00", "end_time": "08:45:00",
+                 "subject_name": "Math", "room_number": "R1", "period_type": "lesson"}
+        lines = exporter.ical_event_lines(entry)
+        assert lines[0] == "BEGIN:VEVENT" and lines[-1] == "END:VEVENT"
+        assert "RRULE:FREQ=WEEKLY;BYDAY=MO" in lines and "LOCATION:Room R1" in lines
+        assert exporter.ical_event_lines({**entry, "period_type": "break"}, include_breaks=False) == []
+
+
+class TestFeedState:
+
+    def state(self):
+        return FeedState({"_id": "tok"}, '"abc"', datetime(2025, 3, 4, 10, 30, 15, 500))
+
+    def test_if_none_match(self):
+        state = self.state()
+        assert state.not_modified({"if-none-match": '"abc"'})
+        assert state.not_modified({"if-none-match": 'W/"abc", "old"'})
+        assert not state.not_modified({"if-none-match": '"old"',
+                                       "if-modified-since": http_date(datetime(2026, 1, 1))})
+
+    def test_if_modified_since(self):
+        state = self.state()
+        assert state.not_modified({"if-modified-since": http_date(datetime(2025, 3, 4, 10, 30, 15))})
+        assert not state.not_modified({"if-modified-since": http_date(datetime(2025, 3, 4, 10, 30, 14))})
+        assert not state.not_modified({"if-modified-since": "not a date"})
+        assert not state.not_modified({})
+
+    def test_feed_scopes(self):
+        assert feed_scopes("user", "u1", "b1") == [EVENTS_SCOPE]
+        assert feed_scopes("class", "c1", "b1") == [EVENTS_SCOPE, "timetable:class:c1", "timetable:branch:b1"]
+        assert feed_scopes("teacher", "t1", "b1") == ["timetable:teacher:t1", "timetable:branch:b1"]
@@ -0,0 +1,246 @@
+"""
+Collection forecast tests
+Checks the financial rollup deltas, incremental model updates and forecaster syncing
+"""
+
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.decimal128 import Decimal128
+
+from app.utils.financial_rollup import (
+    RollupDelta, RollupTotals, FinancialRollup, META_ID, category_shares, payment_contribution
+)
+from app.utils.collection_forecast import SeasonalRegression, CollectionForecaster, BRANCH_TOTAL, SYNC_OVERLAP, future_days
+
+START = datetime(2025, 1, 6)  # a Monday
+TERMS = [datetime(2025, 1, 6), datetime(2025, 4, 7)]
+
+
+def collections(days):
+    """Weekday pattern with a term-start surge and no noise"""
+    values = []
+    for d in days:
+        value = 0.0 if d.weekday() >= 5 else 1000.0 + 200 * d.weekday()
+        if any(0 <= (d - t).days < 7 for t in TERMS):
+            value += 3000
+        values.append(value)
+    return values
+
+
+def increments(delta, doc_id):
+    return {k: v for k, v in delta.updates[doc_id]["$inc"].items() if v}
+
+
+class TestRollupDelta:
+
+    def test_payment_is_split_across_categories_to_the_cent(self):
+        shares = category_shares([
+            {"fee_category_id": "books", "fee_category_name": "Books", "paid_amount": "100"},
+            {"fee_category_id": "tuition", "fee_category_name": "Tuition", "paid_amount": "200"}
+        ])
+        delta = RollupDelta()
+        delta.add({"branch_id": "b1", "payment_date": datetime(2025, 3, 4, 9), "payment_method": "cash",
+                   "status": "completed", "amount": "100.00", "discount_amount": "10"}, shares)
+
+        tuition = increments(delta, "b1:20250304:cash:tuition")
+        books = increments(delta, "b1:20250304:cash:books")
+        assert (tuition["collected"], books["collected"]) == (Decimal("66.67"), Decimal("33.33"))
+        assert (tuition["discount"], books["discount"]) == (Decimal("6.67"), Decimal("3.33"))
+        # The payment counts once overall, in its largest category, and once per category
+        assert (tuition["payments"], tuition["category_payments"], tuition["statuses.completed.count"]) == (1, 1, 1)
+        assert "payments" not in books and books["category_payments"] == 1
+
+    def test_refund_and_cancel_are_rebooked(self):
+        payment = {"amount": "500", "status": "completed"}
+
+        assert payment_contribution({**payment, "refund_amount": "120"}) == Decimal("380")
+        assert payment_contribution({**payment, "status": "cancelled"}) == 0
+
+        delta = RollupDelta()
+        shares = category_shares([])
+        before = {**payment, "branch_id": "b1", "payment_date": datetime(2025, 3, 4), "payment_method": "card"}
+        delta.add(before, shares, -1)
+        delta.add({**before, "status": "partial_refund", "refund_amount": "120"}, shares)
+        assert increments(delta, "b1:20250304:card:uncategorized") == {
+            "collected": Decimal("-120"), "refunded": Decimal("120"), "refunds": 1,
+            "statuses.completed.amount": Decimal("-500"), "statuses.completed.count": -1,
+            "statuses.partial_refund.amount": Decimal("500"), "statuses.partial_refund.count": 1
+        }
+
+        delta = RollupDelta()
+        delta.add(before, shares, -1)
+        delta.add({**before, "status": "cancelled"}, shares)
+        cancelled = increments(delta, "b1:20250304:card:uncategorized")
+        assert cancelled["amount"] == Decimal("-500") and cancelled["payments"] == -1
+        assert cancelled["statuses.cancelled.count"] == 1
+
+    def test_totals_sum_stored_documents(self):
+        totals = RollupTotals()
+        totals.add({"collected": Decimal128("380"), "amount": Decimal128("500"), "refunded": Decimal128("120"),
+                    "payments": 1, "category_payments": 1, "refunds": 1,
+                    "statuses": {"partial_refund": {"amount": Decimal128("500"), "count": 1}}})
+        totals.add({"amount": Decimal128("0"), "statuses": {"cancelled": {"amount": Decimal128("75"), "count": 1}}})
+        assert (totals["collected"], totals["amount"], totals["payments"]) == (Decimal("380"), Decimal("500"), 1)
+        assert dict(totals.status_counts) == {"partial_refund": 1, "cancelled": 1}
+        assert totals.status_amounts["cancelled"] == Decimal("75")
+
+
+class TestSeasonalRegression:
+
+    def test_incremental_updates_match_a_single_fit(self):
+        days = future_days(START, 140)
+        values = collections(days)
+
+        whole = SeasonalRegression(origin=START)
+        whole.observe(days, values, TERMS)
+
+        stepped = SeasonalRegression(origin=START)
+        stepped.observe(days[:100], [v + 50 for v in values[:100]], TERMS)
+        stepped.revise(days[:100], [v + 50 for v in values[:100]], values[:100], TERMS)
+        stepped.observe(days[100:], values[100:], TERMS)
+
+        assert np.allclose(whole.coefficients, stepped.coefficients)
+        assert np.isclose(whole.residual_variance, stepped.residual_variance, atol=1e-6)
+
+    def test_forecast_follows_weekly_and_term_start_pattern(self):
+        days = future_days(START, 84)
+        noise = np.random.default_rng(7).normal(0, 100, len(days))
+        model = SeasonalRegression(origin=START)
+        model.observe(days, np.array(collections(days)) + noise, TERMS)
+
+        ahead = future_days(datetime(2025, 3, 31), 14)
+        forecast = model.forecast(ahead, TERMS)
+        expected = collections(ahead)
+
+        assert np.allclose(forecast["mean"], expected, atol=250)
+        assert forecast["total_lower"] <= sum(expected) <= forecast["total_upper"]
+
+
+class FakeRollup:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = []
+
+    async def daily_documents(self, branch_ids=None, start=None, end=None, changed_since=None):
+        self.calls.append(changed_since)
+        return [d for d in self.docs if changed_since is None or d["updated_at"] >= changed_since]
+
+
+class FakeTerms:
+    def find(self, *args):
+        async def rows():
+            for start in TERMS:
+                yield {"start_date": start}
+        return rows()
+
+
+class TestCollectionForecaster:
+
+    @pytest.mark.asyncio
+    async def test_sync_reads_only_changes_and_revises_fitted_days(self):
+        written = datetime(2025, 4, 1)
+        days = future_days(START, 84)
+        docs = [
+            {"_id": f"b1:{d:%Y%m%d}:tuition", "branch_id": "b1", "day": d, "fee_category_id": "tuition",
+             "fee_category_name": "Tuition", "collected": Decimal(str(v)), "updated_at": written}
+            for d, v in zip(days, collections(days)) if v
+        ]
+        rollup = FakeRollup(docs)
+        forecaster = CollectionForecaster({"terms": FakeTerms()}, rollup=rollup, clock=lambda: datetime(2025, 3, 31, 12))
+
+        first = await forecaster.forecast(forecast_days=7)
+        branch = first["branches"]["b1"]
+        assert branch["by_fee_category"][0]["fee_category_name"] == "Tuition"
+        assert branch["based_on_days"] == 84
+
+        # A refund booked against an already fitted day arrives as one changed document
+        docs[0] = {**docs[0], "collected": Decimal("0"), "updated_at": written + timedelta(hours=1)}
+        await forecaster.forecast(forecast_days=7)
+
+        assert rollup.calls == [None, written - SYNC_OVERLAP]
+        total = forecaster.series[("b1", BRANCH_TOTAL)]
+        assert total.values[START] == 0.0
+        assert total.model.observations == 84
+
+        # A write stamped before the newest one seen but committed after it is still folded in,
+        # and documents read again in the overlap are not counted twice
+        docs[1] = {**docs[1], "collected": docs[1]["collected"] + 100, "updated_at": written + timedelta(minutes=55)}
+        before = total.values[docs[1]["day"]]
+        await forecaster.forecast(forecast_days=7)
+
+        assert total.values[docs[1]["day"]] == before + 100
+        assert total.values[START] == 0.0
+
+
+class FakeCollection:
+    def __init__(self, db, name, docs=None):
+        self.db, self.name, self.docs = db, name, docs or []
+
+    def find(self, *args, **kwargs):
+        async def rows():
+            for doc in self.docs:
+                yield doc
+        return rows()
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+    async def bulk_write(self, ops, ordered=True):
+        if self.db.fail_writes:
+            raise RuntimeError("write failed")
+        self.docs.extend({**op._filter, **op._doc["$inc"]} for op in ops)
+
+    async def insert_one(self, doc):
+        self.docs.append(doc)
+
+    async def rename(self, new_name, dropTarget=False):
+        self.db.collections[new_name] = self.db.collections.pop(self.name)
+        self.name = new_name
+
+    async def drop(self):
+        self.db.collections.pop(self.name, None)
+
+
+class FakeDatabase:
+    name = "test"
+
+    def __init__(self, payments, fail_writes=False):
+        self.fail_writes = fail_writes
+        self.collections = {"payments": FakeCollection(self, "payments", payments),
+                            "payment_details": FakeCollection(self, "payment_details"),
+                            "financial_daily": FakeCollection(self, "financial_daily", [{"_id": "old"}])}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self, name)
+        return self.collections[name]
+
+
+class TestRollupRebuild:
+
+    def payments(self):
+        return [{"_id": "p1", "branch_id": "b1", "payment_method": "cash", "status": "completed",
+                 "amount": "100.00", "total_amount": "100.00", "payment_date": datetime(2025, 3, 3)}]
+
+    @pytest.mark.asyncio
+    async def test_rebuild_replaces_rollup_and_stamps_meta(self):
+        db = FakeDatabase(self.payments())
+        assert await FinancialRollup(db).rebuild() == 1
+        assert set(db.collections) == {"payments", "payment_details", "financial_daily"}
+        ids = [doc["_id"] for doc in db.collections["financial_daily"].docs]
+        assert "old" not in ids and ids[-1] == META_ID
+
+    @pytest.mark.asyncio
+    async def test_failed_rebuild_keeps_previous_rollup(self):
+        db = FakeDatabase(self.payments(), fail_writes=True)
+        with pytest.raises(RuntimeError):
+            await FinancialRollup(db).rebuild()
+        assert set(db.collections) == {"payments", "payment_details", "financial_daily"}
+        assert db.collections["financial_daily"].docs == [{"_id": "old"}]
@@ -0,0 +1,122 @@
+"""
+Dashboard statistics service tests
+Checks totals built from grouped rows, shared computation and change stream counter updates
+"""
+
+import asyncio
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.dashboard_stats_service import DashboardStatsService
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length):
+        return self.rows
+
+
+class FakeCollection:
+    def __init__(self, db, count=0, rows=None):
+        self.db = db
+        self.count = count
+        self.rows = rows or []
+
+    async def count_documents(self, query):
+        self.db.queries += 1
+        await asyncio.sleep(0)
+        return self.count
+
+    def aggregate(self, pipeline):
+        self.db.queries += 1
+        return FakeCursor(self.rows)
+
+
+class FakeDB:
+    def __init__(self):
+        self.queries = 0
+        self.collections = {
+            "branches": FakeCollection(self, 2),
+            "classes": FakeCollection(self, 12),
+            "teachers": FakeCollection(self, 20),
+            "students": FakeCollection(self, rows=[{
+                "by_status": [{"_id": "Active", "count": 90}, {"_id": "Graduated", "count": 10}],
+                "by_grade": [{"_id": "Grade 1", "count": 60}, {"_id": "Grade 2", "count": 40}],
+                "recent": [{"n": 7}]
+            }]),
+            "registration_payments": FakeCollection(self, rows=[
+                {"_id": "Paid", "count": 30, "amount": 3000.0},
+                {"_id": "Partial", "count": 5, "amount": 250.0},
+                {"_id": "Unpaid", "count": 15, "amount": 0}
+            ]),
+            "fees": FakeCollection(self, rows=[
+                {"_id": "paid", "count": 10, "amount": 500.0},
+                {"_id": "unpaid", "count": 40, "amount": 2000.0}
+            ]),
+            "attendance": FakeCollection(self, rows=[{"_id": "present", "count": 80}])
+        }
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection(self, 3))
+
+
+class TestDashboardStatsService:
+
+    @pytest.mark.asyncio
+    async def test_totals_from_grouped_rows(self):
+        service = DashboardStatsService(FakeDB())
+
+        data = await service.get_dashboard_stats("b1")
+
+        assert data["overview"]["total_students"] == 100
+        assert data["overview"]["active_students"] == 90
+        assert data["financial"]["total_revenue"] == 3750.0
+        assert (data["financial"]["paid_count"], data["financial"]["unpaid_count"],
+                data["financial"]["pending_count"]) == (40, 55, 5)
+        assert data["attendance"] == {"present_today": 80, "absent_today": 10, "attendance_rate": 80 / 90 * 100}
+        assert data["recent_activity"]["total_recent"] == 15
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_computation(self):
+        db = FakeDB()
+        service = DashboardStatsService(db)
+
+        await asyncio.gather(*(service.get_dashboard_stats("b1") for _ in range(50)))
+
+        assert db.queries == 10
+
+    @pytest.mark.asyncio
+    async def test_change_stream_inserts_update_cached_counters(self):
+        db = FakeDB()
+        service = DashboardStatsService(db)
+        await service.get_dashboard_stats("b1")
+
+        service.handle_insert(SimpleNamespace(collection_name="students", full_document={
+            "branch_id": "b1", "status": "Active", "grade_level": "Grade 2", "created_at": datetime.now()
+        }))
+        data = await service.get_dashboard_stats("b1")
+
+        assert data["overview"]["total_students"] == 101
+        assert data["overview"]["recent_registrations"] == 8
+        assert db.queries == 10
+
+        service.handle_change(SimpleNamespace(
+            collection_name="students", event_type=SimpleNamespace(value="update"),
+            updated_fields={"phone": "555"}, branch_id="b1"
+        ))
+        await service.get_dashboard_stats("b1")
+        assert db.queries == 10
+
+        service.handle_change(SimpleNamespace(
+            collection_name="students", event_type=SimpleNamespace(value="update"),
+            updated_fields={"status": "Graduated"}, branch_id="b1"
+        ))
+        await service.get_dashboard_stats("b1")
+        assert db.queries == 20
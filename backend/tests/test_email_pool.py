@@ -0,0 +1,138 @@
+"""
+SMTP connection pool tests
+Checks connection reuse, reconnects and multi-recipient bulk sends
+"""
+
+import smtplib
+import socket
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.email_service import EmailService, SMTPConnectionPool
+
+
+SMTP_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 2525,
+    "username": "",
+    "password": "",
+    "use_tls": False,
+    "from_email": "noreply@school.edu",
+    "from_name": "Spring of Knowledge Hub"
+}
+
+
+class FakeSMTP:
+    """Records sendmail calls; optionally drops the first one like an idle-timed-out server"""
+    instances = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sent = []
+        self.drop_next = False
+        FakeSMTP.instances.append(self)
+
+    def sendmail(self, from_addr, recipients, message):
+        if self.drop_next:
+            self.drop_next = False
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.sent.append(recipients)
+        return {}
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestSMTPConnectionPool:
+
+    def setup_method(self):
+        FakeSMTP.instances = []
+
+    def test_connections_are_reused(self):
+        pool = SMTPConnectionPool(SMTP_CONFIG, size=2, connection_factory=FakeSMTP)
+        for i in range(10):
+            pool.send("noreply@school.edu", [f"parent{i}@example.com"], "body")
+
+        assert pool.stats["connections_opened"] == 1
+        assert pool.stats["messages_sent"] == 10
+
+    def test_reconnects_after_disconnect(self):
+        pool = SMTPConnectionPool(SMTP_CONFIG, size=1, connection_factory=FakeSMTP)
+        pool.send("noreply@school.edu", ["a@example.com"], "body")
+        FakeSMTP.instances[0].drop_next = True
+
+        pool.send("noreply@school.edu", ["b@example.com"], "body")
+
+        assert pool.stats["reconnects"] == 1
+        assert FakeSMTP.instances[1].sent == [["b@example.com"]]
+
+    def test_connection_recycled_after_message_budget(self):
+        pool = SMTPConnectionPool(SMTP_CONFIG, size=1, max_messages_per_connection=3, connection_factory=FakeSMTP)
+        for _ in range(7):
+            pool.send("noreply@school.edu", ["a@example.com"], "body")
+
+        assert pool.stats["connections_opened"] == 3
+
+
+class TestBulkEmail:
+
+    @pytest.mark.asyncio
+    async def test_shared_content_batched_into_multi_recipient_messages(self):
+        FakeSMTP.instances = []
+        service = EmailService()
+        service.provider = "smtp"
+        service.max_recipients_per_message = 50
+        service.smtp_pool = SMTPConnectionPool(SMTP_CONFIG, size=1, connection_factory=FakeSMTP)
+        recipients = [{"email": f"parent{i}@example.com"} for i in range(120)]
+
+        result = await service.send_bulk_email(
+            recipients, "Fee reminder", "<p>Term 2 fees are due</p>",
+            personalization_data={"parent0@example.com": {"name": "Sara"}}
+        )
+
+        assert result == {"sent": 120, "failed": 0, "errors": []}
+        batch_sizes = sorted(len(r) for r in FakeSMTP.instances[0].sent)
+        # One personalized message plus 119 recipients split into 50/50/19
+        assert batch_sizes == [1, 19, 50, 50]
+
+    @pytest.mark.asyncio
+    async def test_bulk_send_against_local_smtp_server(self):
+        controller_module = pytest.importorskip("aiosmtpd.controller")
+
+        received = []
+
+        class Handler:
+            async def handle_DATA(self, server, session, envelope):
+                received.append(envelope.rcpt_tos)
+                return "250 OK"
+
+        port = free_port()
+        controller = controller_module.Controller(Handler(), hostname="127.0.0.1", port=port)
+        controller.start()
+        try:
+            service = EmailService()
+            service.provider = "smtp"
+            service.smtp_config = {**SMTP_CONFIG, "port": port}
+            service.smtp_pool = SMTPConnectionPool(service.smtp_config, size=4)
+            personalization = {f"parent{i}@example.com": {"name": f"P{i}"} for i in range(200)}
+            recipients = [{"email": email} for email in personalization]
+
+            result = await service.send_bulk_email(recipients, "Hi {name}", "<p>Dear {name}</p>", None, personalization)
+            await service.close()
+        finally:
+            controller.stop()
+
+        assert result["sent"] == 200
+        assert len(received) == 200
+        assert service.smtp_pool.stats["connections_opened"] <= 4
@@ -0,0 +1,99 @@
+"""
+Event recurrence tests
+Checks recurrence rules, interval index keys and expansion of recurring events to a query window
+"""
+
+import pytest
+from datetime import datetime
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.event_recurrence import (
+    RecurrenceRule, interval_fields, window_query, expand_event, week_bucket, OPEN_BUCKET
+)
+from app.utils.calendar_export import CalendarExporter
+
+
+def lesson(**overrides):
+    event = {"_id": "e1", "title": "Math", "start_date": datetime(2025, 3, 3, 8), "end_date": datetime(2025, 3, 3, 9),
+             "is_all_day": False, "is_recurring": True, "recurrence_pattern": "FREQ=WEEKLY;BYDAY=MO,WE",
+             "class_ids": ["c1"], "metadata": {"teacher_id": "t1"}}
+    event.update(overrides)
+    return event
+
+
+class TestRecurrenceRule:
+
+    def test_parse_round_trip(self):
+        rule = RecurrenceRule.parse("RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=WE,MO;UNTIL=20250630T000000Z")
+        assert rule.freq == "WEEKLY" and rule.interval == 2 and rule.by_day == (0, 2)
+        assert rule.until == datetime(2025, 6, 30)
+        assert rule.to_string() == "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20250630T000000Z"
+        assert RecurrenceRule.parse("weekly").freq == "WEEKLY"
+        with pytest.raises(ValueError):
+            RecurrenceRule.parse("FREQ=HOURLY")
+
+    def test_occurrences(self):
+        weekly = RecurrenceRule.parse("FREQ=WEEKLY;BYDAY=MO,WE;COUNT=3")
+        assert list(weekly.occurrences(datetime(2025, 3, 3, 8))) == [
+            datetime(2025, 3, 3, 8), datetime(2025, 3, 5, 8), datetime(2025, 3, 10, 8)
+        ]
+        monthly = RecurrenceRule.parse("FREQ=MONTHLY;COUNT=3")
+        # Months without a 31st are skipped and do not count
+        assert list(monthly.occurrences(datetime(2025, 1, 31))) == [
+            datetime(2025, 1, 31), datetime(2025, 3, 31), datetime(2025, 5, 31)
+        ]
+
+
+class TestIntervalIndex:
+
+    def test_single_event_keys(self):
+        event = {"start_date": datetime(2025, 3, 7), "end_date": datetime(2025, 3, 11), "class_ids": ["c1"]}
+        fields = interval_fields(event)
+        first, second = week_bucket(datetime(2025, 3, 7)), week_bucket(datetime(2025, 3, 11))
+        assert second == first + 1
+        assert fields["interval_keys"] == [f"w{first}", f"w{first}:class:c1", f"w{second}", f"w{second}:class:c1"]
+        assert fields["interval_start"] == datetime(2025, 3, 7)
+
+    def test_series_keys_are_open(self):
+        fields = interval_fields(lesson(recurrence_until=datetime(2025, 6, 30)))
+        assert fields["interval_keys"] == [OPEN_BUCKET, f"{OPEN_BUCKET}:class:c1", f"{OPEN_BUCKET}:teacher:t1"]
+        # UNTIL bounds the series; its end is the last possible occurrence start plus a duration
+        assert fields["interval_end"] == datetime(2025, 6, 30, 1)
+
+    def test_window_query_scopes(self):
+        query = window_query(datetime(2025, 3, 3), datetime(2025, 3, 10), ["class:c1"])
+        weekly, series, unindexed = query["$or"]
+        assert weekly["interval_keys"] == {"$in": [f"w{week_bucket(datetime(2025, 3, 3))}:class:c1",
+                                                   f"w{week_bucket(datetime(2025, 3, 10))}:class:c1"]}
+        assert series["interval_keys"] == {"$in": [f"{OPEN_BUCKET}:class:c1"]}
+        assert unindexed["class_ids"] == {"$in": ["c1"]} and unindexed["interval_keys"] is None
+
+
+class TestExpansion:
+
+    def test_expand_skips_exceptions(self):
+        event = lesson(recurrence_exceptions=[datetime(2025, 3, 5, 8)])
+        occurrences = expand_event(event, datetime(2025, 3, 3), datetime(2025, 3, 13))
+        assert [o["start_date"] for o in occurrences] == [
+            datetime(2025, 3, 3, 8), datetime(2025, 3, 10, 8), datetime(2025, 3, 12, 8)
+        ]
+        assert occurrences[1]["end_date"] == datetime(2025, 3, 10, 9)
+        assert occurrences[1]["recurrence_id"] == datetime(2025, 3, 10, 8)
+
+    def test_single_event_is_kept_when_overlapping(self):
+        event = {"start_date": datetime(2025, 3, 1), "end_date": datetime(2025, 3, 4)}
+        assert expand_event(event, datetime(2025, 3, 3), datetime(2025, 3, 10)) == [event]
+        assert expand_event(event, datetime(2025, 3, 5), datetime(2025, 3, 10)) == []
+
+    @pytest.mark.asyncio
+    async def test_ical_series_and_occurrences(self):
+        exporter = CalendarExporter()
+        series = await exporter.format_ical_event(lesson(recurrence_exceptions=[datetime(2025, 3, 5, 8)]))
+        assert "RRULE:FREQ=WEEKLY;BYDAY=MO,WE" in series and "EXDATE:20250305T080000Z" in series
+        occurrence = await exporter.format_ical_event(expand_event(lesson(), datetime(2025, 3, 10),
+                                                                   datetime(2025, 3, 11))[0])
+        assert "UID:e1-20250310T080000@springofknowledgehub.com" in occurrence
+        assert not any(line.startswith("RRULE") for line in occurrence)
@@ -0,0 +1,232 @@
+"""
+Inventory stock engine tests
+Checks guarded decrements under concurrency, outbox journaling, all-or-nothing bulk movements
+and receiving purchase order lines into stock
+"""
+
+import asyncio
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.inventory_stock import (
+    InventoryStockEngine, StockMovement, InsufficientStockError, SupplyNotFoundError, OUTBOX_FIELD
+)
+from app.routers.inventory import resolve_order_lines, item_movements
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if field == f"{OUTBOX_FIELD}._id":
+            ids = {e["_id"] for e in doc.get(OUTBOX_FIELD, [])}
+            wanted = condition["$in"] if isinstance(condition, dict) else [condition]
+            if not ids.intersection(wanted):
+                return False
+        elif field == f"{OUTBOX_FIELD}.0":
+            if not doc.get(OUTBOX_FIELD):
+                return False
+        elif isinstance(condition, dict) and "$gte" in condition:
+            if doc.get(field, 0) < condition["$gte"]:
+                return False
+        elif isinstance(condition, dict) and "$in" in condition:
+            if doc.get(field) not in condition["$in"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+def apply_update(doc, update):
+    for field, n in update.get("$inc", {}).items():
+        doc[field] = doc.get(field, 0) + n
+    doc.update(update.get("$set", {}))
+    for field, value in update.get("$push", {}).items():
+        doc.setdefault(field, []).append(value)
+    for field, condition in update.get("$pull", {}).items():
+        ids = condition["_id"]
+        ids = ids["$in"] if isinstance(ids, dict) else [ids]
+        doc[field] = [e for e in doc.get(field, []) if e["_id"] not in ids]
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeSupplies:
+    """Single-document updates are atomic, as in MongoDB; every call yields to the loop"""
+
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.bulk_writes = 0
+
+    async def find_one(self, query, projection=None):
+        await asyncio.sleep(0)
+        return next((dict(d) for d in self.docs.values() if matches(d, query)), None)
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(d) for d in self.docs.values() if matches(d, query)])
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        await asyncio.sleep(0)
+        doc = next((d for d in self.docs.values() if matches(d, query)), None)
+        if doc is None:
+            return None
+        apply_update(doc, update)
+        return {k: v for k, v in doc.items() if k != OUTBOX_FIELD}
+
+    async def bulk_write(self, ops, ordered=True):
+        self.bulk_writes += 1
+        await asyncio.sleep(0)
+        matched = 0
+        for op in ops:
+            doc = next((d for d in self.docs.values() if matches(d, op._filter)), None)
+            if doc is not None:
+                matched += 1
+                apply_update(doc, op._doc)
+        return type("BulkResult", (), {"matched_count": matched})()
+
+    async def update_many(self, query, update):
+        for doc in self.docs.values():
+            if matches(doc, query):
+                apply_update(doc, update)
+
+
+class FakeTransactions:
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self.docs[doc["_id"]] = doc
+
+
+class FakeCounters:
+    def __init__(self):
+        self.value = 999
+
+    async def next_value(self, key, seed=None, block_size=1):
+        self.value += 1
+        return self.value
+
+    async def allocate_block(self, key, size, seed=None):
+        first = self.value + 1
+        self.value += size
+        return first, self.value
+
+
+def make_engine(*supplies):
+    db = {"supplies": FakeSupplies(list(supplies)), "inventory_transactions": FakeTransactions()}
+    return InventoryStockEngine(db, counters=FakeCounters()), db
+
+
+def supply(quantity, name="Chalk"):
+    return {"_id": ObjectId(), "name": name, "branch_id": "b1", "quantity_in_stock": quantity}
+
+
+class TestInventoryStockEngine:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_decrements_never_oversell(self):
+        chalk = supply(10)
+        engine, db = make_engine(chalk)
+
+        results = await asyncio.gather(
+            *(engine.apply(StockMovement(str(chalk["_id"]), -3), "u1") for _ in range(5)),
+            return_exceptions=True
+        )
+
+        assert sum(not isinstance(r, Exception) for r in results) == 3
+        assert all(isinstance(r, InsufficientStockError) for r in results if isinstance(r, Exception))
+        assert db["supplies"].docs[chalk["_id"]]["quantity_in_stock"] == 1
+        assert len(db["inventory_transactions"].docs) == 3
+
+    @pytest.mark.asyncio
+    async def test_journal_written_and_outbox_cleared(self):
+        chalk = supply(4)
+        engine, db = make_engine(chalk)
+
+        updated = await engine.apply(StockMovement(str(chalk["_id"]), 6, reason="Delivery"), "u1")
+
+        assert updated["quantity_in_stock"] == 10
+        assert OUTBOX_FIELD not in updated
+        [entry] = db["inventory_transactions"].docs.values()
+        assert (entry["transaction_code"], entry["transaction_type"], entry["item_name"]) == ("TXN-001000", "in", "Chalk")
+        assert db["supplies"].docs[chalk["_id"]][OUTBOX_FIELD] == []
+
+    @pytest.mark.asyncio
+    async def test_bulk_failure_rolls_back_applied_movements(self):
+        chalk, paper = supply(5), supply(1, "Paper")
+        engine, db = make_engine(chalk, paper)
+
+        with pytest.raises(InsufficientStockError) as exc:
+            await engine.apply_bulk([
+                StockMovement(str(chalk["_id"]), -2),
+                StockMovement(str(paper["_id"]), -3)
+            ], "u1")
+
+        assert exc.value.supply_id == str(paper["_id"])
+        assert db["supplies"].docs[chalk["_id"]]["quantity_in_stock"] == 5
+        assert db["supplies"].docs[chalk["_id"]][OUTBOX_FIELD] == []
+        assert db["inventory_transactions"].docs == {}
+
+    @pytest.mark.asyncio
+    async def test_bulk_uses_one_write_and_unknown_supply_raises(self):
+        chalk, paper = supply(5), supply(1, "Paper")
+        engine, db = make_engine(chalk, paper)
+
+        entries = await engine.apply_bulk([
+            StockMovement(str(chalk["_id"]), 20),
+            StockMovement(str(paper["_id"]), 20)
+        ], "u1")
+
+        assert db["supplies"].bulk_writes == 1
+        assert [e["transaction_code"] for e in entries] == ["TXN-001000", "TXN-001001"]
+        with pytest.raises(SupplyNotFoundError):
+            await engine.apply(StockMovement(str(ObjectId()), 1), "u1")
+
+    @pytest.mark.asyncio
+    async def test_relay_publishes_stranded_entries(self):
+        entry_id = ObjectId()
+        chalk = supply(5)
+        chalk[OUTBOX_FIELD] = [{"_id": entry_id, "transaction_code": "TXN-000999", "item_id": "x"}]
+        engine, db = make_engine(chalk)
+
+        assert await engine.relay_outbox() == 1
+        assert db["inventory_transactions"].docs[entry_id]["item_name"] == "Chalk"
+        assert db["supplies"].docs[chalk["_id"]][OUTBOX_FIELD] == []
+
+    @pytest.mark.asyncio
+    async def test_purchase_order_lines_are_received_by_supply_name(self):
+        chalk, paper = supply(5), supply(0, name="Paper")
+        engine, db = make_engine(chalk, paper)
+        items = [
+            {"item_name": "Chalk", "quantity": 10, "unit_cost": 2.0, "total_cost": 20.0},
+            {"item_name": "Paper ", "quantity": 4, "unit_cost": 5.0, "total_cost": 20.0}
+        ]
+
+        lines = await resolve_order_lines(items, db["supplies"], "b1")
+        await engine.apply_bulk(item_movements(lines, 1, reason="Received PO-1"), "u1")
+
+        assert db["supplies"].docs[chalk["_id"]]["quantity_in_stock"] == 15
+        assert db["supplies"].docs[paper["_id"]]["quantity_in_stock"] == 4
+        with pytest.raises(HTTPException) as error:
+            await resolve_order_lines(items + [{"item_name": "Ink", "quantity": 1}], db["supplies"], "b1")
+        assert error.value.status_code == 400 and "Ink" in error.value.detail
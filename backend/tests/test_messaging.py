@@ -0,0 +1,171 @@
+"""
+Messaging engine tests
+Checks bulk fan-out, unread counter upkeep and inbox cursors
+"""
+
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from bson import ObjectId
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.messaging import MessagingEngine, encode_inbox_cursor, decode_inbox_cursor
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if field.endswith(".0"):
+            # Only used as {"<array>.0": {"$exists": False}}
+            if bool(doc.get(field[:-2])) != condition["$exists"]:
+                return False
+            continue
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$ne" in condition and (condition["$ne"] in value if isinstance(value, list) else value == condition["$ne"]):
+                return False
+            if "$gt" in condition and not (value or 0) > condition["$gt"]:
+                return False
+        elif isinstance(value, list):
+            if condition not in value:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+        self.calls = []
+
+    async def create_index(self, keys, **kwargs):
+        pass
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls.append("insert_many")
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self.docs[doc["_id"]] = doc
+
+    async def find_one(self, query, projection=None):
+        return next((d for d in self.docs.values() if matches(d, query)), None)
+
+    async def count_documents(self, query):
+        self.calls.append("count_documents")
+        return sum(matches(d, query) for d in self.docs.values())
+
+    async def update_one(self, query, update, upsert=False):
+        doc = await self.find_one(query)
+        if doc is None and upsert:
+            doc = self.docs[query["_id"]] = {"_id": query["_id"], **update.get("$setOnInsert", {})}
+        elif doc is not None:
+            self._apply(doc, update)
+        return SimpleNamespace(modified_count=int(doc is not None and "$setOnInsert" not in update),
+                               matched_count=int(doc is not None))
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        await self.update_one(query, update, upsert=upsert)
+        return dict(await self.find_one(query))
+
+    async def update_many(self, query, update):
+        self.calls.append("update_many")
+        for doc in self.docs.values():
+            if matches(doc, query):
+                self._apply(doc, update)
+
+    @staticmethod
+    def _apply(doc, update):
+        for field, n in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + n
+        doc.update(update.get("$set", {}))
+        for field, value in update.get("$push", {}).items():
+            doc.setdefault(field, []).append(value)
+        for field, value in update.get("$pull", {}).items():
+            doc[field] = [v for v in doc.get(field, []) if v != value]
+
+
+def make_engine():
+    db = {"messages": FakeCollection(), "message_recipients": FakeCollection(),
+          "message_unread_counters": FakeCollection()}
+    return MessagingEngine(db), db
+
+
+class TestMessagingEngine:
+
+    @pytest.mark.asyncio
+    async def test_fan_out_writes_in_bulk_and_skips_duplicates(self):
+        engine, db = make_engine()
+        recipients = [f"parent-{i}" for i in range(2500)] + ["parent-1"]
+
+        delivered = await engine.fan_out("m1", recipients, "grade", datetime.utcnow())
+
+        assert delivered == 2500
+        assert len(db["message_recipients"].docs) == 2500
+        assert db["message_recipients"].calls.count("insert_many") == 3
+
+    @pytest.mark.asyncio
+    async def test_unread_counter_seeded_once_then_maintained(self):
+        engine, db = make_engine()
+        await engine.fan_out("m1", ["u1", "u2"], "individual", datetime.utcnow())
+
+        assert await engine.unread_count("u1") == 1
+        await engine.fan_out("m2", ["u1"], "individual", datetime.utcnow())
+        assert await engine.unread_count("u1") == 2
+        assert db["message_recipients"].calls.count("count_documents") == 1
+
+        row_id = next(d["_id"] for d in db["message_recipients"].docs.values()
+                      if d["recipient_id"] == "u1" and d["message_id"] == "m1")
+        assert await engine.mark_read(row_id, "u1") is True
+        assert await engine.mark_read(row_id, "u1") is False
+        assert await engine.mark_read(row_id, "u2") is None
+        assert await engine.unread_count("u1") == 1
+
+    @pytest.mark.asyncio
+    async def test_delivery_during_seeding_is_not_lost(self):
+        engine, db = make_engine()
+        await engine.fan_out("m1", ["u1"], "individual", datetime.utcnow())
+        recipients = db["message_recipients"]
+        count = recipients.count_documents
+
+        async def count_then_deliver(query):
+            counted = await count(query)
+            if recipients.calls.count("count_documents") == 1:
+                await engine.fan_out("m2", ["u1"], "individual", datetime.utcnow())
+            return counted
+        recipients.count_documents = count_then_deliver
+
+        assert await engine.unread_count("u1") == 2
+        assert recipients.calls.count("count_documents") == 2
+        assert await engine.unread_count("u1") == 2
+
+    @pytest.mark.asyncio
+    async def test_seed_overlapping_a_delivery_does_not_count_it_twice(self):
+        engine, db = make_engine()
+        await engine.fan_out("m1", ["u1"], "individual", datetime.utcnow())
+        assert await engine.unread_count("u1") == 1
+        db["message_unread_counters"].docs["u1"]["verified"] = False
+        recipients = db["message_recipients"]
+        insert_many = recipients.insert_many
+
+        async def insert_then_read(docs, ordered=True):
+            # A read lands after the rows are written but before the counter is bumped
+            await insert_many(docs, ordered=ordered)
+            assert await engine.unread_count("u1") == 2
+        recipients.insert_many = insert_then_read
+
+        await engine.fan_out("m2", ["u1"], "individual", datetime.utcnow())
+
+        assert db["message_unread_counters"].docs["u1"]["unread"] == 2
+        assert await engine.unread_count("u1") == 2
+
+    def test_cursor_round_trip(self):
+        row = {"_id": ObjectId(), "created_at": datetime(2025, 3, 1, 9, 30, 15, 250000)}
+
+        assert decode_inbox_cursor(encode_inbox_cursor(row)) == (row["created_at"], row["_id"])
+        with pytest.raises(ValueError):
+            decode_inbox_cursor("not-a-cursor")
@@ -0,0 +1,72 @@
+"""
+Payment search tests
+Checks search key building, prefix matching and keyset cursors for payment listings
+"""
+
+import pytest
+import re
+from datetime import datetime
+from bson import ObjectId
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.payment_search import (
+    payment_search_keys, payment_search_fields, student_search_keys, prefix_match, SEARCH_KEYS_VERSION, encode_cursor, decode_cursor, after_cursor
+)
+
+
+class TestSearchKeys:
+
+    def test_payment_keys_cover_receipt_reference_and_payer_words(self):
+        keys = payment_search_keys({
+            "receipt_number": "RCP-2025-00042", "payment_reference": " TXN 881 ", "payer_name": "Abebe  Kebede"
+        })
+
+        assert keys == ["rcp-2025-00042", "2025-00042", "00042", "42",
+                        "txn 881", "txn", "881", "abebe kebede", "abebe", "kebede"]
+
+    def test_receipt_sequence_and_remarks_are_searchable(self):
+        keys = payment_search_keys({"receipt_no": "RCP-2025-000123", "remarks": "Paid by uncle"})
+
+        for term in ("000123", "123", "2025-0001", "uncle", "paid by"):
+            assert any(re.match(prefix_match(term)["$regex"], key) for key in keys), term
+        assert payment_search_fields({})["search_keys_version"] == SEARCH_KEYS_VERSION
+
+    def test_student_keys_match_name_prefixes(self):
+        keys = student_search_keys({"student_id": "SCH-2025-00003", "first_name": "Hana",
+                                    "father_name": "Tesfaye", "grandfather_name": "Girma"})
+        pattern = re.compile(prefix_match("  HANA tes")["$regex"])
+
+        assert "sch-2025-00003" in keys
+        assert any(pattern.match(key) for key in keys)
+        assert not any(re.match(prefix_match("girma hana")["$regex"], key) for key in keys)
+
+    def test_prefix_match_escapes_regex_characters(self):
+        assert prefix_match("RCP.2025(") == {"$regex": r"^rcp\.2025\("}
+
+
+class TestCursors:
+
+    def test_cursor_round_trips_position(self):
+        payment = {"_id": ObjectId(), "payment_date": datetime(2025, 3, 4, 10, 30, 15, 123000)}
+
+        assert decode_cursor(encode_cursor(payment)) == (payment["payment_date"], payment["_id"])
+
+    def test_after_cursor_continues_past_ties_and_into_undated_rows(self):
+        payment_id = ObjectId()
+        when = datetime(2025, 3, 4)
+
+        condition = after_cursor(encode_cursor({"_id": payment_id, "payment_date": when}))
+
+        assert condition == {"$or": [
+            {"payment_date": {"$lt": when}},
+            {"payment_date": when, "_id": {"$lt": payment_id}},
+            {"payment_date": None}
+        ]}
+        assert after_cursor(encode_cursor({"_id": payment_id})) == {"payment_date": None, "_id": {"$lt": payment_id}}
+
+    def test_tampered_cursor_is_rejected(self):
+        with pytest.raises(ValueError):
+            decode_cursor("not-a-cursor")
@@ -0,0 +1,103 @@
+"""
+Rate limiter tests
+Uses a controllable clock to check GCRA limits, blocking, policies and cleanup
+"""
+
+import pytest
+from fastapi import HTTPException, Request
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.rate_limit import (
+    RateLimiter, RateLimitPolicy, InMemoryRateLimitBackend, resolve_policy, DEFAULT_POLICY, rate_limit
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_limiter():
+    clock = FakeClock()
+    return RateLimiter(InMemoryRateLimitBackend(shards=8, clock=clock)), clock
+
+
+class TestRateLimiter:
+
+    @pytest.mark.asyncio
+    async def test_burst_then_steady_rate(self):
+        limiter, clock = make_limiter()
+        policy = RateLimitPolicy("api", max_requests=5, window_seconds=10)
+
+        for _ in range(5):
+            assert await limiter.enforce("10.0.0.1", policy)
+        with pytest.raises(HTTPException) as exc:
+            await limiter.enforce("10.0.0.1", policy)
+        assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"] == "2"
+
+        # One emission interval later exactly one more request fits
+        clock.now += 2
+        assert await limiter.enforce("10.0.0.1", policy)
+        with pytest.raises(HTTPException):
+            await limiter.enforce("10.0.0.1", policy)
+
+    @pytest.mark.asyncio
+    async def test_clients_are_independent(self):
+        limiter, _ = make_limiter()
+        policy = RateLimitPolicy("api", max_requests=1, window_seconds=60)
+
+        assert await limiter.enforce("10.0.0.1", policy)
+        assert await limiter.enforce("10.0.0.2", policy)
+
+    @pytest.mark.asyncio
+    async def test_block_after_exceeding(self):
+        limiter, clock = make_limiter()
+
+        for _ in range(5):
+            await limiter.check_rate_limit("10.0.0.1", max_requests=5, window_seconds=60, block_duration_minutes=15)
+        with pytest.raises(HTTPException) as exc:
+            await limiter.check_rate_limit("10.0.0.1", max_requests=5, window_seconds=60, block_duration_minutes=15)
+        assert "blocked for 15 minutes" in exc.value.detail
+
+        # The window has refilled but the block still applies
+        clock.now += 120
+        with pytest.raises(HTTPException) as exc:
+            await limiter.check_rate_limit("10.0.0.1", max_requests=5, window_seconds=60, block_duration_minutes=15)
+        assert exc.value.headers["Retry-After"] == str(900 - 120)
+
+        clock.now += 900
+        assert await limiter.check_rate_limit("10.0.0.1", max_requests=5, window_seconds=60, block_duration_minutes=15)
+
+    @pytest.mark.asyncio
+    async def test_cleanup_drops_decayed_state(self):
+        limiter, clock = make_limiter()
+        policy = RateLimitPolicy("api", max_requests=10, window_seconds=10)
+        for i in range(100):
+            await limiter.enforce(f"10.0.0.{i}", policy)
+        assert len(limiter.backend) == 100
+
+        clock.now += 1
+        await limiter.cleanup_old_entries()
+        assert len(limiter.backend) == 0
+
+    def test_route_policies(self):
+        assert resolve_policy("/users/login").name == "login"
+        assert resolve_policy("/registration-payments/bulk-import/upload").name == "bulk_import"
+        assert resolve_policy("/students/") is DEFAULT_POLICY
+
+    def test_decorator_requires_a_request_parameter(self):
+        with pytest.raises(TypeError):
+            @rate_limit(max_requests=5)
+            async def unthrottled(exam_id: str):
+                pass
+
+        @rate_limit(max_requests=5)
+        async def throttled(exam_id: str, req: Request):
+            pass
@@ -363,9 +363,12 @@ class TestAuditLogging:
             branch_id="branch_1"
         )
         
+        # Events are batched; flush the queue before checking the write
+        await audit_logger.flush()
+        
         # Verify audit log was created
-        audit_logger.collection.insert_one.assert_called_once()
-        call_args = audit_logger.collection.insert_one.call_args[0][0]
+        audit_logger.collection.insert_many.assert_called_once()
+        call_args = audit_logger.collection.insert_many.call_args[0][0][0]
         
         assert call_args["action"] == "read"
         assert call_args["user"]["id"] == "user_1"
@@ -389,9 +392,12 @@ class TestAuditLogging:
             severity=AuditSeverity.CRITICAL
         )
         
+        # Events are batched; flush the queue before checking the write
+        await audit_logger.flush()
+        
         # Verify security event was logged
-        audit_logger.collection.insert_one.assert_called_once()
-        call_args = audit_logger.collection.insert_one.call_args[0][0]
+        audit_logger.collection.insert_many.assert_called_once()
+        call_args = audit_logger.collection.insert_many.call_args[0][0][0]
         
         assert call_args["action"] == "suspicious_activity"
         assert call_args["severity"] == "critical"
@@ -0,0 +1,142 @@
+"""
+Realtime backplane tests
+Simulates several workers sharing an in-memory hub and checks broadcasts cross worker boundaries
+"""
+
+import pytest
+from fastapi.websockets import WebSocketState
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.websocket_manager import WebSocketManager, WebSocketConnection, MessageType
+from app.utils.realtime_bus import (
+    InMemoryHub, InMemoryBackplane, branch_topic, user_topic, topic_matches
+)
+from app.utils.data_sync import SyncEvent, SyncEventType
+
+
+class FakeWebSocket:
+    """Minimal stand-in for a connected Starlette WebSocket"""
+
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+
+async def make_worker(hub):
+    manager = WebSocketManager(None, backplane=InMemoryBackplane(hub))
+    await manager.backplane.start(manager._handle_backplane_message)
+    return manager
+
+
+def attach_client(manager, connection_id, user_id, branch_id, role="parent", resource=None):
+    connection = WebSocketConnection(FakeWebSocket(), connection_id)
+    connection.user_id = user_id
+    connection.branch_id = branch_id
+    connection.user_role = role
+    connection.authenticated = True
+    manager.connections[connection_id] = connection
+    manager.user_connections[user_id].add(connection_id)
+    manager.branch_connections[branch_id].add(connection_id)
+    manager._acquire_bus_topics(connection)
+    if resource:
+        manager.subscriptions[resource].add(connection_id)
+    return connection
+
+
+class TestTopics:
+    """Test topic naming and matching"""
+
+    def test_branch_and_user_topics(self):
+        assert branch_topic("b1") == "branch:b1"
+        assert branch_topic(None) == "branch:global"
+        assert user_topic("u1") == user_topic("u1")
+        assert user_topic("u1").startswith("users:")
+
+    def test_wildcard_matching(self):
+        assert topic_matches({"branch:*"}, "branch:b1")
+        assert topic_matches({"branch:b1"}, "branch:b1")
+        assert not topic_matches({"branch:b1"}, "branch:b2")
+        assert not topic_matches({"branch:*"}, "users:3")
+
+
+class TestCrossWorkerDelivery:
+    """Test that broadcasts reach clients held by other workers"""
+
+    @pytest.mark.asyncio
+    async def test_notification_reaches_other_worker(self):
+        hub = InMemoryHub()
+        worker_a = await make_worker(hub)
+        worker_b = await make_worker(hub)
+        parent = attach_client(worker_b, "c1", "parent-1", "branch-1")
+
+        await worker_a.broadcast_grade_notification(
+            ["parent-1"], {"subject_name": "Math", "grade": "A"}, "Sara"
+        )
+
+        assert len(parent.websocket.sent) == 1
+        assert parent.websocket.sent[0]["type"] == MessageType.NOTIFICATION.value
+        assert worker_b.stats["bus_received"] == 1
+
+    @pytest.mark.asyncio
+    async def test_sync_event_partitioned_by_branch(self):
+        hub = InMemoryHub()
+        worker_a = await make_worker(hub)
+        worker_b = await make_worker(hub)
+        worker_c = await make_worker(hub)
+        same_branch = attach_client(worker_b, "c1", "t-1", "branch-1", "teacher", "students")
+        other_branch = attach_client(worker_c, "c2", "t-2", "branch-2", "teacher", "students")
+
+        event = SyncEvent(
+            event_id="e1",
+            event_type=SyncEventType.UPDATE,
+            collection_name="students",
+            document_id="s1",
+            full_document={"first_name": "Sara"},
+            branch_id="branch-1",
+            correlation_id="token-1"
+        )
+        await worker_a._handle_sync_event(event)
+
+        assert len(same_branch.websocket.sent) == 1
+        assert other_branch.websocket.sent == []
+        # Worker C never subscribed to branch-1, so the hub did not even deliver it
+        assert worker_c.stats["bus_received"] == 0
+
+    @pytest.mark.asyncio
+    async def test_duplicate_change_stream_events_delivered_once(self):
+        hub = InMemoryHub()
+        worker_a = await make_worker(hub)
+        worker_b = await make_worker(hub)
+        client = attach_client(worker_b, "c1", "t-1", "branch-1", "teacher", "students")
+
+        event = SyncEvent(
+            event_id="e1",
+            event_type=SyncEventType.INSERT,
+            collection_name="students",
+            document_id="s1",
+            full_document={"first_name": "Sara"},
+            branch_id="branch-1",
+            correlation_id="token-1"
+        )
+        # Both workers consume the same change stream event
+        await worker_a._handle_sync_event(event)
+        await worker_b._handle_sync_event(event)
+
+        assert len(client.websocket.sent) == 1
+
+    @pytest.mark.asyncio
+    async def test_topics_released_on_disconnect(self):
+        hub = InMemoryHub()
+        worker = await make_worker(hub)
+        attach_client(worker, "c1", "u-1", "branch-1")
+        assert "branch:branch-1" in worker.backplane.topics
+
+        await worker.disconnect_client("c1")
+
+        assert worker.backplane.topics == set()
@@ -0,0 +1,91 @@
+"""
+Result cache tests
+Checks single-flight computation, invalidation during a computation and stale-while-revalidate
+"""
+
+import asyncio
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.result_cache import ResultCache
+
+
+class ManualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingLoader:
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.calls
+
+
+class TestResultCache:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_computation(self):
+        cache = ResultCache(ttl_seconds=30)
+        loader = CountingLoader()
+
+        waiters = [asyncio.ensure_future(cache.get_or_compute(("b1", "overview"), loader)) for _ in range(20)]
+        await asyncio.sleep(0)
+        loader.release.set()
+
+        assert await asyncio.gather(*waiters) == [1] * 20
+        assert await cache.get_or_compute(("b1", "overview"), loader) == 1
+        assert loader.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_invalidation_discards_result_computed_before_write(self):
+        cache = ResultCache(ttl_seconds=30)
+        loader = CountingLoader()
+
+        before_write = asyncio.ensure_future(cache.get_or_compute(("b1", "overview"), loader))
+        await asyncio.sleep(0)
+        cache.invalidate_branch("b1")
+        loader.release.set()
+
+        assert await before_write == 1
+        assert await cache.get_or_compute(("b1", "overview"), loader) == 2
+
+    @pytest.mark.asyncio
+    async def test_branch_invalidation_keeps_other_branches(self):
+        cache = ResultCache(ttl_seconds=30)
+        loader = CountingLoader()
+        loader.release.set()
+        for key in [("b1", "overview"), ("b2", "overview"), (None, "overview")]:
+            await cache.get_or_compute(key, loader)
+
+        cache.invalidate_branch("b1")
+
+        assert cache.get_stats()["entries"] == 1
+        assert await cache.get_or_compute(("b2", "overview"), loader) == 2
+
+    @pytest.mark.asyncio
+    async def test_stale_value_served_while_refreshing(self):
+        clock = ManualClock()
+        cache = ResultCache(ttl_seconds=10, stale_seconds=50, clock=clock)
+        loader = CountingLoader()
+        loader.release.set()
+        await cache.get_or_compute("dashboard", loader)
+
+        clock.now = 15
+        assert await cache.get_or_compute("dashboard", loader) == 1
+        await asyncio.sleep(0)
+        assert await cache.get_or_compute("dashboard", loader) == 2
+
+        clock.now = 100
+        assert await cache.get_or_compute("dashboard", loader) == 3
+        assert cache.get_stats()["stale_hits"] == 1
@@ -0,0 +1,128 @@
+"""
+Streaming security detector tests
+Checks sketch accuracy bounds and that detector state stays bounded under load
+"""
+
+import pytest
+from datetime import datetime, timedelta
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.security_monitor import SecurityPatternDetector, AlertType
+from app.utils.stream_sketches import WindowedCountMinSketch, HyperLogLog, DecayedCounter, LRUState
+
+
+START = datetime(2025, 3, 3, 8, 0, 0)
+
+
+def event(action, user_id="u1", ip="10.0.0.1", success=True, at=START, **extra):
+    doc = {
+        "action": action,
+        "success": success,
+        "timestamp": at,
+        "user": {"id": user_id, "email": f"{user_id}@example.com", "role": "teacher"},
+        "metadata": {"ip_address": ip},
+    }
+    doc.update(extra)
+    return doc
+
+
+class TestStreamSketches:
+
+    def test_windowed_count_min_expires_old_panes(self):
+        sketch = WindowedCountMinSketch(window_seconds=60, panes=4, width=256)
+        for i in range(10):
+            sketch.add("alice", 1000 + i)
+        assert sketch.estimate("alice", 1010) == 10
+        assert sketch.estimate("bob", 1010) == 0
+        assert sketch.estimate("alice", 1000 + 61 + 15) == 0
+
+    def test_count_min_never_undercounts(self):
+        sketch = WindowedCountMinSketch(window_seconds=60, panes=4, width=64, depth=3)
+        truth = {}
+        for i in range(2000):
+            key = f"ip-{i % 300}"
+            truth[key] = truth.get(key, 0) + 1
+            sketch.add(key, 100.0)
+        assert all(sketch.estimate(key, 100.0) >= n for key, n in truth.items())
+
+    def test_hyperloglog_estimates_distinct_items(self):
+        small, large = HyperLogLog(), HyperLogLog(precision=12)
+        for i in range(12):
+            small.add(f"student_{i}")
+            small.add(f"student_{i}")
+        for i in range(50000):
+            large.add(f"record_{i}")
+        assert abs(small.count() - 12) <= 1
+        assert abs(large.count() - 50000) / 50000 < 0.05
+
+    def test_decayed_counter_halves(self):
+        counter = DecayedCounter(half_life=10)
+        counter.add(0)
+        counter.add(0)
+        assert counter.value_at(10) == pytest.approx(1.0)
+
+    def test_lru_state_evicts_least_recent(self):
+        state = LRUState(2, dict)
+        state.get("a")
+        state.get("b")
+        state.get("a")
+        state.get("c")
+        assert list(state.items) == ["a", "c"]
+        assert state.evictions == 1
+
+
+class TestStreamingDetector:
+
+    @pytest.mark.asyncio
+    async def test_brute_force_alert_within_window(self):
+        detector = SecurityPatternDetector(sketch_width=512)
+        alerts = []
+        for i in range(5):
+            alerts += await detector.analyze_event(
+                event("login_failed", success=False, at=START + timedelta(seconds=20 * i))
+            )
+        brute = [a for a in alerts if a.alert_type == AlertType.BRUTE_FORCE]
+        assert len(brute) == 1
+        assert brute[0].evidence["failed_attempts"] == 5
+
+        # Spread beyond the window, the same number of failures is quiet
+        detector = SecurityPatternDetector(sketch_width=512)
+        alerts = []
+        for i in range(5):
+            alerts += await detector.analyze_event(
+                event("login_failed", success=False, at=START + timedelta(minutes=10 * i))
+            )
+        assert not [a for a in alerts if a.alert_type == AlertType.BRUTE_FORCE]
+
+    @pytest.mark.asyncio
+    async def test_bulk_access_needs_distinct_records(self):
+        detector = SecurityPatternDetector(sketch_width=512)
+        alerts = []
+        for i in range(25):
+            alerts += await detector.analyze_event(event(
+                "read", at=START + timedelta(seconds=i),
+                resource={"type": "student", "id": "same-record"}
+            ))
+        assert not alerts
+
+        for i in range(25):
+            alerts += await detector.analyze_event(event(
+                "read", user_id="u2", at=START + timedelta(seconds=i),
+                resource={"type": "student", "id": f"s{i}"}
+            ))
+        bulk = [a for a in alerts if a.alert_type == AlertType.BULK_DATA_ACCESS]
+        assert bulk and bulk[-1].evidence["unique_resources"] >= 10
+
+    @pytest.mark.asyncio
+    async def test_state_is_bounded_by_lru(self):
+        detector = SecurityPatternDetector(max_tracked_users=100, sketch_width=512)
+        before = detector.get_state_stats()["sketch_bytes"]
+        for i in range(5000):
+            await detector.analyze_event(event("read", user_id=f"user{i}", ip=f"10.1.{i // 256}.{i % 256}"))
+        stats = detector.get_state_stats()
+        assert stats["tracked_users"] == 100
+        assert stats["user_evictions"] == 4900
+        assert stats["sketch_bytes"] == before
@@ -0,0 +1,142 @@
+"""
+Sequence counter tests
+Checks that concurrent allocations never repeat and that counters continue after seeded values
+"""
+
+import asyncio
+import pytest
+from datetime import datetime
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.sequence_counters import SequenceCounterService, counter_key
+from app.utils.discipline_codes import DisciplineCodeAllocator
+
+
+class FakeCounterCollection:
+    """In-process stand-in for the counters collection; each call yields to the loop like a round trip"""
+
+    def __init__(self):
+        self.docs = {}
+        self.round_trips = 0
+
+    async def find_one(self, query, projection=None):
+        self.round_trips += 1
+        await asyncio.sleep(0)
+        return self.docs.get(query["_id"])
+
+    async def update_one(self, query, update, upsert=False):
+        self.round_trips += 1
+        await asyncio.sleep(0)
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "value": 0})
+        doc["value"] = max(doc["value"], update["$max"]["value"])
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        self.round_trips += 1
+        await asyncio.sleep(0)
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "value": 0})
+        doc["value"] += update["$inc"]["value"]
+        return dict(doc)
+
+
+class FakeCodeCollection:
+    """A discipline collection holding a few codes; only the queries the allocator makes are supported"""
+
+    def __init__(self, codes=()):
+        self.codes = list(codes)
+
+    async def create_index(self, keys, **kwargs):
+        pass
+
+    async def find_one(self, query, projection=None, sort=None):
+        field, condition = next(iter(query.items()))
+        prefix = condition["$regex"].lstrip("^")
+        matching = sorted(c for c in self.codes if c.startswith(prefix))
+        return {field: matching[-1]} if matching else None
+
+
+def make_service(collection):
+    return SequenceCounterService({"counters": collection})
+
+
+class TestSequenceCounters:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_allocations_are_unique(self):
+        service = make_service(FakeCounterCollection())
+        key = counter_key("receipt", "RCP", "branch-1", 2025)
+
+        values = await asyncio.gather(*(service.next_value(key) for _ in range(200)))
+
+        assert sorted(values) == list(range(1, 201))
+
+    @pytest.mark.asyncio
+    async def test_seed_runs_once_and_numbering_continues(self):
+        collection = FakeCounterCollection()
+        service = make_service(collection)
+        seed_calls = []
+
+        async def last_issued():
+            seed_calls.append(1)
+            return 41
+
+        first = await service.next_value("receipt:RCP:b1:2025", seed=last_issued)
+        second = await service.next_value("receipt:RCP:b1:2025", seed=last_issued)
+
+        assert (first, second) == (42, 43)
+        assert len(seed_calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_seed_never_moves_counter_backwards(self):
+        service = make_service(FakeCounterCollection())
+        await service.seed("inventory:TXN", 1500)
+        await service.seed("inventory:TXN", 1200)
+
+        assert await service.current_value("inventory:TXN") == 1500
+
+    @pytest.mark.asyncio
+    async def test_block_allocation_across_workers(self):
+        collection = FakeCounterCollection()
+        worker_a = make_service(collection)
+        worker_b = make_service(collection)
+
+        values = await asyncio.gather(
+            *(worker_a.next_value("inventory:TXN", block_size=10) for _ in range(25)),
+            *(worker_b.next_value("inventory:TXN", block_size=10) for _ in range(25))
+        )
+
+        assert len(set(values)) == 50
+        # 3 blocks per worker instead of 25 round trips each
+        assert collection.round_trips == 6
+
+
+class TestDisciplineCodeAllocator:
+
+    def make_allocator(self, incident_codes=()):
+        counters = FakeCounterCollection()
+        db = {"incidents": FakeCodeCollection(incident_codes), "behavior_points": FakeCodeCollection()}
+        return DisciplineCodeAllocator(db, counters=make_service(counters)), counters
+
+    @pytest.mark.asyncio
+    async def test_codes_continue_after_existing_and_ignore_old_random_codes(self):
+        allocator, _ = self.make_allocator(["INC482913", "INC-2025-000007"])
+
+        codes = await asyncio.gather(*(allocator.next_code("incident", 2025) for _ in range(3)))
+
+        assert sorted(codes) == ["INC-2025-000008", "INC-2025-000009", "INC-2025-000010"]
+
+    @pytest.mark.asyncio
+    async def test_bulk_assignment_uses_one_counter_update_per_year(self):
+        allocator, counters = self.make_allocator()
+        records = [{"date_awarded": datetime(2023 + i % 2, 5, 1)} for i in range(500)]
+        records.append({"point_code": "BP-2023-000999", "date_awarded": datetime(2023, 1, 1)})
+
+        await allocator.assign_codes("point", records, "date_awarded")
+
+        codes = [r["point_code"] for r in records]
+        assert len(set(codes)) == 501
+        assert codes[:2] == ["BP-2023-000001", "BP-2024-000001"]
+        assert codes[-2:] == ["BP-2024-000250", "BP-2023-000999"]
+        assert sum(1 for _ in counters.docs) == 2
@@ -0,0 +1,118 @@
+"""
+Delta sync protocol tests
+Covers versioning, field projection and delta payloads sent by the WebSocket manager
+"""
+
+import pytest
+from bson import ObjectId
+from fastapi.websockets import WebSocketState
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.websocket_manager import (
+    WebSocketManager, WebSocketConnection, Subscription, SubscriptionType
+)
+from app.utils.sync_delta import DocumentVersionStore, project_delta, build_delta
+from app.utils.data_sync import SyncEvent, SyncEventType
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+
+def subscribe(manager, connection_id, resource, fields=None):
+    connection = WebSocketConnection(FakeWebSocket(), connection_id)
+    connection.authenticated = True
+    connection.user_role = "admin"
+    connection.branch_id = "branch-1"
+    connection.subscriptions["sub-" + connection_id] = Subscription(
+        subscription_id="sub-" + connection_id,
+        client_id=connection_id,
+        subscription_type=SubscriptionType.COLLECTION,
+        resource=resource,
+        filters={},
+        permissions=[],
+        created_at=None,
+        last_activity=None,
+        fields=fields
+    )
+    manager.connections[connection_id] = connection
+    manager.subscriptions[resource].add(connection_id)
+    return connection
+
+
+def update_event(token, updated_fields, removed_fields=None):
+    return SyncEvent(
+        event_id=str(ObjectId()),
+        event_type=SyncEventType.UPDATE,
+        collection_name="students",
+        document_id="s1",
+        full_document={"first_name": "Sara", "documents": ["a.pdf"] * 50},
+        updated_fields=updated_fields,
+        removed_fields=removed_fields,
+        branch_id="branch-1",
+        correlation_id=token
+    )
+
+
+class TestDocumentVersionStore:
+
+    @pytest.mark.asyncio
+    async def test_versions_are_sequential_and_idempotent_per_token(self):
+        store = DocumentVersionStore()
+        assert await store.next_version("students", "s1", "t1") == 1
+        assert await store.next_version("students", "s1", "t1") == 1
+        assert await store.next_version("students", "s1", "t2") == 2
+        assert await store.current_version("students", "s1") == 2
+        assert await store.current_version("students", "s2") == 0
+
+    @pytest.mark.asyncio
+    async def test_replayed_older_token_keeps_its_version(self):
+        store = DocumentVersionStore()
+        for version, token in enumerate(["t1", "t2", "t3"], start=1):
+            assert await store.next_version("students", "s1", token) == version
+
+        # A restarted worker replays the stream from t1
+        assert [await store.next_version("students", "s1", t) for t in ("t1", "t2", "t3")] == [1, 2, 3]
+        assert await store.next_version("students", "s1", "t4") == 4
+
+
+class TestDeltaPayloads:
+
+    def test_project_delta_uses_top_level_fields(self):
+        delta = build_delta({"address.city": "Adama", "phone": "1"}, ["nickname"])
+        projected = project_delta(delta, ["address"])
+        assert projected == {"set": {"address.city": "Adama"}, "unset": []}
+
+    @pytest.mark.asyncio
+    async def test_update_sends_only_changed_fields_with_version(self):
+        manager = WebSocketManager(None)
+        client = subscribe(manager, "c1", "students")
+
+        await manager._handle_sync_event(update_event("t1", {"first_name": "Sara"}))
+        await manager._handle_sync_event(update_event("t2", {"grade": "5"}, ["nickname"]))
+
+        first, second = [m["payload"] for m in client.websocket.sent]
+        assert "data" not in first
+        assert first["delta"] == {"set": {"first_name": "Sara"}, "unset": []}
+        assert (first["version"], first["base_version"]) == (1, 0)
+        assert (second["version"], second["base_version"]) == (2, 1)
+        assert second["delta"]["unset"] == ["nickname"]
+
+    @pytest.mark.asyncio
+    async def test_subscription_field_projection(self):
+        manager = WebSocketManager(None)
+        narrow = subscribe(manager, "c1", "students", fields=["grade"])
+        full = subscribe(manager, "c2", "students")
+
+        await manager._handle_sync_event(update_event("t1", {"first_name": "Sara", "grade": "5"}))
+
+        assert narrow.websocket.sent[0]["payload"]["delta"]["set"] == {"grade": "5"}
+        assert full.websocket.sent[0]["payload"]["delta"]["set"] == {"first_name": "Sara", "grade": "5"}
@@ -0,0 +1,127 @@
+"""
+Timetable occupancy index tests
+Checks in-memory conflict detection for single entries, bulk submissions and full scans
+"""
+
+import time
+import pytest
+from datetime import time as clock_time
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.timetable import ConflictType
+from app.utils.timetable_conflicts import TimetableConflictDetector
+from app.utils.timetable_occupancy import TimetableOccupancyIndex
+
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday"]
+SLOTS = [
+    {"_id": f"slot{p}", "period_number": p, "start_time": clock_time(7 + p), "end_time": clock_time(8 + p),
+     "period_type": "lunch" if p == 5 else "regular"}
+    for p in range(1, 9)
+]
+
+
+def make_index():
+    index = TimetableOccupancyIndex("b1", "2025-2026", SLOTS)
+    index.teacher_names.update({"t1": "Abebe Kebede", "t2": "Sara Tesfaye"})
+    index.class_names.update({"c1": "Grade 7A", "c2": "Grade 7B"})
+    index.subject_names.update({"math": "Mathematics", "art": "Art", "pe": "Physical Education"})
+    return index
+
+
+def entry(class_id="c1", teacher_id="t1", day="monday", period=1, room=None, subject="art", **extra):
+    doc = {
+        "class_id": class_id, "teacher_id": teacher_id, "subject_id": subject, "room_number": room,
+        "day_of_week": day, "time_slot_id": f"slot{period}", "academic_year": "2025-2026",
+        "branch_id": "b1", "resources_needed": []
+    }
+    doc.update(extra)
+    return doc
+
+
+def types(conflicts):
+    return sorted(c.conflict_type.value for c in conflicts)
+
+
+class TestOccupancyIndex:
+
+    def test_bitset_add_remove(self):
+        index = make_index()
+        index.add("e1", entry())
+        assert not index.is_free("teacher", "t1", "monday", "slot1")
+        assert index.is_free("teacher", "t1", "tuesday", "slot1")
+        assert index.occupied_periods("class", "c1", "monday") == [1]
+
+        index.remove("e1")
+        assert index.is_free("teacher", "t1", "monday", "slot1")
+        assert index.masks["teacher"] == {}
+
+    def test_entry_conflicts_without_database(self):
+        detector = TimetableConflictDetector()
+        index = make_index()
+        index.add("e1", entry(room="R1", resources_needed=["projector"]))
+
+        conflicts = detector.check_entry(
+            entry(class_id="c2", room="R1", resources_needed=["projector"]), index
+        )
+
+        assert types(conflicts) == ["resource_overlap", "room_overlap", "teacher_overlap"]
+        teacher = next(c for c in conflicts if c.conflict_type == ConflictType.TEACHER_OVERLAP)
+        assert teacher.affected_entries == ["e1"]
+        assert "Abebe Kebede" in teacher.description
+
+        # Updating the stored entry itself is not a clash
+        assert detector.check_entry(entry(_id="e1", room="R1"), index) == []
+
+    def test_time_constraints(self):
+        detector = TimetableConflictDetector()
+        index = make_index()
+        for period in (1, 2, 3):
+            index.add(f"e{period}", entry(period=period, subject="math" if period == 3 else "art"))
+
+        conflicts = detector.check_entry(entry(period=4, subject="math"), index)
+        descriptions = " ".join(c.description for c in conflicts)
+
+        assert "4 consecutive periods" in descriptions
+        assert "lunch break" in descriptions
+        assert "Heavy subjects scheduled consecutively" in descriptions
+        assert any(c.metadata.get("constraint_type") == "last_period_pe"
+                   for c in detector.check_entry(entry(class_id="c2", teacher_id="t2", period=8, subject="pe"), index))
+
+    @pytest.mark.asyncio
+    async def test_bulk_submission_checks_against_itself(self):
+        detector = TimetableConflictDetector()
+        index = make_index()
+        detector.indexes[("b1", "2025-2026")] = index
+
+        reservation = await detector.validate_bulk([
+            entry(period=2), entry(class_id="c2", period=2), entry(teacher_id="t2", period=3)
+        ], db=None)
+
+        assert [types(c) for c in reservation.conflicts] == [[], ["teacher_overlap"], []]
+        assert reservation.conflicts[1][0].affected_entries == [reservation.pending_id(0)]
+
+        reservation.commit(["id-a", "id-b", "id-c"])
+        assert sorted(index.entries) == ["id-a", "id-b", "id-c"]
+
+    def test_full_scan_of_school_timetable_is_fast(self):
+        detector = TimetableConflictDetector()
+        index = make_index()
+        # 60 classes x 5 days x 8 periods, each class with its own teacher per period
+        for c in range(60):
+            for day in DAYS:
+                for period in range(1, 9):
+                    index.add(f"{c}-{day}-{period}", entry(
+                        class_id=f"class{c}", teacher_id=f"teacher{(c + period) % 60}-{period}",
+                        day=day, period=period, room=f"room{c}"
+                    ))
+        index.add("double-booked", entry(class_id="class0", teacher_id="t9", day="friday", period=8, room="room1"))
+
+        started = time.perf_counter()
+        conflicts = detector.scan_conflicts(index)
+        elapsed = time.perf_counter() - started
+
+        assert types(conflicts) == ["class_overlap", "room_overlap"]
+        assert elapsed < 0.05
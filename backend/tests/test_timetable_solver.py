@@ -0,0 +1,89 @@
+"""
+Timetable solver tests
+Checks generated timetables are conflict-free, respect fixed bookings and stay stable on re-solve
+"""
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.timetable_conflicts import TimetableConflictDetector
+from app.utils.timetable_occupancy import TimetableOccupancyIndex
+from app.utils.timetable_solver import (
+    Lesson, TimetableProblem, solve_timetable, build_timetable_problem
+)
+
+DAYS = ["monday", "tuesday", "wednesday"]
+SLOTS = [{"_id": f"slot{p}", "period_number": p} for p in range(1, 5)]
+
+
+def conflicts_in(problem, solution):
+    index = TimetableOccupancyIndex("b1", "2025-2026", SLOTS)
+    for position, (lesson, placement) in enumerate(zip(problem.lessons, solution.placements)):
+        if placement:
+            index.add(str(position), {"class_id": lesson.class_id, "teacher_id": lesson.teacher_id, **placement})
+    return TimetableConflictDetector().scan_conflicts(index)
+
+
+class TestTimetableSolver:
+
+    def test_tight_week_is_filled_without_conflicts(self):
+        # Two classes share every teacher and need every one of the 12 cells
+        lessons = []
+        for klass in ("c1", "c2"):
+            for subject, teacher in (("math", "t1"), ("english", "t2"), ("science", "t3")):
+                lessons += [Lesson(klass, subject, teacher) for _ in range(4)]
+        problem = TimetableProblem(lessons=lessons, days=DAYS, slots=SLOTS, max_periods_per_subject_per_day=2)
+
+        solution = solve_timetable(problem, time_budget_seconds=5, seed=3)
+
+        assert solution.unplaced == []
+        assert conflicts_in(problem, solution) == []
+
+    def test_room_capacity_and_room_assignment(self):
+        lessons = [Lesson(f"c{i}", "ict", f"t{i}", "computer_lab") for i in range(3) for _ in range(2)]
+        rooms = [{"room_number": "LAB1", "room_type": "computer_lab"}]
+        problem = TimetableProblem(lessons=lessons, days=DAYS, slots=SLOTS, rooms=rooms)
+
+        solution = solve_timetable(problem, time_budget_seconds=2)
+
+        cells = [(p["day_of_week"], p["time_slot_id"]) for p in solution.placements]
+        assert len(set(cells)) == 6
+        assert {p["room_number"] for p in solution.placements} == {"LAB1"}
+
+    def test_problem_from_index_blocks_other_classes_and_warm_starts(self):
+        index = TimetableOccupancyIndex("b1", "2025-2026", SLOTS)
+        # Another class already has t1 on Monday period 1; c1 has math on Tuesday period 2
+        index.add("other", {"class_id": "c9", "teacher_id": "t1", "subject_id": "math",
+                            "day_of_week": "monday", "time_slot_id": "slot1"})
+        index.add("mine", {"class_id": "c1", "teacher_id": "t1", "subject_id": "math",
+                           "day_of_week": "tuesday", "time_slot_id": "slot2"})
+        classes = [{"_id": "c1", "subject_teachers": [{"subject_id": "math", "teacher_id": "t1"}]}]
+
+        problem = build_timetable_problem(classes, index, [], DAYS, subject_periods={"math": 3, "art": 2})
+        solution = solve_timetable(problem, time_budget_seconds=2)
+
+        assert [lesson.subject_id for lesson in problem.lessons] == ["math"] * 3
+        assert problem.fixed_teacher_cells == {"t1": [(0, 0)]}
+        assert ("tuesday", "slot2") in [(p["day_of_week"], p["time_slot_id"]) for p in solution.placements]
+        assert ("monday", "slot1") not in [(p["day_of_week"], p["time_slot_id"]) for p in solution.placements]
+        assert solution.moved_lessons == 0
+
+    def test_unscheduled_subjects_of_solved_classes_stay_fixed(self):
+        index = TimetableOccupancyIndex("b1", "2025-2026", SLOTS)
+        # c1 keeps its music lesson; only math is being scheduled
+        index.add("music", {"class_id": "c1", "teacher_id": "t5", "subject_id": "music",
+                            "day_of_week": "wednesday", "time_slot_id": "slot1", "room_number": "M1"})
+        classes = [{"_id": "c1", "subject_teachers": [{"subject_id": "math", "teacher_id": "t1"}]}]
+
+        problem = build_timetable_problem(classes, index, [], DAYS, subject_periods={"math": 12})
+        solution = solve_timetable(problem, time_budget_seconds=2)
+
+        assert problem.fixed_class_cells == {"c1": [(2, 0)]}
+        assert problem.fixed_teacher_cells == {"t5": [(2, 0)]} and problem.fixed_room_cells == {"M1": [(2, 0)]}
+        assert ("wednesday", "slot1") not in [
+            (p["day_of_week"], p["time_slot_id"]) for p in solution.placements if p
+        ]
+        assert len(solution.unplaced) == 1
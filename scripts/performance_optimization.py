@@ -1,463 +0,0 @@
-#!/usr/bin/env python3
-"""
-Database Performance Optimization Script
-Creates indexes, optimizes queries, and implements caching strategies
-"""
-import asyncio
-import sys
-import json
-from datetime import datetime
-from pathlib import Path
-
-# Add project root to Python path
-project_root = Path(__file__).parent.parent
-sys.path.insert(0, str(project_root))
-
-class DatabaseOptimizer:
-    def __init__(self):
-        self.optimizations = []
-        
-    async def create_database_indexes(self):
-        """Create optimized database indexes"""
-        print("📊 Creating Database Indexes...")
-        
-        # Define indexes for each collection
-        indexes = {
-            "students": [
-                {"fields": ["branch_id", "status"], "name": "branch_status_idx"},
-                {"fields": ["email"], "name": "email_idx", "unique": True},
-                {"fields": ["student_id"], "name": "student_id_idx", "unique": True},
-                {"fields": ["current_class_id"], "name": "class_idx"},
-                {"fields": ["parent_id"], "name": "parent_idx"},
-                {"fields": ["created_at"], "name": "created_date_idx"},
-                {"fields": ["branch_id", "grade_level"], "name": "branch_grade_idx"}
-            ],
-            "teachers": [
-                {"fields": ["branch_id", "status"], "name": "branch_status_idx"},
-                {"fields": ["user_id"], "name": "user_id_idx", "unique": True},
-                {"fields": ["email"], "name": "email_idx", "unique": True},
-                {"fields": ["subjects"], "name": "subjects_idx"},
-                {"fields": ["assigned_classes"], "name": "classes_idx"}
-            ],
-            "classes": [
-                {"fields": ["branch_id"], "name": "branch_idx"},
-                {"fields": ["teacher_id"], "name": "teacher_idx"},
-                {"fields": ["grade_level"], "name": "grade_idx"},
-                {"fields": ["academic_year"], "name": "year_idx"},
-                {"fields": ["branch_id", "grade_level"], "name": "branch_grade_idx"}
-            ],
-            "exams": [
-                {"fields": ["branch_id"], "name": "branch_idx"},
-                {"fields": ["class_id"], "name": "class_idx"},
-                {"fields": ["teacher_id"], "name": "teacher_idx"},
-                {"fields": ["exam_date"], "name": "exam_date_idx"},
-                {"fields": ["status"], "name": "status_idx"},
-                {"fields": ["branch_id", "exam_date"], "name": "branch_date_idx"}
-            ],
-            "exam_results": [
-                {"fields": ["exam_id"], "name": "exam_idx"},
-                {"fields": ["student_id"], "name": "student_idx"},
-                {"fields": ["branch_id"], "name": "branch_idx"},
-                {"fields": ["exam_id", "student_id"], "name": "exam_student_idx", "unique": True},
-                {"fields": ["created_at"], "name": "created_date_idx"}
-            ],
-            "assignments": [
-                {"fields": ["branch_id"], "name": "branch_idx"},
-                {"fields": ["teacher_id"], "name": "teacher_idx"},
-                {"fields": ["class_id"], "name": "class_idx"},
-                {"fields": ["subject_id"], "name": "subject_idx"},
-                {"fields": ["status"], "name": "status_idx"},
-                {"fields": ["due_date"], "name": "due_date_idx"},
-                {"fields": ["assignment_id"], "name": "assignment_id_idx", "unique": True},
-                {"fields": ["branch_id", "status", "due_date"], "name": "branch_status_due_idx"}
-            ],
-            "assignment_submissions": [
-                {"fields": ["assignment_id"], "name": "assignment_idx"},
-                {"fields": ["student_id"], "name": "student_idx"},
-                {"fields": ["branch_id"], "name": "branch_idx"},
-                {"fields": ["status"], "name": "status_idx"},
-                {"fields": ["is_submitted"], "name": "submitted_idx"},
-                {"fields": ["assignment_id", "student_id"], "name": "assignment_student_idx", "unique": True},
-                {"fields": ["submitted_at"], "name": "submitted_date_idx"}
-            ],
-            "payments": [
-                {"fields": ["student_id"], "name": "student_idx"},
-                {"fields": ["branch_id"], "name": "branch_idx"},
-                {"fields": ["status"], "name": "status_idx"},
-                {"fields": ["due_date"], "name": "due_date_idx"},
-                {"fields": ["payment_date"], "name": "payment_date_idx"},
-                {"fields": ["branch_id", "status"], "name": "branch_status_idx"},
-                {"fields": ["academic_year"], "name": "year_idx"}
-            ],
-            "attendance": [
-                {"fields": ["student_id"], "name": "student_idx"},
-                {"fields": ["branch_id"], "name": "branch_idx"},
-                {"fields": ["attendance_date"], "name": "date_idx"},
-                {"fields": ["class_id"], "name": "class_idx"},
-                {"fields": ["student_id", "attendance_date"], "name": "student_date_idx", "unique": True},
-                {"fields": ["branch_id", "attendance_date"], "name": "branch_date_idx"}
-            ],
-            "timetable": [
-                {"fields": ["class_id"], "name": "class_idx"},
-                {"fields": ["teacher_id"], "name": "teacher_idx"},
-                {"fields": ["branch_id"], "name": "branch_idx"},
-                {"fields": ["day_of_week"], "name": "day_idx"},
-                {"fields": ["branch_id", "day_of_week"], "name": "branch_day_idx"}
-            ],
-            "notifications": [
-                {"fields": ["recipient_type"], "name": "recipient_type_idx"},
-                {"fields": ["created_at"], "name": "created_date_idx"},
-                {"fields": ["status"], "name": "status_idx"},
-                {"fields": ["notification_type"], "name": "type_idx"},
-                {"fields": ["scheduled_for"], "name": "scheduled_idx"}
-            ],
-            "notification_recipients": [
-                {"fields": ["user_id"], "name": "user_idx"},
-                {"fields": ["notification_id"], "name": "notification_idx"},
-                {"fields": ["sent_at"], "name": "sent_date_idx"},
-                {"fields": ["read_at"], "name": "read_date_idx"},
-                {"fields": ["user_id", "notification_id"], "name": "user_notification_idx"}
-            ]
-        }
-        
-        index_count = 0
-        for collection, collection_indexes in indexes.items():
-            print(f"  Creating indexes for {collection}...")
-            for index in collection_indexes:
-                # Simulate index creation
-                index_name = index.get("name", "_".join(index["fields"]) + "_idx")
-                unique = index.get("unique", False)
-                
-                self.optimizations.append({
-                    "type": "index",
-                    "collection": collection,
-                    "fields": index["fields"],
-                    "name": index_name,
-                    "unique": unique
-                })
-                
-                index_count += 1
-        
-        print(f"  ✅ Created {index_count} database indexes")
-        return True
-    
-    async def optimize_queries(self):
-        """Optimize common database queries"""
-        print("\n🔍 Optimizing Database Queries...")
-        
-        query_optimizations = [
-            {
-                "query": "Student Dashboard Stats",
-                "optimization": "Use aggregation pipeline with $match first, add compound index on (student_id, status)",
-                "before": "Multiple separate queries",
-                "after": "Single aggregation pipeline"
-            },
-            {
-                "query": "Teacher Class Overview", 
-                "optimization": "Pre-calculate class statistics, use materialized views",
-                "before": "Real-time calculation",
-                "after": "Cached statistics with periodic refresh"
-            },
-            {
-                "query": "Payment Collection Report",
-                "optimization": "Use index on (branch_id, payment_date, status), implement pagination",
-                "before": "Full collection scan",
-                "after": "Index-optimized query with limits"
-            },
-            {
-                "query": "Attendance Percentage",
-                "optimization": "Pre-aggregate attendance data daily, use time-series collections",
-                "before": "Calculate on every request",
-                "after": "Read from pre-calculated aggregates"
-            },
-            {
-                "query": "Exam Results Analysis",
-                "optimization": "Create summary collections with exam statistics",
-                "before": "Complex joins and calculations",
-                "after": "Simple lookups from summary tables"
-            },
-            {
-                "query": "Homework Due Notifications",
-                "optimization": "Index on (due_date, status), batch process notifications",
-                "before": "Scan all assignments",
-                "after": "Index-based query with date range"
-            },
-            {
-                "query": "Parent Portal Data",
-                "optimization": "Denormalize frequently accessed child data",
-                "before": "Multiple collection joins",
-                "after": "Single query with embedded data"
-            }
-        ]
-        
-        for optimization in query_optimizations:
-            print(f"  ✅ {optimization['query']}: {optimization['optimization']}")
-            self.optimizations.append({
-                "type": "query_optimization",
-                "query": optimization["query"],
-                "details": optimization
-            })
-        
-        print(f"  ✅ Optimized {len(query_optimizations)} critical queries")
-        return True
-    
-    async def implement_caching_strategy(self):
-        """Implement caching strategies"""
-        print("\n💾 Implementing Caching Strategies...")
-        
-        caching_strategies = [
-            {
-                "type": "Redis Cache",
-                "data": "User sessions and authentication tokens",
-                "ttl": "24 hours",
-                "strategy": "Write-through cache"
-            },
-            {
-                "type": "Application Cache",
-                "data": "Dashboard statistics and summaries",
-                "ttl": "15 minutes", 
-                "strategy": "Cache-aside with background refresh"
-            },
-            {
-                "type": "Database Query Cache",
-                "data": "Frequently accessed static data (branches, subjects)",
-                "ttl": "1 hour",
-                "strategy": "Read-through cache"
-            },
-            {
-                "type": "API Response Cache",
-                "data": "Class lists, teacher schedules",
-                "ttl": "30 minutes",
-                "strategy": "HTTP cache headers"
-            },
-            {
-                "type": "Static Asset Cache",
-                "data": "Student photos, document attachments",
-                "ttl": "1 day",
-                "strategy": "CDN caching"
-            },
-            {
-                "type": "Computed Results Cache",
-                "data": "Grade calculations, attendance percentages",
-                "ttl": "1 hour",
-                "strategy": "Lazy loading with background updates"
-            }
-        ]
-        
-        for cache in caching_strategies:
-            print(f"  ✅ {cache['type']}: {cache['data']} (TTL: {cache['ttl']})")
-            self.optimizations.append({
-                "type": "caching",
-                "cache_type": cache["type"],
-                "details": cache
-            })
-        
-        print(f"  ✅ Implemented {len(caching_strategies)} caching strategies")
-        return True
-    
-    async def optimize_api_performance(self):
-        """Optimize API performance"""
-        print("\n🚀 Optimizing API Performance...")
-        
-        api_optimizations = [
-            {
-                "endpoint": "/students/",
-                "optimization": "Implement pagination, field selection, response compression",
-                "expected_improvement": "60% faster response times"
-            },
-            {
-                "endpoint": "/dashboard/stats/",
-                "optimization": "Cache computed statistics, use background jobs",
-                "expected_improvement": "80% faster loading"
-            },
-            {
-                "endpoint": "/exams/results/",
-                "optimization": "Pre-aggregate results, implement lazy loading",
-                "expected_improvement": "70% reduction in response time"
-            },
-            {
-                "endpoint": "/homework/assignments/",
-                "optimization": "Index optimization, selective field loading",
-                "expected_improvement": "50% performance improvement"
-            },
-            {
-                "endpoint": "/payments/reports/",
-                "optimization": "Implement streaming responses for large datasets",
-                "expected_improvement": "90% reduction in memory usage"
-            },
-            {
-                "endpoint": "/notifications/",
-                "optimization": "Batch processing, connection pooling",
-                "expected_improvement": "40% faster notifications"
-            }
-        ]
-        
-        for optimization in api_optimizations:
-            print(f"  ✅ {optimization['endpoint']}: {optimization['expected_improvement']}")
-            self.optimizations.append({
-                "type": "api_optimization",
-                "endpoint": optimization["endpoint"],
-                "details": optimization
-            })
-        
-        print(f"  ✅ Optimized {len(api_optimizations)} API endpoints")
-        return True
-    
-    async def setup_monitoring(self):
-        """Setup performance monitoring"""
-        print("\n📈 Setting Up Performance Monitoring...")
-        
-        monitoring_components = [
-            {
-                "component": "Database Performance Monitor",
-                "metrics": ["Query response times", "Index usage", "Connection pool status"],
-                "alerts": ["Slow queries > 2s", "High connection usage > 80%"],
-                "dashboard": "MongoDB performance dashboard"
-            },
-            {
-                "component": "API Response Monitor", 
-                "metrics": ["Response times", "Error rates", "Throughput"],
-                "alerts": ["Response time > 3s", "Error rate > 5%"],
-                "dashboard": "API performance dashboard"
-            },
-            {
-                "component": "System Resource Monitor",
-                "metrics": ["CPU usage", "Memory usage", "Disk I/O"],
-                "alerts": ["CPU > 80%", "Memory > 85%", "Disk usage > 90%"],
-                "dashboard": "System health dashboard"
-            },
-            {
-                "component": "User Experience Monitor",
-                "metrics": ["Page load times", "User sessions", "Feature usage"],
-                "alerts": ["Page load > 5s", "Session errors > 2%"],
-                "dashboard": "User experience dashboard"
-            },
-            {
-                "component": "Cache Performance Monitor",
-                "metrics": ["Cache hit rates", "Cache size", "Eviction rates"],
-                "alerts": ["Hit rate < 80%", "Cache size > 1GB"],
-                "dashboard": "Cache performance dashboard"
-            }
-        ]
-        
-        for monitor in monitoring_components:
-            print(f"  ✅ {monitor['component']}")
-            for metric in monitor['metrics']:
-                print(f"    📊 {metric}")
-            
-            self.optimizations.append({
-                "type": "monitoring",
-                "component": monitor["component"],
-                "details": monitor
-            })
-        
-        print(f"  ✅ Setup {len(monitoring_components)} monitoring components")
-        return True
-    
-    async def run_optimization(self):
-        """Run all optimization tasks"""
-        print("⚡ Spring of Knowledge Hub - Performance Optimization")
-        print("=" * 60)
-        
-        optimization_tasks = [
-            ("Database Indexes", self.create_database_indexes),
-            ("Query Optimization", self.optimize_queries),
-            ("Caching Strategy", self.implement_caching_strategy),
-            ("API Performance", self.optimize_api_performance),
-            ("Performance Monitoring", self.setup_monitoring)
-        ]
-        
-        results = {}
-        overall_success = True
-        
-        for task_name, task_func in optimization_tasks:
-            try:
-                success = await task_func()
-                results[task_name] = {
-                    "success": success,
-                    "status": "COMPLETED" if success else "FAILED"
-                }
-            except Exception as e:
-                print(f"  ❌ {task_name} failed: {e}")
-                results[task_name] = {
-                    "success": False,
-                    "error": str(e),
-                    "status": "ERROR"
-                }
-                overall_success = False
-        
-        # Generate optimization summary
-        print(f"\n📊 OPTIMIZATION SUMMARY")
-        print("=" * 50)
-        
-        for task_name, result in results.items():
-            status = "✅ SUCCESS" if result["success"] else "❌ FAILED"
-            print(f"{task_name}: {status}")
-        
-        total_optimizations = len(self.optimizations)
-        index_count = len([opt for opt in self.optimizations if opt["type"] == "index"])
-        cache_count = len([opt for opt in self.optimizations if opt["type"] == "caching"])
-        query_count = len([opt for opt in self.optimizations if opt["type"] == "query_optimization"])
-        
-        print("=" * 50)
-        print(f"Total Optimizations Applied: {total_optimizations}")
-        print(f"  Database Indexes: {index_count}")
-        print(f"  Query Optimizations: {query_count}")
-        print(f"  Caching Strategies: {cache_count}")
-        print(f"  API Optimizations: {len([opt for opt in self.optimizations if opt['type'] == 'api_optimization'])}")
-        print(f"  Monitoring Components: {len([opt for opt in self.optimizations if opt['type'] == 'monitoring'])}")
-        
-        if overall_success:
-            print("\n🎉 PERFORMANCE OPTIMIZATION COMPLETED!")
-            print("✅ System optimized for production performance")
-            print("📈 Expected improvements:")
-            print("  • 60-80% faster API response times")
-            print("  • 50-70% reduction in database query times")
-            print("  • 40-90% improvement in memory efficiency")
-            print("  • Real-time performance monitoring enabled")
-        else:
-            print("\n⚠️ Some optimization tasks failed")
-            print("❌ Manual intervention required")
-        
-        return overall_success, results
-    
-    def save_optimization_results(self, filename: str = "optimization_results.json"):
-        """Save optimization results"""
-        results_file = project_root / f"scripts/results/{filename}"
-        results_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(results_file, "w") as f:
-            json.dump({
-                "timestamp": datetime.now().isoformat(),
-                "optimizations": self.optimizations,
-                "summary": {
-                    "total_optimizations": len(self.optimizations),
-                    "by_type": {
-                        "indexes": len([opt for opt in self.optimizations if opt["type"] == "index"]),
-                        "queries": len([opt for opt in self.optimizations if opt["type"] == "query_optimization"]),
-                        "caching": len([opt for opt in self.optimizations if opt["type"] == "caching"]),
-                        "api": len([opt for opt in self.optimizations if opt["type"] == "api_optimization"]),
-                        "monitoring": len([opt for opt in self.optimizations if opt["type"] == "monitoring"])
-                    }
-                }
-            }, f, indent=2)
-        
-        return results_file
-
-
-async def main():
-    """Main optimization execution"""
-    optimizer = DatabaseOptimizer()
-    success, results = await optimizer.run_optimization()
-    
-    # Save results
-    results_file = optimizer.save_optimization_results()
-    print(f"\n📄 Results saved to: {results_file}")
-    
-    return success
-
-
-if __name__ == "__main__":
-    success = asyncio.run(main())
-    if not success:
-        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+API Benchmark
+Seeds a synthetic school into a scratch MongoDB database and load-tests the FastAPI app in-process
+
+Needs a MongoDB server to act as the local stand-in (e.g. `docker run -p 27017:27017 mongo:7`);
+each run uses its own `benchmark_*` database and drops it afterwards. Requests go through
+httpx's ASGI transport, so there is no HTTP server or network in the measurement. Startup
+hooks (change streams, websocket manager) are not run.
+
+    python tests/performance/benchmark_api.py --students 5000 --concurrency 16 --output before.json
+    python tests/performance/benchmark_api.py --compare before.json --max-regression 20
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from pymongo import monitoring
+
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root / "backend"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from synthetic_school import SchoolDataset, seed_school
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts commands sent by every client created after registration"""
+
+    def __init__(self):
+        self.commands: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.commands)
+
+
+# name -> function building (path, query params) for one request from the dataset
+RequestFactory = Callable[[SchoolDataset, random.Random], Tuple[str, Dict[str, Any]]]
+
+
+def branch(data: SchoolDataset, rng: random.Random) -> str:
+    return rng.choice(data.branch_ids)
+
+
+def any_class(data: SchoolDataset, rng: random.Random) -> str:
+    return rng.choice(data.class_ids[branch(data, rng)])
+
+
+ENDPOINTS: Dict[str, RequestFactory] = {
+    "students.list": lambda d, r: ("/students/", {"branch_id": branch(d, r), "page": r.randint(1, 20), "limit": 30}),
+    "students.search": lambda d, r: ("/students/", {"branch_id": branch(d, r), "search": r.choice(["Abe", "Hana", "SCH-2024", "Tes"])}),
+    "students.stats": lambda d, r: ("/students/stats", {"branch_id": branch(d, r)}),
+    "stats.dashboard": lambda d, r: ("/stats/dashboard", {"branch_id": branch(d, r)}),
+    "attendance.by_class_day": lambda d, r: ("/attendance/", {
+        "class_id": any_class(d, r),
+        "date": (d.term_start + timedelta(days=r.randint(0, (d.term_end - d.term_start).days))).date().isoformat()
+    }),
+    "attendance.analytics": lambda d, r: ("/attendance/analytics", {"branch_id": branch(d, r), "period_days": 30}),
+    "exam_results.by_exam": lambda d, r: ("/exam-results/", {"exam_id": r.choice(d.exam_ids)}),
+    "payments.list": lambda d, r: ("/payments/", {"branch_id": branch(d, r), "skip": r.choice([0, 0, 100, 500]), "limit": 50}),
+    "payments.search": lambda d, r: ("/payments/", {"branch_id": branch(d, r), "search": f"RCP-2025-{r.randint(1, 999):03d}"}),
+    "payments.dashboard_stats": lambda d, r: ("/payments/dashboard-stats", {"branch_id": branch(d, r)}),
+    "discipline.stats": lambda d, r: ("/discipline/stats", {"branch_id": branch(d, r)}),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_endpoint(client, name: str, factory: RequestFactory, data: SchoolDataset, counter: CommandCounter,
+                       requests: int, concurrency: int, warmup: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(f"{seed}:{name}")
+    plan = [factory(data, rng) for _ in range(warmup + requests)]
+
+    for path, params in plan[:warmup]:
+        await client.get(path, params=params)
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    queue = iter(plan[warmup:])
+
+    async def worker():
+        for path, params in queue:
+            started = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] += 1
+
+    before = counter.snapshot()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    commands = counter.snapshot() - before
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": sum(n for code, n in statuses.items() if code >= 400),
+        "status_codes": {str(code): n for code, n in sorted(statuses.items())},
+        "throughput_rps": round(requests / wall, 1),
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "db_commands_per_request": round(sum(commands.values()) / requests, 2),
+        "db_commands": dict(commands.most_common())
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: Optional[float]) -> bool:
+    """Print per-endpoint changes against a previous run; False if p95 regressed past the limit"""
+    print(f"\n📊 Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp', '?')})")
+    ok = True
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            print(f"  {name:<28} new endpoint")
+            continue
+        p95_change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0.0
+        rps_change = (current["throughput_rps"] - previous["throughput_rps"]) / previous["throughput_rps"] * 100 \
+            if previous["throughput_rps"] else 0.0
+        regressed = max_regression is not None and p95_change > max_regression
+        ok = ok and not regressed
+        print(f"  {'❌' if regressed else '✅'} {name:<26} p95 {previous['p95_ms']:>8.1f} → {current['p95_ms']:>8.1f}ms "
+              f"({p95_change:+.0f}%)  rps {rps_change:+.0f}%  "
+              f"cmds/req {previous['db_commands_per_request']} → {current['db_commands_per_request']}")
+    return ok
+
+
+async def main(args) -> int:
+    counter = CommandCounter()
+    monitoring.register(counter)
+
+    database_name = args.database or f"benchmark_{int(time.time())}"
+    os.environ.update({
+        "MONGODB_URI": args.mongo_url,
+        "MONGODB_DB_NAME": database_name,
+        "USE_MOCK_DB": "false",
+        "ALLOWED_HOSTS": "localhost",
+        "DASHBOARD_STATS_TTL_SECONDS": str(args.cache_ttl),
+        "INVENTORY_ANALYTICS_TTL_SECONDS": str(args.cache_ttl)
+    })
+
+    import httpx
+    from app.main import app
+    from app.db import client as mongo_client, db
+    from app.utils.auth import create_access_token
+
+    try:
+        started = time.perf_counter()
+        data = await seed_school(db, students=args.students, branches=args.branches,
+                                 term_days=args.term_days, seed=args.seed)
+        print(f"🌱 Seeded {database_name} in {time.perf_counter() - started:.1f}s: "
+              + ", ".join(f"{name} {n:,}" for name, n in data.counts.items()))
+
+        token = create_access_token({
+            "sub": "benchmark", "email": "benchmark@example.com", "role": "super_admin", "full_name": "Benchmark"
+        }, expires_delta=timedelta(hours=2))
+        selected = {name: factory for name, factory in ENDPOINTS.items()
+                    if not args.endpoints or any(part in name for part in args.endpoints)}
+
+        results: Dict[str, Any] = {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+            "dataset": data.counts,
+            "endpoints": {}
+        }
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost", timeout=120,
+                                     headers={"Authorization": f"Bearer {token}"}) as client:
+            print(f"⏱️ {args.requests} requests per endpoint at concurrency {args.concurrency}")
+            for name, factory in selected.items():
+                stats = await run_endpoint(client, name, factory, data, counter, args.requests,
+                                           args.concurrency, args.warmup, args.seed)
+                results["endpoints"][name] = stats
+                flag = "✅" if not stats["errors"] else "⚠️"
+                print(f"  {flag} {name:<26} {stats['throughput_rps']:>8.1f} rps  p50 {stats['p50_ms']:>8.1f}  "
+                      f"p95 {stats['p95_ms']:>8.1f}  p99 {stats['p99_ms']:>8.1f}ms  "
+                      f"{stats['db_commands_per_request']:>6} cmds/req  errors {stats['errors']}")
+    finally:
+        # Only scratch databases created by this run are dropped
+        if not args.keep_db and not args.database:
+            await mongo_client.drop_database(database_name)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, default=str))
+        print(f"💾 Results written to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if not compare(results, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--database", help="database to seed and keep (default: a scratch benchmark_<timestamp>)")
+    parser.add_argument("--keep-db", action="store_true", help="keep the scratch database after the run")
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--branches", type=int, default=3)
+    parser.add_argument("--term-days", type=int, default=60, help="school days of attendance to generate")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cache-ttl", type=float, default=30, help="TTL for the app's result caches")
+    parser.add_argument("--endpoints", nargs="*", help="only run endpoints whose name contains one of these")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, help="fail if any p95 grows by more than this percent")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+SMTP Pool Benchmark
+Sends personalized and shared-body bulk email through the pooled SMTP sender to a local server
+"""
+import asyncio
+import socket
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root / "backend"))
+
+from aiosmtpd.controller import Controller
+
+from app.utils.email_service import EmailService, SMTPConnectionPool
+
+RECIPIENTS = 1000
+POOL_SIZE = 4
+
+
+class CountingHandler:
+    def __init__(self):
+        self.messages = 0
+        self.recipients = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        self.recipients += len(envelope.rcpt_tos)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def bench(name: str, port: int, handler: CountingHandler, personalized: bool):
+    service = EmailService()
+    service.provider = "smtp"
+    service.smtp_config = {
+        "host": "127.0.0.1", "port": port, "username": "", "password": "", "use_tls": False,
+        "from_email": "noreply@school.edu", "from_name": "Spring of Knowledge Hub"
+    }
+    service.smtp_pool = SMTPConnectionPool(service.smtp_config, size=POOL_SIZE)
+    recipients = [{"email": f"parent{i}@example.com"} for i in range(RECIPIENTS)]
+    personalization = {r["email"]: {"name": f"P{i}"} for i, r in enumerate(recipients)} if personalized else None
+    handler.messages = handler.recipients = 0
+
+    started = time.perf_counter()
+    result = await service.send_bulk_email(recipients, "Hi {name}", "<p>Dear {name}</p>", None, personalization)
+    elapsed = time.perf_counter() - started
+    await service.close()
+
+    print(f"{name:>14}: {RECIPIENTS / elapsed:>8,.0f} recipients/s  {handler.messages:>5} SMTP messages  "
+          f"sent {result['sent']}/{RECIPIENTS}  connections opened {service.smtp_pool.stats['connections_opened']}")
+
+
+async def main():
+    handler = CountingHandler()
+    port = free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        print(f"⏱️ {RECIPIENTS:,} recipients through a pool of {POOL_SIZE} connections")
+        await bench("personalized", port, handler, personalized=True)
+        await bench("shared body", port, handler, personalized=False)
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,427 +0,0 @@
-#!/usr/bin/env python3
-"""
-Performance Testing Suite
-Tests API response times, database performance, and system scalability
-"""
-import asyncio
-import time
-import statistics
-import json
-# import psutil  # Optional dependency
-from datetime import datetime
-from pathlib import Path
-from typing import Dict, List, Any
-import concurrent.futures
-
-project_root = Path(__file__).parent.parent.parent
-
-class PerformanceTester:
-    def __init__(self):
-        self.results = {}
-        self.api_endpoints = [
-            "/students/",
-            "/teachers/",
-            "/classes/",
-            "/exams/",
-            "/homework/assignments/",
-            "/payments/",
-            "/notifications/",
-            "/dashboard/stats/"
-        ]
-        
-    async def test_api_response_times(self):
-        """Test API endpoint response times"""
-        print("⏱️ Testing API Response Times...")
-        
-        endpoint_results = {}
-        
-        for endpoint in self.api_endpoints:
-            print(f"  Testing {endpoint}...")
-            
-            response_times = []
-            for i in range(10):  # Test each endpoint 10 times
-                start_time = time.time()
-                
-                # Simulate API call
-                await asyncio.sleep(0.05)  # Simulate network latency
-                
-                end_time = time.time()
-                response_times.append((end_time - start_time) * 1000)  # Convert to ms
-            
-            endpoint_results[endpoint] = {
-                "avg_response_time": statistics.mean(response_times),
-                "min_response_time": min(response_times),
-                "max_response_time": max(response_times),
-                "median_response_time": statistics.median(response_times),
-                "std_dev": statistics.stdev(response_times) if len(response_times) > 1 else 0,
-                "samples": len(response_times)
-            }
-            
-            avg_time = endpoint_results[endpoint]["avg_response_time"]
-            status = "✅" if avg_time < 3000 else "⚠️" if avg_time < 5000 else "❌"
-            print(f"    {status} Avg: {avg_time:.2f}ms")
-        
-        self.results["api_response_times"] = endpoint_results
-        
-        # Check if all endpoints meet <3s requirement
-        slow_endpoints = [
-            ep for ep, data in endpoint_results.items() 
-            if data["avg_response_time"] > 3000
-        ]
-        
-        return len(slow_endpoints) == 0, endpoint_results
-    
-    async def test_database_performance(self):
-        """Test database query performance"""
-        print("\n💾 Testing Database Performance...")
-        
-        # Simulate database operations
-        db_tests = {
-            "student_lookup": self._simulate_db_query,
-            "complex_join": self._simulate_complex_query,
-            "bulk_insert": self._simulate_bulk_operation,
-            "aggregate_report": self._simulate_aggregation,
-            "index_scan": self._simulate_index_scan
-        }
-        
-        db_results = {}
-        
-        for test_name, test_func in db_tests.items():
-            print(f"  Testing {test_name}...")
-            
-            times = []
-            for i in range(5):
-                start_time = time.time()
-                await test_func()
-                end_time = time.time()
-                times.append((end_time - start_time) * 1000)
-            
-            avg_time = statistics.mean(times)
-            db_results[test_name] = {
-                "avg_time": avg_time,
-                "min_time": min(times),
-                "max_time": max(times),
-                "samples": len(times)
-            }
-            
-            status = "✅" if avg_time < 1000 else "⚠️" if avg_time < 2000 else "❌"
-            print(f"    {status} Avg: {avg_time:.2f}ms")
-        
-        self.results["database_performance"] = db_results
-        
-        # Check if all queries meet performance requirements
-        slow_queries = [
-            query for query, data in db_results.items()
-            if data["avg_time"] > 2000
-        ]
-        
-        return len(slow_queries) == 0, db_results
-    
-    async def test_concurrent_users(self, user_count: int = 50):
-        """Test system performance with concurrent users"""
-        print(f"\n👥 Testing {user_count} Concurrent Users...")
-        
-        async def simulate_user_session():
-            """Simulate a user session with multiple operations"""
-            operations = [
-                ("login", 0.1),
-                ("dashboard_load", 0.2),
-                ("student_list", 0.15),
-                ("create_assignment", 0.3),
-                ("grade_submission", 0.25),
-                ("logout", 0.05)
-            ]
-            
-            session_times = {}
-            total_time = 0
-            
-            for operation, base_time in operations:
-                start_time = time.time()
-                # Simulate operation with some variance
-                await asyncio.sleep(base_time + (time.time() % 0.1))
-                end_time = time.time()
-                
-                operation_time = (end_time - start_time) * 1000
-                session_times[operation] = operation_time
-                total_time += operation_time
-            
-            return session_times, total_time
-        
-        # Run concurrent user sessions
-        start_time = time.time()
-        
-        tasks = [simulate_user_session() for _ in range(user_count)]
-        results = await asyncio.gather(*tasks)
-        
-        end_time = time.time()
-        total_test_time = end_time - start_time
-        
-        # Analyze results
-        all_session_times = [session_time for _, session_time in results]
-        operation_times = {}
-        
-        for session_ops, _ in results:
-            for op, time_ms in session_ops.items():
-                if op not in operation_times:
-                    operation_times[op] = []
-                operation_times[op].append(time_ms)
-        
-        operation_stats = {}
-        for op, times in operation_times.items():
-            operation_stats[op] = {
-                "avg_time": statistics.mean(times),
-                "max_time": max(times),
-                "min_time": min(times),
-                "p95_time": sorted(times)[int(len(times) * 0.95)] if times else 0
-            }
-        
-        concurrent_results = {
-            "user_count": user_count,
-            "total_test_time": total_test_time,
-            "avg_session_time": statistics.mean(all_session_times),
-            "max_session_time": max(all_session_times),
-            "min_session_time": min(all_session_times),
-            "operations": operation_stats,
-            "throughput": user_count / total_test_time,  # users per second
-            "avg_response_time": statistics.mean([
-                stats["avg_time"] for stats in operation_stats.values()
-            ])
-        }
-        
-        self.results["concurrent_users"] = concurrent_results
-        
-        # Check if system handles load adequately
-        success = (
-            concurrent_results["avg_response_time"] < 5000 and  # <5s under load
-            concurrent_results["throughput"] > 5  # >5 users/second
-        )
-        
-        print(f"  Average session time: {concurrent_results['avg_session_time']:.2f}ms")
-        print(f"  Throughput: {concurrent_results['throughput']:.2f} users/second")
-        print(f"  {'✅' if success else '❌'} Performance under load")
-        
-        return success, concurrent_results
-    
-    async def test_memory_usage(self):
-        """Test system memory usage"""
-        print("\n🧠 Testing Memory Usage...")
-        
-        # Simulate memory usage without psutil
-        print("  Simulating memory-intensive operations...")
-        
-        # Simulate data processing
-        large_data = []
-        for i in range(1000):
-            large_data.append({
-                "id": i,
-                "data": f"test_data_{i}" * 100,
-                "timestamp": datetime.now().isoformat()
-            })
-        
-        # Estimate memory usage
-        estimated_memory_mb = len(large_data) * 0.01  # Rough estimate
-        
-        memory_results = {
-            "estimated_usage_mb": estimated_memory_mb,
-            "data_objects_created": len(large_data),
-            "memory_efficient": estimated_memory_mb < 50,  # Less than 50MB
-            "cleanup_successful": True
-        }
-        
-        # Clean up
-        del large_data
-        
-        self.results["memory_usage"] = memory_results
-        
-        success = memory_results["memory_efficient"]
-        
-        print(f"  Estimated memory usage: {memory_results['estimated_usage_mb']:.2f}MB")
-        print(f"  Data objects created: {memory_results['data_objects_created']}")
-        print(f"  {'✅' if success else '❌'} Memory efficiency")
-        
-        return success, memory_results
-    
-    async def test_data_processing_speed(self):
-        """Test data processing and calculation speed"""
-        print("\n📊 Testing Data Processing Speed...")
-        
-        processing_tests = {
-            "grade_calculation": self._simulate_grade_calculation,
-            "attendance_aggregation": self._simulate_attendance_aggregation,
-            "report_generation": self._simulate_report_generation,
-            "fee_calculation": self._simulate_fee_calculation,
-            "bulk_data_import": self._simulate_bulk_import
-        }
-        
-        processing_results = {}
-        
-        for test_name, test_func in processing_tests.items():
-            print(f"  Testing {test_name}...")
-            
-            start_time = time.time()
-            records_processed = await test_func()
-            end_time = time.time()
-            
-            duration = end_time - start_time
-            processing_speed = records_processed / duration if duration > 0 else 0
-            
-            processing_results[test_name] = {
-                "duration": duration,
-                "records_processed": records_processed,
-                "processing_speed": processing_speed,  # records per second
-                "efficient": processing_speed > 100  # >100 records/second
-            }
-            
-            status = "✅" if processing_results[test_name]["efficient"] else "❌"
-            print(f"    {status} Speed: {processing_speed:.0f} records/second")
-        
-        self.results["data_processing"] = processing_results
-        
-        # Check if all processing tasks are efficient
-        slow_processes = [
-            name for name, data in processing_results.items()
-            if not data["efficient"]
-        ]
-        
-        return len(slow_processes) == 0, processing_results
-    
-    # Simulation methods
-    async def _simulate_db_query(self):
-        """Simulate database query"""
-        await asyncio.sleep(0.05)  # 50ms query
-    
-    async def _simulate_complex_query(self):
-        """Simulate complex database query"""
-        await asyncio.sleep(0.15)  # 150ms complex query
-    
-    async def _simulate_bulk_operation(self):
-        """Simulate bulk database operation"""
-        await asyncio.sleep(0.2)  # 200ms bulk operation
-    
-    async def _simulate_aggregation(self):
-        """Simulate database aggregation"""
-        await asyncio.sleep(0.3)  # 300ms aggregation
-    
-    async def _simulate_index_scan(self):
-        """Simulate index scan"""
-        await asyncio.sleep(0.02)  # 20ms index scan
-    
-    async def _simulate_grade_calculation(self):
-        """Simulate grade calculation"""
-        # Simulate processing 500 student grades
-        await asyncio.sleep(0.1)
-        return 500
-    
-    async def _simulate_attendance_aggregation(self):
-        """Simulate attendance aggregation"""
-        # Simulate processing 1000 attendance records
-        await asyncio.sleep(0.15)
-        return 1000
-    
-    async def _simulate_report_generation(self):
-        """Simulate report generation"""
-        # Simulate generating 100 reports
-        await asyncio.sleep(0.2)
-        return 100
-    
-    async def _simulate_fee_calculation(self):
-        """Simulate fee calculation"""
-        # Simulate calculating fees for 300 students
-        await asyncio.sleep(0.08)
-        return 300
-    
-    async def _simulate_bulk_import(self):
-        """Simulate bulk data import"""
-        # Simulate importing 2000 records
-        await asyncio.sleep(0.5)
-        return 2000
-    
-    async def run_all_performance_tests(self):
-        """Run all performance tests"""
-        print("🚀 Spring of Knowledge Hub - Performance Testing")
-        print("=" * 60)
-        
-        test_results = {}
-        overall_success = True
-        
-        # Run all performance test suites
-        tests = [
-            ("API Response Times", self.test_api_response_times),
-            ("Database Performance", self.test_database_performance),
-            ("Concurrent Users (50)", lambda: self.test_concurrent_users(50)),
-            ("Memory Usage", self.test_memory_usage),
-            ("Data Processing Speed", self.test_data_processing_speed)
-        ]
-        
-        for test_name, test_func in tests:
-            print(f"\n🧪 {test_name}")
-            try:
-                start_time = time.time()
-                success, results = await test_func()
-                end_time = time.time()
-                
-                test_results[test_name] = {
-                    "success": success,
-                    "duration": end_time - start_time,
-                    "results": results
-                }
-                
-                overall_success = overall_success and success
-                
-            except Exception as e:
-                print(f"  ❌ {test_name} failed: {e}")
-                test_results[test_name] = {
-                    "success": False,
-                    "error": str(e)
-                }
-                overall_success = False
-        
-        # Generate performance summary
-        print(f"\n📊 PERFORMANCE TEST SUMMARY")
-        print("=" * 50)
-        
-        for test_name, result in test_results.items():
-            status = "✅ PASS" if result["success"] else "❌ FAIL"
-            duration = result.get("duration", 0)
-            print(f"{test_name}: {status} ({duration:.2f}s)")
-        
-        print("=" * 50)
-        if overall_success:
-            print("🎉 ALL PERFORMANCE TESTS PASSED!")
-            print("✅ System meets performance requirements")
-        else:
-            print("⚠️ Some performance tests failed")
-            print("❌ Performance optimization needed")
-        
-        return overall_success, test_results
-    
-    def save_results(self, filename: str = "performance_results.json"):
-        """Save performance test results"""
-        results_file = project_root / f"tests/results/{filename}"
-        results_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(results_file, "w") as f:
-            json.dump({
-                "timestamp": datetime.now().isoformat(),
-                "results": self.results
-            }, f, indent=2)
-        
-        return results_file
-
-
-async def main():
-    """Main performance test execution"""
-    tester = PerformanceTester()
-    success, results = await tester.run_all_performance_tests()
-    
-    # Save results
-    results_file = tester.save_results()
-    print(f"\n📄 Results saved to: {results_file}")
-    
-    return success
-
-
-if __name__ == "__main__":
-    success = asyncio.run(main())
-    if not success:
-        exit(1)
\ No newline at end of file
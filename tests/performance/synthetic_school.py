@@ -0,0 +1,578 @@
+#!/usr/bin/env python3
+"""
+Synthetic School Dataset
+Generates a deterministic multi-branch school (1k-500k students) and streams it into MongoDB with batched inserts
+
+Every record is derived from the seed, including ObjectIds, so two runs with the same
+arguments produce identical databases. Students carry two hidden traits, engagement and
+family means, that drive their attendance, exam marks, discipline record and how reliably
+and promptly fees are paid, so the data has the correlations real reports look for.
+
+    python tests/performance/synthetic_school.py --students 100000 --database school_100k --drop
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from bson import ObjectId
+
+BATCH_SIZE = 5000
+STUDENT_CHUNK = 500
+CLASS_SIZE = 40
+# Classes that share one teacher per subject
+TEACHER_GROUP = 4
+EPOCH = datetime(1970, 1, 1)
+GRADES = [f"Grade {g}" for g in range(1, 13)]
+SUBJECTS = {
+    # name: periods per week
+    "Mathematics": 6, "English": 5, "Amharic": 5, "Science": 5, "Social Studies": 4,
+    "Physical Education": 3, "Art": 2, "ICT": 3, "Civics": 2
+}
+EXAMS = [("Midterm", 0.45), ("Final", 0.95)]
+DAYS_OF_WEEK = ["monday", "tuesday", "wednesday", "thursday", "friday"]
+PERIODS = 7
+TERMS = 3
+# Tuition per term by grade band, then the yearly and optional fees
+TUITION = {range(1, 5): Decimal("4500"), range(5, 9): Decimal("5200"), range(9, 13): Decimal("6100")}
+OTHER_FEES = [("Registration", Decimal("500"), "one-time"), ("Books", Decimal("900"), "annual"),
+              ("Transportation", Decimal("1800"), "recurring")]
+FIRST_NAMES = ["Abebe", "Almaz", "Bekele", "Chaltu", "Dawit", "Eden", "Fikir", "Genet", "Hana", "Kebede",
+               "Lidya", "Meron", "Nahom", "Ruth", "Samuel", "Tigist", "Yonas", "Zewdu", "Selam", "Mulu",
+               "Abel", "Bethel", "Elias", "Feven", "Hiwot", "Kidus", "Liya", "Mahlet", "Naod", "Saron"]
+FAMILY_NAMES = ["Tesfaye", "Girma", "Alemu", "Haile", "Mekonnen", "Tadesse", "Bekele", "Wolde",
+                "Assefa", "Kebede", "Negash", "Desta", "Gebre", "Mengistu", "Ayele", "Tilahun"]
+PAYMENT_METHODS = ["cash", "cash", "cash", "bank_transfer", "mobile_money", "mobile_money", "card"]
+INCIDENT_TYPES = [("tardiness", "minor", 30), ("disruption", "minor", 25), ("homework", "minor", 15),
+                  ("dress_code", "minor", 10), ("bullying", "major", 8), ("fighting", "major", 7),
+                  ("cheating", "major", 4), ("vandalism", "severe", 1)]
+POSITIVE_CATEGORIES = ["academic", "helpfulness", "leadership", "participation", "respect"]
+
+
+@dataclass
+class SchoolDataset:
+    """Ids of the generated records, for building benchmark requests"""
+    academic_year: str
+    term_start: datetime
+    term_end: datetime
+    branch_ids: List[str] = field(default_factory=list)
+    class_ids: Dict[str, List[str]] = field(default_factory=dict)
+    student_ids: List[str] = field(default_factory=list)
+    exam_ids: List[str] = field(default_factory=list)
+    counts: Dict[str, int] = field(default_factory=dict)
+
+
+def school_days(start: datetime, days: int) -> List[datetime]:
+    """The first `days` weekdays from `start`"""
+    result, day = [], start
+    while len(result) < days:
+        if day.weekday() < 5:
+            result.append(day)
+        day += timedelta(days=1)
+    return result
+
+
+def sigmoid(x: float) -> float:
+    return 1 / (1 + math.exp(-x))
+
+
+def rotations_without_clashes(lessons: List[str], size: int) -> List[int]:
+    """
+    Offsets at which copies of a weekly lesson sequence never put the same subject in the same
+    period, so classes timetabled with them can share a teacher per subject without double-booking
+    """
+    n = len(lessons)
+    safe = {d for d in range(1, n) if all(lessons[p] != lessons[(p + d) % n] for p in range(n))}
+    chosen = [0]
+    for offset in range(1, n):
+        if len(chosen) == size:
+            break
+        if all((offset - c) % n in safe for c in chosen):
+            chosen.append(offset)
+    return chosen
+
+
+def poisson(rng: random.Random, lam: float) -> int:
+    """Knuth's method; fine for the small rates used here"""
+    threshold, k, p = math.exp(-lam), 0, rng.random()
+    while p > threshold:
+        k += 1
+        p *= rng.random()
+    return k
+
+
+class CollectionWriter:
+    """Buffers documents for one collection and hands full batches to concurrent insert_many workers"""
+
+    def __init__(self, collection, workers: int, batch_size: int):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.buffer: List[Dict[str, Any]] = []
+        self.written = 0
+        self.error: Optional[BaseException] = None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+
+    async def _worker(self):
+        while True:
+            batch = await self.queue.get()
+            if batch is None:
+                return
+            try:
+                if self.error is None:
+                    await self.collection.insert_many(batch, ordered=False)
+                    self.written += len(batch)
+            except Exception as e:
+                # Keep draining so the generator never blocks on a full queue; add() reports it
+                self.error = e
+
+    async def add(self, docs: List[Dict[str, Any]]):
+        if self.error is not None:
+            raise self.error
+        self.buffer.extend(docs)
+        while len(self.buffer) >= self.batch_size:
+            batch, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+            # Blocks when the workers fall behind, which bounds memory at any dataset size
+            await self.queue.put(batch)
+
+    async def close(self):
+        if self.buffer:
+            await self.queue.put(self.buffer)
+            self.buffer = []
+        for _ in self.tasks:
+            await self.queue.put(None)
+        await asyncio.gather(*self.tasks)
+        if self.error is not None:
+            raise self.error
+
+
+class SyntheticSchoolGenerator:
+    def __init__(self, db, students: int = 5000, branches: int = 3, days: int = 190, seed: int = 7,
+                 start: datetime = datetime(2025, 9, 8), batch_size: int = BATCH_SIZE, workers: int = 4):
+        self.db = db
+        self.students = students
+        self.branches = branches
+        self.seed = seed
+        self.batch_size = batch_size
+        self.workers = workers
+        self.rng = random.Random(seed)
+        self.days = school_days(start, days)
+        self.academic_year = f"{start.year}-{start.year + 1}"
+        self.term_starts = [self.days[len(self.days) * t // TERMS] for t in range(TERMS)]
+        # School-wide absence pressure per day (Mondays, Fridays and a flu wave mid-year), kept as
+        # exp(-pressure) so a student's daily absence odds are one multiply away
+        self.day_pressure = [
+            math.exp(-((0.3 if day.weekday() in (0, 4) else 0.0)
+                       + 0.8 * math.exp(-((i - len(self.days) * 0.55) / 8) ** 2)))
+            for i, day in enumerate(self.days)
+        ]
+        # Per-day values shared by every attendance record: ObjectId time prefix, term and record time
+        self.day_fields = [
+            (struct.pack(">I", int((day - EPOCH).total_seconds())),
+             f"Term {min(TERMS, i * TERMS // len(self.days) + 1)}", day + timedelta(hours=8))
+            for i, day in enumerate(self.days)
+        ]
+        self.writers: Dict[str, CollectionWriter] = {}
+        self.class_teachers: Dict[str, Dict[str, str]] = {}
+        # Per-year sequences for student ids and discipline codes, in the formats the app issues
+        self.sequences: Dict[str, int] = {}
+        self.dataset = SchoolDataset(academic_year=self.academic_year, term_start=self.days[0], term_end=self.days[-1])
+
+    def oid(self, at: datetime) -> ObjectId:
+        """ObjectId carrying `at` as its timestamp and seeded random bytes, so _id order follows time"""
+        return ObjectId(struct.pack(">I", int((at - EPOCH).total_seconds())) + self.rng.getrandbits(64).to_bytes(8, "big"))
+
+    def code(self, prefix: str, year: int, width: int = 6) -> str:
+        key = f"{prefix}-{year}"
+        self.sequences[key] = self.sequences.get(key, 0) + 1
+        return f"{key}-{self.sequences[key]:0{width}d}"
+
+    async def emit(self, collection: str, docs: List[Dict[str, Any]]):
+        writer = self.writers.get(collection)
+        if writer is None:
+            workers = self.workers if collection == "attendance" else max(1, self.workers // 2)
+            writer = self.writers[collection] = CollectionWriter(self.db[collection], workers, self.batch_size)
+        await writer.add(docs)
+
+    async def run(self, progress: Optional[Callable[[int], None]] = None) -> SchoolDataset:
+        await self._reference_data()
+        for first in range(0, self.students, STUDENT_CHUNK):
+            for n in range(first, min(first + STUDENT_CHUNK, self.students)):
+                await self._student(n)
+            if progress:
+                progress(min(first + STUDENT_CHUNK, self.students))
+        # Written last so current_enrollment reflects the generated students
+        await self.emit("classes", [klass for classes in self.classes.values() for klass in classes])
+        await asyncio.gather(*(writer.close() for writer in self.writers.values()))
+        self.dataset.counts = {name: writer.written for name, writer in self.writers.items()}
+        return self.dataset
+
+    async def _reference_data(self):
+        created = self.days[0] - timedelta(days=60)
+        sections = max(1, math.ceil(self.students / self.branches / len(GRADES) / CLASS_SIZE))
+
+        grade_levels = [{"_id": self.oid(created), "grade": grade, "name": grade, "order": i + 1,
+                         "created_at": created} for i, grade in enumerate(GRADES)]
+        subjects = [{"_id": self.oid(created), "subject_name": name, "subject_code": name[:4].upper(),
+                     "periods_per_week": periods, "created_at": created} for name, periods in SUBJECTS.items()]
+        time_slots = [{"_id": self.oid(created), "period_number": p, "start_time": f"{7 + p}:00",
+                       "end_time": f"{7 + p}:45", "period_type": "regular", "is_break": False,
+                       "created_at": created} for p in range(1, PERIODS + 1)]
+        await self.emit("grade_levels", grade_levels)
+        await self.emit("subjects", subjects)
+        await self.emit("time_slots", time_slots)
+
+        self.branch_docs, self.classes, self.fees = [], {}, {}
+        self.exams_by_class: Dict[str, List[Tuple[str, str, int, datetime]]] = {}
+        for b in range(self.branches):
+            branch_id = self.oid(created)
+            self.dataset.branch_ids.append(str(branch_id))
+            self.branch_docs.append({"_id": branch_id, "name": f"Branch {b + 1}", "address": f"{b + 1} School Road",
+                                     "is_active": True, "created_at": created})
+            await self._branch(str(branch_id), sections, subjects, time_slots, created)
+        await self.emit("branches", self.branch_docs)
+
+    async def _branch(self, branch_id: str, sections: int, subjects, time_slots, created: datetime):
+        rng = self.rng
+        # Fee categories: tuition per grade band plus registration, books and optional transport
+        fees = {}
+        for grades, amount in TUITION.items():
+            fees[("Tuition", grades.start)] = {
+                "_id": self.oid(created), "name": f"Tuition Grades {grades.start}-{grades.stop - 1}",
+                "amount": str(amount), "fee_type": "recurring", "frequency": "quarterly",
+                "academic_year_id": self.academic_year, "late_fee_percentage": "5", "late_fee_grace_days": 7,
+                "discount_eligible": True, "is_active": True, "branch_id": branch_id, "created_at": created
+            }
+        for name, amount, fee_type in OTHER_FEES:
+            fees[(name, 0)] = {
+                "_id": self.oid(created), "name": name, "amount": str(amount), "fee_type": fee_type,
+                "frequency": {"recurring": "quarterly"}.get(fee_type, fee_type),
+                "academic_year_id": self.academic_year, "late_fee_percentage": "0", "late_fee_grace_days": 0,
+                "discount_eligible": False, "is_active": True, "branch_id": branch_id, "created_at": created
+            }
+        self.fees[branch_id] = fees
+        await self.emit("fee_categories", list(fees.values()))
+
+        # Classes come in groups sharing a teacher per subject; the timetables within a group are
+        # offsets of one weekly sequence chosen so those teachers are never double-booked
+        subject_ids = {sub["subject_name"]: str(sub["_id"]) for sub in subjects}
+        # Striding through the subjects' periods by a week's day plus one spreads each subject over the week
+        order = rng.sample(list(SUBJECTS), len(SUBJECTS))
+        blocks = [name for name in order for _ in range(SUBJECTS[name])]
+        lessons = [blocks[(p * (PERIODS + 1)) % len(blocks)] for p in range(len(blocks))]
+        offsets = rotations_without_clashes(lessons, TEACHER_GROUP)
+        teachers, timetable, classes = [], [], []
+        group_teachers: Dict[str, str] = {}
+        for g, grade in enumerate(GRADES):
+            for s in range(sections):
+                if len(classes) % len(offsets) == 0:
+                    group_teachers = {}
+                    for name in SUBJECTS:
+                        first, family = rng.choice(FIRST_NAMES), rng.choice(FAMILY_NAMES)
+                        teacher = {
+                            "_id": self.oid(created), "first_name": first, "last_name": family,
+                            "email": f"{first.lower()}.{family.lower()}.{len(teachers)}@school.example",
+                            "subjects": [name], "branch_id": branch_id, "status": "active", "created_at": created
+                        }
+                        teachers.append(teacher)
+                        group_teachers[name] = str(teacher["_id"])
+                offset = offsets[len(classes) % len(offsets)]
+                class_id = self.oid(created)
+                section = f"{chr(65 + s % 26)}{s // 26 or ''}"
+                classes.append({
+                    "_id": class_id, "class_name": f"{grade} - Section {section}",
+                    "grade_level": grade, "section": section, "branch_id": branch_id,
+                    "max_capacity": CLASS_SIZE + 5, "current_enrollment": 0,
+                    "academic_year": self.academic_year, "created_at": created
+                })
+                self.class_teachers[str(class_id)] = group_teachers
+
+                for position in range(len(DAYS_OF_WEEK) * PERIODS):
+                    name = lessons[(position + offset) % len(lessons)]
+                    timetable.append({
+                        "_id": self.oid(created), "class_id": str(class_id), "subject_id": subject_ids[name],
+                        "teacher_id": group_teachers[name], "room_number": f"R{g + 1:02d}{s:03d}",
+                        "day_of_week": DAYS_OF_WEEK[position // PERIODS],
+                        "time_slot_id": str(time_slots[position % PERIODS]["_id"]),
+                        "academic_year": self.academic_year, "is_recurring": True, "branch_id": branch_id,
+                        "created_at": created
+                    })
+
+                exams = []
+                for subject in subjects:
+                    for exam_name, when in EXAMS:
+                        for term in range(TERMS):
+                            exam_date = self.days[min(len(self.days) - 1,
+                                                      int(len(self.days) * (term + when) / TERMS))]
+                            exams.append({
+                                "_id": self.oid(exam_date - timedelta(days=14)),
+                                "name": f"{subject['subject_name']} {exam_name} T{term + 1}",
+                                "subject_id": str(subject["_id"]), "subject": subject["subject_name"],
+                                "class_id": str(class_id), "branch_id": branch_id, "total_marks": 100,
+                                "passing_marks": 50, "exam_date": exam_date, "term": f"Term {term + 1}",
+                                "academic_year": self.academic_year, "created_at": exam_date - timedelta(days=14)
+                            })
+                # (exam id, subject, pass mark, graded on) for generating results
+                self.exams_by_class[str(class_id)] = [
+                    (str(e["_id"]), e["subject"], e["passing_marks"], e["exam_date"] + timedelta(days=4)) for e in exams
+                ]
+                self.dataset.exam_ids.extend(str(e["_id"]) for e in exams)
+                await self.emit("exams", exams)
+
+        self.classes[branch_id] = classes
+        self.dataset.class_ids[branch_id] = [str(c["_id"]) for c in classes]
+        await self.emit("teachers", teachers)
+        await self.emit("timetable_entries", timetable)
+
+    async def _student(self, n: int):
+        rng, days = self.rng, self.days
+        branch_id = self.dataset.branch_ids[n % self.branches]
+        klass = rng.choice(self.classes[branch_id])
+        klass["current_enrollment"] += 1
+        class_id = str(klass["_id"])
+        teachers = self.class_teachers[class_id]
+        grade_number = GRADES.index(klass["grade_level"]) + 1
+        engagement, means = rng.gauss(0, 1), rng.gauss(0, 1)
+
+        admitted = days[0] - timedelta(days=rng.randint(1, 365 * min(grade_number, 6)))
+        student_oid = self.oid(admitted)
+        student_id = str(student_oid)
+        self.dataset.student_ids.append(student_id)
+        first, father, grandfather = rng.choice(FIRST_NAMES), rng.choice(FIRST_NAMES), rng.choice(FAMILY_NAMES)
+        takes_transport = rng.random() < 0.2 + 0.2 * sigmoid(means)
+        await self.emit("students", [{
+            "_id": student_oid, "student_id": self.code("SCH", admitted.year, width=5),
+            "first_name": first, "father_name": father, "grandfather_name": grandfather,
+            "gender": rng.choice(["Male", "Female"]), "grade_level": klass["grade_level"],
+            "class_id": class_id, "branch_id": branch_id,
+            "status": "Active" if rng.random() < 0.96 else rng.choice(["Inactive", "Transferred Out"]),
+            "phone": f"+2519{rng.randint(10000000, 99999999)}",
+            "date_of_birth": datetime(days[0].year - 6 - grade_number, rng.randint(1, 12), rng.randint(1, 28)),
+            "uses_transportation": takes_transport,
+            "admission_date": admitted, "created_at": admitted, "updated_at": admitted
+        }])
+
+        # Attendance: low engagement raises absence; school-wide pressure moves everyone together
+        base = -3.2 - 0.7 * engagement
+        odds, late_rate = math.exp(-base), sigmoid(base - 0.4)
+        random_float, random_bits = rng.random, rng.getrandbits
+        recorded_by, academic_year = teachers["Mathematics"], self.academic_year
+        attendance, absences = [], 0
+        for day, pressure, (prefix, term, recorded_at) in zip(days, self.day_pressure, self.day_fields):
+            roll = random_float()
+            absent = 1 / (1 + odds * pressure)
+            if roll < absent:
+                status = "excused" if random_float() < 0.25 else "absent"
+                absences += 1
+            elif roll < absent + late_rate:
+                status = "late"
+                absences += 1
+            else:
+                status = "present"
+            attendance.append({
+                "_id": ObjectId(prefix + random_bits(64).to_bytes(8, "big")), "student_id": student_id,
+                "class_id": class_id, "branch_id": branch_id, "attendance_date": day, "status": status,
+                "academic_year": academic_year, "term": term, "recorded_by": recorded_by, "created_at": recorded_at
+            })
+        await self.emit("attendance", attendance)
+
+        await self._fees(student_id, branch_id, grade_number, means, takes_transport, father, grandfather)
+        await self._exam_results(student_id, class_id, branch_id, engagement, absences / len(days))
+        await self._discipline(student_id, class_id, branch_id, teachers, engagement)
+
+    async def _fees(self, student_id: str, branch_id: str, grade_number: int, means: float,
+                    takes_transport: bool, father: str, grandfather: str):
+        rng, fees = self.rng, self.fees[branch_id]
+        reliability = sigmoid(1.2 + 1.1 * means)
+        registration_status = "Paid" if rng.random() < reliability + 0.1 else rng.choice(["Partial", "Unpaid"])
+        registered_on = self.days[0] - timedelta(days=rng.randint(1, 30))
+        await self.emit("registration_payments", [{
+            "_id": self.oid(registered_on), "student_id": student_id, "branch_id": branch_id,
+            "payment_status": registration_status, "total_amount": 500.0,
+            "amount_paid": {"Paid": 500.0, "Partial": 250.0}.get(registration_status, 0.0),
+            "payment_date": registered_on, "academic_year": self.academic_year, "created_at": registered_on
+        }])
+
+        tuition = next(fee for (name, band), fee in fees.items()
+                       if name == "Tuition" and grade_number in range(band, band + 4))
+        payments, details = [], []
+        for term, term_start in enumerate(self.term_starts):
+            if rng.random() > reliability:
+                continue
+            lines = [tuition] + ([fees[("Books", 0)]] if term == 0 else []) \
+                + ([fees[("Transportation", 0)]] if takes_transport else [])
+            delay = int(rng.expovariate(1 / (2 + 25 * (1 - reliability))))
+            paid_on = term_start + timedelta(days=delay, hours=rng.randint(8, 16), minutes=rng.randint(0, 59))
+            late = delay > 14
+            method = rng.choice(PAYMENT_METHODS)
+            payment_id = self.oid(paid_on)
+            total = Decimal(0)
+            for fee in lines:
+                original = Decimal(fee["amount"])
+                late_fee = (original * Decimal(fee["late_fee_percentage"]) / 100) if late else Decimal(0)
+                total += original + late_fee
+                details.append({
+                    "_id": self.oid(paid_on), "payment_id": str(payment_id), "fee_category_id": str(fee["_id"]),
+                    "fee_category_name": fee["name"], "original_amount": str(original), "discount_amount": "0",
+                    "tax_amount": "0", "late_fee_amount": str(late_fee), "paid_amount": str(original + late_fee),
+                    "quantity": 1, "unit_price": str(original), "branch_id": branch_id, "created_at": paid_on
+                })
+            payments.append({
+                "_id": payment_id, "student_id": student_id, "payment_date": paid_on,
+                "amount": str(total), "total_amount": str(total), "discount_amount": "0", "tax_amount": "0",
+                "late_fee_amount": str(sum((Decimal(d["late_fee_amount"]) for d in details[-len(lines):]), Decimal(0))),
+                "payment_method": method, "payment_reference": None if method == "cash" else f"TX{rng.randint(10 ** 9, 10 ** 10 - 1)}",
+                "status": "completed" if method == "cash" or rng.random() < 0.97 else "pending",
+                "verification_status": "verified" if method != "cash" else "unverified",
+                "payer_name": f"{father} {grandfather}", "payer_phone": f"+2519{rng.randint(10000000, 99999999)}",
+                "academic_year": self.academic_year, "semester": f"Term {term + 1}", "branch_id": branch_id,
+                "created_at": paid_on, "updated_at": paid_on
+            })
+        if payments:
+            await self.emit("payments", payments)
+            await self.emit("payment_details", details)
+
+    async def _exam_results(self, student_id: str, class_id: str, branch_id: str, engagement: float,
+                            absence_rate: float):
+        rng = self.rng
+        ability = 66 + 9 * engagement - 60 * absence_rate
+        strengths = {subject: rng.gauss(0, 6) for subject in SUBJECTS}
+        results = []
+        for exam_id, subject, passing_marks, graded_at in self.exams_by_class[class_id]:
+            sat = rng.random() > absence_rate
+            marks = max(0.0, min(100.0, round(rng.gauss(ability + strengths[subject], 7), 1))) if sat else 0.0
+            results.append({
+                "_id": self.oid(graded_at), "exam_id": exam_id, "student_id": student_id,
+                "class_id": class_id, "branch_id": branch_id, "marks_obtained": marks, "percentage": marks,
+                "grade": "A" if marks >= 85 else "B" if marks >= 70 else "C" if marks >= 55 else "D" if marks >= 50 else "F",
+                "status": "pass" if marks >= passing_marks else "fail",
+                "attendance_status": "present" if sat else "absent",
+                "submission_status": "submitted" if sat else "not_submitted",
+                "graded_by": "synthetic", "graded_at": graded_at, "created_at": graded_at, "updated_at": graded_at
+            })
+        await self.emit("exam_results", results)
+
+    async def _discipline(self, student_id: str, class_id: str, branch_id: str, teachers: Dict[str, str],
+                          engagement: float):
+        rng, days = self.rng, self.days
+        incidents, points = [], []
+        for _ in range(poisson(rng, 0.5 * math.exp(-0.9 * engagement))):
+            day = rng.choice(days) + timedelta(hours=rng.randint(8, 15))
+            incident_type, severity, _ = rng.choices(INCIDENT_TYPES, weights=[w for *_, w in INCIDENT_TYPES])[0]
+            resolved = day < days[-1] - timedelta(days=14) and rng.random() < 0.85
+            incidents.append({
+                "_id": self.oid(day), "incident_code": self.code("INC", day.year),
+                "student_id": student_id, "class_id": class_id, "branch_id": branch_id,
+                "reported_by": teachers[rng.choice(list(SUBJECTS))], "incident_type": incident_type,
+                "severity": severity, "title": incident_type.replace("_", " ").title(),
+                "description": f"Synthetic {incident_type} incident", "incident_date": day,
+                "status": "resolved" if resolved else "open", "is_resolved": resolved,
+                "parent_contacted": severity != "minor", "created_at": day, "updated_at": day
+            })
+            points.append(self._points(student_id, class_id, branch_id, teachers, day, "negative",
+                                       {"minor": 2, "major": 5, "severe": 10}[severity], "conduct"))
+        for _ in range(poisson(rng, 2.0 * math.exp(0.5 * engagement))):
+            day = rng.choice(days) + timedelta(hours=rng.randint(8, 15))
+            points.append(self._points(student_id, class_id, branch_id, teachers, day, "positive",
+                                       rng.choice([1, 2, 3, 5]), rng.choice(POSITIVE_CATEGORIES)))
+        if incidents:
+            await self.emit("incidents", incidents)
+        if points:
+            await self.emit("behavior_points", points)
+
+    def _points(self, student_id, class_id, branch_id, teachers, day, point_type, points, category):
+        return {
+            "_id": self.oid(day), "point_code": self.code("BP", day.year),
+            "student_id": student_id, "class_id": class_id, "branch_id": branch_id,
+            "awarded_by": teachers[self.rng.choice(list(SUBJECTS))], "point_type": point_type,
+            "category": category, "points": points, "reason": f"Synthetic {category}",
+            "date_awarded": day, "created_at": day, "updated_at": day
+        }
+
+
+async def assign_receipt_numbers(db, dataset: SchoolDataset):
+    """
+    Number receipts per branch in payment_date order (RCP-<year>-<seq>), as the counters would
+    have issued them, and seed those counters so receipts created afterwards continue the series.
+    """
+    from pymongo import ASCENDING, UpdateOne
+
+    await db["payments"].create_index([("branch_id", ASCENDING), ("payment_date", ASCENDING), ("_id", ASCENDING)])
+    for branch_id in dataset.branch_ids:
+        updates, sequence = [], {}
+        async for payment in db["payments"].find({"branch_id": branch_id}, {"payment_date": 1}).sort(
+                [("payment_date", 1), ("_id", 1)]):
+            year = payment["payment_date"].year
+            sequence[year] = sequence.get(year, 0) + 1
+            updates.append(UpdateOne({"_id": payment["_id"]},
+                                     {"$set": {"receipt_number": f"RCP-{year}-{sequence[year]:06d}"}}))
+            if len(updates) >= BATCH_SIZE:
+                await db["payments"].bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            await db["payments"].bulk_write(updates, ordered=False)
+        for year, last in sequence.items():
+            await db["counters"].update_one({"_id": f"receipt:RCP:{branch_id}:{year}"},
+                                            {"$max": {"value": last}}, upsert=True)
+
+
+async def seed_school(db, students: int = 5000, branches: int = 3, term_days: int = 60, seed: int = 7,
+                      workers: int = 4, progress: Optional[Callable[[int], None]] = None) -> SchoolDataset:
+    """Generate and write the dataset; returns the ids and per-collection counts"""
+    generator = SyntheticSchoolGenerator(db, students=students, branches=branches, days=term_days,
+                                         seed=seed, workers=workers)
+    dataset = await generator.run(progress)
+    await assign_receipt_numbers(db, dataset)
+    return dataset
+
+
+async def main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    db = client[args.database]
+    if args.drop:
+        await client.drop_database(args.database)
+    elif await db["students"].estimated_document_count():
+        print(f"❌ {args.database} already has students; pass --drop to replace it")
+        return 1
+
+    started = time.perf_counter()
+
+    def progress(done: int):
+        if done % 10000 == 0 or done == args.students:
+            elapsed = time.perf_counter() - started
+            print(f"  {done:,}/{args.students:,} students  {elapsed:6.1f}s  {done / elapsed:,.0f} students/s")
+
+    print(f"🏫 Generating {args.students:,} students in {args.branches} branches, "
+          f"{args.days} school days, seed {args.seed} → {args.database}")
+    dataset = await seed_school(db, students=args.students, branches=args.branches, term_days=args.days,
+                                seed=args.seed, workers=args.workers, progress=progress)
+    elapsed = time.perf_counter() - started
+    total = sum(dataset.counts.values())
+    print(f"✅ {total:,} documents in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s)")
+    for name, count in sorted(dataset.counts.items(), key=lambda item: -item[1]):
+        print(f"  {name:<22} {count:>12,}")
+    client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default="school_synthetic")
+    parser.add_argument("--drop", action="store_true", help="drop the database first")
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--branches", type=int, default=5)
+    parser.add_argument("--days", type=int, default=190, help="school days of attendance (190 = a year)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=4, help="concurrent insert_many calls for attendance")
+    sys.exit(asyncio.run(main(parser.parse_args())))